@@ -0,0 +1 @@
+"""Benchmarks of the parsing, conversion and writing of NanoFinder files."""
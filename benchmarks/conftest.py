@@ -0,0 +1,237 @@
+"""Fixtures shared by the benchmarks.
+
+The files measured are generated once per session, with the catalog of synthetic samples for SMD
+mappings and by replicating a frame of a sample file for MDT spectra, so that the size of what is
+read and written can be chosen freely. Besides the timings collected by pytest-benchmark, every
+benchmark records its throughput and peak memory, which are summarised at the end of the run and
+stored along with the timings when the run is saved.
+"""
+
+import struct
+import tracemalloc
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Final
+
+import pytest
+
+from nanofinderparser import create_smd, sample_spec
+
+MDT_SAMPLE = Path(__file__).parent.parent / "sample_data" / "mdt" / "Spectra.mdt"
+
+# Layout of the NT-MDT files, as read by nanofinderparser.parsers.
+_MDT_FILE_HEADER_SIZE: Final[int] = 33
+_MDT_BODY_SIZE_OFFSET: Final[int] = 4
+_MDT_FRAME_COUNT_OFFSET: Final[int] = 12
+
+# Relative height below which the peaks of the generated mappings are not evaluated. It only makes
+# the files quicker to generate; the benchmarks do not depend on the spectra themselves.
+_TOLERANCE: Final[float] = 1e-4
+
+_MB: Final[float] = 1e6
+
+
+@dataclass(frozen=True, slots=True)
+class MapSize:
+    """Size of a generated mapping.
+
+    Attributes
+    ----------
+    x_size, y_size : int
+        Number of points of the scan along each axis.
+    n_points : int
+        Number of points of every spectrum.
+    """
+
+    x_size: int
+    y_size: int
+    n_points: int
+
+    @property
+    def n_spectra(self) -> int:
+        """Number of spectra of the mapping."""
+        return self.x_size * self.y_size
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the data block of the mapping, in bytes."""
+        return self.n_spectra * self.n_points * 4
+
+    def __str__(self) -> str:
+        """Short label, used in the ids of the benchmarks."""
+        return f"{self.x_size}x{self.y_size}x{self.n_points}"
+
+
+# Sizes of the mappings benchmarked: a quick one, close to what the tests use, and one the size of
+# a typical measurement.
+MAP_SIZES: Final[tuple[MapSize, ...]] = (
+    MapSize(32, 24, 1024),
+    MapSize(128, 96, 1024),
+)
+
+# Number of spectra of the MDT files benchmarked.
+MDT_SIZES: Final[tuple[int, ...]] = (16, 1024)
+
+
+@dataclass(frozen=True, slots=True)
+class Measurement:
+    """Throughput and memory of a single benchmark.
+
+    Attributes
+    ----------
+    name : str
+        Name of the benchmark.
+    mean : float
+        Mean wall time of a call, in seconds.
+    mb_per_s : float | None
+        Bytes of data processed per second, in MB/s.
+    spectra_per_s : float | None
+        Spectra processed per second.
+    peak_mb : float
+        Peak memory allocated during a call, in MB.
+    """
+
+    name: str
+    mean: float
+    mb_per_s: float | None
+    spectra_per_s: float | None
+    peak_mb: float
+
+
+_MEASUREMENTS: list[Measurement] = []
+
+
+def _peak_memory(func: Callable[[], Any]) -> int:
+    """Peak memory allocated by a single call, in bytes."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def write_mdt(file: Path, n_spectra: int) -> Path:
+    """Write an MDT file with as many spectra as needed.
+
+    The first frame of the sample file is copied as many times as spectra are asked for, and the
+    file header updated to declare them.
+
+    Parameters
+    ----------
+    file : Path
+        The file to write.
+    n_spectra : int
+        Number of spectra of the file.
+
+    Returns
+    -------
+    Path
+        The path of the file written.
+    """
+    buffer = MDT_SAMPLE.read_bytes()
+    (frame_size,) = struct.unpack_from("<I", buffer, _MDT_FILE_HEADER_SIZE)
+    frame = buffer[_MDT_FILE_HEADER_SIZE : _MDT_FILE_HEADER_SIZE + frame_size]
+
+    header = bytearray(buffer[:_MDT_FILE_HEADER_SIZE])
+    struct.pack_into("<I", header, _MDT_BODY_SIZE_OFFSET, frame_size * n_spectra)
+    struct.pack_into("<H", header, _MDT_FRAME_COUNT_OFFSET, n_spectra - 1)
+
+    file.write_bytes(bytes(header) + frame * n_spectra)
+    return file
+
+
+@pytest.fixture(scope="session", params=MAP_SIZES, ids=str)
+def map_size(request: pytest.FixtureRequest) -> MapSize:
+    """Size of the mapping benchmarked."""
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def smd_file(map_size: MapSize, tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """SMD file of a synthetic mapping of the size benchmarked."""
+    spec = sample_spec(
+        "graphene", x_size=map_size.x_size, y_size=map_size.y_size, n_points=map_size.n_points
+    )
+    folder = tmp_path_factory.mktemp("smd")
+    return create_smd(folder / f"graphene_{map_size}.smd", spec, tolerance=_TOLERANCE)
+
+
+@pytest.fixture(scope="session", params=MDT_SIZES, ids=lambda size: f"{size}spectra")
+def mdt_file(request: pytest.FixtureRequest, tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """MDT file holding the number of spectra benchmarked."""
+    folder = tmp_path_factory.mktemp("mdt")
+    return write_mdt(folder / f"spectra_{request.param}.mdt", request.param)
+
+
+@pytest.fixture
+def measure(benchmark: Any, request: pytest.FixtureRequest) -> Iterator[Callable[..., Any]]:
+    """Benchmark a callable and record its throughput and peak memory.
+
+    The fixture returns a function taking the callable to benchmark and, optionally, the number of
+    bytes and spectra each call processes, and a fixed number of rounds for calls too slow to let
+    pytest-benchmark calibrate them. The peak memory is measured on a separate call, so that
+    tracing the allocations does not slow down the timed ones.
+    """
+    sizes: dict[str, int | None] = {}
+
+    def run(
+        func: Callable[[], Any],
+        *,
+        nbytes: int | None = None,
+        n_spectra: int | None = None,
+        rounds: int | None = None,
+    ) -> Any:
+        sizes.update(nbytes=nbytes, n_spectra=n_spectra)
+        benchmark.extra_info["peak_mb"] = _peak_memory(func) / _MB
+        if rounds is not None:
+            return benchmark.pedantic(func, rounds=rounds, iterations=1)
+        return benchmark(func)
+
+    yield run
+
+    if benchmark.disabled or benchmark.stats is None:
+        return
+
+    mean = benchmark.stats.stats.mean
+    nbytes, n_spectra = sizes.get("nbytes"), sizes.get("n_spectra")
+    mb_per_s = nbytes / _MB / mean if nbytes else None
+    spectra_per_s = n_spectra / mean if n_spectra else None
+    benchmark.extra_info.update(mb_per_s=mb_per_s, spectra_per_s=spectra_per_s)
+    _MEASUREMENTS.append(
+        Measurement(
+            name=request.node.name,
+            mean=mean,
+            mb_per_s=mb_per_s,
+            spectra_per_s=spectra_per_s,
+            peak_mb=benchmark.extra_info["peak_mb"],
+        )
+    )
+
+
+def _format(value: float | None, width: int, precision: int) -> str:
+    """Format a value of the summary, which may be missing."""
+    if value is None:
+        return f"{'-':>{width}}"
+    return f"{value:>{width}.{precision}f}"
+
+
+def pytest_terminal_summary(terminalreporter: Any) -> None:
+    """Print the throughput and peak memory of every benchmark run."""
+    if not _MEASUREMENTS:
+        return
+
+    width = max(len(measurement.name) for measurement in _MEASUREMENTS)
+    terminalreporter.section("throughput and memory")
+    terminalreporter.write_line(
+        f"{'Name':<{width}}  {'Mean (ms)':>10}  {'MB/s':>10}  {'Spectra/s':>12}  {'Peak (MB)':>10}"
+    )
+    for measurement in _MEASUREMENTS:
+        terminalreporter.write_line(
+            f"{measurement.name:<{width}}  {measurement.mean * 1e3:>10.2f}  "
+            f"{_format(measurement.mb_per_s, 10, 1)}  "
+            f"{_format(measurement.spectra_per_s, 12, 0)}  "
+            f"{measurement.peak_mb:>10.1f}"
+        )
@@ -0,0 +1,345 @@
+"""Benchmarks of the hot paths: parsing SMD and MDT files, converting and writing them.
+
+Run them with ``invoke bench``, which stores the results, and compare a later run against the
+stored ones with ``invoke bench-compare``. They are not part of the test suite.
+"""
+
+import pickle
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+
+from benchmarks.conftest import MapSize
+from nanofinderparser import (
+    build_spectra,
+    load_mdt,
+    load_smd,
+    sample_mapping,
+    sample_spec,
+    write_smd,
+)
+from nanofinderparser.baseline import (
+    AlsBaseline,
+    BaselineMethod,
+    PolynomialBaseline,
+    RollingBallBaseline,
+    subtract_baseline,
+)
+from nanofinderparser.decomposition import Method, decompose_mapping
+from nanofinderparser.despike import despike
+from nanofinderparser.fit import fit_mapping
+from nanofinderparser.models import Mapping, Spectra
+from nanofinderparser.parsers import read_binary_part, read_mdt_frames, read_xml_part
+from nanofinderparser.resample import Method as ResampleMethod
+from nanofinderparser.shapes import PeakShape
+from nanofinderparser.unmix import unmix_mapping
+
+pytest.importorskip("pytest_benchmark")
+
+type Measure = Callable[..., Any]
+
+# Rounds used for the conversions to text, which take seconds on the larger mappings.
+CSV_ROUNDS = 3
+
+# A mapping of over 100k spectra, the size at which processing every spectrum in a Python loop
+# stops being an option. The spectra are short to keep it within a few hundred MB.
+LARGE_MAP_SIZE = MapSize(320, 320, 256)
+
+# Rounds used for the processing of the large mapping, which takes seconds.
+LARGE_MAP_ROUNDS = 3
+
+
+@pytest.fixture(scope="session")
+def mapping(smd_file: Path) -> Mapping:
+    """Load the mapping of the SMD file benchmarked."""
+    return load_smd(smd_file)
+
+
+@pytest.fixture(scope="session")
+def large_mapping() -> Mapping:
+    """Build the synthetic mapping of over 100k spectra."""
+    return sample_mapping(
+        "graphene",
+        x_size=LARGE_MAP_SIZE.x_size,
+        y_size=LARGE_MAP_SIZE.y_size,
+        n_points=LARGE_MAP_SIZE.n_points,
+        tolerance=1e-4,
+    )
+
+
+@pytest.fixture(scope="session")
+def spectra(mdt_file: Path) -> Spectra:
+    """Load the spectra of the MDT file benchmarked."""
+    return load_mdt(mdt_file)
+
+
+# ---------------------------------------------------------------------------------------------
+# SMD files
+# ---------------------------------------------------------------------------------------------
+
+
+def test_load_smd(measure: Measure, smd_file: Path, map_size: MapSize) -> None:
+    """Read a whole SMD file into a mapping."""
+    measure(
+        lambda: load_smd(smd_file),
+        nbytes=smd_file.stat().st_size,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+def test_lazy_mean_spectrum(measure: Measure, smd_file: Path, map_size: MapSize) -> None:
+    """Average the spectra of a memory-mapped SMD file, reading its chunks in parallel."""
+    measure(
+        lambda: load_smd(smd_file, lazy=True).to_dask().mean(axis=0).compute(),
+        nbytes=smd_file.stat().st_size,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+def test_read_xml_part(measure: Measure, smd_file: Path) -> None:
+    """Scan and parse the XML header of an SMD file."""
+    _, position = read_xml_part(smd_file)
+    measure(lambda: read_xml_part(smd_file), nbytes=position)
+
+
+def test_read_binary_part(measure: Measure, smd_file: Path, map_size: MapSize) -> None:
+    """Read the data block of an SMD file."""
+    _, position = read_xml_part(smd_file)
+    measure(
+        lambda: read_binary_part(smd_file, position),
+        nbytes=map_size.nbytes,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+def test_mapping_to_df(measure: Measure, mapping: Mapping, map_size: MapSize) -> None:
+    """Convert a mapping to DataFrames, with the spectral axis as Raman shift."""
+    measure(
+        lambda: mapping.to_df("raman_shift"),
+        nbytes=map_size.nbytes,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+def test_mapping_to_csv(
+    measure: Measure, mapping: Mapping, map_size: MapSize, tmp_path: Path
+) -> None:
+    """Export a mapping to CSV files."""
+    measure(
+        lambda: mapping.to_csv(path=tmp_path, spectral_units="raman_shift"),
+        nbytes=map_size.nbytes,
+        n_spectra=map_size.n_spectra,
+        rounds=CSV_ROUNDS,
+    )
+
+
+def test_write_smd(measure: Measure, mapping: Mapping, map_size: MapSize, tmp_path: Path) -> None:
+    """Write a mapping as an SMD file."""
+    file = tmp_path / "mapping.smd"
+    measure(
+        lambda: write_smd(mapping, file),
+        nbytes=map_size.nbytes,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+def test_smd_to_envi(measure: Measure, smd_file: Path, map_size: MapSize, tmp_path: Path) -> None:
+    """Export a memory-mapped SMD file to ENVI, its data block copied by the kernel."""
+    file = tmp_path / "mapping.bip"
+    measure(
+        lambda: load_smd(smd_file, lazy=True).to_envi(file, "raman_shift"),
+        nbytes=smd_file.stat().st_size,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+def test_smd_to_npy(measure: Measure, smd_file: Path, map_size: MapSize, tmp_path: Path) -> None:
+    """Export a memory-mapped SMD file to NPY, its data block copied by the kernel."""
+    file = tmp_path / "mapping.npy"
+    measure(
+        lambda: load_smd(smd_file, lazy=True).to_npy(file, "raman_shift"),
+        nbytes=smd_file.stat().st_size,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+def test_pickle_mapping(measure: Measure, mapping: Mapping, map_size: MapSize) -> None:
+    """Pickle a mapping and its band index with protocol 5, the data out of band, and back."""
+    mapping.band_index()
+
+    def round_trip() -> Mapping:
+        buffers: list[pickle.PickleBuffer] = []
+        pickled = pickle.dumps(mapping, protocol=5, buffer_callback=buffers.append)
+        unpickled: Mapping = pickle.loads(pickled, buffers=buffers)  # noqa: S301
+        return unpickled
+
+    measure(round_trip, nbytes=map_size.nbytes, n_spectra=map_size.n_spectra)
+
+
+def test_build_spectra(measure: Measure, map_size: MapSize) -> None:
+    """Generate the spectra of a synthetic mapping, evaluating every peak everywhere."""
+    spec = sample_spec(
+        "graphene", x_size=map_size.x_size, y_size=map_size.y_size, n_points=map_size.n_points
+    )
+    measure(lambda: build_spectra(spec), nbytes=map_size.nbytes, n_spectra=map_size.n_spectra)
+
+
+def test_build_spectra_tolerance(measure: Measure, map_size: MapSize) -> None:
+    """Generate the spectra of a synthetic mapping, evaluating the peaks over their support."""
+    spec = sample_spec(
+        "graphene", x_size=map_size.x_size, y_size=map_size.y_size, n_points=map_size.n_points
+    )
+    measure(
+        lambda: build_spectra(spec, tolerance=1e-4),
+        nbytes=map_size.nbytes,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+@pytest.mark.parametrize("shape", ["lorentzian", "pseudo_voigt"])
+def test_fit_mapping(
+    measure: Measure, mapping: Mapping, map_size: MapSize, shape: PeakShape
+) -> None:
+    """Fit the G peak of every spectrum of a mapping."""
+    measure(
+        lambda: fit_mapping(mapping, (1500.0, 1650.0), shape),
+        nbytes=map_size.nbytes,
+        n_spectra=map_size.n_spectra,
+    )
+
+
+# ---------------------------------------------------------------------------------------------
+# Processing of the spectra of a large mapping
+# ---------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "method",
+    [PolynomialBaseline(), AlsBaseline(), RollingBallBaseline(radius=20)],
+    ids=["polynomial", "als", "rolling_ball"],
+)
+def test_subtract_baseline(
+    measure: Measure, large_mapping: Mapping, method: BaselineMethod
+) -> None:
+    """Subtract the baseline of every spectrum of a mapping of over 100k spectra."""
+    measure(
+        lambda: subtract_baseline(large_mapping, method),
+        nbytes=LARGE_MAP_SIZE.nbytes,
+        n_spectra=LARGE_MAP_SIZE.n_spectra,
+        rounds=LARGE_MAP_ROUNDS,
+    )
+
+
+def test_band_maps(measure: Measure, large_mapping: Mapping) -> None:
+    """Build the band index of a mapping of over 100k spectra, then map a dozen bands with it."""
+
+    def band_maps() -> None:
+        # A mapping of the same data, without the index of the previous round
+        mapping = large_mapping.with_data(large_mapping.data)
+        for low in range(1300, 2900, 130):
+            mapping.band_map(low, low + 100)
+
+    measure(
+        band_maps,
+        nbytes=LARGE_MAP_SIZE.nbytes,
+        n_spectra=LARGE_MAP_SIZE.n_spectra,
+        rounds=LARGE_MAP_ROUNDS,
+    )
+
+
+def test_eval_maps(measure: Measure, large_mapping: Mapping) -> None:
+    """Map the usual quality checks of graphene on a mapping of over 100k spectra, in one pass."""
+    expressions = {
+        "I(2D)/I(G)": "band(2600, 2750) / band(1550, 1620)",
+        "I(D)/I(G)": "band(1300, 1400) / band(1550, 1620)",
+        "2D - G": "position(2600, 2750) - position(1550, 1620)",
+    }
+    measure(
+        lambda: large_mapping.eval_maps(expressions),
+        nbytes=LARGE_MAP_SIZE.nbytes,
+        n_spectra=LARGE_MAP_SIZE.n_spectra,
+        rounds=LARGE_MAP_ROUNDS,
+    )
+
+
+def test_despike(measure: Measure, large_mapping: Mapping) -> None:
+    """Remove the spikes of every spectrum of a mapping of over 100k spectra."""
+    measure(
+        lambda: despike(large_mapping),
+        nbytes=LARGE_MAP_SIZE.nbytes,
+        n_spectra=LARGE_MAP_SIZE.n_spectra,
+        rounds=LARGE_MAP_ROUNDS,
+    )
+
+
+@pytest.mark.parametrize("method", ["pca", "nmf"])
+def test_decompose_mapping(measure: Measure, large_mapping: Mapping, method: Method) -> None:
+    """Decompose the spectra of a mapping of over 100k spectra into 4 components, chunk by chunk."""
+    measure(
+        lambda: decompose_mapping(large_mapping, 4, method=method),
+        nbytes=LARGE_MAP_SIZE.nbytes,
+        n_spectra=LARGE_MAP_SIZE.n_spectra,
+        rounds=LARGE_MAP_ROUNDS,
+    )
+
+
+@pytest.mark.parametrize("method", ["linear", "cubic"])
+def test_resample_mapping(measure: Measure, large_mapping: Mapping, method: ResampleMethod) -> None:
+    """Resample the spectra of a mapping of over 100k spectra onto an even grid of Raman shifts."""
+    axis = large_mapping.get_spectral_axis("raman_shift")
+    grid = np.linspace(axis.min(), axis.max(), axis.size)
+    measure(
+        lambda: large_mapping.resample(grid, "raman_shift", method=method),
+        nbytes=LARGE_MAP_SIZE.nbytes,
+        n_spectra=LARGE_MAP_SIZE.n_spectra,
+        rounds=LARGE_MAP_ROUNDS,
+    )
+
+
+def test_unmix_mapping(measure: Measure, large_mapping: Mapping) -> None:
+    """Unmix the spectra of a mapping of over 100k spectra into 4 of its spectra, by NNLS."""
+    spectra = large_mapping.get_spectra()
+    step = len(spectra) // 4
+    references = {f"Point {index}": spectra[index] for index in range(0, 4 * step, step)}
+    measure(
+        lambda: unmix_mapping(large_mapping, references),
+        nbytes=LARGE_MAP_SIZE.nbytes,
+        n_spectra=LARGE_MAP_SIZE.n_spectra,
+        rounds=LARGE_MAP_ROUNDS,
+    )
+
+
+# ---------------------------------------------------------------------------------------------
+# MDT files
+# ---------------------------------------------------------------------------------------------
+
+
+def test_read_mdt_frames(measure: Measure, mdt_file: Path, spectra: Spectra) -> None:
+    """Decode every frame of an MDT file."""
+    measure(
+        lambda: read_mdt_frames(mdt_file),
+        nbytes=mdt_file.stat().st_size,
+        n_spectra=len(spectra),
+    )
+
+
+def test_spectra_to_df(measure: Measure, spectra: Spectra) -> None:
+    """Combine the spectra of an MDT file in a single DataFrame."""
+    nbytes = sum(spectrum.data.nbytes for spectrum in spectra)
+    measure(lambda: spectra.to_df("raman_shift"), nbytes=nbytes, n_spectra=len(spectra))
+
+
+def test_spectra_to_feather(measure: Measure, spectra: Spectra, tmp_path: Path) -> None:
+    """Write the spectra of an MDT file as a Feather file, and read them back memory-mapped."""
+    pytest.importorskip("pyarrow")
+    from nanofinderparser.arrow import read_feather  # noqa: PLC0415
+
+    nbytes = sum(spectrum.data.nbytes for spectrum in spectra)
+    measure(
+        lambda: read_feather(spectra.to_feather(tmp_path / "spectra.feather", "raman_shift")),
+        nbytes=nbytes,
+        n_spectra=len(spectra),
+    )
@@ -8,6 +8,7 @@ __email__ = "psolsfer@gmail.com"
 __version__ = "0.7.0"
 
 from nanofinderparser.load import (
+    follow_smd,
     load_mdt,
     load_mdt_file,
     load_mdt_folder,
@@ -55,6 +56,7 @@ __all__ = [
     "build_mapping",
     "build_spectra",
     "create_smd",
+    "follow_smd",
     "load_mdt",
     "load_mdt_file",
     "load_mdt_folder",
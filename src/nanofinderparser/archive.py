@@ -0,0 +1,423 @@
+"""Find the points of an archive of mappings whose spectra look like a reference spectrum.
+
+An :class:`ArchiveIndex` holds a compact vector per point of every mapping of an archive, in a
+folder of its own, so that a query compares the reference with every point without reading any
+mapping again. Building it:
+
+1. resamples every spectrum onto a common spectral axis and scales it to unit norm, so that the
+   similarity of two spectra is the cosine of their angle, whatever their intensity;
+2. stores each spectrum either as it is, in half precision (``"float16"``), or projected on the
+   few directions in which the spectra of the archive vary the most (``"pca"``), learnt from all
+   of them in a first pass.
+
+The mappings are read in parallel, one per process. A query compares the reference with the
+vectors by chunks, each a single matrix product, keeping the best points as it goes: the vectors
+are memory-mapped, so an archive larger than the memory is searched through.
+
+Examples
+--------
+>>> axis = np.linspace(100.0, 3000.0, 1024)
+>>> index = ArchiveIndex.build(Path("smd"), Path("smd-index"), axis)  # doctest: +SKIP
+>>> hits = index.search(reference, reference_axis, k=5)  # doctest: +SKIP
+>>> hits[0].file, hits[0].x, hits[0].y  # doctest: +SKIP
+(PosixPath('smd/sample_12.smd'), 31, 7)
+"""
+
+import itertools
+import json
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Final, Literal, Self
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.load import load_smd, load_smd_header
+from nanofinderparser.models import Mapping
+from nanofinderparser.resample import Interpolation
+from nanofinderparser.units import Units, validate_units
+from nanofinderparser.utils import DEFAULT_CHUNK_SIZE, resolve_jobs
+
+# Number of directions the spectra are projected on, for the "pca" representation.
+DEFAULT_COMPONENTS: Final[int] = 32
+
+# Vectors compared with the reference at once: many more than spectra in a chunk, the vectors
+# being short, in half precision or as a few PCA scores.
+DEFAULT_SEARCH_CHUNK_SIZE: Final[int] = 65536
+
+# Files of an index, in its folder.
+_METADATA_NAME: Final[str] = "archive.json"
+_VECTORS_NAME: Final[str] = "vectors.npy"
+_PIXELS_NAME: Final[str] = "pixels.npy"
+_BASIS_NAME: Final[str] = "basis.npy"
+
+# Version of the layout of an index; an index of another version must be built again.
+_ARCHIVE_VERSION: Final[int] = 1
+
+Representation = Literal["float16", "pca"]
+
+
+@dataclass(frozen=True, slots=True)
+class Hit:
+    """A point of a mapping of the archive, and how similar its spectrum is to the reference.
+
+    Attributes
+    ----------
+    file : Path
+        The SMD file of the mapping.
+    x, y : int
+        Column and row of the point, in the maps of the mapping (as laid out by
+        :meth:`~nanofinderparser.models.Mapping.to_image`).
+    similarity : float
+        Cosine similarity of the spectrum with the reference, 1 for the same shape.
+    """
+
+    file: Path
+    x: int
+    y: int
+    similarity: float
+
+
+@dataclass(frozen=True, slots=True)
+class ArchiveIndex:
+    """The compact vectors of the spectra of every point of an archive of mappings.
+
+    Build it with :meth:`build`, and open it again with :meth:`open`.
+
+    Attributes
+    ----------
+    folder : Path
+        The folder of the index.
+    axis : NDArray[np.float64]
+        The common spectral axis the spectra were resampled onto, in `units`.
+    units : Units
+        The units of the axis.
+    files : tuple[Path, ...]
+        The SMD files indexed.
+    vectors : NDArray[Any]
+        One vector of unit norm per point, of shape ``(n_points, n_dimensions)``: memory-mapped
+        ``float16`` spectra, or ``float32`` projections on the basis.
+    pixels : NDArray[np.int32]
+        The file (as a position in `files`), column and row of every point, of shape
+        ``(n_points, 3)``, memory-mapped.
+    basis : NDArray[np.float64] | None
+        The directions the spectra were projected on, one per row, or None if they were not.
+    """
+
+    folder: Path
+    axis: NDArray[np.float64]
+    units: Units
+    files: tuple[Path, ...]
+    vectors: NDArray[Any]
+    pixels: NDArray[np.int32]
+    basis: NDArray[np.float64] | None
+
+    @classmethod
+    def build(  # noqa: PLR0913
+        cls,
+        sources: Path | Sequence[Path],
+        folder: Path,
+        axis: NDArray[np.float64],
+        *,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.raman_shift,
+        representation: Representation = "float16",
+        n_components: int = DEFAULT_COMPONENTS,
+        jobs: int = 1,
+    ) -> Self:
+        """Index the spectra of an archive of mappings.
+
+        Parameters
+        ----------
+        sources : Path | Sequence[Path]
+            The SMD files, or a folder whose SMD files are indexed, as
+            :func:`~nanofinderparser.load.load_smd_folder` reads them.
+        folder : Path
+            Where to write the index. Any index already there is replaced.
+        axis : NDArray[np.float64]
+            The common spectral axis, increasing, in `units`. Spectra are zero beyond their own
+            axis.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+            The units of the axis, by default "raman_shift".
+        representation : {"float16", "pca"}, optional
+            How the spectra are stored, by default "float16": as they are, in half precision, or
+            projected on the `n_components` directions in which they vary the most.
+        n_components : int, optional
+            Number of directions of the "pca" representation, by default 32.
+        jobs : int, optional
+            Number of mappings read at once, each in its own process, by default 1. 0 uses one
+            per CPU.
+
+        Returns
+        -------
+        ArchiveIndex
+            The index, opened.
+
+        Raises
+        ------
+        ValueError
+            If there is no file to index, the axis is not increasing, or there are more
+            directions than points of the axis.
+        """
+        axis = np.asarray(axis, dtype=np.float64)
+        if axis.ndim != 1 or axis.size < 2 or (np.diff(axis) <= 0).any():  # noqa: PLR2004
+            msg = "The common spectral axis must hold at least 2 points, increasing."
+            raise ValueError(msg)
+        if representation == "pca" and not 1 <= n_components <= axis.size:
+            msg = f"Cannot project spectra of {axis.size} points on {n_components} directions."
+            raise ValueError(msg)
+        units = validate_units(units)
+        files = _source_files(sources)
+        if not files:
+            msg = "There is no SMD file to index."
+            raise ValueError(msg)
+        jobs = resolve_jobs(jobs)
+
+        basis = None
+        if representation == "pca":
+            # The directions best reconstructing the spectra are the main eigenvectors of the
+            # sum of their outer products, which the files are reduced to in a first pass
+            moments = sum(
+                _map_files(_second_moments, files, jobs, axis, units),
+                start=np.zeros((axis.size, axis.size)),
+            )
+            variances, directions = np.linalg.eigh(moments)
+            basis = directions[:, np.argsort(variances)[::-1][:n_components]].T
+
+        counts = [_count_spectra(file) for file in files]
+        offsets = [0, *itertools.accumulate(counts)]
+        n_dimensions = axis.size if basis is None else len(basis)
+        dtype = np.float16 if basis is None else np.float32
+
+        folder.mkdir(parents=True, exist_ok=True)
+        # Until the new index is complete, the folder holds none
+        (folder / _METADATA_NAME).unlink(missing_ok=True)
+        (folder / _BASIS_NAME).unlink(missing_ok=True)
+        vectors = np.lib.format.open_memmap(
+            folder / _VECTORS_NAME, mode="w+", dtype=dtype, shape=(offsets[-1], n_dimensions)
+        )
+        pixels = np.lib.format.open_memmap(
+            folder / _PIXELS_NAME, mode="w+", dtype=np.int32, shape=(offsets[-1], 3)
+        )
+        results = _map_files(_index_file, files, jobs, axis, units, basis)
+        for number, (file_vectors, positions) in enumerate(results):
+            rows = slice(offsets[number], offsets[number + 1])
+            vectors[rows] = file_vectors
+            pixels[rows, 0] = number
+            pixels[rows, 1:] = positions
+        vectors.flush()
+        pixels.flush()
+        del vectors, pixels
+
+        if basis is not None:
+            np.save(folder / _BASIS_NAME, basis)
+        metadata = {
+            "version": _ARCHIVE_VERSION,
+            "units": units.value,
+            "axis": axis.tolist(),
+            "files": [str(file) for file in files],
+        }
+        # The metadata is written last: a folder without it holds no usable index
+        temporary = folder / (_METADATA_NAME + ".tmp")
+        temporary.write_text(json.dumps(metadata, indent=2), encoding="utf-8")
+        temporary.replace(folder / _METADATA_NAME)
+        return cls.open(folder)
+
+    @classmethod
+    def open(cls, folder: Path) -> Self:
+        """Open an index built by :meth:`build`, memory-mapping its vectors.
+
+        Parameters
+        ----------
+        folder : Path
+            The folder of the index.
+
+        Returns
+        -------
+        ArchiveIndex
+            The index.
+
+        Raises
+        ------
+        ValueError
+            If the folder holds no index, or an index of another version.
+        """
+        metadata_file = folder / _METADATA_NAME
+        if not metadata_file.is_file():
+            msg = f"{folder} holds no archive index."
+            raise ValueError(msg)
+        metadata = json.loads(metadata_file.read_text(encoding="utf-8"))
+        if metadata.get("version") != _ARCHIVE_VERSION:
+            msg = f"The archive index of {folder} is of version {metadata.get('version')!r}; "
+            msg += "build it again."
+            raise ValueError(msg)
+
+        basis_file = folder / _BASIS_NAME
+        return cls(
+            folder=folder,
+            axis=np.asarray(metadata["axis"], dtype=np.float64),
+            units=Units(metadata["units"]),
+            files=tuple(Path(file) for file in metadata["files"]),
+            vectors=np.load(folder / _VECTORS_NAME, mmap_mode="r"),
+            pixels=np.load(folder / _PIXELS_NAME, mmap_mode="r"),
+            basis=np.load(basis_file) if basis_file.is_file() else None,
+        )
+
+    def search(
+        self,
+        spectrum: NDArray[Any],
+        axis: NDArray[np.float64] | None = None,
+        *,
+        k: int = 10,
+        chunk_size: int = DEFAULT_SEARCH_CHUNK_SIZE,
+    ) -> list[Hit]:
+        """Find the points whose spectra are the most similar to a reference.
+
+        Parameters
+        ----------
+        spectrum : NDArray[Any]
+            The reference spectrum.
+        axis : NDArray[np.float64] | None, optional
+            The spectral axis of the reference, in the units of the index, by default None (the
+            reference is given on the axis of the index).
+        k : int, optional
+            Number of points to find, by default 10.
+        chunk_size : int, optional
+            Number of vectors compared with the reference at once, by default 65536.
+
+        Returns
+        -------
+        list[Hit]
+            The `k` most similar points, the most similar first.
+
+        Raises
+        ------
+        ValueError
+            If `k` is not positive, the reference is not given on the axis of the index and no
+            axis is given, or it is zero over the whole axis of the index.
+        """
+        if k < 1:
+            msg = f"The number of points to find must be positive, got {k}."
+            raise ValueError(msg)
+        reference = np.asarray(spectrum, dtype=np.float64)[None, :]
+        if axis is not None:
+            reference = _resample(reference, Interpolation.build(axis, self.axis))
+        elif reference.shape[1] != self.axis.size:
+            msg = f"The reference has {reference.shape[1]} points, but the axis of the index has "
+            msg += f"{self.axis.size}; give its axis."
+            raise ValueError(msg)
+        query = _vectors(reference, self.basis)[0].astype(np.float32)
+        if not query.any():
+            msg = "The reference is zero over the whole axis of the index."
+            raise ValueError(msg)
+
+        best = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for start in range(0, len(self.vectors), chunk_size):
+            similarities = np.asarray(self.vectors[start : start + chunk_size], np.float32) @ query
+            candidates = np.concatenate([best, similarities])
+            rows = np.concatenate([best_rows, np.arange(start, start + len(similarities))])
+            keep = np.argpartition(-candidates, k)[:k] if len(candidates) > k else slice(None)
+            best, best_rows = candidates[keep], rows[keep]
+
+        order = np.argsort(-best, kind="stable")
+        return [
+            Hit(self.files[file], int(x), int(y), float(similarity))
+            for (file, x, y), similarity in zip(
+                self.pixels[best_rows[order]], best[order], strict=True
+            )
+        ]
+
+
+def _source_files(sources: Path | Sequence[Path]) -> list[Path]:
+    """List the SMD files to index: those given, or those of a folder."""
+    if isinstance(sources, Path):
+        return sorted(sources.glob("*.smd"))
+    return [Path(source) for source in sources]
+
+
+def _map_files(
+    function: Callable[..., Any], files: Sequence[Path], jobs: int, *args: Any
+) -> Iterator[Any]:
+    """Call a function with every file, in parallel when asked to, yielding in the file order."""
+    workers = min(jobs, len(files))
+    if workers <= 1:
+        for file in files:
+            yield function(file, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(function, files, *([arg] * len(files) for arg in args))
+
+
+def _count_spectra(file: Path) -> int:
+    """Count the spectra of an SMD file from its header, without reading its data."""
+    header, _ = load_smd_header(file)
+    return header.expected_data_size // header.get_spectral_axis_len()
+
+
+def _second_moments(file: Path, axis: NDArray[np.float64], units: Units) -> NDArray[np.float64]:
+    """Sum the outer products of the resampled spectra of a mapping, scaled to unit norm."""
+    moments = np.zeros((axis.size, axis.size))
+    for chunk in _resampled_chunks(file, axis, units):
+        normalized = _vectors(chunk, None)
+        moments += normalized.T @ normalized
+    return moments
+
+
+def _index_file(
+    file: Path, axis: NDArray[np.float64], units: Units, basis: NDArray[np.float64] | None
+) -> tuple[NDArray[Any], NDArray[np.int32]]:
+    """Compute the vectors of the spectra of a mapping, and the column and row of each."""
+    mapping = load_smd(file)
+    vectors = np.concatenate(
+        [_vectors(chunk, basis) for chunk in _resampled_chunks(file, axis, units, mapping)]
+    )
+
+    # The layout of the maps gives the column and row of every spectrum of the acquisition
+    n_spectra = len(vectors)
+    layout = mapping.to_image(np.arange(n_spectra), "").values.astype(int)
+    positions = np.empty((n_spectra, 2), dtype=np.int32)
+    rows, columns = np.indices(layout.shape)
+    positions[layout.ravel(), 0] = columns.ravel()
+    positions[layout.ravel(), 1] = rows.ravel()
+    return vectors.astype(np.float16 if basis is None else np.float32), positions
+
+
+def _resampled_chunks(
+    file: Path, axis: NDArray[np.float64], units: Units, mapping: Mapping | None = None
+) -> Iterator[NDArray[np.float64]]:
+    """Read the spectra of a mapping by chunks, resampled onto the common axis."""
+    mapping = load_smd(file) if mapping is None else mapping
+    interpolation = Interpolation.build(mapping.get_spectral_axis(units), axis)
+    spectra = mapping.get_spectra()
+    for start in range(0, len(spectra), DEFAULT_CHUNK_SIZE):
+        yield _resample(spectra[start : start + DEFAULT_CHUNK_SIZE], interpolation)
+
+
+def _resample(spectra: NDArray[Any], interpolation: Interpolation) -> NDArray[np.float64]:
+    """Interpolate spectra linearly onto another axis, as zero beyond their own.
+
+    Examples
+    --------
+    >>> interpolation = Interpolation.build(np.array([2.0, 1.0, 0.0]), np.array([0.5, 3.0]))
+    >>> _resample(np.array([[0.0, 2.0, 4.0]]), interpolation)
+    array([[3., 0.]])
+    """
+    resampled = interpolation.apply(spectra)
+    resampled[:, ~interpolation.inside] = 0.0
+    return resampled
+
+
+def _vectors(
+    spectra: NDArray[np.float64], basis: NDArray[np.float64] | None
+) -> NDArray[np.float64]:
+    """Scale spectra to unit norm, projected on a basis if any; zero spectra stay zero."""
+    vectors = spectra / np.maximum(np.linalg.norm(spectra, axis=1, keepdims=True), 1e-300)
+    if basis is None:
+        return vectors
+    projected = vectors @ basis.T
+    norms = np.linalg.norm(projected, axis=1, keepdims=True)
+    normalized: NDArray[np.float64] = projected / np.maximum(norms, 1e-300)
+    return normalized
@@ -0,0 +1,294 @@
+"""Store collections of spectra as Arrow tables, and as Feather files read without copying.
+
+A collection of spectra is a table of one row per spectrum: its title, units, laser wavelength
+and time of measurement, and its spectral axis and intensities as lists of ``float32`` values.
+Unlike :meth:`~nanofinderparser.models.Spectra.to_df`, which aligns the spectra on the union of
+their axes, every spectrum keeps its own axis, so spectra recorded over different axes cost
+nothing more than the others.
+
+Feather files (the Arrow IPC file format) are written in batches of spectra, so that only one
+batch is ever converted at a time, and are read back memory-mapped: the axes and intensities
+of the spectra read are views of the file, which is never loaded whole.
+
+Requires pyarrow, installed by the ``arrow`` extra.
+
+Examples
+--------
+>>> from nanofinderparser import load_mdt
+>>> spectra = load_mdt(Path("spectra.mdt"))  # doctest: +SKIP
+>>> spectra.to_feather(Path("spectra.feather"), spectral_units="raman_shift")  # doctest: +SKIP
+>>> read_feather(Path("spectra.feather"))["Spectrum_1"].data  # doctest: +SKIP
+"""
+
+from collections.abc import Iterator, Sequence
+from itertools import pairwise
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final, Literal
+
+import numpy as np
+
+from nanofinderparser.models import Spectra, Spectrum
+from nanofinderparser.units import Units, validate_units
+from nanofinderparser.utils import import_optional
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# Spectra converted and written together. A batch of 1024-point spectra is then 8 MB.
+DEFAULT_BATCH_SIZE: Final[int] = 1024
+
+# Key of the schema metadata holding the file the spectra were read from.
+_SOURCE_KEY: Final[bytes] = b"nanofinderparser.source"
+
+
+def spectra_schema() -> "pa.Schema":
+    """Return the schema of the Arrow tables of spectra.
+
+    Returns
+    -------
+    pa.Schema
+        One row per spectrum, with the columns ``title``, ``spectral_axis_unit``,
+        ``data_unit``, ``laser_wavelength`` (nm), ``measured_at``, ``text_comment``, and the
+        lists of ``float32`` values ``spectral_axis`` and ``data``.
+
+    Raises
+    ------
+    ImportError
+        If pyarrow is not installed.
+    """
+    pyarrow = import_optional("pyarrow", "arrow")
+    schema: pa.Schema = pyarrow.schema(
+        [
+            ("title", pyarrow.string()),
+            ("spectral_axis_unit", pyarrow.string()),
+            ("data_unit", pyarrow.string()),
+            ("laser_wavelength", pyarrow.float64()),
+            ("measured_at", pyarrow.timestamp("us")),
+            ("text_comment", pyarrow.string()),
+            ("spectral_axis", pyarrow.list_(pyarrow.float32())),
+            ("data", pyarrow.list_(pyarrow.float32())),
+        ]
+    )
+    return schema
+
+
+def spectra_to_table(
+    spectra: Spectra,
+    spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> "pa.Table":
+    """Build the Arrow table of a collection of spectra.
+
+    Parameters
+    ----------
+    spectra : Spectra
+        The spectra.
+    spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+        Units of the spectral axes, by default None (the units of each spectrum).
+    batch_size : int, optional
+        Spectra in each chunk of the table, by default 1024.
+
+    Returns
+    -------
+    pa.Table
+        The table, of schema :func:`spectra_schema`.
+
+    Raises
+    ------
+    ImportError
+        If pyarrow is not installed.
+    ValueError
+        If `batch_size` is not positive.
+    """
+    pyarrow = import_optional("pyarrow", "arrow")
+    schema = _schema_of(spectra)
+    table: pa.Table = pyarrow.Table.from_batches(
+        list(_record_batches(spectra, spectral_units, batch_size)), schema=schema
+    )
+    return table
+
+
+def write_feather(
+    spectra: Spectra,
+    file: Path,
+    spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Path:
+    """Write a collection of spectra as a Feather file, batch after batch.
+
+    Parameters
+    ----------
+    spectra : Spectra
+        The spectra.
+    file : Path
+        Path of the file to write. Parent directories are created when missing.
+    spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+        Units of the spectral axes, by default None (the units of each spectrum).
+    batch_size : int, optional
+        Spectra converted and written together, by default 1024.
+
+    Returns
+    -------
+    Path
+        The path of the file just written.
+
+    Raises
+    ------
+    ImportError
+        If pyarrow is not installed.
+    ValueError
+        If `batch_size` is not positive.
+
+    Notes
+    -----
+    The file is left uncompressed, which is what allows :func:`read_feather` to read it without
+    copying it.
+    """
+    pyarrow = import_optional("pyarrow", "arrow")
+    file = Path(file)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    schema = _schema_of(spectra)
+    with (
+        pyarrow.OSFile(str(file), "wb") as sink,
+        pyarrow.ipc.new_file(sink, schema) as writer,
+    ):
+        for batch in _record_batches(spectra, spectral_units, batch_size):
+            writer.write_batch(batch)
+    return file
+
+
+def read_feather(file: Path) -> Spectra:
+    """Read a collection of spectra from a Feather file, memory-mapping it.
+
+    Parameters
+    ----------
+    file : Path
+        A file written by :func:`write_feather`, or any Arrow IPC file of schema
+        :func:`spectra_schema`.
+
+    Returns
+    -------
+    Spectra
+        The spectra, whose axes and intensities are read-only ``float32`` views of the file.
+
+    Raises
+    ------
+    ImportError
+        If pyarrow is not installed.
+    """
+    pyarrow = import_optional("pyarrow", "arrow")
+    # The map is not closed here: it stays open as long as the arrays of the spectra use it
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(str(file), "r")).read_all()
+    return spectra_from_table(table, source=Path(file))
+
+
+def spectra_from_table(table: "pa.Table", source: Path | None = None) -> Spectra:
+    """Build a collection of spectra from an Arrow table, without copying its values.
+
+    Parameters
+    ----------
+    table : pa.Table
+        A table of schema :func:`spectra_schema`.
+    source : Path | None, optional
+        Path of the file the table was read from, by default None.
+
+    Returns
+    -------
+    Spectra
+        The spectra, whose axes and intensities are read-only views of the table.
+    """
+    axes = _list_values(table.column("spectral_axis"))
+    values = _list_values(table.column("data"))
+    columns = {
+        name: table.column(name).to_pylist()
+        for name in (
+            "title",
+            "spectral_axis_unit",
+            "data_unit",
+            "laser_wavelength",
+            "measured_at",
+            "text_comment",
+        )
+    }
+    items = [
+        Spectrum(
+            title=title,
+            spectral_axis=axis,
+            data=data,
+            spectral_axis_unit=Units(unit),
+            data_unit=data_unit,
+            laser_wavelength=laser_wavelength,
+            measured_at=measured_at,
+            text_comment=text_comment or "",
+        )
+        for title, unit, data_unit, laser_wavelength, measured_at, text_comment, axis, data in zip(
+            *columns.values(), axes, values, strict=True
+        )
+    ]
+    return Spectra(items, source=source)
+
+
+def _schema_of(spectra: Spectra) -> "pa.Schema":
+    """Return the schema of the table of a collection, recording the file it was read from."""
+    schema = spectra_schema()
+    if spectra.source is None:
+        return schema
+    with_source: pa.Schema = schema.with_metadata({_SOURCE_KEY: str(spectra.source)})
+    return with_source
+
+
+def _record_batches(
+    spectra: Sequence[Spectrum],
+    spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None,
+    batch_size: int,
+) -> Iterator["pa.RecordBatch"]:
+    """Convert the spectra to record batches, one batch of spectra at a time."""
+    if batch_size < 1:
+        msg = f"The number of spectra in each batch must be positive, got {batch_size}."
+        raise ValueError(msg)
+    pyarrow = import_optional("pyarrow", "arrow")
+    schema = spectra_schema()
+    units = None if spectral_units is None else validate_units(spectral_units)
+    for start in range(0, len(spectra), batch_size):
+        batch = spectra[start : start + batch_size]
+        axes = [spectrum.get_spectral_axis(units) for spectrum in batch]
+        yield pyarrow.RecordBatch.from_arrays(
+            [
+                pyarrow.array([spectrum.title for spectrum in batch], pyarrow.string()),
+                pyarrow.array(
+                    [(units or spectrum.spectral_axis_unit).value for spectrum in batch],
+                    pyarrow.string(),
+                ),
+                pyarrow.array([spectrum.data_unit for spectrum in batch], pyarrow.string()),
+                pyarrow.array([spectrum.laser_wavelength for spectrum in batch], pyarrow.float64()),
+                pyarrow.array(
+                    [spectrum.measured_at for spectrum in batch], pyarrow.timestamp("us")
+                ),
+                pyarrow.array([spectrum.text_comment for spectrum in batch], pyarrow.string()),
+                _float32_lists(pyarrow, axes),
+                _float32_lists(pyarrow, [spectrum.data for spectrum in batch]),
+            ],
+            schema=schema,
+        )
+
+
+def _float32_lists(pyarrow: Any, arrays: Sequence[Any]) -> "pa.ListArray":
+    """Build a list array of ``float32`` values from arrays, with a single copy of them."""
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int32)
+    np.cumsum([np.size(array) for array in arrays], out=offsets[1:])
+    flat = np.concatenate([np.ravel(array) for array in arrays], dtype=np.float32)
+    lists: pa.ListArray = pyarrow.ListArray.from_arrays(
+        pyarrow.array(offsets), pyarrow.array(flat, pyarrow.float32())
+    )
+    return lists
+
+
+def _list_values(column: "pa.ChunkedArray") -> list[Any]:
+    """Return the values of every row of a column of lists, as views of its memory."""
+    rows: list[Any] = []
+    for chunk in column.chunks:
+        # The offsets index the values backing the whole chunk, whatever its own offset
+        values = chunk.values.to_numpy(zero_copy_only=True)
+        offsets = chunk.offsets.to_numpy()
+        rows.extend(values[start:end] for start, end in pairwise(offsets))
+    return rows
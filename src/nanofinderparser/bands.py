@@ -0,0 +1,219 @@
+"""Integrate the spectra of a mapping over windows of the spectral axis, from a prefix-sum index.
+
+An integrated-intensity map (of the D, G or 2D band, or of a window of a PL spectrum) sums every
+spectrum over a window of its axis: a full pass over the data for each map. A
+:class:`BandIndex` holds instead the running integral of every spectrum along its axis, built in
+a single pass, so that the integral over any window is the difference of two of its values per
+spectrum, whatever the width of the window.
+
+The index is laid out with one row per point of the spectral axis, so the two rows a window needs
+are contiguous. Saved as a ``.npy`` file and memory-mapped, a window then reads two rows from the
+disk rather than the whole index.
+
+Examples
+--------
+>>> axis = np.array([0.0, 1.0, 2.0, 3.0])
+>>> index = BandIndex.build(axis, np.array([[1.0, 1.0, 3.0, 3.0], [0.0, 2.0, 2.0, 0.0]]))
+>>> index.integrate(1.0, 3.0).tolist()
+[5.0, 3.0]
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Self
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.spectral_axis import SpectralAxis
+from nanofinderparser.utils import DEFAULT_CHUNK_SIZE
+
+
+@dataclass(frozen=True, slots=True)
+class BandIndex:
+    """The running integral of a batch of spectra along their spectral axis.
+
+    Attributes
+    ----------
+    axis : NDArray[np.float64]
+        The spectral axis, of shape ``(n_points,)``, in the units the integrals are taken in.
+    cumulative : NDArray[np.float64]
+        Integral of every spectrum from the first point of the axis to each point, by the
+        trapezoidal rule, of shape ``(n_points, n_spectra)``. It may be a memory map.
+    """
+
+    axis: NDArray[np.float64]
+    cumulative: NDArray[np.float64]
+    # The axis, prepared for finding the points of the windows
+    _lookup: SpectralAxis = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        """Prepare the axis for finding the points of the windows."""
+        object.__setattr__(self, "_lookup", SpectralAxis.from_values(self.axis))
+
+    @classmethod
+    def build(
+        cls,
+        axis: NDArray[np.float64],
+        spectra: NDArray[Any],
+        *,
+        file: Path | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Self:
+        """Build the index of a batch of spectra.
+
+        The index is twice the size of float32 spectra. Built into a file, it is written
+        straight to it, chunk by chunk, rather than held in memory first.
+
+        Parameters
+        ----------
+        axis : NDArray[np.float64]
+            The spectral axis, of shape ``(n_points,)``, increasing or decreasing.
+        spectra : NDArray[Any]
+            The spectra, of shape ``(n_spectra, n_points)``.
+        file : Path | None, optional
+            The ``.npy`` file to build the index into, as :meth:`save` would write it, by
+            default None (in memory).
+        chunk_size : int, optional
+            Number of spectra integrated together, by default 4096.
+
+        Returns
+        -------
+        BandIndex
+            The index of the spectra, memory-mapped from `file` when given.
+
+        Raises
+        ------
+        ValueError
+            If the spectra and the axis do not have the same number of points.
+        """
+        axis = np.asarray(axis, dtype=np.float64)
+        n_spectra, n_points = spectra.shape
+        if n_points != axis.size:
+            msg = f"The spectra have {n_points} points, but the axis has {axis.size}."
+            raise ValueError(msg)
+
+        # Integrals are positive whichever way the axis runs, as for an increasing one
+        half_steps = np.abs(np.diff(axis)) / 2
+        if file is None:
+            cumulative = np.zeros((n_points, n_spectra))
+            _integrate_chunks(spectra, half_steps, cumulative, chunk_size)
+            return cls(axis, cumulative)
+
+        # Written to a temporary file, renamed once complete, so that an interrupted build
+        # never leaves a partial index. A new file is filled with zeros, as the first row must be.
+        temporary = file.with_name(file.name + ".tmp")
+        mapped = np.lib.format.open_memmap(
+            temporary, mode="w+", dtype=np.float64, shape=(n_points, n_spectra)
+        )
+        _integrate_chunks(spectra, half_steps, mapped, chunk_size)
+        mapped.flush()
+        del mapped
+        temporary.replace(file)
+        return cls.load(file, axis)
+
+    @classmethod
+    def load(cls, file: Path, axis: NDArray[np.float64]) -> Self:
+        """Open an index saved by :meth:`save`, as a memory map.
+
+        Parameters
+        ----------
+        file : Path
+            The ``.npy`` file.
+        axis : NDArray[np.float64]
+            The spectral axis of the index, which is not saved with it.
+
+        Returns
+        -------
+        BandIndex
+            The index, reading from the file only the rows it needs.
+
+        Raises
+        ------
+        ValueError
+            If the file does not hold one row per point of the axis.
+        """
+        cumulative = np.load(file, mmap_mode="r")
+        if cumulative.ndim != 2 or len(cumulative) != axis.size:  # noqa: PLR2004
+            msg = f"{file} does not hold the index of a spectral axis of {axis.size} points."
+            raise ValueError(msg)
+        return cls(np.asarray(axis, dtype=np.float64), cumulative)
+
+    def save(self, file: Path) -> Path:
+        """Save the running integrals as a ``.npy`` file.
+
+        The file is written to a temporary file first and then renamed, so that an interrupted
+        save never leaves a partial index behind.
+
+        Parameters
+        ----------
+        file : Path
+            Where to save them.
+
+        Returns
+        -------
+        Path
+            The file written.
+        """
+        temporary = file.with_name(file.name + ".tmp")
+        with temporary.open("wb") as stream:
+            np.save(stream, self.cumulative)
+        temporary.replace(file)
+        return file
+
+    def window(self, low: float, high: float) -> tuple[int, int]:
+        """Find the first and last points of the axis within a window.
+
+        Parameters
+        ----------
+        low, high : float
+            The limits of the window, in the units of the axis, in any order.
+
+        Returns
+        -------
+        tuple[int, int]
+            The indices of the first and last points within the window.
+
+        Raises
+        ------
+        ValueError
+            If no point of the axis lies within the window.
+        """
+        points = self._lookup.window(low, high)
+        return points.start, points.stop - 1
+
+    def integrate(self, low: float, high: float) -> NDArray[np.float64]:
+        """Integrate every spectrum over a window of the axis.
+
+        Parameters
+        ----------
+        low, high : float
+            The limits of the window, in the units of the axis, in any order.
+
+        Returns
+        -------
+        NDArray[np.float64]
+            The integral of every spectrum between the first and last points of the axis within
+            the window, by the trapezoidal rule, of shape ``(n_spectra,)``.
+
+        Raises
+        ------
+        ValueError
+            If no point of the axis lies within the window.
+        """
+        first, last = self.window(low, high)
+        integrals: NDArray[np.float64] = np.asarray(self.cumulative[last] - self.cumulative[first])
+        return integrals
+
+
+def _integrate_chunks(
+    spectra: NDArray[Any],
+    half_steps: NDArray[np.float64],
+    cumulative: NDArray[np.float64],
+    chunk_size: int,
+) -> None:
+    """Write the running integrals of the spectra into the rows after the first, by chunks."""
+    for start in range(0, len(spectra), chunk_size):
+        chunk = np.asarray(spectra[start : start + chunk_size], dtype=np.float64)
+        areas = (chunk[:, :-1] + chunk[:, 1:]) * half_steps
+        np.cumsum(areas.T, axis=0, out=cumulative[1:, start : start + chunk_size])
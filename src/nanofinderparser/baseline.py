@@ -0,0 +1,591 @@
+"""Estimate and subtract the baseline of every spectrum of a mapping.
+
+Three estimators are available, each described by a small frozen dataclass holding its settings:
+
+- :class:`PolynomialBaseline`: a polynomial fitted iteratively under the spectrum, so that the
+  peaks are left out of the fit (the "modified polyfit" of Lieber and Mahadevan-Jansen).
+- :class:`AlsBaseline`: asymmetric least squares (Eilers and Boelens), a smooth curve that is
+  pulled under the peaks by weighting the points above it less than those below.
+- :class:`RollingBallBaseline`: a morphological opening of the spectrum (a rolling minimum, then
+  a rolling maximum) smoothed by a moving average, which follows baselines of any shape as long
+  as they are broader than the peaks.
+
+Every estimator works on a whole batch of spectra at once: the polynomial shares a single
+pseudo-inverse between all the spectra, the asymmetric least squares solves the banded systems of
+all the spectra together, and the rolling filters run in time independent of their width.
+:func:`subtract_baseline` applies an estimator to a mapping by chunks of spectra, in parallel
+processes when asked to, either in place or into a new mapping.
+
+Examples
+--------
+>>> from nanofinderparser import sample_mapping
+>>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+>>> corrected = subtract_baseline(mapping, AlsBaseline(smoothness=1e5))
+>>> corrected.data.shape == mapping.data.shape
+True
+"""
+
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Any, Protocol
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.models import Mapping
+from nanofinderparser.utils import DEFAULT_CHUNK_SIZE, resolve_jobs
+
+
+class BaselineMethod(Protocol):
+    """An estimator of the baseline of a batch of spectra."""
+
+    def estimate(self, axis: NDArray[np.float64], spectra: NDArray[np.float64]) -> NDArray[Any]:
+        """Estimate the baseline of every spectrum.
+
+        Parameters
+        ----------
+        axis : NDArray[np.float64]
+            The spectral axis, of shape ``(n_points,)``.
+        spectra : NDArray[np.float64]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        NDArray[Any]
+            The baselines, of the shape of `spectra`.
+        """
+        ...
+
+
+@dataclass(frozen=True, slots=True)
+class PolynomialBaseline:
+    """A polynomial fitted under the spectrum, leaving the peaks out.
+
+    The polynomial is fitted to the spectrum, then the spectrum is clipped to it, and so on: the
+    points above the polynomial (the peaks) are pulled down to it at every iteration, until the
+    polynomial stops moving.
+
+    Attributes
+    ----------
+    degree : int
+        Degree of the polynomial, by default 3.
+    max_iterations : int
+        Iterations after which the fit is stopped, by default 100.
+    tolerance : float
+        Change of the baseline between two iterations, relative to the range of the spectrum,
+        below which the fit has converged, by default 1e-3.
+    """
+
+    degree: int = 3
+    max_iterations: int = 100
+    tolerance: float = 1e-3
+
+    def estimate(self, axis: NDArray[np.float64], spectra: NDArray[np.float64]) -> NDArray[Any]:
+        """Estimate the baseline of every spectrum.
+
+        Parameters
+        ----------
+        axis : NDArray[np.float64]
+            The spectral axis, of shape ``(n_points,)``.
+        spectra : NDArray[np.float64]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        NDArray[Any]
+            The baselines, of the shape of `spectra`.
+
+        Raises
+        ------
+        ValueError
+            If the spectra hold fewer points than the polynomial has coefficients.
+        """
+        if axis.size <= self.degree:
+            msg = f"At least {self.degree + 1} points are needed for a polynomial of degree "
+            msg += f"{self.degree}."
+            raise ValueError(msg)
+
+        # The axis is rescaled to [-1, 1], which keeps the Vandermonde matrix well conditioned
+        low, high = float(axis.min()), float(axis.max())
+        scaled = (2 * axis - (low + high)) / ((high - low) or 1.0)
+        vandermonde = np.vander(scaled, self.degree + 1)
+        # Fitting every spectrum goes through the same pseudo-inverse, computed once
+        pseudo_inverse = np.linalg.pinv(vandermonde)
+
+        clipped = spectra.copy()
+        span = np.ptp(spectra, axis=1, keepdims=True)
+        threshold = self.tolerance * np.where(span > 0, span, 1.0)
+        baseline = (clipped @ pseudo_inverse.T) @ vandermonde.T
+        for _ in range(self.max_iterations):
+            np.minimum(clipped, baseline, out=clipped)
+            previous, baseline = baseline, (clipped @ pseudo_inverse.T) @ vandermonde.T
+            if (np.abs(baseline - previous) <= threshold).all():
+                break
+        return baseline
+
+
+@dataclass(frozen=True, slots=True)
+class AlsBaseline:
+    """Asymmetric least squares smoothing of the spectrum.
+
+    The baseline ``z`` minimizes ``sum(w * (y - z)**2) + smoothness * sum(diff(z, 2)**2)``, where
+    the weights ``w`` are `asymmetry` for the points above the baseline and ``1 - asymmetry`` for
+    those below, and are updated from the baseline of the previous iteration.
+
+    Attributes
+    ----------
+    smoothness : float
+        Weight of the smoothness of the baseline, by default 1e5. Typical values run from 1e2
+        to 1e9, larger for broader baselines.
+    asymmetry : float
+        Weight of the points above the baseline, by default 0.01. Typical values run from 0.001
+        to 0.1.
+    max_iterations : int
+        Iterations after which the fit is stopped, by default 10. A spectrum stops earlier when
+        its weights do not change any more.
+    """
+
+    smoothness: float = 1e5
+    asymmetry: float = 0.01
+    max_iterations: int = 10
+
+    def estimate(self, axis: NDArray[np.float64], spectra: NDArray[np.float64]) -> NDArray[Any]:
+        """Estimate the baseline of every spectrum.
+
+        Parameters
+        ----------
+        axis : NDArray[np.float64]
+            The spectral axis, of shape ``(n_points,)``. Only its size is used: the points are
+            taken as evenly spaced.
+        spectra : NDArray[np.float64]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        NDArray[Any]
+            The baselines, of the shape of `spectra`.
+
+        Raises
+        ------
+        ValueError
+            If the spectra hold fewer than 3 points, `asymmetry` is not between 0 and 1, or
+            `max_iterations` is less than 1.
+        """
+        n_points = spectra.shape[1]
+        if n_points < 3:  # noqa: PLR2004
+            msg = "At least 3 points are needed for an asymmetric least squares baseline."
+            raise ValueError(msg)
+        if not 0 < self.asymmetry < 1:
+            msg = f"The asymmetry must be between 0 and 1, got {self.asymmetry}."
+            raise ValueError(msg)
+        if self.max_iterations < 1:
+            msg = "At least one iteration is needed for an asymmetric least squares baseline."
+            raise ValueError(msg)
+
+        # The bands of smoothness * D.T @ D, D being the second differences, are shared by every
+        # spectrum; only the weights on the diagonal differ
+        diagonal, first, second = _second_difference_bands(n_points)
+        diagonal *= self.smoothness
+        first *= self.smoothness
+        second *= self.smoothness
+
+        # The solver walks along the points, so the spectra are laid out as columns for every
+        # step to work on a contiguous row
+        values = np.ascontiguousarray(spectra.T)
+        weights = np.ones_like(values)
+        baseline = np.empty_like(values)
+        # Spectra leave the batch once their weights stop changing: their baseline is final
+        batch = np.arange(values.shape[1])
+        for iteration in range(self.max_iterations):
+            fitted = _solve_pentadiagonal(
+                diagonal[:, None] + weights, first, second, weights * values
+            )
+            new_weights = np.where(values > fitted, self.asymmetry, 1 - self.asymmetry)
+            changed = (new_weights != weights).any(axis=0)
+            if iteration == self.max_iterations - 1:
+                changed[:] = False
+
+            if changed.all():
+                weights = new_weights
+                continue
+            baseline[:, batch[~changed]] = fitted[:, ~changed]
+            batch = batch[changed]
+            if batch.size == 0:
+                break
+            values = values[:, changed]
+            weights = new_weights[:, changed]
+        return baseline.T
+
+
+@dataclass(frozen=True, slots=True)
+class RollingBallBaseline:
+    """A rolling minimum and maximum of the spectrum, smoothed.
+
+    The spectrum is eroded (rolling minimum) and then dilated (rolling maximum) with windows of
+    the same width, which removes every feature narrower than the window and keeps the broader
+    ones; the result is smoothed by a moving average.
+
+    Attributes
+    ----------
+    radius : int
+        Half-width of the window, in points of the spectrum, by default 50. It must be larger
+        than the half-width of the broadest peak.
+    smoothing : int | None
+        Half-width of the moving average, in points, by default None (the radius). 0 disables it.
+    """
+
+    radius: int = 50
+    smoothing: int | None = None
+
+    def estimate(self, axis: NDArray[np.float64], spectra: NDArray[np.float64]) -> NDArray[Any]:
+        """Estimate the baseline of every spectrum.
+
+        Parameters
+        ----------
+        axis : NDArray[np.float64]
+            The spectral axis, of shape ``(n_points,)``. Only its size is used: the window is
+            counted in points.
+        spectra : NDArray[np.float64]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        NDArray[Any]
+            The baselines, of the shape of `spectra`.
+
+        Raises
+        ------
+        ValueError
+            If the radius or the smoothing are negative.
+        """
+        smoothing = self.radius if self.smoothing is None else self.smoothing
+        if self.radius < 0 or smoothing < 0:
+            msg = "The radius and the smoothing of a rolling ball cannot be negative."
+            raise ValueError(msg)
+
+        # The spectrum is extended beyond its ends first, so that the windows of the second
+        # filter near an end see what the first one found there, rather than its last value
+        margin = 2 * self.radius
+        extended = np.pad(spectra, ((0, 0), (margin, margin)), mode="edge")
+        eroded = _rolling(np.minimum, extended, self.radius)
+        opened = _rolling(np.maximum, eroded, self.radius)[:, margin : margin + spectra.shape[1]]
+        # The opening lies below the spectrum; smoothing could lift it above in places, which
+        # the minimum undoes
+        return np.minimum(_moving_average(opened, smoothing), spectra)
+
+
+def estimate_baseline(
+    mapping: Mapping,
+    method: BaselineMethod | None = None,
+    *,
+    channel: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    jobs: int = 1,
+) -> NDArray[np.float32]:
+    """Estimate the baseline of every spectrum of a mapping.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    method : BaselineMethod | None, optional
+        The estimator, by default None (an :class:`AlsBaseline` with its default settings).
+    channel : int, optional
+        The channel index, by default 0.
+    chunk_size : int, optional
+        Number of spectra processed together, by default 4096.
+    jobs : int, optional
+        Number of chunks processed at once, each in its own process, by default 1. 0 uses one
+        per CPU. Worth it for mappings of several chunks, where estimating the baselines
+        outweighs starting the processes.
+
+    Returns
+    -------
+    NDArray[np.float32]
+        The baselines, of the shape of :meth:`~nanofinderparser.models.Mapping.get_spectra`.
+    """
+    spectra = mapping.get_spectra(channel)
+    baselines = np.empty(spectra.shape, dtype=np.float32)
+    axis = mapping.get_spectral_axis(channel=channel)
+    for start, chunk_baselines in _chunk_baselines(axis, method, spectra, chunk_size, jobs):
+        baselines[start : start + chunk_size] = chunk_baselines
+    return baselines
+
+
+def subtract_baseline(  # noqa: PLR0913
+    mapping: Mapping,
+    method: BaselineMethod | None = None,
+    *,
+    inplace: bool = False,
+    channel: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    jobs: int = 1,
+) -> Mapping:
+    """Subtract the baseline of every spectrum of a mapping.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    method : BaselineMethod | None, optional
+        The estimator, by default None (an :class:`AlsBaseline` with its default settings).
+    inplace : bool, optional
+        Whether to modify the data of the mapping itself, by default False (a new mapping is
+        returned, sharing the metadata of the original one). Working in place avoids holding a
+        second copy of the data.
+    channel : int, optional
+        The channel index, by default 0.
+    chunk_size : int, optional
+        Number of spectra processed together, by default 4096.
+    jobs : int, optional
+        Number of chunks processed at once, each in its own process, by default 1. 0 uses one
+        per CPU. Worth it for mappings of several chunks, where estimating the baselines
+        outweighs starting the processes.
+
+    Returns
+    -------
+    Mapping
+        The mapping without its baselines: `mapping` itself when `inplace` is True.
+
+    Raises
+    ------
+    ValueError
+        If `inplace` is True and the data of the mapping is read-only, as when memory-mapped
+        by ``load_smd(file, lazy=True)``.
+    """
+    if inplace:
+        mapping.check_writeable()
+    result = mapping if inplace else mapping.with_data(mapping.data.copy())
+    spectra = result.get_spectra(channel)
+    axis = mapping.get_spectral_axis(channel=channel)
+    for start, baselines in _chunk_baselines(axis, method, spectra, chunk_size, jobs):
+        chunk = spectra[start : start + chunk_size]
+        chunk -= baselines.astype(chunk.dtype)
+    result.data_modified()
+    return result
+
+
+def _chunk_baselines(
+    axis: NDArray[np.float64],
+    method: BaselineMethod | None,
+    spectra: NDArray[Any],
+    chunk_size: int,
+    jobs: int,
+) -> Iterator[tuple[int, NDArray[np.float64]]]:
+    """Estimate the baselines of spectra by chunks, in parallel when asked to.
+
+    Yields the start of every chunk, in order, with the baselines of its spectra.
+    """
+    method = AlsBaseline() if method is None else method
+    starts = range(0, len(spectra), chunk_size)
+    chunks = (spectra[start : start + chunk_size] for start in starts)
+    workers = min(resolve_jobs(jobs), len(starts))
+    if workers <= 1:
+        yield from zip(
+            starts, map(_estimate_chunk, repeat(method), repeat(axis), chunks), strict=True
+        )
+        return
+
+    # The asymmetric least squares and the polynomial iterate over many small array operations,
+    # most of them holding the GIL, so threads estimate no faster than one; processes do, for
+    # the cost of sending them the chunks
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from zip(
+            starts, executor.map(_estimate_chunk, repeat(method), repeat(axis), chunks), strict=True
+        )
+
+
+def _estimate_chunk(
+    method: BaselineMethod, axis: NDArray[np.float64], chunk: NDArray[Any]
+) -> NDArray[np.float64]:
+    """Estimate the baselines of a chunk of spectra, in double precision."""
+    return method.estimate(axis, chunk.astype(np.float64))
+
+
+def _second_difference_bands(
+    n_points: int,
+) -> tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.float64]]:
+    """Bands of ``D.T @ D``, D being the matrix of the second differences of n points.
+
+    Parameters
+    ----------
+    n_points : int
+        Number of points, at least 3.
+
+    Returns
+    -------
+    tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.float64]]
+        The diagonal, of ``n_points`` values, and the first and second subdiagonals (equal to
+        the superdiagonals), of ``n_points - 1`` and ``n_points - 2`` values.
+
+    Examples
+    --------
+    >>> [band.tolist() for band in _second_difference_bands(5)]
+    [[1.0, 5.0, 6.0, 5.0, 1.0], [-2.0, -4.0, -4.0, -2.0], [1.0, 1.0, 1.0]]
+    >>> [band.tolist() for band in _second_difference_bands(3)]
+    [[1.0, 4.0, 1.0], [-2.0, -2.0], [1.0]]
+    """
+    # Row k of D holds the kernel at columns k to k + 2; the band at a given offset sums the
+    # products of the kernel with itself shifted by that offset, over the rows covering a column
+    kernel = np.array([1.0, -2.0, 1.0])
+    bands = []
+    for offset in range(3):
+        band = np.zeros(n_points - offset)
+        for start in range(3 - offset):
+            band[start : n_points - 2 + start] += kernel[start] * kernel[start + offset]
+        bands.append(band)
+    return bands[0], bands[1], bands[2]
+
+
+def _solve_pentadiagonal(
+    diagonal: NDArray[np.float64],
+    first: NDArray[np.float64],
+    second: NDArray[np.float64],
+    rhs: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    """Solve symmetric pentadiagonal systems, one per column, by an LDL factorization.
+
+    Parameters
+    ----------
+    diagonal : NDArray[np.float64]
+        The diagonal of every system, of shape ``(n_points, n_systems)``.
+    first, second : NDArray[np.float64]
+        The first and second subdiagonals, shared by every system, of ``n_points - 1`` and
+        ``n_points - 2`` values.
+    rhs : NDArray[np.float64]
+        The right-hand sides, of shape ``(n_points, n_systems)``.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The solutions, of shape ``(n_points, n_systems)``.
+
+    Notes
+    -----
+    The factorization is a recurrence along the points, so it is a loop over them; every step
+    works on all the systems at once, which is what makes a batch of spectra fast to solve.
+
+    Examples
+    --------
+    >>> matrix = np.diag([4.0, 5.0, 6.0]) + np.diag([1.0, 1.0], 1) + np.diag([1.0, 1.0], -1)
+    >>> matrix += np.diag([0.5], 2) + np.diag([0.5], -2)
+    >>> rhs = np.array([[1.0], [2.0], [3.0]])
+    >>> np.allclose(
+    ...     matrix @ _solve_pentadiagonal(np.diag(matrix)[:, None], np.ones(2), [0.5], rhs), rhs
+    ... )
+    True
+    """
+    # Every step works on a row, which must be contiguous for the loop to be fast
+    diagonal = np.ascontiguousarray(diagonal)
+    rhs = np.ascontiguousarray(rhs)
+    n_points = len(diagonal)
+    d = np.empty_like(diagonal)
+    l1 = np.zeros_like(diagonal)
+    l2 = np.zeros_like(diagonal)
+    z = np.empty_like(rhs)
+
+    # L D L.T = A, with unit lower L of subdiagonals l1 and l2; and L z = rhs on the way
+    for i in range(n_points):
+        d[i] = diagonal[i]
+        z[i] = rhs[i]
+        if i >= 1:
+            d[i] -= l1[i - 1] ** 2 * d[i - 1]
+            z[i] -= l1[i - 1] * z[i - 1]
+        if i >= 2:  # noqa: PLR2004
+            d[i] -= l2[i - 2] ** 2 * d[i - 2]
+            z[i] -= l2[i - 2] * z[i - 2]
+        if i < n_points - 1:
+            l1[i] = first[i]
+            if i >= 1:
+                l1[i] -= l2[i - 1] * l1[i - 1] * d[i - 1]
+            l1[i] /= d[i]
+        if i < n_points - 2:
+            l2[i] = second[i] / d[i]
+
+    # D L.T x = z
+    z /= d
+    for i in range(n_points - 2, -1, -1):
+        z[i] -= l1[i] * z[i + 1]
+        if i < n_points - 2:
+            z[i] -= l2[i] * z[i + 2]
+    return z
+
+
+def _rolling(reduce: np.ufunc, values: NDArray[np.float64], radius: int) -> NDArray[np.float64]:
+    """Take the rolling minimum or maximum along the last axis, over ``2 * radius + 1`` points.
+
+    The van Herk/Gil-Werman algorithm takes a few operations per point whatever the width of the
+    window: the values are split into blocks of the width of the window, and the reduction over
+    any window is that of the end of one block and the start of the next.
+
+    Parameters
+    ----------
+    reduce : np.ufunc
+        ``np.minimum`` or ``np.maximum``.
+    values : NDArray[np.float64]
+        The values, of shape ``(n_spectra, n_points)``.
+    radius : int
+        Half-width of the window. The values are extended by their first and last one at the
+        edges.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The rolling reduction, of the shape of `values`.
+
+    Examples
+    --------
+    >>> _rolling(np.minimum, np.array([[3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0]]), 1)
+    array([[1., 1., 1., 1., 1., 2., 2.]])
+    """
+    if radius == 0:
+        return values.copy()
+
+    width = 2 * radius + 1
+    n_spectra, n_points = values.shape
+    n_blocks = -(-(n_points + 2 * radius) // width)
+    padded = np.pad(
+        values, ((0, 0), (radius, n_blocks * width - n_points - radius)), mode="edge"
+    ).reshape(n_spectra, n_blocks, width)
+
+    # Reductions from the start of each block up to every point, and from every point to its end
+    prefix = reduce.accumulate(padded, axis=2).reshape(n_spectra, -1)
+    suffix = reduce.accumulate(padded[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_spectra, -1)
+    rolled: NDArray[np.float64] = reduce(
+        suffix[:, :n_points], prefix[:, width - 1 : width - 1 + n_points]
+    )
+    return rolled
+
+
+def _moving_average(values: NDArray[np.float64], radius: int) -> NDArray[np.float64]:
+    """Average the values along the last axis, over windows of ``2 * radius + 1`` points.
+
+    Parameters
+    ----------
+    values : NDArray[np.float64]
+        The values, of shape ``(n_spectra, n_points)``.
+    radius : int
+        Half-width of the window. The values are extended by their first and last one at the
+        edges.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The averages, of the shape of `values`.
+
+    Examples
+    --------
+    >>> _moving_average(np.array([[0.0, 3.0, 0.0, 3.0]]), 1)
+    array([[1., 1., 2., 2.]])
+    """
+    if radius == 0:
+        return values.copy()
+
+    width = 2 * radius + 1
+    padded = np.pad(values, ((0, 0), (radius + 1, radius)), mode="edge")
+    padded[:, 0] = 0.0
+    cumulative = np.cumsum(padded, axis=1)
+    averages: NDArray[np.float64] = (cumulative[:, width:] - cumulative[:, :-width]) / width
+    return averages
@@ -1,5 +1,7 @@
 """Console script for nanofinderparser."""
 
+import time
+from functools import partial
 from pathlib import Path
 from typing import Annotated
 
@@ -9,8 +11,21 @@ from rich.progress import Progress
 from rich.table import Table
 
 from nanofinderparser import load_mdt_file, load_smd
+from nanofinderparser.convert import (
+    ConversionResult,
+    ConversionSummary,
+    Converter,
+    ExportFormat,
+    Manifest,
+    convert_files,
+    mdt_to_csv,
+    smd_to_csv,
+    smd_to_envi,
+    smd_to_npy,
+)
 from nanofinderparser.units import Units
-from nanofinderparser.utils import SaveMapCoords
+from nanofinderparser.utils import SaveMapCoords, resolve_jobs
+from nanofinderparser.watch import DEFAULT_POLL_INTERVAL, WatchedFormat, watch_folder
 
 # Using "Optional" as typer doesn't accept "X | Y" notation
 
@@ -21,15 +36,125 @@ app = typer.Typer(
 )
 console = Console()
 
+_MB = 1e6
+
+
+def _smd_options(
+    units: Units, save_mapcoords: SaveMapCoords, export_format: ExportFormat = ExportFormat.csv
+) -> dict[str, str]:
+    """Options of the conversion of SMD files, as the manifest records them."""
+    if export_format is not ExportFormat.csv:
+        # The format is left out of conversions to CSV, so that manifests written before it was
+        # an option still match them
+        return {"command": "convert", "units": units.value, "format": export_format.value}
+    return {"command": "convert", "units": units.value, "save_mapcoords": save_mapcoords.value}
+
+
+def _mdt_options(units: Units, combined: bool, maps: bool) -> dict[str, str]:
+    """Options of the conversion of MDT files, as the manifest records them."""
+    return {
+        "command": "convert-mdt",
+        "units": units.value,
+        "combined": str(combined),
+        "maps": str(maps),
+    }
+
+
+def _convert(  # noqa: PLR0913
+    convert: Converter,
+    files: list[Path],
+    jobs: int,
+    *,
+    manifest: Manifest | None = None,
+    options: dict[str, str] | None = None,
+    force: bool = False,
+) -> None:
+    """Convert files, reporting the progress, the failures and the throughput.
+
+    Parameters
+    ----------
+    convert : Converter
+        Converts a single file; see :func:`~nanofinderparser.convert.convert_files`.
+    files : list[Path]
+        The files to convert.
+    jobs : int
+        Number of processes converting files at once; 0 uses one per CPU.
+    manifest : Manifest | None, optional
+        Manifest of the output folder, to convert only the files that changed since they were
+        last converted, and to record those converted now. By default None (convert every file).
+    options : dict[str, str] | None, optional
+        The options of the conversion, as the manifest records them.
+    force : bool, optional
+        Convert every file even if the manifest holds it as up to date, by default False.
+
+    Raises
+    ------
+    typer.Exit
+        With code 1, once every file has been tried, if any of them could not be converted.
+    """
+    options = options or {}
+    if manifest is not None and not force:
+        pending = [file for file in files if not manifest.is_current(file, options)]
+        if len(pending) < len(files):
+            # Remember the files found unchanged through their hash
+            manifest.save()
+            console.print(
+                f"[yellow]Skipping {len(files) - len(pending)} file(s) converted already and "
+                "unchanged since (use --force to convert them again).[/yellow]"
+            )
+        if not pending:
+            console.print("[green]Every file is up to date.[/green]")
+            return
+        files = pending
+
+    results: list[ConversionResult] = []
+    start = time.perf_counter()
+    try:
+        with Progress(console=console) as progress:
+            task = progress.add_task("[cyan]Converting files...", total=len(files))
+            for result in convert_files(convert, files, jobs=jobs, digest=manifest is not None):
+                results.append(result)
+                if manifest is not None:
+                    manifest.record(result, options)
+                progress.update(task, advance=1)
+                if result.ok:
+                    console.print(f"[green]Converted {result.file}[/green]")
+                else:
+                    console.print(f"[red]Error converting '{result.file}': {result.error}[/red]")
+    finally:
+        # Keep the files converted until then, even when interrupted
+        if manifest is not None:
+            manifest.flush()
+
+    summary = ConversionSummary.from_results(results, time.perf_counter() - start)
+    workers = min(resolve_jobs(jobs), len(files))
+    console.print(
+        f"[green]Successfully wrote {summary.outputs} file(s) from {summary.converted} "
+        f"file(s) in {summary.seconds:.2f} s ({summary.throughput / _MB:.1f} MB/s, "
+        f"{summary.files_per_second:.1f} files/s, {workers} job(s))[/green]"
+    )
+
+    failures = [result for result in results if not result.ok]
+    if failures:
+        table = Table(title=f"{len(failures)} file(s) could not be converted")
+        table.add_column("File", style="cyan")
+        table.add_column("Error", style="red")
+        for result in failures:
+            table.add_row(str(result.file), result.error)
+        console.print(table)
+        raise typer.Exit(code=1)
+
 
 @app.command(
     "convert",
-    short_help="Convert a SMD file(s) to CSV.",
+    short_help="Convert a SMD file(s) to CSV, ENVI or NPY.",
     no_args_is_help=True,
 )
-def convert_smd(
+def convert_smd(  # noqa: PLR0913, PLR0917
     input_path: Annotated[Path, typer.Argument(..., help="Path to the SMD file or folder")],
-    output: Annotated[Path | None, typer.Argument(help="Output folder for CSV file(s)")] = None,
+    output: Annotated[
+        Path | None, typer.Argument(help="Output folder for the converted file(s)")
+    ] = None,
     units: Annotated[
         Units, typer.Option(case_sensitive=False, help="Units for the spectral axis")
     ] = Units.raman_shift,
@@ -37,11 +162,41 @@ def convert_smd(
         SaveMapCoords,
         typer.Option(..., case_sensitive=False, help="How to save mapping coordinates"),
     ] = SaveMapCoords.combined,
+    export_format: Annotated[
+        ExportFormat,
+        typer.Option("--format", "-f", case_sensitive=False, help="Format of the files written"),
+    ] = ExportFormat.csv,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=0, help="Files converted in parallel; 0 uses every CPU"),
+    ] = 1,
+    incremental: Annotated[
+        bool,
+        typer.Option(help="Only convert files that are new or changed since the last conversion"),
+    ] = False,
+    force: Annotated[
+        bool,
+        typer.Option(help="With --incremental, convert every file again and renew the manifest"),
+    ] = False,
 ) -> None:
-    """Convert SMD file(s) to CSV format.
+    """Convert SMD file(s) to CSV, ENVI or NPY format.
+
+    If input is a folder, converts all SMD files in the folder. A file that cannot be converted
+    does not stop the others; the failures are listed at the end.
 
-    If input is a folder, converts all SMD files in the folder.
+    With --format envi, each file is written as an ENVI cube interleaved by pixel (.bip) and its
+    header (.hdr); with --format npy, as a NumPy array of shape (y, x, n_points) (.npy) and its
+    metadata (.json). Either way the data block is copied from the SMD file as it is, and
+    --save-mapcoords does not apply, the header or the metadata holding the map coordinates.
+
+    With --incremental, a manifest of the files converted is kept in the output folder, and only
+    the files that are new, have changed or were converted with other options are converted;
+    --force, which only applies with it, converts them all again.
     """
+    if force and not incremental:
+        msg = "--force only applies with --incremental"
+        raise typer.BadParameter(msg, param_hint="--force")
+
     if input_path.is_file():
         files_to_convert = [input_path]
     elif input_path.is_dir():
@@ -54,28 +209,29 @@ def convert_smd(
         console.print("[yellow]No SMD files found in the specified directory.[/yellow]")
         return
 
-    output_dir = output or input_path.parent if input_path.is_file() else input_path
+    output_dir = output or (input_path.parent if input_path.is_file() else input_path)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    with Progress() as progress:
-        task = progress.add_task("[cyan]Converting files...", total=len(files_to_convert))
-        try:
-            for file in files_to_convert:
-                mapping = load_smd(file)
-                output_file = output_dir / file.with_suffix(".csv").name
-
-                mapping.to_csv(
-                    path=output_dir,
-                    filename=output_file.name,
-                    spectral_units=units.value,
-                    save_mapcoords=save_mapcoords.value,
-                )
-                progress.update(task, advance=1)
-                console.print(f"[green]Converted {file} to {output_file}[/green]")
-            console.print(f"[green]Successfully converted {len(files_to_convert)} file(s)[/green]")
-        except Exception as e:
-            console.print(f"[red]Error converting '{file}': {e}[/red]")
-            raise typer.Exit(code=1) from e
+    convert: Converter
+    if export_format is ExportFormat.envi:
+        convert = partial(smd_to_envi, output_dir=output_dir, spectral_units=units)
+    elif export_format is ExportFormat.npy:
+        convert = partial(smd_to_npy, output_dir=output_dir, spectral_units=units)
+    else:
+        convert = partial(
+            smd_to_csv,
+            output_dir=output_dir,
+            spectral_units=units,
+            save_mapcoords=save_mapcoords,
+        )
+    _convert(
+        convert,
+        files_to_convert,
+        jobs,
+        manifest=Manifest.load(output_dir) if incremental else None,
+        options=_smd_options(units, save_mapcoords, export_format),
+        force=force,
+    )
 
 
 @app.command(
@@ -124,7 +280,7 @@ def info(file: Annotated[Path, typer.Argument(..., help="Path to the SMD file")]
     short_help="Convert a MDT file(s) of individual spectra to CSV.",
     no_args_is_help=True,
 )
-def convert_mdt(
+def convert_mdt(  # noqa: PLR0913, PLR0917
     input_path: Annotated[Path, typer.Argument(..., help="Path to the MDT file or folder")],
     output: Annotated[Path | None, typer.Argument(help="Output folder for CSV file(s)")] = None,
     units: Annotated[
@@ -134,13 +290,34 @@ def convert_mdt(
         bool, typer.Option(help="Write all the spectra of a file to a single CSV")
     ] = False,
     maps: Annotated[bool, typer.Option(help="Also export the 2-D maps stored in the file")] = False,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=0, help="Files converted in parallel; 0 uses every CPU"),
+    ] = 1,
+    incremental: Annotated[
+        bool,
+        typer.Option(help="Only convert files that are new or changed since the last conversion"),
+    ] = False,
+    force: Annotated[
+        bool,
+        typer.Option(help="With --incremental, convert every file again and renew the manifest"),
+    ] = False,
 ) -> None:
     """Convert MDT file(s) to CSV format.
 
     If input is a folder, converts all MDT files in the folder. Each spectrum is written to its
     own CSV unless --combined is given, since spectra in the same file may have been recorded
-    over different spectral axes.
+    over different spectral axes. A file that cannot be converted does not stop the others; the
+    failures are listed at the end.
+
+    With --incremental, a manifest of the files converted is kept in the output folder, and only
+    the files that are new, have changed or were converted with other options are converted;
+    --force, which only applies with it, converts them all again.
     """
+    if force and not incremental:
+        msg = "--force only applies with --incremental"
+        raise typer.BadParameter(msg, param_hint="--force")
+
     if input_path.is_file():
         files_to_convert = [input_path]
     elif input_path.is_dir():
@@ -156,31 +333,21 @@ def convert_mdt(
     output_dir = output or (input_path.parent if input_path.is_file() else input_path)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    with Progress() as progress:
-        task = progress.add_task("[cyan]Converting files...", total=len(files_to_convert))
-        try:
-            written = 0
-            for file in files_to_convert:
-                spectra, images = load_mdt_file(file)
-                written += len(
-                    spectra.to_csv(
-                        path=output_dir,
-                        filename=file.stem,
-                        spectral_units=units.value,
-                        combined=combined,
-                    )
-                )
-                if maps:
-                    written += len(images.to_csv(output_dir, filename=file.stem))
-                progress.update(task, advance=1)
-                console.print(f"[green]Converted {file}[/green]")
-            console.print(
-                f"[green]Successfully wrote {written} CSV file(s) "
-                f"from {len(files_to_convert)} MDT file(s)[/green]"
-            )
-        except Exception as e:
-            console.print(f"[red]Error converting '{file}': {e}[/red]")
-            raise typer.Exit(code=1) from e
+    convert = partial(
+        mdt_to_csv,
+        output_dir=output_dir,
+        spectral_units=units,
+        combined=combined,
+        maps=maps,
+    )
+    _convert(
+        convert,
+        files_to_convert,
+        jobs,
+        manifest=Manifest.load(output_dir) if incremental else None,
+        options=_mdt_options(units, combined, maps),
+        force=force,
+    )
 
 
 @app.command("info-mdt", no_args_is_help=True)
@@ -227,6 +394,91 @@ def info_mdt(file: Annotated[Path, typer.Argument(..., help="Path to the MDT fil
         raise typer.Exit(code=1) from e
 
 
+@app.command(no_args_is_help=True)
+def watch(  # noqa: PLR0913, PLR0917
+    folder: Annotated[Path, typer.Argument(..., help="Folder the instrument saves files into")],
+    output: Annotated[Path | None, typer.Argument(help="Output folder for CSV file(s)")] = None,
+    units: Annotated[
+        Units, typer.Option(case_sensitive=False, help="Units for the spectral axis")
+    ] = Units.raman_shift,
+    save_mapcoords: Annotated[
+        SaveMapCoords,
+        typer.Option(case_sensitive=False, help="How to save mapping coordinates of SMD files"),
+    ] = SaveMapCoords.combined,
+    combined: Annotated[
+        bool, typer.Option(help="Write all the spectra of an MDT file to a single CSV")
+    ] = False,
+    maps: Annotated[
+        bool, typer.Option(help="Also export the 2-D maps stored in MDT files")
+    ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=0, help="Files converted in parallel; 0 uses every CPU"),
+    ] = 1,
+    poll_interval: Annotated[
+        float, typer.Option(min=0.05, help="Seconds between two scans of the folder")
+    ] = DEFAULT_POLL_INTERVAL,
+    timeout: Annotated[
+        float | None, typer.Option(min=0, help="Stop watching after this many seconds")
+    ] = None,
+) -> None:
+    """Convert SMD and MDT files to CSV as the instrument writes them into a folder.
+
+    A file is converted once its size has stopped changing and it holds all the data its header
+    declares. Every file is converted once: a manifest of the files converted is kept in the
+    output folder, as with convert --incremental, so restarting the command does not convert
+    them again. Stop watching with Ctrl+C.
+    """
+    if not folder.is_dir():
+        msg = "The folder to watch must be an existing directory"
+        raise typer.BadParameter(msg)
+
+    output_dir = output or folder
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    formats = {
+        ".smd": WatchedFormat(
+            partial(
+                smd_to_csv,
+                output_dir=output_dir,
+                spectral_units=units,
+                save_mapcoords=save_mapcoords,
+            ),
+            _smd_options(units, save_mapcoords),
+        ),
+        ".mdt": WatchedFormat(
+            partial(
+                mdt_to_csv,
+                output_dir=output_dir,
+                spectral_units=units,
+                combined=combined,
+                maps=maps,
+            ),
+            _mdt_options(units, combined, maps),
+        ),
+    }
+
+    console.print(f"[cyan]Watching {folder} for SMD and MDT files (Ctrl+C to stop)...[/cyan]")
+    converted = failed = 0
+    try:
+        for result in watch_folder(
+            folder, output_dir, formats, jobs=jobs, poll_interval=poll_interval, timeout=timeout
+        ):
+            if result.ok:
+                converted += 1
+                console.print(
+                    f"[green]Converted {result.file} in {result.seconds:.2f} s "
+                    f"({len(result.outputs)} CSV file(s))[/green]"
+                )
+            else:
+                failed += 1
+                console.print(f"[red]Error converting '{result.file}': {result.error}[/red]")
+    except KeyboardInterrupt:
+        console.print("[yellow]Stopped watching.[/yellow]")
+
+    console.print(f"[green]Converted {converted} file(s); {failed} could not be converted.[/green]")
+
+
 # ??? Is this needed? Conversion back to a SMD is not straightforward
 @app.command()
 def export_smd(
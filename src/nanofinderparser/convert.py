@@ -0,0 +1,608 @@
+"""Convert NanoFinder files to CSV, ENVI or NPY, one file at a time or several in parallel.
+
+The command line converts whole folders with the functions of this module. Each file is
+converted independently of the others, so they can be spread over a pool of processes: parsing a
+file and formatting its CSV are bound by the CPU, and a single process converts one file at a
+time however many cores the machine has.
+
+A file that cannot be converted does not stop the others; its failure is reported in its
+:class:`ConversionResult`, along with what was written for every other file.
+
+Folders converted over and over, where only a few files are new each time, are converted
+incrementally with a :class:`Manifest`: a record, kept in the output folder, of every file
+converted, what its content was and what was written from it. Only the files that are new, have
+changed or were converted with other options need converting again.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from enum import StrEnum
+from pathlib import Path
+from typing import Any, Final, Self
+
+from nanofinderparser.load import load_mdt_file, load_smd
+from nanofinderparser.units import Units
+from nanofinderparser.utils import SaveMapCoords, resolve_jobs
+
+logger = logging.getLogger(__name__)
+
+type Converter = Callable[[Path], list[Path]]
+
+# Name of the manifest of incremental conversions, in the output folder.
+MANIFEST_NAME: Final[str] = ".nanofinderparser-manifest.json"
+
+# Version of the layout of the manifest; a manifest of another version is started afresh.
+_MANIFEST_VERSION: Final[int] = 1
+
+# Seconds between two writes of the manifest while files are recorded. Each write serialises
+# every entry, so writing after every file would cost time quadratic in the number of files.
+MANIFEST_SAVE_INTERVAL: Final[float] = 10.0
+
+
+class ExportFormat(StrEnum):
+    """Formats SMD files are converted to."""
+
+    csv = "csv"
+    envi = "envi"
+    npy = "npy"
+
+
+@dataclass(frozen=True, slots=True)
+class ConversionResult:
+    """The outcome of converting a single file.
+
+    Attributes
+    ----------
+    file : Path
+        The file converted.
+    outputs : tuple[Path, ...]
+        The files written, empty when the conversion failed.
+    nbytes : int
+        Size of the file converted, in bytes.
+    seconds : float
+        Wall time the conversion took, in the process that ran it.
+    error : str | None
+        Why the conversion failed, or None when it succeeded.
+    mtime_ns : int
+        Modification time of the file when it was read, in nanoseconds.
+    sha256 : str | None
+        Hash of the content of the file, when asked for.
+    """
+
+    file: Path
+    outputs: tuple[Path, ...] = ()
+    nbytes: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+    mtime_ns: int = 0
+    sha256: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the file was converted."""
+        return self.error is None
+
+
+@dataclass(frozen=True, slots=True)
+class ConversionSummary:
+    """Totals of the conversion of several files.
+
+    Attributes
+    ----------
+    converted : int
+        Files converted.
+    failed : int
+        Files that could not be converted.
+    outputs : int
+        Files written.
+    nbytes : int
+        Size of the files converted, in bytes.
+    seconds : float
+        Wall time of the whole conversion.
+    """
+
+    converted: int
+    failed: int
+    outputs: int
+    nbytes: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes converted per second of wall time."""
+        return self.nbytes / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        """Files converted per second of wall time."""
+        return self.converted / self.seconds if self.seconds > 0 else 0.0
+
+    @classmethod
+    def from_results(cls, results: Sequence[ConversionResult], seconds: float) -> Self:
+        """Add up the results of a conversion.
+
+        Parameters
+        ----------
+        results : Sequence[ConversionResult]
+            The result of every file.
+        seconds : float
+            Wall time of the whole conversion.
+
+        Returns
+        -------
+        ConversionSummary
+            The totals.
+        """
+        succeeded = [result for result in results if result.ok]
+        return cls(
+            converted=len(succeeded),
+            failed=len(results) - len(succeeded),
+            outputs=sum(len(result.outputs) for result in succeeded),
+            nbytes=sum(result.nbytes for result in succeeded),
+            seconds=seconds,
+        )
+
+
+def smd_to_csv(
+    file: Path,
+    output_dir: Path,
+    spectral_units: Units = Units.raman_shift,
+    save_mapcoords: SaveMapCoords = SaveMapCoords.combined,
+) -> list[Path]:
+    """Convert an SMD file to CSV.
+
+    Parameters
+    ----------
+    file : Path
+        The SMD file to convert.
+    output_dir : Path
+        Folder in which the CSV file(s) are written, named after the SMD file.
+    spectral_units : Units, optional
+        Units of the spectral axis, by default Raman shift.
+    save_mapcoords : SaveMapCoords, optional
+        How to save the mapping coordinates, by default in the same file as the data.
+
+    Returns
+    -------
+    list[Path]
+        The files written.
+    """
+    return load_smd(file).to_csv(
+        path=output_dir,
+        filename=file.with_suffix(".csv").name,
+        spectral_units=spectral_units,
+        save_mapcoords=save_mapcoords,
+    )
+
+
+def smd_to_envi(
+    file: Path,
+    output_dir: Path,
+    spectral_units: Units = Units.raman_shift,
+) -> list[Path]:
+    """Convert an SMD file to an ENVI file, interleaved by pixel (BIP).
+
+    The file is memory-mapped rather than read, and its data block copied by the kernel where
+    the system allows it; see :func:`~nanofinderparser.export.write_envi`.
+
+    Parameters
+    ----------
+    file : Path
+        The SMD file to convert.
+    output_dir : Path
+        Folder in which the ENVI file and its header are written, named after the SMD file.
+    spectral_units : Units, optional
+        Units of the wavelengths of the header, by default Raman shift.
+
+    Returns
+    -------
+    list[Path]
+        The files written.
+    """
+    return load_smd(file, lazy=True).to_envi(
+        output_dir / file.with_suffix(".bip").name, spectral_units=spectral_units
+    )
+
+
+def smd_to_npy(
+    file: Path,
+    output_dir: Path,
+    spectral_units: Units = Units.raman_shift,
+) -> list[Path]:
+    """Convert an SMD file to a NumPy ``.npy`` file, with its metadata in a JSON sidecar.
+
+    The file is memory-mapped rather than read, and its data block copied by the kernel where
+    the system allows it; see :func:`~nanofinderparser.export.write_npy`.
+
+    Parameters
+    ----------
+    file : Path
+        The SMD file to convert.
+    output_dir : Path
+        Folder in which the array and its metadata are written, named after the SMD file.
+    spectral_units : Units, optional
+        Units of the spectral axis of the metadata, by default Raman shift.
+
+    Returns
+    -------
+    list[Path]
+        The files written.
+    """
+    return load_smd(file, lazy=True).to_npy(
+        output_dir / file.with_suffix(".npy").name, spectral_units=spectral_units
+    )
+
+
+def mdt_to_csv(
+    file: Path,
+    output_dir: Path,
+    spectral_units: Units = Units.raman_shift,
+    combined: bool = False,
+    maps: bool = False,
+) -> list[Path]:
+    """Convert the spectra of an MDT file, and optionally its 2-D maps, to CSV.
+
+    Parameters
+    ----------
+    file : Path
+        The MDT file to convert.
+    output_dir : Path
+        Folder in which the CSV files are written, named after the MDT file.
+    spectral_units : Units, optional
+        Units of the spectral axis, by default Raman shift.
+    combined : bool, optional
+        Write all the spectra to a single file, by default False (one file per spectrum).
+    maps : bool, optional
+        Also write the 2-D maps of the file, by default False.
+
+    Returns
+    -------
+    list[Path]
+        The files written.
+    """
+    spectra, images = load_mdt_file(file)
+    written = spectra.to_csv(
+        path=output_dir, filename=file.stem, spectral_units=spectral_units, combined=combined
+    )
+    if maps:
+        written += images.to_csv(output_dir, filename=file.stem)
+    return written
+
+
+def file_digest(file: Path) -> str:
+    """Hash the content of a file.
+
+    Parameters
+    ----------
+    file : Path
+        The file to hash.
+
+    Returns
+    -------
+    str
+        The SHA-256 hash of the file, in hexadecimal.
+    """
+    with file.open("rb") as stream:
+        return hashlib.file_digest(stream, "sha256").hexdigest()
+
+
+def convert_one(convert: Converter, file: Path, digest: bool = False) -> ConversionResult:
+    """Convert a file, turning a failure into a result rather than an exception.
+
+    This is what :func:`convert_files` and :func:`~nanofinderparser.watch.watch_folder` run in
+    their worker processes, so it lives at module level to be pickled. The file is described
+    before it is converted, so that a file that changes while being converted no longer matches
+    its description afterwards.
+
+    Parameters
+    ----------
+    convert : Converter
+        The conversion to apply, such as :func:`smd_to_csv` with its options bound.
+    file : Path
+        The file to convert.
+    digest : bool, optional
+        Whether to record the SHA-256 hash of the file, by default False.
+
+    Returns
+    -------
+    ConversionResult
+        The outputs written and the time taken, or the error that stopped the conversion.
+    """
+    start = time.perf_counter()
+    try:
+        stat = file.stat()
+        sha256 = file_digest(file) if digest else None
+        outputs = convert(file)
+    except Exception as e:
+        logger.debug("Could not convert %s.", file, exc_info=True)
+        return ConversionResult(
+            file=file, seconds=time.perf_counter() - start, error=f"{type(e).__name__}: {e}"
+        )
+    return ConversionResult(
+        file=file,
+        outputs=tuple(outputs),
+        nbytes=stat.st_size,
+        seconds=time.perf_counter() - start,
+        mtime_ns=stat.st_mtime_ns,
+        sha256=sha256,
+    )
+
+
+def convert_files(
+    convert: Converter, files: Sequence[Path], jobs: int = 1, *, digest: bool = False
+) -> Iterator[ConversionResult]:
+    """Convert several files, in parallel when asked to.
+
+    Parameters
+    ----------
+    convert : Callable[[Path], list[Path]]
+        Converts a single file and returns the files written, such as :func:`smd_to_csv` with its
+        options bound by :func:`functools.partial`. With several jobs it is sent to the worker
+        processes, so it must be picklable: a module-level function, or a partial of one.
+    files : Sequence[Path]
+        The files to convert.
+    jobs : int, optional
+        Number of processes converting files at once, by default 1 (convert them one after
+        another in the calling process). 0 uses one process per CPU.
+    digest : bool, optional
+        Also hash the content of every file, as a :class:`Manifest` records it, by default False.
+        The files are hashed by the processes converting them.
+
+    Yields
+    ------
+    ConversionResult
+        The result of every file, as soon as its conversion ends. Files are reported in the order
+        given when converted one after another, and in the order they complete otherwise.
+
+    Examples
+    --------
+    >>> from functools import partial
+    >>> convert = partial(smd_to_csv, output_dir=Path("csv"))
+    >>> files = sorted(Path("smd").glob("*.smd"))
+    >>> failed = [r for r in convert_files(convert, files, jobs=4) if not r.ok]  # doctest: +SKIP
+    """
+    jobs = min(resolve_jobs(jobs), len(files))
+
+    if jobs <= 1:
+        for file in files:
+            yield convert_one(convert, file, digest)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(convert_one, convert, file, digest): file for file in files}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:  # noqa: BLE001
+                # The worker itself died (e.g. killed by the system for using too much memory)
+                yield ConversionResult(file=futures[future], error=f"{type(e).__name__}: {e}")
+
+
+# ---------------------------------------------------------------------------------------------
+# Incremental conversion
+# ---------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class ManifestEntry:
+    """What the manifest knows of a file converted.
+
+    Attributes
+    ----------
+    size : int
+        Size of the file when it was converted, in bytes.
+    mtime_ns : int
+        Modification time of the file when it was converted, in nanoseconds.
+    sha256 : str
+        Hash of the content of the file when it was converted.
+    outputs : tuple[str, ...]
+        The files written from it, relative to the folder of the manifest when inside it.
+    options : dict[str, str]
+        The options it was converted with.
+    """
+
+    size: int
+    mtime_ns: int
+    sha256: str
+    outputs: tuple[str, ...] = ()
+    options: dict[str, str] = field(default_factory=dict)
+
+
+class Manifest:
+    """Record of the files converted into a folder, to convert only what changed since.
+
+    A file is up to date when it was converted with the same options, every file written from
+    it still exists, and its content is the same. The content is compared through the size and
+    modification time of the file first, and only when those differ through its hash, so that
+    checking a folder of unchanged files reads none of them, and a file that was merely touched
+    or copied is not converted again.
+
+    The manifest is written to the folder at most every :data:`MANIFEST_SAVE_INTERVAL` seconds
+    while files are recorded, replacing the previous one in a single step. Writing it once more
+    when a run ends, even by an interruption, as with ``try: ... finally: manifest.save()``,
+    leaves a valid manifest listing every file converted until then: the next run resumes with
+    the rest.
+
+    Parameters
+    ----------
+    folder : Path
+        The output folder of the conversions. The manifest is kept in it, as
+        :data:`MANIFEST_NAME`.
+
+    Examples
+    --------
+    >>> manifest = Manifest.load(Path("csv"))  # doctest: +SKIP
+    >>> options = {"spectral_units": "nm"}
+    >>> pending = [f for f in files if not manifest.is_current(f, options)]  # doctest: +SKIP
+    """
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = Path(folder)
+        self.entries: dict[str, ManifestEntry] = {}
+        # Files recorded since the manifest was last written, and when it was
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    @property
+    def path(self) -> Path:
+        """Path of the manifest file."""
+        return self.folder / MANIFEST_NAME
+
+    @classmethod
+    def load(cls, folder: Path) -> Self:
+        """Read the manifest of a folder.
+
+        Parameters
+        ----------
+        folder : Path
+            The output folder of the conversions.
+
+        Returns
+        -------
+        Manifest
+            The manifest of the folder; empty when the folder has none yet, or when it cannot be
+            read, in which case every file is converted again.
+        """
+        manifest = cls(folder)
+        if not manifest.path.is_file():
+            return manifest
+
+        try:
+            content = json.loads(manifest.path.read_text(encoding="utf-8"))
+            if content.get("version") != _MANIFEST_VERSION:
+                msg = f"unsupported version {content.get('version')!r}"
+                raise ValueError(msg)  # noqa: TRY301
+            manifest.entries = {
+                key: ManifestEntry(
+                    size=value["size"],
+                    mtime_ns=value["mtime_ns"],
+                    sha256=value["sha256"],
+                    outputs=tuple(value["outputs"]),
+                    options=dict(value["options"]),
+                )
+                for key, value in content["files"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(
+                "Ignoring the manifest %s, which cannot be read (%s); every file will be "
+                "converted again.",
+                manifest.path,
+                e,
+            )
+            manifest.entries = {}
+
+        return manifest
+
+    @staticmethod
+    def _key(file: Path) -> str:
+        """Identify a file in the manifest, wherever the conversion is run from."""
+        return Path(file).resolve().as_posix()
+
+    def _output_key(self, output: Path) -> str:
+        """Store the path of an output relative to the folder, so the folder can be moved."""
+        output = Path(output).resolve()
+        try:
+            return output.relative_to(self.folder.resolve()).as_posix()
+        except ValueError:
+            return output.as_posix()
+
+    def is_current(self, file: Path, options: dict[str, str]) -> bool:
+        """Whether a file was converted, with the same options, and has not changed since.
+
+        Parameters
+        ----------
+        file : Path
+            The file to convert.
+        options : dict[str, str]
+            The options it is about to be converted with.
+
+        Returns
+        -------
+        bool
+            True when converting it again would write the same files.
+        """
+        entry = self.entries.get(self._key(file))
+        if (
+            entry is None
+            or entry.options != options
+            or not all((self.folder / output).is_file() for output in entry.outputs)
+        ):
+            return False
+
+        try:
+            stat = file.stat()
+        except OSError:
+            return False
+        if stat.st_size != entry.size:
+            return False
+        if stat.st_mtime_ns == entry.mtime_ns:
+            return True
+
+        # Touched or copied: compare the content itself, and remember the new time if it is
+        # unchanged so the next check is quick again
+        if file_digest(file) != entry.sha256:
+            return False
+        self.entries[self._key(file)] = ManifestEntry(
+            size=entry.size,
+            mtime_ns=stat.st_mtime_ns,
+            sha256=entry.sha256,
+            outputs=entry.outputs,
+            options=entry.options,
+        )
+        return True
+
+    def record(self, result: ConversionResult, options: dict[str, str]) -> None:
+        """Record a file just converted, and write the manifest when it is due.
+
+        Parameters
+        ----------
+        result : ConversionResult
+            The result of converting the file, with its hash (see the ``digest`` argument of
+            :func:`convert_files`). Failed conversions are forgotten, so that they are tried
+            again next time.
+        options : dict[str, str]
+            The options it was converted with.
+        """
+        key = self._key(result.file)
+        if not result.ok or result.sha256 is None:
+            if self.entries.pop(key, None) is None:
+                return
+        else:
+            self.entries[key] = ManifestEntry(
+                size=result.nbytes,
+                mtime_ns=result.mtime_ns,
+                sha256=result.sha256,
+                outputs=tuple(self._output_key(output) for output in result.outputs),
+                options=dict(options),
+            )
+
+        self._unsaved += 1
+        if time.monotonic() - self._saved_at >= MANIFEST_SAVE_INTERVAL:
+            self.save()
+
+    def flush(self) -> None:
+        """Write the manifest if files were recorded since it was last written."""
+        if self._unsaved:
+            self.save()
+
+    def save(self) -> None:
+        """Write the manifest, replacing the previous one in a single step.
+
+        The manifest is written to a temporary file first and then renamed over the previous
+        one, so that it is never left half written.
+        """
+        content: dict[str, Any] = {
+            "version": _MANIFEST_VERSION,
+            "files": {key: asdict(entry) for key, entry in sorted(self.entries.items())},
+        }
+        self.folder.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(json.dumps(content, indent=2), encoding="utf-8")
+        temporary.replace(self.path)
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
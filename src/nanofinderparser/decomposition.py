@@ -0,0 +1,505 @@
+"""Decompose the spectra of a mapping into a few components, reading them chunk by chunk.
+
+Principal component analysis (PCA) and non-negative matrix factorization (NMF) find the spectra
+of the phases of a sample, and how much of each there is at every point of the map. Done at once,
+they need every spectrum in memory, in double precision. Here, they learn from one chunk of
+spectra at a time, so the spectra may be a memory map of a mapping larger than the memory:
+
+- :class:`IncrementalPCA` accumulates the mean and the covariance of the spectra, chunk by chunk,
+  and diagonalizes the covariance (a matrix of ``n_points x n_points``) when the components are
+  asked for. The components are those of a PCA of all the spectra at once.
+- :class:`MiniBatchNMF` factorizes the spectra by multiplicative updates, refining the
+  components from the statistics of every chunk, weighting those of the previous chunks less.
+
+Both learn with :meth:`~IncrementalPCA.partial_fit`, called with each chunk of any reader of
+spectra, and give the scores of a chunk with :meth:`~IncrementalPCA.transform`.
+:func:`decompose` runs them over an array of spectra, and :func:`decompose_mapping` over a
+mapping, mapping the scores.
+
+Examples
+--------
+>>> from nanofinderparser import sample_mapping
+>>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+>>> decomposition, maps = decompose_mapping(mapping, 2)
+>>> decomposition.components.shape, maps.titles
+((2, 256), ['Component 1 (PCA)', 'Component 2 (PCA)'])
+"""
+
+from dataclasses import dataclass
+from typing import Any, Final, Literal, Self
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.models import Images, Mapping
+from nanofinderparser.utils import DEFAULT_CHUNK_SIZE
+
+# Passes of an NMF over the spectra.
+DEFAULT_EPOCHS: Final[int] = 10
+
+# Multiplicative updates of the scores of a chunk, for an NMF.
+DEFAULT_MAX_ITERATIONS: Final[int] = 200
+
+# Weight of the statistics of the previous chunks when an NMF learns from a new one.
+DEFAULT_FORGET_FACTOR: Final[float] = 0.7
+
+# Multiplicative updates of the components of an NMF after each chunk.
+_COMPONENT_ITERATIONS: Final[int] = 30
+
+# Guard of the divisions of the multiplicative updates.
+_EPSILON: Final[float] = 1e-12
+
+Method = Literal["pca", "nmf"]
+
+# How the maps of the scores are titled, for each method.
+_METHOD_TITLES: Final[dict[str, str]] = {"pca": "PCA", "nmf": "NMF"}
+
+
+class IncrementalPCA:
+    """A principal component analysis, learning from one chunk of spectra at a time.
+
+    The sum of the spectra and of their outer products are accumulated, relative to the mean of
+    the first chunk to keep the precision, so that the result does not depend on the chunks.
+
+    Parameters
+    ----------
+    n_components : int
+        Number of components to keep.
+
+    Attributes
+    ----------
+    n_components : int
+        Number of components kept.
+    n_seen : int
+        Number of spectra learnt from.
+
+    Raises
+    ------
+    ValueError
+        If `n_components` is not positive.
+    """
+
+    def __init__(self, n_components: int) -> None:
+        """Initialize an analysis that has not learnt from any spectrum yet."""
+        if n_components < 1:
+            msg = f"The number of components must be positive, got {n_components}."
+            raise ValueError(msg)
+        self.n_components = n_components
+        self.n_seen = 0
+        self._shift: NDArray[np.float64] | None = None
+        self._sum: NDArray[np.float64] | None = None
+        self._products: NDArray[np.float64] | None = None
+        # Components and variances, computed when asked for, until the next chunk
+        self._solution: tuple[NDArray[np.float64], NDArray[np.float64]] | None = None
+
+    def partial_fit(self, chunk: NDArray[Any]) -> Self:
+        """Learn from a chunk of spectra.
+
+        Parameters
+        ----------
+        chunk : NDArray[Any]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        IncrementalPCA
+            The analysis itself.
+
+        Raises
+        ------
+        ValueError
+            If the spectra do not have as many points as those learnt from before, or fewer
+            points than there are components.
+        """
+        spectra = np.asarray(chunk, dtype=np.float64)
+        if self._shift is None:
+            if spectra.shape[1] < self.n_components:
+                msg = f"Cannot find {self.n_components} components of spectra of "
+                msg += f"{spectra.shape[1]} points."
+                raise ValueError(msg)
+            self._shift = spectra.mean(axis=0)
+            self._sum = np.zeros_like(self._shift)
+            self._products = np.zeros((self._shift.size, self._shift.size))
+        shift, total, products = self._statistics()
+        _check_points(spectra, shift.size)
+
+        centered = spectra - shift
+        total += centered.sum(axis=0)
+        products += centered.T @ centered
+        self.n_seen += len(spectra)
+        self._solution = None
+        return self
+
+    @property
+    def mean(self) -> NDArray[np.float64]:
+        """The mean of the spectra learnt from, of shape ``(n_points,)``."""
+        shift, total, _ = self._statistics()
+        return shift + total / self.n_seen
+
+    @property
+    def components(self) -> NDArray[np.float64]:
+        """The principal components, one per row, by decreasing variance.
+
+        Each is of unit norm, and signed so that its largest value is positive.
+        """
+        return self._solve()[0]
+
+    @property
+    def explained_variance(self) -> NDArray[np.float64]:
+        """The variance of the spectra along each component."""
+        return self._solve()[1]
+
+    def transform(self, chunk: NDArray[Any]) -> NDArray[np.float64]:
+        """Project a chunk of spectra on the components.
+
+        Parameters
+        ----------
+        chunk : NDArray[Any]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        NDArray[np.float64]
+            The scores of the spectra, of shape ``(n_spectra, n_components)``.
+        """
+        spectra = np.asarray(chunk, dtype=np.float64)
+        _check_points(spectra, self.mean.size)
+        scores: NDArray[np.float64] = (spectra - self.mean) @ self.components.T
+        return scores
+
+    def _statistics(
+        self,
+    ) -> tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.float64]]:
+        """Return the shift, the sum and the sum of outer products of the spectra learnt from."""
+        if self._shift is None or self._sum is None or self._products is None:
+            msg = "The analysis has not learnt from any spectrum yet."
+            raise ValueError(msg)
+        return self._shift, self._sum, self._products
+
+    def _solve(self) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """Diagonalize the covariance of the spectra, once per chunk learnt from."""
+        if self._solution is None:
+            _, total, products = self._statistics()
+            n_seen = self.n_seen
+            covariance = (products - np.outer(total, total) / n_seen) / max(n_seen - 1, 1)
+            variances, vectors = np.linalg.eigh(covariance)
+            # eigh sorts up; the largest variances come first
+            order = np.argsort(variances)[::-1][: self.n_components]
+            components = vectors[:, order].T
+            # Eigenvectors have no sign; choosing one makes the result reproducible
+            largest = np.abs(components).argmax(axis=1)
+            components *= np.sign(components[np.arange(len(components)), largest])[:, None]
+            self._solution = components, np.clip(variances[order], 0.0, None)
+        return self._solution
+
+
+class MiniBatchNMF:
+    """A non-negative matrix factorization, learning from one chunk of spectra at a time.
+
+    The spectra are approximated by ``scores @ components``, both non-negative. For every chunk,
+    the scores are found with the components fixed, and the components are then updated from
+    the statistics of the scores and the spectra of all the chunks so far, those of each previous
+    chunk weighted by `forget_factor` once more. Negative values of the spectra, such as the
+    noise of a subtracted baseline, are taken as 0.
+
+    Parameters
+    ----------
+    n_components : int
+        Number of components.
+    max_iterations : int, optional
+        Multiplicative updates of the scores of a chunk, by default 200.
+    forget_factor : float, optional
+        Weight of the statistics of the previous chunks, between 0 and 1, by default 0.7.
+    seed : int, optional
+        Seed of the random initial components, by default 0.
+
+    Attributes
+    ----------
+    n_components : int
+        Number of components.
+    n_seen : int
+        Number of spectra learnt from, counting those seen several times.
+
+    Raises
+    ------
+    ValueError
+        If `n_components` or `max_iterations` is not positive, or `forget_factor` is not
+        between 0 and 1.
+    """
+
+    def __init__(
+        self,
+        n_components: int,
+        *,
+        max_iterations: int = DEFAULT_MAX_ITERATIONS,
+        forget_factor: float = DEFAULT_FORGET_FACTOR,
+        seed: int = 0,
+    ) -> None:
+        """Initialize a factorization that has not learnt from any spectrum yet."""
+        if n_components < 1:
+            msg = f"The number of components must be positive, got {n_components}."
+            raise ValueError(msg)
+        if max_iterations < 1:
+            msg = f"The number of iterations must be positive, got {max_iterations}."
+            raise ValueError(msg)
+        if not 0 <= forget_factor <= 1:
+            msg = f"The forget factor must be between 0 and 1, got {forget_factor}."
+            raise ValueError(msg)
+        self.n_components = n_components
+        self.n_seen = 0
+        self._max_iterations = max_iterations
+        self._forget_factor = forget_factor
+        self._rng = np.random.default_rng(seed)
+        self._components: NDArray[np.float64] | None = None
+        # Sums of scores.T @ scores and of scores.T @ spectra
+        self._score_products = np.zeros((n_components, n_components))
+        self._spectra_products = np.zeros((n_components, 0))
+
+    def partial_fit(self, chunk: NDArray[Any]) -> Self:
+        """Learn from a chunk of spectra.
+
+        Parameters
+        ----------
+        chunk : NDArray[Any]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        MiniBatchNMF
+            The factorization itself.
+
+        Raises
+        ------
+        ValueError
+            If the spectra do not have as many points as those learnt from before.
+        """
+        spectra = np.clip(np.asarray(chunk, dtype=np.float64), 0.0, None)
+        if self._components is None:
+            self._components = _normalized(
+                self._rng.uniform(size=(self.n_components, spectra.shape[1]))
+            )
+            self._spectra_products = np.zeros_like(self._components)
+        _check_points(spectra, self._components.shape[1])
+
+        scores = self._scores(spectra, self._components)
+        forget = self._forget_factor
+        self._score_products = forget * self._score_products + scores.T @ scores
+        self._spectra_products = forget * self._spectra_products + scores.T @ spectra
+
+        components = self._components
+        for _ in range(_COMPONENT_ITERATIONS):
+            components *= self._spectra_products / (self._score_products @ components + _EPSILON)
+        # Components of unit norm keep their scale from drifting; the statistics follow, as the
+        # scores they were built from scale the other way
+        norms = np.linalg.norm(components, axis=1) + _EPSILON
+        components /= norms[:, None]
+        self._score_products *= np.outer(norms, norms)
+        self._spectra_products *= norms[:, None]
+        self.n_seen += len(spectra)
+        return self
+
+    @property
+    def components(self) -> NDArray[np.float64]:
+        """The components, one per row, non-negative and of unit norm."""
+        if self._components is None:
+            msg = "The factorization has not learnt from any spectrum yet."
+            raise ValueError(msg)
+        return self._components
+
+    def transform(self, chunk: NDArray[Any]) -> NDArray[np.float64]:
+        """Find the scores of a chunk of spectra, the components being fixed.
+
+        Parameters
+        ----------
+        chunk : NDArray[Any]
+            The spectra, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        NDArray[np.float64]
+            The scores of the spectra, non-negative, of shape ``(n_spectra, n_components)``.
+        """
+        spectra = np.clip(np.asarray(chunk, dtype=np.float64), 0.0, None)
+        _check_points(spectra, self.components.shape[1])
+        return self._scores(spectra, self.components)
+
+    def _scores(
+        self, spectra: NDArray[np.float64], components: NDArray[np.float64]
+    ) -> NDArray[np.float64]:
+        """Find the scores of spectra by multiplicative updates, the components being fixed."""
+        # Both products are computed once: every update then costs n_spectra x n_components²
+        projections = spectra @ components.T
+        gram = components @ components.T
+        scores = np.ones((len(spectra), self.n_components))
+        for _ in range(self._max_iterations):
+            scores *= projections / (scores @ gram + _EPSILON)
+        return scores
+
+
+@dataclass(frozen=True, slots=True)
+class Decomposition:
+    """The components of a batch of spectra, and the scores of every spectrum.
+
+    The spectra are approximated by ``mean + scores @ components``.
+
+    Attributes
+    ----------
+    method : {"pca", "nmf"}
+        How the spectra were decomposed.
+    components : NDArray[np.float64]
+        The components, one spectrum per row, of shape ``(n_components, n_points)``.
+    scores : NDArray[np.float64]
+        The scores of every spectrum, of shape ``(n_spectra, n_components)``.
+    mean : NDArray[np.float64]
+        The mean spectrum for a PCA, zeros for an NMF, of shape ``(n_points,)``.
+    explained_variance : NDArray[np.float64] | None
+        The variance of the spectra along each component for a PCA, None for an NMF.
+    """
+
+    method: Method
+    components: NDArray[np.float64]
+    scores: NDArray[np.float64]
+    mean: NDArray[np.float64]
+    explained_variance: NDArray[np.float64] | None
+
+
+def decompose(  # noqa: PLR0913
+    spectra: NDArray[Any],
+    n_components: int,
+    *,
+    method: Method = "pca",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    epochs: int = DEFAULT_EPOCHS,
+    seed: int = 0,
+) -> Decomposition:
+    """Decompose a batch of spectra, reading them chunk by chunk.
+
+    The spectra are read once to learn the components (`epochs` times for an NMF), and once more
+    to find the scores, so they may be a memory map larger than the memory.
+
+    Parameters
+    ----------
+    spectra : NDArray[Any]
+        The spectra, of shape ``(n_spectra, n_points)``.
+    n_components : int
+        Number of components.
+    method : {"pca", "nmf"}, optional
+        How to decompose the spectra, by default "pca".
+    chunk_size : int, optional
+        Number of spectra read together, by default 4096.
+    epochs : int, optional
+        Passes over the spectra to learn the components of an NMF, by default 10.
+    seed : int, optional
+        Seed of the random initial components of an NMF, by default 0.
+
+    Returns
+    -------
+    Decomposition
+        The components, and the scores of every spectrum.
+
+    Raises
+    ------
+    ValueError
+        If there are more components than spectra or than points, or `epochs` is not positive.
+    """
+    n_spectra, n_points = spectra.shape
+    if n_components > min(n_spectra, n_points):
+        msg = f"Cannot find {n_components} components of {n_spectra} spectra of {n_points} points."
+        raise ValueError(msg)
+    if epochs < 1:
+        msg = f"The number of epochs must be positive, got {epochs}."
+        raise ValueError(msg)
+
+    model: IncrementalPCA | MiniBatchNMF
+    if method == "pca":
+        model = IncrementalPCA(n_components)
+        epochs = 1
+    else:
+        model = MiniBatchNMF(n_components, seed=seed)
+    starts = range(0, n_spectra, chunk_size)
+    for _ in range(epochs):
+        for start in starts:
+            model.partial_fit(spectra[start : start + chunk_size])
+
+    scores = np.empty((n_spectra, n_components))
+    for start in starts:
+        scores[start : start + chunk_size] = model.transform(spectra[start : start + chunk_size])
+
+    if isinstance(model, IncrementalPCA):
+        return Decomposition(method, model.components, scores, model.mean, model.explained_variance)
+    return Decomposition(method, model.components, scores, np.zeros(n_points), None)
+
+
+def decompose_mapping(  # noqa: PLR0913
+    mapping: Mapping,
+    n_components: int,
+    *,
+    method: Method = "pca",
+    channel: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    epochs: int = DEFAULT_EPOCHS,
+    seed: int = 0,
+) -> tuple[Decomposition, Images]:
+    """Decompose the spectra of a mapping, and map their scores.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    n_components : int
+        Number of components.
+    method : {"pca", "nmf"}, optional
+        How to decompose the spectra, by default "pca".
+    channel : int, optional
+        The channel index, by default 0.
+    chunk_size : int, optional
+        Number of spectra read together, by default 4096.
+    epochs : int, optional
+        Passes over the spectra to learn the components of an NMF, by default 10.
+    seed : int, optional
+        Seed of the random initial components of an NMF, by default 0.
+
+    Returns
+    -------
+    tuple[Decomposition, Images]
+        The decomposition, and the map of the scores of each component, titled as
+        ``"Component 1 (PCA)"``.
+
+    Raises
+    ------
+    ValueError
+        If there are more components than spectra or than points, or `epochs` is not positive.
+    """
+    decomposition = decompose(
+        mapping.get_spectra(channel),
+        n_components,
+        method=method,
+        chunk_size=chunk_size,
+        epochs=epochs,
+        seed=seed,
+    )
+    suffix = f" ({_METHOD_TITLES[method]})"
+    images = [
+        mapping.to_image(scores, f"Component {number}{suffix}")
+        for number, scores in enumerate(decomposition.scores.T, start=1)
+    ]
+    return decomposition, Images(images, source=mapping.source)
+
+
+def _check_points(spectra: NDArray[np.float64], n_points: int) -> None:
+    """Check that spectra have as many points as those learnt from.
+
+    Raises
+    ------
+    ValueError
+        If they do not.
+    """
+    if spectra.ndim != 2 or spectra.shape[1] != n_points:  # noqa: PLR2004
+        msg = f"Expected spectra of {n_points} points, got an array of shape {spectra.shape}."
+        raise ValueError(msg)
+
+
+def _normalized(components: NDArray[np.float64]) -> NDArray[np.float64]:
+    """Scale every component to unit norm."""
+    normalized: NDArray[np.float64] = components / np.linalg.norm(components, axis=1)[:, None]
+    return normalized
@@ -0,0 +1,310 @@
+"""Remove the cosmic-ray spikes of a mapping.
+
+A cosmic ray hitting the detector shows as a spike a point or two wide in a single spectrum of the
+mapping. The spectra next to it on the map are measured on the same sample a step away, so they
+are the best reference there is for what the spectrum should have been: each spectrum is compared
+with the median of its spatial neighbours (the 8 around it on the map), and the points rising far
+above that median are flagged and replaced by it.
+
+The map is processed in bands of rows, each read with a row above and below it (its halo) for the
+neighbours of its edges. Only a band is held in memory at a time, so :func:`despike_cube` works on
+any array that can be sliced along its rows, such as a memory-mapped file, and the cost grows
+linearly with the size of the map.
+
+Examples
+--------
+>>> from nanofinderparser import sample_mapping
+>>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+>>> mapping.get_map()[1, 2, 100] += 5000
+>>> despiked, mask = despike(mapping)
+>>> [index.tolist() for index in np.nonzero(mask)]
+[[1], [2], [100]]
+"""
+
+from typing import Any, Final, Protocol
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.models import Mapping
+
+# Threshold of a spike, in units of the robust standard deviation of the difference between a
+# spectrum and the median of its neighbours.
+DEFAULT_THRESHOLD: Final[float] = 8.0
+
+# Spectra processed together in a band of rows, when the number of rows is not given. A band
+# holds its spectra and those of the 8 neighbours of each, so this keeps it within a few tens of
+# MB for spectra of a thousand points.
+DEFAULT_BAND_SPECTRA: Final[int] = 1024
+
+# Scale from the median absolute deviation to the standard deviation, for normal noise.
+_MAD_TO_STD: Final[float] = 1.4826
+
+
+class Cube(Protocol):
+    """An array of spectra of shape ``(slow_steps, fast_steps, spectral_len)`` read by rows.
+
+    numpy arrays and memory maps are cubes, as are the datasets of most chunked storage formats.
+    """
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        """The shape of the cube."""
+        ...
+
+    def __getitem__(self, key: slice, /) -> Any:
+        """Read a band of rows."""
+        ...
+
+
+def despike_cube(
+    cube: Cube,
+    *,
+    threshold: float = DEFAULT_THRESHOLD,
+    band_rows: int | None = None,
+    out: NDArray[Any] | None = None,
+) -> NDArray[np.bool_]:
+    """Flag the cosmic-ray spikes of a map of spectra, and replace them.
+
+    Parameters
+    ----------
+    cube : Cube
+        The spectra, of shape ``(slow_steps, fast_steps, spectral_len)`` as given by
+        :meth:`~nanofinderparser.models.Mapping.get_map`. It is only read a band of rows at a time.
+    threshold : float, optional
+        How far above the median of its neighbours a point must be to be a spike, in robust
+        standard deviations, by default 8.0.
+    band_rows : int | None, optional
+        Rows processed together, by default None (enough rows for about 1024 spectra).
+    out : NDArray[Any] | None, optional
+        Array of the shape of `cube` where to write the spectra without their spikes, by default
+        None (they are not written). It may be `cube` itself, to despike it in place.
+
+    Returns
+    -------
+    NDArray[np.bool_]
+        The points replaced, of the shape of `cube`.
+
+    Raises
+    ------
+    ValueError
+        If the map holds a single spectrum, or `threshold` or `band_rows` are not positive.
+
+    Notes
+    -----
+    A point is a spike when it passes two tests against the noise, each `threshold` times its
+    robust standard deviation:
+
+    - its difference with the median of the neighbours exceeds the noise of the spectrum, taken
+      from the spread of that difference along the spectrum;
+    - its rise above the highest of the neighbours exceeds their spread around the point, which
+      keeps real changes across the map, and narrow features of the sample seen in a few spectra,
+      from being taken as spikes. On the flanks of sharp peaks, the step between neighbouring
+      points of the median is allowed on top, as the peaks may shift slightly from one spectrum
+      to the next.
+
+    Two cosmic rays hitting neighbouring spectra at the same point are therefore missed.
+    """
+    slow, fast, n_points = cube.shape
+    if slow * fast < 2:  # noqa: PLR2004
+        msg = "A spectrum without neighbours cannot be despiked."
+        raise ValueError(msg)
+    if threshold <= 0:
+        msg = f"The threshold must be positive, got {threshold}."
+        raise ValueError(msg)
+    if band_rows is None:
+        band_rows = max(1, DEFAULT_BAND_SPECTRA // fast)
+    if band_rows < 1:
+        msg = f"At least one row is needed in a band, got {band_rows}."
+        raise ValueError(msg)
+
+    mask = np.zeros((slow, fast, n_points), dtype=np.bool_)
+    # Writing a band is put off until the next one has been read, so that when despiking in
+    # place, the halo of a band still holds the spectra as they were
+    pending: tuple[slice, NDArray[np.float64]] | None = None
+    for start in range(0, slow, band_rows):
+        rows = slice(start, min(start + band_rows, slow))
+        band, neighbours = _read_band(cube, rows)
+        median = _stack_median(neighbours)
+        mask[rows] = _find_spikes(band, neighbours, median, threshold)
+
+        if out is not None:
+            if pending is not None:
+                out[pending[0]] = pending[1]
+            pending = (rows, np.where(mask[rows], median, band))
+    if out is not None and pending is not None:
+        out[pending[0]] = pending[1]
+    return mask
+
+
+def despike(
+    mapping: Mapping,
+    *,
+    threshold: float = DEFAULT_THRESHOLD,
+    inplace: bool = False,
+    channel: int = 0,
+    band_rows: int | None = None,
+) -> tuple[Mapping, NDArray[np.bool_]]:
+    """Remove the cosmic-ray spikes of a mapping.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    threshold : float, optional
+        How far above the median of its neighbours a point must be to be a spike, in robust
+        standard deviations, by default 8.0.
+    inplace : bool, optional
+        Whether to modify the data of the mapping itself, by default False (a new mapping is
+        returned, sharing the metadata of the original one).
+    channel : int, optional
+        The channel index, by default 0.
+    band_rows : int | None, optional
+        Rows of the map processed together, by default None (enough rows for about 1024
+        spectra).
+
+    Returns
+    -------
+    tuple[Mapping, NDArray[np.bool_]]
+        The mapping without its spikes (`mapping` itself when `inplace` is True), and the points
+        replaced, of the shape of :meth:`~nanofinderparser.models.Mapping.get_map`.
+
+    Raises
+    ------
+    ValueError
+        If `inplace` is True and the data of the mapping is read-only, as when memory-mapped
+        by ``load_smd(file, lazy=True)``.
+
+    See Also
+    --------
+    despike_cube : Despike the spectra of any array read by rows, such as a memory map.
+    """
+    if inplace:
+        mapping.check_writeable()
+    result = mapping if inplace else mapping.with_data(mapping.data.copy())
+    mask = despike_cube(
+        mapping.get_map(channel),
+        threshold=threshold,
+        band_rows=band_rows,
+        out=result.get_map(channel),
+    )
+    result.data_modified()
+    return result, mask
+
+
+def _read_band(cube: Cube, rows: slice) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """Read a band of rows of a cube, and the neighbours of each of its spectra.
+
+    Parameters
+    ----------
+    cube : Cube
+        The spectra, of shape ``(slow_steps, fast_steps, spectral_len)``.
+    rows : slice
+        The rows of the band, with a start and a stop.
+
+    Returns
+    -------
+    tuple[NDArray[np.float64], NDArray[np.float64]]
+        The band, of shape ``(n_rows, fast_steps, spectral_len)``, and the neighbours of its
+        spectra, of shape ``(n_neighbours, n_rows, fast_steps, spectral_len)``.
+    """
+    slow, fast, _ = cube.shape
+    start, stop = rows.start, rows.stop
+    # The halo: the rows just above and below the band, when the map has them
+    low, high = max(start - 1, 0), min(stop + 1, slow)
+    block = np.asarray(cube[low:high], dtype=np.float64)
+
+    # Beyond the edges of the map, the neighbours are mirrored from inside it, so that a spectrum
+    # on the edge is never its own neighbour
+    row_offsets = [-1, 0, 1] if slow > 1 else [0]
+    column_offsets = [-1, 0, 1] if fast > 1 else [0]
+    padding = (
+        (int(slow > 1 and start == 0), int(slow > 1 and stop == slow)),
+        (int(fast > 1), int(fast > 1)),
+        (0, 0),
+    )
+    block = np.pad(block, padding, mode="reflect")
+
+    n_rows = stop - start
+    top, left = int(slow > 1), int(fast > 1)
+    band = block[top : top + n_rows, left : left + fast]
+    neighbours = np.stack(
+        [
+            block[top + dr : top + dr + n_rows, left + dc : left + dc + fast]
+            for dr in row_offsets
+            for dc in column_offsets
+            if (dr, dc) != (0, 0)
+        ]
+    )
+    return band, neighbours
+
+
+def _find_spikes(
+    band: NDArray[np.float64],
+    neighbours: NDArray[np.float64],
+    median: NDArray[np.float64],
+    threshold: float,
+) -> NDArray[np.bool_]:
+    """Flag the points of a band rising far above the median of their neighbours.
+
+    Parameters
+    ----------
+    band : NDArray[np.float64]
+        The spectra, of shape ``(n_rows, fast_steps, spectral_len)``.
+    neighbours : NDArray[np.float64]
+        Their neighbours, of shape ``(n_neighbours, n_rows, fast_steps, spectral_len)``.
+    median : NDArray[np.float64]
+        The median of the neighbours, of the shape of `band`.
+    threshold : float
+        Threshold of a spike, in robust standard deviations.
+
+    Returns
+    -------
+    NDArray[np.bool_]
+        The spikes, of the shape of `band`.
+    """
+    difference = band - median
+    # Spread of the difference along each spectrum: the noise, as a spike is only a few points
+    centered = difference - np.median(difference, axis=-1, keepdims=True)
+    spectral = _MAD_TO_STD * np.median(np.abs(centered), axis=-1, keepdims=True)
+    spikes = difference > threshold * spectral
+
+    # Spread of the neighbours around each point: the map changes there, by its own variation or
+    # by the noise of the spectra. It is taken over the point and the two next to it, for enough
+    # values to estimate it from, and only for the few points above the noise
+    candidates = np.nonzero(spikes)
+    # The neighbours along the last axis, for indexing a point to give all of them
+    by_point = np.moveaxis(neighbours, 0, -1)
+    *position, point = candidates
+    last = band.shape[-1] - 1
+    around = [(*position, np.clip(point + shift, 0, last)) for shift in (-1, 0, 1)]
+    spread = np.concatenate([np.abs(by_point[index].T - median[index]) for index in around])
+    spatial = _MAD_TO_STD * _stack_median(spread)
+    # On the flank of a sharp peak, a shift of the peak by a fraction of a point, too small to
+    # show in the spread of the neighbours, changes the spectrum by up to the step of the median
+    before, here, after = (median[index] for index in around)
+    step = np.maximum(np.abs(here - before), np.abs(after - here))
+    # A cosmic ray hits a single spectrum, so it rises above every neighbour; a narrow feature
+    # shared by some of them is in the sample
+    highest = by_point[candidates].max(axis=1)
+    spikes[candidates] = band[candidates] - highest > threshold * spatial + step
+    return spikes
+
+
+def _stack_median(values: NDArray[np.float64]) -> NDArray[np.float64]:
+    """Take the median along the first axis, of a few values each.
+
+    Sorting the few values of every point is faster than :func:`numpy.median`, which selects
+    them along a strided axis.
+
+    Examples
+    --------
+    >>> _stack_median(np.array([[3.0, 1.0], [1.0, 2.0], [2.0, 9.0], [8.0, 0.0]])).tolist()
+    [2.5, 1.5]
+    """
+    ordered = np.sort(values, axis=0)
+    half = len(values) // 2
+    median: NDArray[np.float64] = (
+        ordered[half] if len(values) % 2 else (ordered[half - 1] + ordered[half]) / 2
+    )
+    return median
@@ -0,0 +1,309 @@
+"""Export mappings to the files of other software: ENVI cubes and NumPy ``.npy`` arrays.
+
+The data block of an SMD file holds the spectra one after another, in the order they were
+acquired, as little-endian ``float32`` values. For a mapping scanned along x first, that is
+already a C-ordered array of shape ``(y, x, n_points)``, which is both the cube of an ENVI file
+interleaved by pixel (BIP) and the data of a ``.npy`` file. Exporting such a mapping only needs
+a header describing the array, and a copy of the data block as it is.
+
+When the mapping was loaded with ``load_smd(file, lazy=True)`` and its data left untouched, the
+data block is copied straight from the SMD file to the exported one with
+:func:`os.copy_file_range`, so the kernel moves the bytes (or the file system shares them)
+without them ever passing through Python. Where the system cannot copy between those files, the
+block is copied by chunks instead; other mappings are written from their data.
+
+Examples
+--------
+>>> from nanofinderparser import load_smd
+>>> mapping = load_smd("mapping.smd", lazy=True)  # doctest: +SKIP
+>>> data, header = write_envi(mapping, "mapping.bip")  # doctest: +SKIP
+>>> array, sidecar = write_npy(mapping, "mapping.npy")  # doctest: +SKIP
+>>> cube = np.load(array, mmap_mode="r")  # doctest: +SKIP
+"""
+
+import contextlib
+import json
+import os
+from pathlib import Path
+from typing import Any, BinaryIO, Final, Literal
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.models import Mapping
+from nanofinderparser.parsers import SMD_DTYPE
+from nanofinderparser.units import Units, validate_units
+
+# Size of the pieces the data block is copied by, when the kernel cannot copy it at once.
+COPY_CHUNK_SIZE: Final[int] = 1 << 24
+
+# Codes of the ``data type`` field of an ENVI header, by numpy dtype.
+_ENVI_DATA_TYPES: Final[dict[str, int]] = {
+    "uint8": 1,
+    "int16": 2,
+    "int32": 3,
+    "float32": 4,
+    "float64": 5,
+    "uint16": 12,
+    "uint32": 13,
+    "int64": 14,
+    "uint64": 15,
+}
+
+# Values of the ``wavelength units`` field of an ENVI header, by spectral units. ENVI has no
+# name for Raman shifts nor energies; the units are also written in a field of their own.
+_ENVI_WAVELENGTH_UNITS: Final[dict[Units, str]] = {
+    Units.nm: "Nanometers",
+    Units.cm_1: "Wavenumber",
+    Units.raman_shift: "Wavenumber",
+    Units.ev: "Unknown",
+}
+
+
+def write_envi(
+    mapping: Mapping,
+    file: Path | str,
+    spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.nm,
+    channel: int = 0,
+) -> list[Path]:
+    """Write a mapping as an ENVI file, interleaved by pixel (BIP), and its header.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    file : Path | str
+        Path of the data file, such as ``mapping.bip``. The header is written next to it, with
+        the suffix ``.hdr``. Parent directories are created when missing.
+    spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+        Units of the wavelengths of the header, by default nm.
+    channel : int, optional
+        The channel index, by default 0.
+
+    Returns
+    -------
+    list[Path]
+        The data file and the header just written.
+
+    Raises
+    ------
+    ValueError
+        If `file` has the suffix of the header, ENVI has no data type for the values of the
+        mapping, or its source file is shorter than its data block.
+    OSError
+        If the files cannot be written.
+
+    Notes
+    -----
+    The lines of the ENVI cube are the rows of the map, along y, and its samples the points of
+    each row, along x, whatever the order of the scan. The position of the first point, the
+    steps between points and the laser wavelength are written as fields that ENVI itself
+    ignores, ``x start``, ``x step``, ``y start``, ``y step``, ``stage units`` and
+    ``laser wavelength``.
+    """
+    file = Path(file)
+    header = file.with_suffix(".hdr")
+    if header == file:
+        msg = f"The data file {file} would be overwritten by its header."
+        raise ValueError(msg)
+    units = validate_units(spectral_units)
+    axes = mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions
+    values = _cube(mapping, channel)
+    lines, samples, bands = values.shape
+    if values.dtype.name not in _ENVI_DATA_TYPES:
+        msg = f"ENVI has no data type for values of type {values.dtype}."
+        raise ValueError(msg)
+
+    fields: dict[str, Any] = {
+        "description": f"NanoFinder mapping {mapping.source or mapping.original_file_name}",
+        "samples": samples,
+        "lines": lines,
+        "bands": bands,
+        "header offset": 0,
+        "file type": "ENVI Standard",
+        "data type": _ENVI_DATA_TYPES[values.dtype.name],
+        "interleave": "bip",
+        "byte order": 0,
+        "acquisition time": mapping.datetime.isoformat(),
+        "wavelength units": _ENVI_WAVELENGTH_UNITS[units],
+        "spectral units": units.value,
+        "wavelength": mapping.get_spectral_axis(units, channel),
+        "x start": axes.x.start_position,
+        "x step": axes.x.step_size,
+        "y start": axes.y.start_position,
+        "y step": axes.y.step_size,
+        "stage units": axes.x.unit_name,
+        "laser wavelength": mapping.laser_wavelength,
+    }
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with file.open("wb") as stream:
+        _write_cube(mapping, values, stream)
+    header.write_text(_envi_header(fields), encoding="utf-8")
+    return [file, header]
+
+
+def write_npy(
+    mapping: Mapping,
+    file: Path | str,
+    spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.nm,
+    channel: int = 0,
+) -> list[Path]:
+    """Write the spectral map of a mapping as a NumPy ``.npy`` file, and its metadata as JSON.
+
+    The array has shape ``(y, x, n_points)``, whatever the order of the scan, so that
+    ``np.load(file, mmap_mode="r")`` opens it at once, however large it is.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    file : Path | str
+        Path of the array, such as ``mapping.npy``. The metadata is written next to it, with the
+        suffix ``.json``. Parent directories are created when missing.
+    spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+        Units of the spectral axis of the metadata, by default nm.
+    channel : int, optional
+        The channel index, by default 0.
+
+    Returns
+    -------
+    list[Path]
+        The array and the metadata just written.
+
+    Raises
+    ------
+    ValueError
+        If `file` has the suffix of the metadata, or the source file of the mapping is shorter
+        than its data block.
+    OSError
+        If the files cannot be written.
+
+    Notes
+    -----
+    The metadata holds the dimensions of the array, the coordinates of the map (``x`` and ``y``,
+    as a start, a step and units), the spectral axis and its units, and the metadata of the
+    measurement as :meth:`~nanofinderparser.models.Mapping.get_metadata` gives it.
+    """
+    file = Path(file)
+    sidecar = file.with_suffix(".json")
+    if sidecar == file:
+        msg = f"The array {file} would be overwritten by its metadata."
+        raise ValueError(msg)
+    units = validate_units(spectral_units)
+    axes = mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions
+    values = _cube(mapping, channel)
+    metadata = {
+        "dims": ["y", "x", "spectral"],
+        "shape": list(values.shape),
+        "coords": {
+            name: {"start": axis.start_position, "step": axis.step_size, "units": axis.unit_name}
+            for name, axis in (("y", axes.y), ("x", axes.x))
+        },
+        "spectral_units": units.value,
+        "spectral_axis": mapping.get_spectral_axis(units, channel).tolist(),
+        **mapping.get_metadata(channel),
+    }
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with file.open("wb") as stream:
+        np.lib.format.write_array_header_1_0(
+            stream,
+            {
+                "descr": np.lib.format.dtype_to_descr(values.dtype.newbyteorder("<")),
+                "fortran_order": False,
+                "shape": values.shape,
+            },
+        )
+        _write_cube(mapping, values, stream)
+    sidecar.write_text(json.dumps(metadata, indent=2), encoding="utf-8")
+    return [file, sidecar]
+
+
+def copy_range(source: Path, offset: int, nbytes: int, target: BinaryIO) -> None:
+    """Copy a range of bytes of a file to the end of another, in the kernel where possible.
+
+    Parameters
+    ----------
+    source : Path
+        The file to copy from.
+    offset : int
+        Position of the first byte to copy, in bytes from the start of `source`.
+    nbytes : int
+        Number of bytes to copy.
+    target : BinaryIO
+        The file to copy to, open for writing at its end, where it is left.
+
+    Raises
+    ------
+    ValueError
+        If `source` ends before the range does.
+    """
+    # What was written through Python must reach the file before the kernel writes after it
+    target.flush()
+    copied = 0
+    with Path(source).open("rb") as stream:
+        # Where the kernel cannot copy between these files (another system, an old kernel, file
+        # systems it does not copy across...), the rest is copied through Python
+        if hasattr(os, "copy_file_range"):
+            with contextlib.suppress(OSError):
+                while copied < nbytes:
+                    count = os.copy_file_range(
+                        stream.fileno(), target.fileno(), nbytes - copied, offset + copied
+                    )
+                    if count == 0:
+                        break
+                    copied += count
+        # The kernel wrote past the position Python knows of
+        target.seek(0, os.SEEK_END)
+        stream.seek(offset + copied)
+        while copied < nbytes:
+            chunk = stream.read(min(COPY_CHUNK_SIZE, nbytes - copied))
+            if not chunk:
+                break
+            target.write(chunk)
+            copied += len(chunk)
+    if copied < nbytes:
+        msg = f"{source} ends {nbytes - copied} bytes before the range copied from it."
+        raise ValueError(msg)
+
+
+def _cube(mapping: Mapping, channel: int) -> NDArray[Any]:
+    """Lay out the spectral map as ``(y, x, n_points)``, transposing the mappings x-slow."""
+    values = mapping.get_map(channel)
+    axes = mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions
+    if axes.x.is_slow and not axes.y.is_slow:
+        values = values.transpose(1, 0, 2)
+    return values
+
+
+def _write_cube(mapping: Mapping, values: NDArray[Any], stream: BinaryIO) -> None:
+    """Write a cube of :func:`_cube` as little-endian values, from the SMD file if possible.
+
+    The data block of the file is copied as it is when it holds the cube in the same order, as
+    for a mapping memory-mapped from its file, scanned along x first.
+    """
+    if (
+        values.flags.c_contiguous
+        and mapping.source is not None
+        and mapping.data_offset is not None
+        and mapping.data.dtype == np.dtype(SMD_DTYPE)
+        and mapping.data.size == values.size
+    ):
+        copy_range(mapping.source, mapping.data_offset, mapping.data.nbytes, stream)
+    else:
+        np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<")).tofile(stream)
+
+
+def _envi_header(fields: dict[str, Any]) -> str:
+    """Format the fields of an ENVI header, arrays as lists in braces."""
+    lines = ["ENVI"]
+    for name, value in fields.items():
+        if isinstance(value, np.ndarray):
+            text = "{" + ", ".join(repr(float(item)) for item in value) + "}"
+        elif name == "description":
+            text = "{" + value + "}"
+        else:
+            text = str(value)
+        lines.append(f"{name} = {text}")
+    return "\n".join(lines) + "\n"
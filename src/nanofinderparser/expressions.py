@@ -0,0 +1,306 @@
+"""Evaluate expressions over windows of the spectral axis, such as band ratios, for every spectrum.
+
+An expression combines the values of every spectrum over windows of its axis with arithmetic,
+as in ``"band(2600, 2750) / band(1550, 1620)"``, the I(2D)/I(G) ratio of graphene. The functions
+an expression may call are:
+
+- ``band(low, high)``: the integral of the spectrum over the window, by the trapezoidal rule.
+- ``height(low, high)``: the maximum of the spectrum within the window.
+- ``position(low, high)``: the position of that maximum on the axis, refined by a parabola
+  through the three points around it.
+
+Expressions are parsed rather than run, so they can only do the above: the numbers, the
+functions, ``+``, ``-``, ``*``, ``/``, ``**`` and parentheses. All the windows of all the
+expressions are gathered first, and the spectra are then read once, chunk by chunk, computing
+every window of a chunk while it is in memory; the expressions are evaluated last, on one value
+per spectrum.
+
+Examples
+--------
+>>> axis = np.linspace(0.0, 10.0, 11)
+>>> spectra = np.array([[0, 1, 4, 1, 0, 0, 0, 2, 6, 2, 0], [0, 2, 8, 2, 0, 0, 0, 1, 3, 1, 0]])
+>>> maps = evaluate_expressions(
+...     {"ratio": "height(6, 10) / height(0, 4)", "shift": "position(6, 10) - position(0, 4)"},
+...     axis,
+...     spectra,
+... )
+>>> maps["ratio"].tolist(), maps["shift"].tolist()
+([1.5, 0.375], [6.0, 6.0])
+"""
+
+import ast
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any, Final, Literal
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.spectral_axis import SpectralAxis
+from nanofinderparser.utils import DEFAULT_CHUNK_SIZE
+
+FunctionName = Literal["band", "height", "position"]
+
+# The arithmetic an expression may use.
+_OPERATORS: Final[dict[type[ast.operator | ast.unaryop], Callable[..., Any]]] = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Window:
+    """A function of the spectra over a window of their axis, called by an expression.
+
+    Attributes
+    ----------
+    function : {"band", "height", "position"}
+        What is computed over the window.
+    low, high : float
+        The limits of the window, ``low <= high``.
+    """
+
+    function: FunctionName
+    low: float
+    high: float
+
+
+@dataclass(frozen=True, slots=True)
+class Expression:
+    """An expression parsed, ready to be evaluated once its windows are computed.
+
+    Attributes
+    ----------
+    text : str
+        The expression, as written.
+    tree : ast.expr
+        The parsed expression, holding only what an expression may use.
+    windows : tuple[Window, ...]
+        The windows the expression calls, in the order they are written.
+    """
+
+    text: str
+    tree: ast.expr
+    windows: tuple[Window, ...]
+
+    @classmethod
+    def parse(cls, text: str) -> "Expression":
+        """Parse an expression, checking it only uses what an expression may.
+
+        Parameters
+        ----------
+        text : str
+            The expression, such as ``"band(2600, 2750) / band(1550, 1620)"``.
+
+        Returns
+        -------
+        Expression
+            The parsed expression.
+
+        Raises
+        ------
+        ValueError
+            If the expression is not valid Python, or uses anything other than numbers, the
+            functions, arithmetic and parentheses.
+        """
+        try:
+            tree = ast.parse(text.strip(), mode="eval").body
+        except SyntaxError as error:
+            msg = f"Invalid expression {text!r}: {error.msg}."
+            raise ValueError(msg) from error
+        windows: list[Window] = []
+        _check(tree, text, windows)
+        return cls(text, tree, tuple(windows))
+
+    def evaluate(self, values: dict[Window, NDArray[np.float64]]) -> NDArray[np.float64]:
+        """Evaluate the expression for every spectrum.
+
+        Parameters
+        ----------
+        values : dict[Window, NDArray[np.float64]]
+            The value of every window of the expression, one per spectrum.
+
+        Returns
+        -------
+        NDArray[np.float64]
+            The value of the expression, one per spectrum. Divisions by zero give infinities or
+            NaN, as in numpy.
+        """
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            result: NDArray[np.float64] = np.asarray(_evaluate(self.tree, values), dtype=float)
+        return result
+
+
+def evaluate_expressions(
+    expressions: dict[str, str],
+    axis: NDArray[np.float64],
+    spectra: NDArray[Any],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict[str, NDArray[np.float64]]:
+    """Evaluate several expressions for every spectrum, reading the spectra once.
+
+    Parameters
+    ----------
+    expressions : dict[str, str]
+        The expressions, by name.
+    axis : NDArray[np.float64]
+        The spectral axis, of shape ``(n_points,)``, in the units of the windows.
+    spectra : NDArray[Any]
+        The spectra, of shape ``(n_spectra, n_points)``.
+    chunk_size : int, optional
+        Number of spectra read together, by default 4096.
+
+    Returns
+    -------
+    dict[str, NDArray[np.float64]]
+        The value of every expression, by name, one per spectrum.
+
+    Raises
+    ------
+    ValueError
+        If an expression is not valid, or a window holds no point of the axis.
+    """
+    parsed = {name: Expression.parse(text) for name, text in expressions.items()}
+    # Every window is computed once, however many expressions call it
+    windows = list(dict.fromkeys(window for e in parsed.values() for window in e.windows))
+    spectral_axis = SpectralAxis.from_values(axis)
+    slices = {window: spectral_axis.window(window.low, window.high) for window in windows}
+    values = {window: np.empty(len(spectra)) for window in windows}
+
+    for start in range(0, len(spectra), chunk_size):
+        chunk = spectra[start : start + chunk_size]
+        for window in windows:
+            points = slices[window]
+            values[window][start : start + chunk_size] = _compute(
+                window.function, axis[points], np.asarray(chunk[:, points], dtype=np.float64)
+            )
+    return {name: expression.evaluate(values) for name, expression in parsed.items()}
+
+
+def _check(node: ast.AST, text: str, windows: list[Window]) -> None:
+    """Check that an expression only uses numbers, the functions and arithmetic.
+
+    Parameters
+    ----------
+    node : ast.AST
+        A node of the parsed expression.
+    text : str
+        The expression, for the error messages.
+    windows : list[Window]
+        The windows found so far, to which those of the node are added.
+
+    Raises
+    ------
+    ValueError
+        If the node, or any node within it, is not allowed.
+    """
+    match node:
+        case ast.Constant(value=float() | int()) if not isinstance(node.value, bool):
+            return
+        case ast.BinOp(left=left, op=op, right=right) if type(op) in _OPERATORS:
+            _check(left, text, windows)
+            _check(right, text, windows)
+            return
+        case ast.UnaryOp(op=op, operand=operand) if type(op) in _OPERATORS:
+            _check(operand, text, windows)
+            return
+        case ast.Call():
+            windows.append(_call_window(node, text))
+            return
+    msg = f"Invalid expression {text!r}: {ast.unparse(node)!r} is not allowed."
+    raise ValueError(msg)
+
+
+def _call_window(node: ast.Call, text: str) -> Window:
+    """Return the window a call to one of the functions of an expression computes.
+
+    Raises
+    ------
+    ValueError
+        If the call is not to one of the functions, with the two limits of a window as numbers.
+    """
+    match node:
+        case ast.Call(func=ast.Name(id="band" | "height" | "position" as name), args=[_, _]):
+            limits = [_constant(arg) for arg in node.args]
+            if not node.keywords and None not in limits:
+                low, high = sorted(limit for limit in limits if limit is not None)
+                return Window(name, low, high)
+            msg = f"Invalid expression {text!r}: {name}() takes the two limits of a window, as "
+            msg += "numbers."
+            raise ValueError(msg)
+    msg = f"Invalid expression {text!r}: {ast.unparse(node)!r} is not allowed."
+    raise ValueError(msg)
+
+
+def _constant(node: ast.expr) -> float | None:
+    """Return the number a node holds, such as ``1550`` or ``-0.5``, or None for anything else."""
+    match node:
+        case ast.Constant(value=float() | int() as value) if not isinstance(value, bool):
+            return float(value)
+        case ast.UnaryOp(op=ast.USub(), operand=ast.Constant(value=float() | int() as value)):
+            return -float(value)
+    return None
+
+
+def _evaluate(node: ast.expr, values: dict[Window, NDArray[np.float64]]) -> Any:
+    """Evaluate a checked node of an expression, for every spectrum at once."""
+    match node:
+        case ast.Constant(value=value):
+            return value
+        case ast.BinOp(left=left, op=op, right=right):
+            return _OPERATORS[type(op)](_evaluate(left, values), _evaluate(right, values))
+        case ast.UnaryOp(op=op, operand=operand):
+            return _OPERATORS[type(op)](_evaluate(operand, values))
+        case ast.Call():
+            return values[_call_window(node, ast.unparse(node))]
+    msg = f"Cannot evaluate {ast.unparse(node)!r}."
+    raise ValueError(msg)
+
+
+def _compute(
+    function: FunctionName, axis: NDArray[np.float64], spectra: NDArray[np.float64]
+) -> NDArray[np.float64]:
+    """Compute a function of the spectra over the points of a window.
+
+    Parameters
+    ----------
+    function : {"band", "height", "position"}
+        What to compute.
+    axis : NDArray[np.float64]
+        The points of the axis within the window.
+    spectra : NDArray[np.float64]
+        The spectra over those points, of shape ``(n_spectra, n_points)``.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        One value per spectrum.
+    """
+    if function == "band":
+        # Integrals are taken along an increasing axis whichever way it runs, as by the band
+        # index; negative areas, as left by a baseline subtraction, keep their sign
+        integrals = np.asarray(np.trapezoid(spectra, axis, axis=1), dtype=np.float64)
+        return integrals if axis[-1] >= axis[0] else -integrals
+    if function == "height":
+        return spectra.max(axis=1)
+
+    n_points = axis.size
+    peak = spectra.argmax(axis=1)
+    if n_points < 3:  # noqa: PLR2004
+        return axis[peak]
+    # The vertex of the parabola through the maximum and the points on each side of it, in points
+    # of the axis; at the ends of the window, the three points nearest to the end are used
+    center = np.clip(peak, 1, n_points - 2)
+    rows = np.arange(len(spectra))
+    before, here, after = (spectra[rows, center + shift] for shift in (-1, 0, 1))
+    curvature = before - 2 * here + after
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(curvature < 0, (before - after) / (2 * curvature), 0.0)
+    refined = np.clip(center + offset, 0, n_points - 1)
+    return np.interp(refined, np.arange(n_points), axis)
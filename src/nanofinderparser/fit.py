@@ -0,0 +1,462 @@
+"""Fit a peak to every spectrum of a mapping.
+
+NanoFinder can fit a peak to each spectrum of a mapping and save the fitted parameters as maps
+(``"G Peak position (Lorentz)"`` and the like, read by
+:func:`~nanofinderparser.load.load_mdt_images`). :func:`fit_mapping` computes the same maps from a
+:class:`~nanofinderparser.models.Mapping`, as :class:`~nanofinderparser.models.Image` objects.
+
+The peak is one of the lineshapes of :mod:`nanofinderparser.shapes` (Gaussian, Lorentzian or
+pseudo-Voigt) on a constant background, fitted within a window of the spectral axis. Rather than
+fitting the spectra one after another, a Levenberg-Marquardt fit runs on a whole chunk of spectra
+at once: every iteration is a handful of array operations over the chunk, and spectra leave the
+batch as soon as their fit has converged. A 200 x 200 mapping is fitted in seconds, and chunks
+can be fitted in several processes at once.
+
+Examples
+--------
+>>> from nanofinderparser import sample_mapping
+>>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+>>> images = fit_mapping(mapping, (1500, 1650), "lorentzian", name="G")
+>>> images.titles[0]
+'G Peak position (Lorentz)'
+>>> images[0].shape
+(3, 4)
+"""
+
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Any, Final, Literal
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.models import Image, Images, Mapping
+from nanofinderparser.shapes import PeakShape, gaussian, lorentzian
+from nanofinderparser.units import Units
+from nanofinderparser.utils import DEFAULT_CHUNK_SIZE, resolve_jobs
+
+# Iterations after which a fit is stopped, whether it has converged or not.
+DEFAULT_MAX_ITERATIONS: Final[int] = 100
+
+# Relative decrease of the sum of squared residuals below which a fit has converged.
+_TOLERANCE: Final[float] = 1e-8
+
+# Damping of the first step, relative to the diagonal of the normal matrix, and the damping
+# beyond which no step can improve the fit any more.
+_INITIAL_DAMPING: Final[float] = 1e-3
+_MAX_DAMPING: Final[float] = 1e10
+
+# Smallest FWHM a fit may reach, relative to the spacing of the spectral axis.
+_MIN_FWHM_STEPS: Final[float] = 0.1
+
+# Names NanoFinder gives to the shapes in the titles of its fitted maps.
+_SHAPE_TITLES: Final[dict[str, str]] = {
+    "gaussian": "Gauss",
+    "lorentzian": "Lorentz",
+    "pseudo_voigt": "Pseudo-Voigt",
+}
+
+# Position of each fitted parameter in the parameter vectors.
+_AMPLITUDE, _CENTER, _FWHM, _BACKGROUND, _ETA = range(5)
+
+
+@dataclass(frozen=True, slots=True)
+class PeakFit:
+    """The peak fitted to each of a batch of spectra.
+
+    Every attribute holds one value per spectrum. Parameters are NaN for the spectra whose peak
+    could not be fitted: its center left the window, or its amplitude is not positive.
+
+    Attributes
+    ----------
+    position : NDArray[np.float64]
+        Center of the peak, in the units of the spectral axis.
+    fwhm : NDArray[np.float64]
+        Full width at half maximum, in the units of the spectral axis.
+    amplitude : NDArray[np.float64]
+        Height of the peak above the background.
+    background : NDArray[np.float64]
+        The constant background under the peak.
+    eta : NDArray[np.float64] | None
+        Weight of the Lorentzian part of a pseudo-Voigt, None for the other shapes.
+    residual : NDArray[np.float64]
+        Root mean square of the residuals of the fit.
+    converged : NDArray[np.bool_]
+        Whether the fit converged before the maximum number of iterations.
+    """
+
+    position: NDArray[np.float64]
+    fwhm: NDArray[np.float64]
+    amplitude: NDArray[np.float64]
+    background: NDArray[np.float64]
+    eta: NDArray[np.float64] | None
+    residual: NDArray[np.float64]
+    converged: NDArray[np.bool_]
+
+
+def fit_peaks(  # noqa: PLR0913
+    axis: NDArray[Any],
+    spectra: NDArray[Any],
+    shape: PeakShape = "lorentzian",
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_iterations: int = DEFAULT_MAX_ITERATIONS,
+    jobs: int = 1,
+) -> PeakFit:
+    """Fit a single peak on a constant background to each of several spectra.
+
+    Parameters
+    ----------
+    axis : NDArray[Any]
+        The spectral axis shared by the spectra, of shape ``(n_points,)``. Only the points in the
+        window to fit should be given.
+    spectra : NDArray[Any]
+        The spectra, of shape ``(n_spectra, n_points)``.
+    shape : {"gaussian", "lorentzian", "pseudo_voigt"}, optional
+        The lineshape of the peak, by default "lorentzian". The Lorentzian weight of a
+        pseudo-Voigt is fitted too.
+    chunk_size : int, optional
+        Number of spectra fitted together, by default 4096.
+    max_iterations : int, optional
+        Iterations after which a fit is stopped, by default 100.
+    jobs : int, optional
+        Number of chunks fitted at once, each in its own process, by default 1. 0 uses one per
+        CPU. Worth it for mappings of several chunks, where fitting outweighs starting the
+        processes.
+
+    Returns
+    -------
+    PeakFit
+        The fitted parameters, one per spectrum.
+
+    Raises
+    ------
+    ValueError
+        If the shape is unknown, or the spectra do not match the axis, or fewer points are given
+        than there are parameters to fit.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> axis = np.linspace(-10, 10, 101)
+    >>> spectra = np.stack([5 + 100 / (1 + ((axis - c) / 1.5) ** 2) for c in (-1.0, 2.0)])
+    >>> fit = fit_peaks(axis, spectra, "lorentzian")
+    >>> np.round(fit.position, 3), np.round(fit.fwhm, 3)
+    (array([-1.,  2.]), array([3., 3.]))
+    """
+    if shape not in _SHAPE_TITLES:
+        msg = f"Unknown peak shape {shape!r}; expected 'gaussian', 'lorentzian' or 'pseudo_voigt'."
+        raise ValueError(msg)
+
+    axis = np.asarray(axis, dtype=np.float64)
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+    n_parameters = 5 if shape == "pseudo_voigt" else 4
+    if spectra.shape[1] != axis.size:
+        msg = f"The spectra hold {spectra.shape[1]} points, but the axis {axis.size}."
+        raise ValueError(msg)
+    if axis.size <= n_parameters:
+        msg = f"At least {n_parameters + 1} points are needed to fit a {shape} peak."
+        raise ValueError(msg)
+
+    chunks = list(_chunks(spectra, chunk_size)) or [spectra]
+    workers = min(resolve_jobs(jobs), len(chunks))
+    if workers <= 1:
+        results = [_fit_chunk(axis, chunk, shape, max_iterations) for chunk in chunks]
+    else:
+        # An iteration is many small array operations, most of them holding the GIL, so threads
+        # fit no faster than one; processes do, for the cost of sending them the chunks
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _fit_chunk,
+                    repeat(axis),
+                    chunks,
+                    repeat(shape),
+                    repeat(max_iterations),
+                )
+            )
+
+    parameters = np.concatenate([parameters for parameters, _, _ in results])
+    residual = np.concatenate([residual for _, residual, _ in results])
+    converged = np.concatenate([converged for _, _, converged in results])
+
+    # Peaks that went out of the window or upside down were not found: don't report them
+    low, high = np.min(axis), np.max(axis)
+    center = parameters[:, _CENTER]
+    failed = (
+        ~np.isfinite(parameters).all(axis=1)
+        | (center < low)
+        | (center > high)
+        | (parameters[:, _AMPLITUDE] <= 0)
+    )
+    parameters[failed] = np.nan
+
+    return PeakFit(
+        position=parameters[:, _CENTER],
+        fwhm=parameters[:, _FWHM],
+        amplitude=parameters[:, _AMPLITUDE],
+        background=parameters[:, _BACKGROUND],
+        eta=parameters[:, _ETA] if shape == "pseudo_voigt" else None,
+        residual=residual,
+        converged=converged,
+    )
+
+
+def fit_mapping(  # noqa: PLR0913
+    mapping: Mapping,
+    window: tuple[float, float],
+    shape: PeakShape = "lorentzian",
+    *,
+    name: str = "",
+    spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.raman_shift,
+    channel: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_iterations: int = DEFAULT_MAX_ITERATIONS,
+    jobs: int = 1,
+) -> Images:
+    """Fit a peak to every spectrum of a mapping, and map the fitted parameters.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping to fit.
+    window : tuple[float, float]
+        The limits of the part of the spectral axis to fit, in `spectral_units`, in any order.
+    shape : {"gaussian", "lorentzian", "pseudo_voigt"}, optional
+        The lineshape of the peak, by default "lorentzian".
+    name : str, optional
+        Name of the peak, such as ``"G"``, prefixed to the titles of the maps, by default "".
+    spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+        Units of the window and of the fitted positions and widths, by default "raman_shift".
+    channel : int, optional
+        The channel index, by default 0.
+    chunk_size : int, optional
+        Number of spectra fitted together, by default 4096.
+    max_iterations : int, optional
+        Iterations after which a fit is stopped, by default 100.
+    jobs : int, optional
+        Number of chunks fitted at once, each in its own process, by default 1. 0 uses one per
+        CPU.
+
+    Returns
+    -------
+    Images
+        The maps of the peak position, FWHM, intensity and background, of the Lorentzian weight
+        for a pseudo-Voigt, and of the root mean square of the residuals. They are titled as
+        NanoFinder titles its own, such as ``"G Peak position (Lorentz)"``. Points whose peak
+        could not be fitted are NaN.
+
+    Raises
+    ------
+    ValueError
+        If the window holds too few points of the spectral axis to fit the peak.
+    """
+    axis = mapping.get_spectral_axis(spectral_units=spectral_units, channel=channel)
+    # The window is a contiguous range of the axis, so slicing keeps the spectra as views
+    points = mapping.spectral_slice(*window, units=spectral_units, channel=channel)
+    spectra = mapping.get_spectra(channel)[:, points]
+    fit = fit_peaks(
+        axis[points],
+        spectra,
+        shape,
+        chunk_size=chunk_size,
+        max_iterations=max_iterations,
+        jobs=jobs,
+    )
+
+    units = str(Units(spectral_units).value)
+    maps: list[tuple[str, NDArray[np.float64], str]] = [
+        ("Peak position", fit.position, units),
+        ("Peak FWHM", fit.fwhm, units),
+        ("Peak intensity", fit.amplitude, "counts"),
+        ("Background", fit.background, "counts"),
+    ]
+    if fit.eta is not None:
+        maps.append(("Lorentzian fraction", fit.eta, ""))
+    maps.append(("Fit residual", fit.residual, "counts"))
+
+    prefix = f"{name} " if name else ""
+    suffix = f" ({_SHAPE_TITLES[shape]})"
+    images: list[Image] = [
+        mapping.to_image(values, f"{prefix}{title}{suffix}", unit) for title, values, unit in maps
+    ]
+    return Images(images, source=mapping.source)
+
+
+def _fit_chunk(
+    axis: NDArray[np.float64],
+    spectra: NDArray[np.float64],
+    shape: str,
+    max_iterations: int,
+) -> tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.bool_]]:
+    """Fit a peak to every spectrum of a chunk, with a batched Levenberg-Marquardt.
+
+    Parameters
+    ----------
+    axis : NDArray[np.float64]
+        The spectral axis, of shape ``(n_points,)``.
+    spectra : NDArray[np.float64]
+        The spectra, of shape ``(n_spectra, n_points)``.
+    shape : str
+        The lineshape of the peak.
+    max_iterations : int
+        Iterations after which the fits are stopped.
+
+    Returns
+    -------
+    tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.bool_]]
+        The fitted parameters, of shape ``(n_spectra, n_parameters)``, the root mean square of
+        the residuals, and whether each fit converged.
+    """
+    min_fwhm = _MIN_FWHM_STEPS * float(np.min(np.abs(np.diff(axis))))
+    parameters = _initial_guess(axis, spectra, shape)
+    model, jacobian = _evaluate(axis, parameters, shape)
+    residuals = spectra - model
+    cost = np.einsum("nm,nm->n", residuals, residuals)
+
+    damping = np.full(len(spectra), _INITIAL_DAMPING)
+    converged = np.zeros(len(spectra), dtype=bool)
+    active = np.isfinite(cost)
+
+    for _ in range(max_iterations):
+        batch = np.flatnonzero(active)
+        if batch.size == 0:
+            break
+
+        # Damped normal equations, with Marquardt's scaling by the diagonal, so the step does
+        # not depend on the units of each parameter
+        jac = jacobian[batch]
+        normal = np.einsum("nmk,nml->nkl", jac, jac)
+        gradient = np.einsum("nmk,nm->nk", jac, residuals[batch])
+        diagonal = np.diagonal(normal, axis1=1, axis2=2)
+        diagonal = diagonal + 1e-12 * diagonal.max(axis=1, keepdims=True)
+        index = np.arange(normal.shape[1])
+        normal[:, index, index] += damping[batch, None] * diagonal
+        step = np.linalg.solve(normal, gradient[..., None])[..., 0]
+
+        trial = parameters[batch] + step
+        trial[:, _FWHM] = np.maximum(np.abs(trial[:, _FWHM]), min_fwhm)
+        if shape == "pseudo_voigt":
+            trial[:, _ETA] = np.clip(trial[:, _ETA], 0.0, 1.0)
+
+        trial_model, trial_jacobian = _evaluate(axis, trial, shape)
+        trial_residuals = spectra[batch] - trial_model
+        trial_cost = np.einsum("nm,nm->n", trial_residuals, trial_residuals)
+
+        # Steps that reduce the residuals are taken, and the damping relaxed; the others are
+        # rejected, and the damping increased so that the next step is shorter
+        better = trial_cost < cost[batch]
+        taken = batch[better]
+        settled = better & (cost[batch] - trial_cost <= _TOLERANCE * cost[batch])
+        parameters[taken] = trial[better]
+        jacobian[taken] = trial_jacobian[better]
+        residuals[taken] = trial_residuals[better]
+        cost[taken] = trial_cost[better]
+        damping[taken] /= 10.0
+        damping[batch[~better]] *= 10.0
+
+        converged[batch[settled]] = True
+        stuck = damping[batch] > _MAX_DAMPING
+        converged[batch[stuck]] = True
+        active[batch[settled | stuck]] = False
+
+    rms = np.sqrt(cost / spectra.shape[1])
+    return parameters, rms, converged
+
+
+def _initial_guess(
+    axis: NDArray[np.float64], spectra: NDArray[np.float64], shape: str
+) -> NDArray[np.float64]:
+    """Estimate the parameters of the peak of each spectrum, to start the fits from.
+
+    The background is taken from the lower end of the window, the peak at the maximum of the
+    spectrum, and its width from the points above half of its height.
+
+    Parameters
+    ----------
+    axis : NDArray[np.float64]
+        The spectral axis, of shape ``(n_points,)``.
+    spectra : NDArray[np.float64]
+        The spectra, of shape ``(n_spectra, n_points)``.
+    shape : str
+        The lineshape of the peak.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The parameters, of shape ``(n_spectra, n_parameters)``.
+    """
+    edge = max(1, axis.size // 20)
+    background = np.minimum(spectra[:, :edge].mean(axis=1), spectra[:, -edge:].mean(axis=1))
+    peak = np.argmax(spectra, axis=1)
+    amplitude = spectra[np.arange(len(spectra)), peak] - background
+    above = (spectra - background[:, None]) > amplitude[:, None] / 2
+    spacing = float(np.abs(np.diff(axis)).mean())
+
+    parameters = np.empty((len(spectra), 5 if shape == "pseudo_voigt" else 4))
+    parameters[:, _AMPLITUDE] = amplitude
+    parameters[:, _CENTER] = axis[peak]
+    parameters[:, _FWHM] = np.maximum(above.sum(axis=1), 2) * spacing
+    parameters[:, _BACKGROUND] = background
+    if shape == "pseudo_voigt":
+        parameters[:, _ETA] = 0.5
+    return parameters
+
+
+def _evaluate(
+    axis: NDArray[np.float64], parameters: NDArray[np.float64], shape: str
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """Evaluate the model of a peak on a background, and its derivatives.
+
+    Parameters
+    ----------
+    axis : NDArray[np.float64]
+        The spectral axis, of shape ``(n_points,)``.
+    parameters : NDArray[np.float64]
+        The parameters of each spectrum, of shape ``(n_spectra, n_parameters)``.
+    shape : str
+        The lineshape of the peak.
+
+    Returns
+    -------
+    tuple[NDArray[np.float64], NDArray[np.float64]]
+        The model, of shape ``(n_spectra, n_points)``, and its derivatives with respect to each
+        parameter, of shape ``(n_spectra, n_points, n_parameters)``.
+    """
+    amplitude = parameters[:, _AMPLITUDE, None]
+    fwhm = parameters[:, _FWHM, None]
+    reduced = 2.0 * (axis - parameters[:, _CENTER, None]) / fwhm
+    squared = reduced**2
+
+    # Each lineshape, and its derivative with respect to the reduced distance to the center
+    if shape == "gaussian":
+        profile = gaussian(squared)
+        slope = -2.0 * np.log(2.0) * reduced * profile
+    else:
+        lorentzian_part = lorentzian(squared)
+        profile = lorentzian_part
+        slope = -2.0 * reduced * lorentzian_part**2
+        if shape == "pseudo_voigt":
+            gaussian_part = gaussian(squared)
+            eta = parameters[:, _ETA, None]
+            profile = eta * lorentzian_part + (1.0 - eta) * gaussian_part
+            slope = eta * slope - (1.0 - eta) * 2.0 * np.log(2.0) * reduced * gaussian_part
+
+    jacobian = np.empty((*profile.shape, parameters.shape[1]))
+    jacobian[..., _AMPLITUDE] = profile
+    jacobian[..., _CENTER] = amplitude * slope * (-2.0 / fwhm)
+    jacobian[..., _FWHM] = amplitude * slope * (-reduced / fwhm)
+    jacobian[..., _BACKGROUND] = 1.0
+    if shape == "pseudo_voigt":
+        jacobian[..., _ETA] = amplitude * (lorentzian_part - gaussian_part)
+
+    model: NDArray[np.float64] = amplitude * profile + parameters[:, _BACKGROUND, None]
+    return model, jacobian
+
+
+def _chunks(spectra: NDArray[Any], chunk_size: int) -> Iterator[NDArray[Any]]:
+    """Split spectra into chunks of at most a given number of spectra."""
+    for start in range(0, len(spectra), chunk_size):
+        yield spectra[start : start + chunk_size]
@@ -0,0 +1,254 @@
+"""Time the stages of reading, converting and writing files.
+
+Loading a file goes through several stages (scanning the XML header, parsing it, validating the
+parsed values, reading the binary block...) and when a load is slow, the total time alone does not
+tell which of them is to blame. The readers, writers and exporters of the package report every
+stage to the listeners registered here, as a :class:`StageEvent` holding its duration and the
+number of bytes it handled.
+
+Nothing is measured unless a listener is registered: :func:`stage` then returns a shared object
+that does nothing, so the instrumented code pays a single check per stage.
+
+Stages are named ``"<area>.<stage>"``:
+
+- ``xml.scan`` and ``xml.parse``: finding the XML header of a file, and parsing it.
+- ``binary.read``: reading a block of binary values.
+- ``smd.load``, ``smd.model`` and ``smd.check``: the whole of
+  :func:`~nanofinderparser.load.load_smd`, the validation of the header into a
+  :class:`~nanofinderparser.models.Mapping`, and the check of its data block.
+- ``mdt.read`` and ``mdt.decode``: reading an MDT file, and decoding its frames.
+- ``mapping.to_df``, ``mapping.to_csv``, ``spectra.to_df`` and ``spectra.to_csv``: the exports of
+  mappings and of spectra.
+- ``smd.write``: the whole of :func:`~nanofinderparser.write.write_smd`.
+
+Stages may be nested (``smd.load`` contains the stages of reading the file), and the event of a
+stage is emitted when it ends, so inner stages are reported first.
+
+Examples
+--------
+>>> from nanofinderparser import instrument, sample_mapping
+>>> with instrument.recording() as events:
+...     _ = sample_mapping("graphene", x_size=4, y_size=3, n_points=64).to_df()
+>>> [event.stage for event in events]
+['mapping.to_df']
+"""
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from types import TracebackType
+from typing import Final, Self
+
+
+@dataclass(frozen=True, slots=True)
+class StageEvent:
+    """A stage of reading, converting or writing a file, once it has ended.
+
+    Attributes
+    ----------
+    stage : str
+        Name of the stage, such as ``"xml.parse"``. See :mod:`nanofinderparser.instrument`.
+    seconds : float
+        Wall time the stage took.
+    nbytes : int | None
+        Bytes the stage read, wrote or converted, when it makes sense for the stage.
+    source : Path | None
+        The file the stage worked on, when there is one.
+    failed : bool
+        Whether the stage ended with an exception.
+    """
+
+    stage: str
+    seconds: float
+    nbytes: int | None = None
+    source: Path | None = None
+    failed: bool = False
+
+    @property
+    def throughput(self) -> float | None:
+        """Bytes handled per second, or None when unknown."""
+        if self.nbytes is None or self.seconds <= 0:
+            return None
+        return self.nbytes / self.seconds
+
+
+type Listener = Callable[[StageEvent], None]
+
+# Registered listeners. The tuple is replaced rather than modified, so that emitting an event
+# never sees a listener being added or removed.
+_listeners: tuple[Listener, ...] = ()
+_lock: Final = threading.Lock()
+
+
+def add_listener(listener: Listener) -> None:
+    """Register a function to be called with the event of every stage.
+
+    Parameters
+    ----------
+    listener : Callable[[StageEvent], None]
+        The function to call. It runs in the thread that ran the stage, and anything it raises
+        propagates to the code being measured. Registering the same function twice has no effect.
+    """
+    global _listeners  # noqa: PLW0603
+    with _lock:
+        if listener not in _listeners:
+            _listeners = (*_listeners, listener)
+
+
+def remove_listener(listener: Listener) -> None:
+    """Stop calling a function registered with :func:`add_listener`.
+
+    Parameters
+    ----------
+    listener : Callable[[StageEvent], None]
+        The function to remove. Nothing happens if it was not registered.
+    """
+    global _listeners  # noqa: PLW0603
+    with _lock:
+        _listeners = tuple(registered for registered in _listeners if registered != listener)
+
+
+@contextmanager
+def listening(listener: Listener) -> Iterator[None]:
+    """Register a listener for the duration of a ``with`` block.
+
+    Parameters
+    ----------
+    listener : Callable[[StageEvent], None]
+        The function to call with the event of every stage.
+
+    Yields
+    ------
+    None
+    """
+    add_listener(listener)
+    try:
+        yield
+    finally:
+        remove_listener(listener)
+
+
+@contextmanager
+def recording() -> Iterator[list[StageEvent]]:
+    """Collect the events of every stage run within a ``with`` block.
+
+    Yields
+    ------
+    list[StageEvent]
+        The list the events are appended to, in the order the stages end.
+    """
+    events: list[StageEvent] = []
+    with listening(events.append):
+        yield events
+
+
+def is_active() -> bool:
+    """Whether any listener is registered.
+
+    Returns
+    -------
+    bool
+        True when the stages are being measured.
+    """
+    return bool(_listeners)
+
+
+class _Stage:
+    """Measure a stage and report it to the listeners when it ends."""
+
+    __slots__ = ("_start", "name", "nbytes", "source")
+
+    def __init__(self, name: str, nbytes: int | None, source: Path | None) -> None:
+        self.name = name
+        self.nbytes = nbytes
+        self.source = source
+        self._start = 0.0
+
+    @property
+    def active(self) -> bool:
+        """Whether the stage is measured; always True."""
+        return True
+
+    def __enter__(self) -> Self:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        event = StageEvent(
+            stage=self.name,
+            seconds=time.perf_counter() - self._start,
+            nbytes=self.nbytes,
+            source=self.source,
+            failed=exc_type is not None,
+        )
+        for listener in _listeners:
+            listener(event)
+
+
+class _NullStage:
+    """Stand-in for a stage when nothing listens: it measures nothing and reports nothing."""
+
+    __slots__ = ()
+
+    @property
+    def active(self) -> bool:
+        """Whether the stage is measured; always False."""
+        return False
+
+    @property
+    def nbytes(self) -> None:
+        """Bytes handled by the stage; never recorded."""
+        return None
+
+    @nbytes.setter
+    def nbytes(self, value: int | None) -> None:
+        pass
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        return None
+
+
+_NULL_STAGE: Final = _NullStage()
+
+
+def stage(
+    name: str, *, nbytes: int | None = None, source: Path | None = None
+) -> _Stage | _NullStage:
+    """Measure the stage run within a ``with`` block.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, ``"<area>.<stage>"``.
+    nbytes : int | None, optional
+        Bytes the stage handles, when known beforehand. It can also be set on the object the
+        ``with`` statement binds, once the stage knows it.
+    source : Path | None, optional
+        The file the stage works on.
+
+    Returns
+    -------
+    _Stage | _NullStage
+        A context manager reporting the stage to the listeners when the block ends, or one doing
+        nothing when no listener is registered. Its ``active`` attribute tells which, so that
+        byte counts that are costly to obtain are only computed when they are reported.
+    """
+    if not _listeners:
+        return _NULL_STAGE
+    return _Stage(name, nbytes, source)
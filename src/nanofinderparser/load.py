@@ -1,12 +1,21 @@
 """Handle NanoFinder files."""
 
 import logging
-from collections.abc import Generator
+import os
+import time
+from collections.abc import Callable, Generator
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal, overload
+from typing import Any, Literal, overload
+from xml.parsers.expat import ExpatError
 
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser import instrument
 from nanofinderparser.models import Channel, Image, Images, Mapping, Spectra, Spectrum
 from nanofinderparser.parsers import (
+    SMD_DTYPE,
     MdtImageFrame,
     MdtSpectrumFrame,
     read_binary_part,
@@ -19,7 +28,7 @@ logger = logging.getLogger(__name__)
 # TODO Need to handle the unit conversion to "raman_shift" properly (now just cm-1...)
 
 
-def load_smd(file: Path) -> Mapping:
+def load_smd(file: Path, *, lazy: bool = False) -> Mapping:
     """Load and parse a Nanofinder SMD file for mappings.
 
     This is the recommended way to create a Mapping instance.
@@ -28,6 +37,15 @@ def load_smd(file: Path) -> Mapping:
     ----------
     file : Path
         The path to the SMD file.
+    lazy : bool, optional
+        Whether to memory-map the data block rather than read it, by default False. Spectra are
+        then read from the file as they are used, so mappings larger than the memory can be
+        opened; the file must not change while the mapping is used.
+        :meth:`~nanofinderparser.models.Mapping.to_dask` then reads its chunks straight from
+        the file. The data is read-only: processing it with ``inplace=True``, as by
+        :func:`~nanofinderparser.baseline.subtract_baseline` or
+        :func:`~nanofinderparser.despike.despike`, raises a ValueError, while the default
+        ``inplace=False`` returns a new mapping holding the processed data.
 
     Returns
     -------
@@ -53,29 +71,284 @@ def load_smd(file: Path) -> Mapping:
     >>> from pathlib import Path
     >>> smd_file = Path("path/to/your/file.smd")
     >>> mapping = load_smd(smd_file)  # doctest: +SKIP
+    >>> means = load_smd(smd_file, lazy=True).to_dask().mean(axis=1).compute()  # doctest: +SKIP
 
     """
     file = Path(file)
+    if lazy:
+        return _map_smd(file)
+
+    with instrument.stage("smd.load", source=file) as load:
+        # 1st part of the mapping file is xml
+        xml_data, file_position = read_xml_part(file)
+        scandata = xml_data["SCANDATA"]
+
+        # 2nd part of the mapping file is binary
+        binary_data = read_binary_part(file, file_position)
+        scandata["Data"] = binary_data
+
+        with instrument.stage("smd.model", nbytes=file_position, source=file):
+            _parse_smd_channels(scandata)
+            mapping = Mapping(scandata, source=file)
+
+        with instrument.stage("smd.check", nbytes=binary_data.nbytes, source=file):
+            _validate_smd_data_block(mapping, file)
+
+        load.nbytes = file_position + binary_data.nbytes
+
+    return mapping
+
+
+def _map_smd(file: Path) -> Mapping:
+    """Load an SMD file with its data block memory-mapped rather than read."""
+    with instrument.stage("smd.load", source=file) as load:
+        mapping, file_position = load_smd_header(file)
+        n_values = (file.stat().st_size - file_position) // np.dtype(SMD_DTYPE).itemsize
+        if n_values > 0:
+            mapping.data = np.memmap(
+                file, dtype=SMD_DTYPE, mode="r", offset=file_position, shape=(n_values,)
+            )
+        _validate_smd_data_block(mapping, file)
+        # Set last: the data is replaced when the block holds more values than declared
+        mapping.data_offset = file_position
+        load.nbytes = file_position
+
+    return mapping
 
-    # 1st part of the mapping file is xml
-    xml_data, file_position = read_xml_part(file)
-    scandata = xml_data["SCANDATA"]
 
-    # Parse channels
-    channels_data = scandata["ScannedFrameParameters"]["DataCalibration"].pop("DataDimentions")
+def _parse_smd_channels(scandata: dict[str, Any]) -> None:
+    """Turn the channel descriptions of an SMD header into the list the model expects.
+
+    Parameters
+    ----------
+    scandata : dict[str, Any]
+        The ``SCANDATA`` element of the header, modified in place.
+    """
+    calibration = scandata["ScannedFrameParameters"]["DataCalibration"]
+    channels_data = calibration.pop("DataDimentions")
     channels = []
     for key, value in channels_data.items():
         if key.startswith("Channel"):
             channels.append(Channel(**value))
-    scandata["ScannedFrameParameters"]["DataCalibration"]["Channels"] = channels
+    calibration["Channels"] = channels
 
-    # 2nd part of the mapping file is binary
-    binary_data = read_binary_part(file, file_position)
-    scandata["Data"] = binary_data
 
-    mapping = Mapping(scandata, source=file)
-    _validate_smd_data_block(mapping, file)
-    return mapping
+def smd_is_complete(file: Path) -> bool:
+    """Whether an SMD file holds the whole data block its header declares.
+
+    NanoFinder writes the header first and the spectra after it, so a file still being written
+    has a header describing more values than the file holds yet. Only the header is parsed.
+
+    Parameters
+    ----------
+    file : Path
+        The path to the SMD file.
+
+    Returns
+    -------
+    bool
+        True when the file is complete. False when its header is incomplete or cannot be parsed,
+        or when its data block is shorter than the header declares.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be read.
+
+    Examples
+    --------
+    >>> smd_is_complete(Path("path/to/your/file.smd"))  # doctest: +SKIP
+    True
+    """
+    file = Path(file)
+    try:
+        mapping, file_position = load_smd_header(file)
+    except (ExpatError, KeyError, TypeError, ValueError):
+        return False
+
+    data_size = file.stat().st_size - file_position
+    return data_size >= mapping.expected_data_size * mapping.data.itemsize
+
+
+def load_smd_header(file: Path) -> tuple[Mapping, int]:
+    """Load the header of an SMD file, without its data.
+
+    Parameters
+    ----------
+    file : Path
+        The path to the SMD file.
+
+    Returns
+    -------
+    tuple[Mapping, int]
+        A Mapping holding the metadata of the file and no data, and the position in the file
+        where the data block starts.
+
+    Raises
+    ------
+    KeyError
+        If expected keys are missing in the XML data.
+    ValueError
+        If the header is incomplete, such as in a file whose writing has just started.
+    IOError
+        If there's an error reading the file.
+    xmltodict.expat.ExpatError
+        If there's an error parsing the XML.
+
+    Examples
+    --------
+    >>> mapping, data_position = load_smd_header(Path("path/to/your/file.smd"))  # doctest: +SKIP
+    """
+    file = Path(file)
+    xml_data, file_position = read_xml_part(file)
+    scandata = xml_data["SCANDATA"]
+    _parse_smd_channels(scandata)
+    scandata["Data"] = np.empty(0, dtype=SMD_DTYPE)
+    return Mapping(scandata, source=file), file_position
+
+
+@dataclass(frozen=True, slots=True)
+class AcquiredSpectrum:
+    """A spectrum of a mapping, read as soon as the instrument has written it.
+
+    Attributes
+    ----------
+    index : int
+        Position of the spectrum in the acquisition order, from 0.
+    x : float
+        Stage position along the x-axis, in the units of the stage (typically nm).
+    y : float
+        Stage position along the y-axis, in the units of the stage.
+    data : NDArray[np.float32]
+        The intensities, one per point of the spectral axis of the mapping.
+    """
+
+    index: int
+    x: float
+    y: float
+    data: NDArray[np.float32]
+
+
+def follow_smd(
+    file: Path,
+    *,
+    poll_interval: float = 1.0,
+    timeout: float | None = None,
+) -> Generator[AcquiredSpectrum, None, None]:
+    """Read the spectra of an SMD file while the instrument is still writing it.
+
+    The header is parsed once, then the file is polled, and the spectra completed since the
+    previous poll are read and yielded: only the new bytes are read, never the whole file. The
+    metadata of the mapping, such as its spectral axis, is given by :func:`load_smd_header`.
+
+    Parameters
+    ----------
+    file : Path
+        The path to the SMD file. Its header may not be written yet.
+    poll_interval : float, optional
+        Time between two polls of the file, in seconds, by default 1.
+    timeout : float | None, optional
+        Stop once the file has not grown for this many seconds, such as when the acquisition was
+        aborted, by default None (wait for as long as it takes).
+
+    Yields
+    ------
+    AcquiredSpectrum
+        Every spectrum of the mapping, in the order it was acquired, as soon as it is complete.
+        The generator ends once the last spectrum the header declares has been yielded.
+
+    Raises
+    ------
+    NotImplementedError
+        If the file holds more than one detector channel, or more than one acquisition per
+        spatial point.
+    OSError
+        If the file cannot be read.
+
+    Notes
+    -----
+    The x and y positions follow the scan order of the header (x-fast unless the x-axis is the
+    slow one, see :meth:`~nanofinderparser.models.Mapping.get_map`), starting from the first
+    point acquired. Unlike :meth:`~nanofinderparser.models.Mapping.to_df`, the spectra are not
+    reordered, since they are yielded as they come.
+
+    Examples
+    --------
+    >>> for spectrum in follow_smd(Path("path/to/your/file.smd"), timeout=60):  # doctest: +SKIP
+    ...     print(spectrum.x, spectrum.y, spectrum.data.max())
+    """
+    file = Path(file)
+    last_growth = time.monotonic()
+
+    def stalled() -> bool:
+        return timeout is not None and time.monotonic() - last_growth > timeout
+
+    # The header comes first; wait until it is whole
+    size = -1
+    while True:
+        try:
+            mapping, data_position = load_smd_header(file)
+            break
+        except (ExpatError, KeyError, TypeError, ValueError, FileNotFoundError):
+            new_size = file.stat().st_size if file.exists() else -1
+            if new_size != size:
+                size, last_growth = new_size, time.monotonic()
+            elif stalled():
+                return
+            time.sleep(poll_interval)
+
+    channel = mapping.single_channel()
+    spectrum_size = channel.channel_size * mapping.data.itemsize
+    n_spectra = mapping.expected_data_size // channel.channel_size
+    position = _scan_positions(mapping)
+
+    with file.open("rb") as f:
+        index = 0
+        while index < n_spectra:
+            available = (os.fstat(f.fileno()).st_size - data_position) // spectrum_size
+            new = min(available, n_spectra) - index
+            if new <= 0:
+                if stalled():
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            last_growth = time.monotonic()
+            f.seek(data_position + index * spectrum_size)
+            block = np.frombuffer(f.read(new * spectrum_size), dtype=SMD_DTYPE)
+            for data in block.reshape(new, channel.channel_size):
+                x, y = position(index)
+                yield AcquiredSpectrum(index=index, x=x, y=y, data=data)
+                index += 1
+
+
+def _scan_positions(mapping: Mapping) -> Callable[[int], tuple[float, float]]:
+    """Stage position of the spectra of a mapping, from their position in the acquisition order.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping, whose header gives the scan order, start and step of the stage.
+
+    Returns
+    -------
+    Callable[[int], tuple[float, float]]
+        Gives the (x, y) position of the spectrum acquired at a given position.
+    """
+    stage = mapping.scanned_frame_parameters.stage_3d_parameters
+    axes = stage.stage_axes_dimensions
+    x_fast = not (axes.x.is_slow and not axes.y.is_slow)
+    fast = stage.axis_size_x if x_fast else stage.axis_size_y
+
+    def position(index: int) -> tuple[float, float]:
+        slow_index, fast_index = divmod(index, fast)
+        xi, yi = (fast_index, slow_index) if x_fast else (slow_index, fast_index)
+        return (
+            axes.x.start_position + xi * axes.x.step_size,
+            axes.y.start_position + yi * axes.y.step_size,
+        )
+
+    return position
 
 
 def _validate_smd_data_block(mapping: Mapping, file: Path) -> None:
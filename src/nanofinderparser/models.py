@@ -1,11 +1,16 @@
 """Models to parse nanofinder files."""
 
+import copy
 import logging
-from collections.abc import Callable, Iterator, Sequence
-from dataclasses import dataclass
+import pickle
+import struct
+import sys
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
 from datetime import date, datetime, time
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
-from typing import Any, Final, Literal, Protocol, Self, overload
+from typing import TYPE_CHECKING, Any, Final, Literal, Protocol, Self, SupportsIndex, overload
 
 import numpy as np
 import pandas as pd
@@ -13,17 +18,45 @@ from numpy.typing import NDArray
 from pyauxlib.fileutils.filesfolders import clean_filename
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 
+from nanofinderparser import instrument
+from nanofinderparser.bands import BandIndex
+from nanofinderparser.expressions import evaluate_expressions
 from nanofinderparser.map import AxisSpec, _nanofinder_mapcoords
-from nanofinderparser.parsers import MdtImageFrame, MdtSpectrumFrame
+from nanofinderparser.parsers import (
+    SMD_DATA_FORMAT,
+    SMD_DTYPE,
+    MdtImageFrame,
+    MdtSpectrumFrame,
+    read_binary_part,
+)
+from nanofinderparser.resample import Method as ResampleMethod
+from nanofinderparser.resample import resample
+from nanofinderparser.spectral_axis import SpectralAxis
 from nanofinderparser.units import MdtUnit, Units, convert_spectral_units, validate_units
 from nanofinderparser.utils import (
+    DEFAULT_CHUNK_SIZE,
     SaveMapCoords,
+    import_optional,
     parse_vb_bool,
     validate_savemapcoords,
 )
 
+if TYPE_CHECKING:
+    import dask.array as da
+    import pyarrow as pa
+    import xarray as xr
+
 logger = logging.getLogger(__name__)
 
+# Spectra in each chunk of the dask array of a mapping. A chunk of 1024-point spectra is then
+# 16 MB, small enough for every core to hold a few, large enough to keep the scheduling cheap.
+DEFAULT_DASK_CHUNK_SIZE: Final[int] = 4096
+
+# Layout of a mapping in shared memory: the length of the pickled metadata, the metadata, and
+# the data, starting at a multiple of the alignment so that it can be read as an array.
+_SHARED_HEADER: Final[struct.Struct] = struct.Struct("<Q")
+_SHARED_DATA_ALIGNMENT: Final[int] = 64
+
 # How SMD files write the date and the time of a measurement.
 SMD_DATE_FORMAT: Final[str] = "%Y/%m/%d"
 SMD_TIME_FORMAT: Final[str] = "%H:%M:%S"
@@ -708,6 +741,9 @@ class Mapping:
         ``(n_spectra * spectral_len,)``.
     source : Path | None
         Path of the file the mapping was read from, when known.
+    data_offset : int | None
+        Position of the data block in :attr:`source` when :attr:`data` is memory-mapped from
+        it, as by ``load_smd(file, lazy=True)``; None otherwise, and once the data is replaced.
 
     Properties
     ----------
@@ -740,12 +776,36 @@ class Mapping:
         Return data reshaped as (n_spectra, spectral_len).
     single_channel()
         Return the only detector channel of the mapping, checking it is supported.
+    with_data(data)
+        Return a mapping holding other data, and the metadata of this one.
+    check_writeable()
+        Check that the data can be modified in place.
+    data_modified()
+        Forget what was derived from the data, after modifying it in place.
+    to_shared_memory()
+        Copy the mapping to a block of shared memory, for other processes to use.
+    from_shared_memory(name)
+        Open a mapping copied to shared memory, without copying it again.
+    resample(axis, units=None, method="linear", chunk_size=4096)
+        Return the mapping with its spectra resampled onto another spectral axis.
     to_smd(file)
         Write the mapping back as a NanoFinder SMD file.
     get_map(channel: int = 0)
         Return data reshaped as the spatial map: (slow_axis, fast_axis, spectral_len).
+    to_image(values, title, value_unit="")
+        Build a map of one value per spectrum.
+    band_index(units="raman_shift", channel=0, cache=False)
+        Return the running integrals of the spectra, built once.
+    band_map(low, high, units="raman_shift", title="", channel=0, cache=False)
+        Map the integral of the spectra over a window of the spectral axis.
+    eval_maps(expressions, units="raman_shift", channel=0, chunk_size=4096)
+        Map expressions over windows of the spectral axis, such as band ratios.
     get_spectral_axis(channel: int = 0)
         Get the spectral axis for the given channel.
+    spectral_index(value, units=None, channel=0)
+        Find the point of the spectral axis nearest to a value.
+    spectral_slice(low, high, units=None, channel=0)
+        Find the points of the spectral axis within a window.
     get_spectral_axis_len(channel: int = 0)
         Get the number of data points of each spectrum for the given channel.
     get_exposure_time(channel: int = 0)
@@ -760,6 +820,10 @@ class Mapping:
         Export the data to csv files.
     to_df(spectral_units: Units | str | None = None, channel: int = 0)
         Export the data and mapcoords to DataFrames.
+    to_xarray(spectral_units: Units | str | None = None, channel: int = 0)
+        Wrap the spectral map in an xarray DataArray, without copying it.
+    to_dask(chunks: int = 4096, channel: int = 0)
+        Return the spectra as a dask array, read chunk by chunk from the file if memory-mapped.
 
     Notes
     -----
@@ -797,6 +861,10 @@ class Mapping:
         )
         self.data = init_dict["Data"]
         self.source = source
+        self._data_is_source = source is not None
+        # Spectral axes prepared for lookups, by units and channel. They depend on the metadata
+        # only, so copies of the mapping holding other data share them.
+        self._spectral_axes: dict[tuple[Units, int], SpectralAxis] = {}
 
     @property
     def data(self) -> NDArray[Any]:
@@ -812,6 +880,11 @@ class Mapping:
     @data.setter
     def data(self, value: Sequence[float] | NDArray[Any]) -> None:
         self._data = np.asarray(value)  # dtype inferred; stored flat as-is
+        self.data_offset: int | None = None
+        # Whether the data is still that read from the file of the mapping
+        self._data_is_source = False
+        # Indices built from the previous data, by units and channel
+        self._band_indices: dict[tuple[Units, int], BandIndex] = {}
 
     def get_spectra(self, channel: int = 0) -> NDArray[Any]:
         """Return the spectral data reshaped as ``(n_spectra, spectral_len)``.
@@ -838,6 +911,283 @@ class Mapping:
         """
         return self._data.reshape(-1, self.get_spectral_axis_len(channel=channel))
 
+    def with_data(self, data: NDArray[Any]) -> Self:
+        """Return a mapping holding other data, and the metadata of this one.
+
+        Parameters
+        ----------
+        data : NDArray[Any]
+            The flat data of the new mapping, such as the processed data of this one.
+
+        Returns
+        -------
+        Mapping
+            A new mapping, sharing the metadata of this one rather than copying it.
+        """
+        mapping = copy.copy(self)
+        mapping.data = data
+        return mapping
+
+    def check_writeable(self) -> None:
+        """Check that the data can be modified in place.
+
+        Raises
+        ------
+        ValueError
+            If the data is read-only, as when memory-mapped by ``load_smd(file, lazy=True)`` or
+            opened from shared memory.
+        """
+        if not self._data.flags.writeable:
+            msg = "The data of the mapping is read-only, as when memory-mapped by "
+            msg += "load_smd(file, lazy=True); load it without lazy=True, or use inplace=False."
+            raise ValueError(msg)
+
+    def data_modified(self) -> None:
+        """Forget what was derived from the data, after modifying it in place.
+
+        Replacing :attr:`data` does so already. Modifying the array itself, as
+        :func:`~nanofinderparser.baseline.subtract_baseline` and
+        :func:`~nanofinderparser.despike.despike` do with ``inplace=True``, must be followed by a
+        call to this method, or :meth:`band_map` would keep integrating the previous data.
+        """
+        self.data = self._data
+
+    @classmethod
+    def _from_parts(  # noqa: PLR0913, PLR0917
+        cls,
+        vendor: str,
+        version: str,
+        parameters: "ScannedFrameParameters",
+        source: Path | None,
+        data: NDArray[Any],
+        data_is_source: bool = False,
+    ) -> Self:
+        """Build a mapping from its parsed metadata and its data, without validating either."""
+        mapping = cls.__new__(cls)
+        mapping.vendor = vendor
+        mapping.version = version
+        mapping.scanned_frame_parameters = parameters
+        mapping.data = data
+        mapping.source = source
+        mapping._data_is_source = data_is_source  # noqa: SLF001
+        mapping._spectral_axes = {}  # noqa: SLF001
+        return mapping
+
+    @classmethod
+    def _from_file_block(  # noqa: PLR0913, PLR0917
+        cls,
+        vendor: str,
+        version: str,
+        parameters: "ScannedFrameParameters",
+        source: Path,
+        data_offset: int,
+        size: int,
+    ) -> Self:
+        """Build a mapping whose data is memory-mapped from the data block of its file."""
+        data = np.memmap(source, dtype=SMD_DTYPE, mode="r", offset=data_offset, shape=(size,))
+        mapping = cls._from_parts(vendor, version, parameters, source, data)
+        mapping.data_offset = data_offset
+        return mapping
+
+    def __copy__(self) -> Self:
+        """Copy the mapping shallowly, sharing its metadata and the lookups built from it."""
+        mapping = type(self).__new__(type(self))
+        mapping.__dict__.update(self.__dict__)
+        return mapping
+
+    def __reduce_ex__(self, protocol: SupportsIndex) -> tuple[Any, ...]:
+        """Pickle the mapping without its caches, and its data out of band with protocol 5.
+
+        The data is pickled as a NumPy array, which protocol 5 hands to the ``buffer_callback``
+        of :func:`pickle.dumps` rather than copying it into the pickle. The band indices and
+        spectral axes built for lookups are left out: the band indices alone are twice the size
+        of the data in double precision, and both are rebuilt when needed.
+
+        A mapping memory-mapped from its file, as by ``load_smd(file, lazy=True)``, is pickled as
+        the position of its data in the file, and memory-mapped again when unpickled: processes
+        it is sent to read the file through the page cache the system shares between them, and
+        the file must still be there.
+        """
+        parts = (self.vendor, self.version, self.scanned_frame_parameters, self.source)
+        if self.source is not None and self.data_offset is not None:
+            return (self._from_file_block, (*parts, self.data_offset, self._data.size))
+        data = np.ascontiguousarray(self._data)
+        return (self._from_parts, (*parts, data, self._data_is_source))
+
+    def to_shared_memory(self) -> SharedMemory:
+        """Copy the mapping to a block of shared memory, for other processes to use.
+
+        The block holds the metadata and the data of the mapping. Processes given its name open
+        the mapping with :meth:`from_shared_memory`, all of them reading the one copy of the
+        data, rather than each receiving its own copy through a pipe.
+
+        Returns
+        -------
+        SharedMemory
+            The block, whose ``name`` is passed to the other processes. Close it and unlink it
+            once they are done, as :class:`~multiprocessing.shared_memory.SharedMemory`
+            requires.
+
+        Examples
+        --------
+        >>> from concurrent.futures import ProcessPoolExecutor
+        >>> from nanofinderparser import sample_mapping
+        >>> def peak_count(name: str) -> int:
+        ...     mapping = Mapping.from_shared_memory(name)
+        ...     return int(mapping.get_spectra().max())
+        >>> block = sample_mapping("graphene").to_shared_memory()
+        >>> with ProcessPoolExecutor() as pool:  # doctest: +SKIP
+        ...     results = list(pool.map(peak_count, [block.name] * 4))
+        >>> block.close()
+        >>> block.unlink()
+        """
+        metadata = pickle.dumps(
+            (
+                self.vendor,
+                self.version,
+                self.scanned_frame_parameters,
+                self.source,
+                self._data.dtype.str,
+                self._data.size,
+            ),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        offset = _shared_data_offset(len(metadata))
+        block = SharedMemory(create=True, size=offset + self._data.nbytes)
+        buffer = _block_buffer(block)
+        _SHARED_HEADER.pack_into(buffer, 0, len(metadata))
+        buffer[_SHARED_HEADER.size : _SHARED_HEADER.size + len(metadata)] = metadata
+        copy = np.ndarray(self._data.shape, self._data.dtype, buffer=buffer, offset=offset)
+        copy[:] = self._data
+        # The block cannot be closed while an array uses it
+        del copy, buffer
+        return block
+
+    @classmethod
+    def from_shared_memory(cls, name: str) -> Self:
+        """Open a mapping copied to shared memory, without copying it again.
+
+        Parameters
+        ----------
+        name : str
+            Name of the block written by :meth:`to_shared_memory`. Its content is unpickled,
+            so only open blocks written by processes you trust.
+
+        Returns
+        -------
+        Mapping
+            The mapping, whose :attr:`data` is a read-only view of the block. The block stays
+            open for as long as an array uses it.
+
+        Raises
+        ------
+        FileNotFoundError
+            If there is no block of that name.
+        """
+        # Blocks are unlinked by the process that wrote them, not by those reading them
+        if sys.version_info >= (3, 13):
+            block = SharedMemory(name=name, track=False)
+        else:
+            block = SharedMemory(name=name)
+        buffer = _block_buffer(block)
+        (length,) = _SHARED_HEADER.unpack_from(buffer)
+        vendor, version, parameters, source, dtype, size = pickle.loads(  # noqa: S301
+            buffer[_SHARED_HEADER.size : _SHARED_HEADER.size + length]
+        )
+        data = np.frombuffer(
+            _SharedBlock(block), dtype=dtype, count=size, offset=_shared_data_offset(length)
+        )
+        data.flags.writeable = False
+        return cls._from_parts(vendor, version, parameters, source, data)
+
+    def resample(
+        self,
+        axis: NDArray[Any],
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+        *,
+        method: ResampleMethod = "linear",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Self:
+        """Return the mapping with its spectra resampled onto another spectral axis.
+
+        Where the points of the new axis fall on the old one is worked out once, and reused for
+        every spectrum; see :mod:`nanofinderparser.resample`.
+
+        Parameters
+        ----------
+        axis : NDArray[Any]
+            The new spectral axis, in `units`, usually evenly spaced.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            The units of the new axis, by default None (the units of the file).
+        method : {"linear", "cubic"}, optional
+            Interpolation between the two nearest points ("linear", the default) or by the cubic
+            through the four nearest ones ("cubic").
+        chunk_size : int, optional
+            Number of spectra resampled together, by default 4096.
+
+        Returns
+        -------
+        Mapping
+            A new mapping, with the spectra on the new axis in single precision, NaN at points
+            beyond the old axis. Its spectral axis is stored in the units of the file, so that
+            it can be written as an SMD file; asked for in `units`, it is the new axis.
+
+        Raises
+        ------
+        NotImplementedError
+            If the mapping holds more than one detector channel.
+        ValueError
+            If the spectral axis of the mapping has too few points for the method.
+
+        Examples
+        --------
+        >>> from nanofinderparser import sample_mapping
+        >>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+        >>> grid = np.arange(1200.0, 2800.0, 2.0)
+        >>> resampled = mapping.resample(grid, "raman_shift")
+        >>> resampled.get_spectra().shape, resampled.get_spectra().dtype
+        ((12, 800), dtype('float32'))
+        >>> bool(np.allclose(resampled.get_spectral_axis("raman_shift"), grid))
+        True
+        """
+        channel = self.single_channel()
+        axis = np.asarray(axis, dtype=np.float64)
+        spectra = resample(
+            self.get_spectra(),
+            self.get_spectral_axis(units),
+            axis,
+            method=method,
+            chunk_size=chunk_size,
+        )
+
+        # The channel keeps its units, NanoFinder reading nothing else than nm
+        file_units = validate_units(channel.channel_axis_unit)
+        if units is not None and validate_units(units) != file_units:
+            axis = convert_spectral_units(
+                axis, units, file_units, laser_wavelength_nm=self.laser_wavelength
+            )
+        calibration = self.scanned_frame_parameters.data_calibration
+        parameters = self.scanned_frame_parameters.model_copy(
+            update={
+                "data_calibration": calibration.model_copy(
+                    update={
+                        "channels": [
+                            channel.model_copy(
+                                update={"channel_size": axis.size, "channel_axis_array": axis}
+                            )
+                        ]
+                    }
+                ),
+                "data_block_size_bytes": spectra.nbytes,
+            }
+        )
+
+        mapping = self.with_data(spectra.ravel())
+        mapping.scanned_frame_parameters = parameters
+        # The spectral axes cached by this mapping are not those of the new one
+        mapping._spectral_axes = {}  # noqa: SLF001
+        return mapping
+
     def single_channel(self) -> Channel:
         """Return the only detector channel of the mapping.
 
@@ -912,14 +1262,82 @@ class Mapping:
         if spectral_units is None or current_units == spectral_units:
             return raw_axis
 
-        new_unit = validate_units(spectral_units)
+        # The conversion is cached; the copy keeps the cached axis safe from the caller
+        return self._spectral_axis(spectral_units, channel).values.copy()
 
-        return convert_spectral_units(
-            raw_axis,
-            self._get_channel_axis_unit(channel),
-            new_unit,
-            laser_wavelength_nm=self.laser_wavelength,
-        )
+    def spectral_index(
+        self,
+        value: float,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+        channel: int = 0,
+    ) -> int:
+        """Find the point of the spectral axis nearest to a value.
+
+        Parameters
+        ----------
+        value : float
+            The value, in `units`.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            The units of the value, by default None (the units of the file).
+        channel : int, optional
+            The channel index, by default 0.
+
+        Returns
+        -------
+        int
+            The index of the nearest point, as for the columns of :meth:`get_spectra`.
+        """
+        return self._spectral_axis(units, channel).nearest(value)
+
+    def spectral_slice(
+        self,
+        low: float,
+        high: float,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+        channel: int = 0,
+    ) -> slice:
+        """Find the points of the spectral axis within a window.
+
+        Parameters
+        ----------
+        low, high : float
+            The limits of the window, in `units`, in any order. Points on the limits are within
+            the window.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            The units of the limits, by default None (the units of the file).
+        channel : int, optional
+            The channel index, by default 0.
+
+        Returns
+        -------
+        slice
+            The points within the window, to slice the columns of :meth:`get_spectra` with.
+
+        Raises
+        ------
+        ValueError
+            If no point of the spectral axis lies within the window.
+        """
+        return self._spectral_axis(units, channel).window(low, high)
+
+    def _spectral_axis(
+        self,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None,
+        channel: int,
+    ) -> SpectralAxis:
+        """Return the spectral axis in some units, prepared for lookups once and cached."""
+        current_units = validate_units(self._get_channel_axis_unit(channel))
+        new_unit = current_units if units is None else validate_units(units)
+        axis = self._spectral_axes.get((new_unit, channel))
+        if axis is None:
+            values = self._get_raw_spectral_axis(channel)
+            if new_unit != current_units:
+                values = convert_spectral_units(
+                    values, current_units, new_unit, laser_wavelength_nm=self.laser_wavelength
+                )
+            axis = SpectralAxis.from_values(values)
+            self._spectral_axes[new_unit, channel] = axis
+        return axis
 
     def get_spectral_axis_len(self, channel: int = 0) -> int:
         """Get the number of data points of each spectrum for the given channel.
@@ -985,6 +1403,35 @@ class Mapping:
         channel_obj = self.scanned_frame_parameters.data_calibration.channels[channel]
         return channel_obj.channel_info.accumulation_number
 
+    def get_metadata(self, channel: int = 0) -> dict[str, Any]:
+        """Get the metadata of the measurement, as exported along with the spectra.
+
+        Parameters
+        ----------
+        channel : int, optional
+            The channel index, by default 0
+
+        Returns
+        -------
+        dict[str, Any]
+            The units of the intensities, the source file, the date and time in ISO format, the
+            laser wavelength and power, the exposure time and the accumulation number; those
+            missing are left out rather than given as None.
+        """
+        channel_obj = self.scanned_frame_parameters.data_calibration.channels[channel]
+        metadata = {
+            "units": channel_obj.data_channel_unit,
+            "source": None if self.source is None else str(self.source),
+            "original_file_name": self.original_file_name,
+            "datetime": self.datetime.isoformat(),
+            "laser_wavelength_nm": self.laser_wavelength,
+            "laser_power_mw": self.laser_power,
+            "exposure_time_s": self.get_exposure_time(channel),
+            "accumulation_number": self.get_accumulation_number(channel),
+        }
+        # netCDF has no missing attribute values, so they are left out
+        return {key: value for key, value in metadata.items() if value is not None}
+
     @property
     def laser_wavelength(self) -> float:
         """Wavelength of the laser in nm."""
@@ -1067,6 +1514,250 @@ class Mapping:
         slow, fast = self.scanned_frame_parameters.stage_3d_parameters.scan_order
         return self._data.reshape((slow, fast, self.get_spectral_axis_len(channel)))
 
+    def to_image(self, values: NDArray[Any], title: str, value_unit: str = "") -> "Image":
+        """Build a map of one value per spectrum, such as a fitted peak position.
+
+        Parameters
+        ----------
+        values : NDArray[Any]
+            One value per spectrum, in acquisition order: either flat, of shape ``(n_spectra,)``,
+            or shaped as :meth:`get_map` without its spectral axis.
+        title : str
+            Name of the map.
+        value_unit : str, optional
+            Units of the values, by default "".
+
+        Returns
+        -------
+        Image
+            The map, of shape ``(y_steps, x_steps)``, with the stage positions of the mapping.
+
+        Raises
+        ------
+        ValueError
+            If there is not one value per spectrum.
+
+        Examples
+        --------
+        >>> from nanofinderparser import sample_mapping
+        >>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=64)
+        >>> mapping.to_image(mapping.get_spectra().max(axis=1), "Maximum", "counts").shape
+        (3, 4)
+        """
+        stage = self.scanned_frame_parameters.stage_3d_parameters
+        slow, fast = stage.scan_order
+        values = np.asarray(values, dtype=np.float64)
+        if values.size != slow * fast:
+            msg = f"Expected one value per spectrum ({slow * fast}), got {values.size}."
+            raise ValueError(msg)
+
+        values = values.reshape(slow, fast)
+        axes = stage.stage_axes_dimensions
+        if axes.x.is_slow and not axes.y.is_slow:
+            values = values.T
+
+        return Image(
+            title=title,
+            values=values,
+            x_axis=AxisSpec(axes.x.start_position, axes.x.step_size, axes.x.unit_name),
+            y_axis=AxisSpec(axes.y.start_position, axes.y.step_size, axes.y.unit_name),
+            value_unit=value_unit,
+            measured_at=self.datetime,
+        )
+
+    def band_index(
+        self,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.raman_shift,
+        channel: int = 0,
+        *,
+        cache: bool = False,
+    ) -> BandIndex:
+        """Return the running integrals of the spectra along the spectral axis, built once.
+
+        The index is built the first time it is asked for, in given units, and kept with the
+        mapping until its data is replaced or :meth:`data_modified` is called.
+
+        Parameters
+        ----------
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+            Units of the spectral axis the spectra are integrated along, by default
+            "raman_shift".
+        channel : int, optional
+            The channel index, by default 0.
+        cache : bool, optional
+            Whether to keep the index in a ``.npy`` file next to the file of the mapping, by
+            default False. The file is reused, as a memory map, as long as it is newer than the
+            file of the mapping and holds as many spectra of as many points as its data. It
+            holds the integrals of the data as read from the file, so only a mapping whose data
+            is still that can use it: not one processed, resampled, or modified in place.
+
+        Returns
+        -------
+        BandIndex
+            The running integrals of the spectra.
+
+        Raises
+        ------
+        ValueError
+            If `cache` is True for a mapping that was not read from a file, or whose data is no
+            longer that read from it.
+        """
+        units = validate_units(units)
+        index = self._band_indices.get((units, channel))
+        if index is not None:
+            return index
+
+        axis = self.get_spectral_axis(units, channel)
+        spectra = self.get_spectra(channel)
+        file = self._band_index_file(units, channel) if cache else None
+        if file is not None and self._is_band_index_fresh(file, spectra.shape):
+            index = BandIndex.load(file, axis)
+        else:
+            index = BandIndex.build(axis, spectra, file=file)
+        self._band_indices[units, channel] = index
+        return index
+
+    def band_map(  # noqa: PLR0913
+        self,
+        low: float,
+        high: float,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.raman_shift,
+        *,
+        title: str = "",
+        channel: int = 0,
+        cache: bool = False,
+    ) -> "Image":
+        """Map the integral of the spectra over a window of the spectral axis.
+
+        The integrals come from :meth:`band_index`, so after the first map, every other one
+        costs two values per spectrum, whatever the width of its window.
+
+        Parameters
+        ----------
+        low, high : float
+            The limits of the window, in `units`, in any order.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+            Units of the window, by default "raman_shift".
+        title : str, optional
+            Name of the map, by default "" (``"Integral <low>-<high> <units>"``).
+        channel : int, optional
+            The channel index, by default 0.
+        cache : bool, optional
+            Whether to keep the index in a file next to the file of the mapping, by default
+            False. See :meth:`band_index`.
+
+        Returns
+        -------
+        Image
+            The integral of every spectrum between the first and last points of the axis within
+            the window, by the trapezoidal rule, in counts times `units`.
+
+        Raises
+        ------
+        ValueError
+            If no point of the spectral axis lies within the window.
+
+        Examples
+        --------
+        >>> from nanofinderparser import sample_mapping
+        >>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+        >>> g_band = mapping.band_map(1550, 1620)
+        >>> g_band.title, g_band.shape
+        ('Integral 1550-1620 raman_shift', (3, 4))
+        """
+        units = validate_units(units)
+        values = self.band_index(units, channel, cache=cache).integrate(low, high)
+        low, high = sorted((low, high))
+        title = title or f"Integral {low:g}-{high:g} {units.value}"
+        return self.to_image(values, title, "counts")
+
+    def eval_maps(
+        self,
+        expressions: dict[str, str],
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.raman_shift,
+        *,
+        channel: int = 0,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> "Images":
+        """Map expressions over windows of the spectral axis, such as band ratios.
+
+        The expressions combine ``band(low, high)`` (the integral over a window),
+        ``height(low, high)`` and ``position(low, high)`` (of the maximum within a window) with
+        arithmetic; see :mod:`nanofinderparser.expressions`. All the windows of all the
+        expressions are computed in a single pass over the spectra.
+
+        Parameters
+        ----------
+        expressions : dict[str, str]
+            The expressions, by the title of their map.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+            Units of the limits of the windows, and of the positions, by default "raman_shift".
+        channel : int, optional
+            The channel index, by default 0.
+        chunk_size : int, optional
+            Number of spectra read together, by default 4096.
+
+        Returns
+        -------
+        Images
+            The map of every expression, titled by its name, in the order given.
+
+        Raises
+        ------
+        ValueError
+            If an expression is not valid, or a window holds no point of the spectral axis.
+
+        Examples
+        --------
+        >>> from nanofinderparser import sample_mapping
+        >>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+        >>> maps = mapping.eval_maps(
+        ...     {
+        ...         "I(2D)/I(G)": "band(2600, 2750) / band(1550, 1620)",
+        ...         "2D - G": "position(2600, 2750) - position(1550, 1620)",
+        ...     }
+        ... )
+        >>> maps.titles
+        ['I(2D)/I(G)', '2D - G']
+        """
+        units = validate_units(units)
+        values = evaluate_expressions(
+            expressions,
+            self.get_spectral_axis(units, channel),
+            self.get_spectra(channel),
+            chunk_size=chunk_size,
+        )
+        return Images(
+            [self.to_image(map_values, name) for name, map_values in values.items()],
+            source=self.source,
+        )
+
+    def _band_index_file(self, units: Units, channel: int) -> Path:
+        """Path of the file caching the band index of the mapping, next to its own file."""
+        if self.source is None:
+            msg = "Only the band index of a mapping read from a file can be cached."
+            raise ValueError(msg)
+        if not self._data_is_source and self.data_offset is None:
+            msg = "Only the band index of the data read from the file of the mapping can be "
+            msg += "cached, not that of data processed, resampled or modified in place."
+            raise ValueError(msg)
+        return self.source.with_name(f"{self.source.name}.bands-{units.value}-{channel}.npy")
+
+    def _is_band_index_fresh(self, file: Path, shape: tuple[int, ...]) -> bool:
+        """Check whether a cached band index was saved after the file of the mapping.
+
+        The index must also hold the spectra of the given shape, ``(n_spectra, n_points)``,
+        which its ``.npy`` header records.
+        """
+        if (
+            self.source is None
+            or not file.is_file()
+            or file.stat().st_mtime_ns < self.source.stat().st_mtime_ns
+        ):
+            return False
+        cumulative: NDArray[Any] = np.load(file, mmap_mode="r")
+        return cumulative.shape == shape[::-1]
+
     def _get_channel_axis_unit(self, channel: int = 0) -> Literal["nm", "cm-1", "eV"]:
         """Get the units of the spectral axis for the given channel.
 
@@ -1090,7 +1781,7 @@ class Mapping:
         spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
         save_mapcoords: SaveMapCoords | str = SaveMapCoords.combined,
         channel: int = 0,
-    ) -> None:
+    ) -> list[Path]:
         """Export the data to csv files.
 
         It exports the data of the spectra and the mapping coordinates to their respective files.
@@ -1116,31 +1807,45 @@ class Mapping:
             By default SaveMapCoords.combined.
         channel : int, optional
             The channel index to export, by default 0
+
+        Returns
+        -------
+        list[Path]
+            The paths of the written files: the data, followed by the mapping coordinates when
+            they are saved separately.
         """
         save_mapcoords = validate_savemapcoords(save_mapcoords)
 
         if spectral_units is not None:
             spectral_units = validate_units(spectral_units)
 
-        data, mapcoords = self.to_df(spectral_units, channel=channel)
+        with instrument.stage("mapping.to_csv", source=self.source) as stage:
+            data, mapcoords = self.to_df(spectral_units, channel=channel)
 
-        if not filename:
-            map_file_path = path / "data.csv"
-            coord_file_path = path / "mapcoords.csv"
-        else:
-            filename = Path(filename).with_suffix("").as_posix()
-            if save_mapcoords == "separated":
-                map_file_path = path / (filename + "_data.csv")
+            if not filename:
+                map_file_path = path / "data.csv"
+                coord_file_path = path / "mapcoords.csv"
             else:
-                map_file_path = path / (filename + ".csv")
-            coord_file_path = path / (filename + "_mapcoords.csv")
+                filename = Path(filename).with_suffix("").as_posix()
+                if save_mapcoords == "separated":
+                    map_file_path = path / (filename + "_data.csv")
+                else:
+                    map_file_path = path / (filename + ".csv")
+                coord_file_path = path / (filename + "_mapcoords.csv")
+
+            index = save_mapcoords not in ["separated", "no"]
+
+            path.mkdir(parents=True, exist_ok=True)
+            data.to_csv(map_file_path, na_rep="NaN", index=index)
+            written = [map_file_path]
+            if save_mapcoords == "separated":
+                mapcoords.to_csv(coord_file_path, na_rep="NaN", index=False)
+                written.append(coord_file_path)
 
-        index = save_mapcoords not in ["separated", "no"]
+            if stage.active:
+                stage.nbytes = sum(file.stat().st_size for file in written)
 
-        path.mkdir(parents=True, exist_ok=True)
-        data.to_csv(map_file_path, na_rep="NaN", index=index)
-        if save_mapcoords == "separated":
-            mapcoords.to_csv(coord_file_path, na_rep="NaN", index=False)
+        return written
 
     def to_df(
         self,
@@ -1172,40 +1877,186 @@ class Mapping:
             columns carry `pint` units (via `pint-pandas`) matching the stage axes' units, when
             available.
         """
-        spectral_axis = self.get_spectral_axis(spectral_units=spectral_units, channel=channel)
+        with instrument.stage("mapping.to_df", source=self.source) as stage:
+            spectral_axis = self.get_spectral_axis(spectral_units=spectral_units, channel=channel)
+
+            # TODO only 2D (x and y) maps are supported for now; z-axis and true 3D maps would need
+            # a different coordinate generation strategy.
+            axes = self.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions
+            mapcoords = _nanofinder_mapcoords(
+                self.map_steps[0],
+                self.map_steps[1],
+                x_axis=AxisSpec(axes.x.start_position, axes.x.step_size, axes.x.unit_name),
+                y_axis=AxisSpec(axes.y.start_position, axes.y.step_size, axes.y.unit_name),
+            )
+
+            spectra = self.get_spectra(channel)
+            stage.nbytes = spectra.nbytes
+            data = pd.DataFrame(
+                spectra,
+                columns=spectral_axis,
+                index=pd.MultiIndex.from_arrays([mapcoords["x"], mapcoords["y"]]),
+            )
+
+            # Reordering the rows
+            # NOTE: this is not essential, only done to coincide with NanoFinder's convention of
+            # 'y' starting from the bottom side of the mapping area.
+            # The rows are moved by position rather than looked up by coordinate: it avoids
+            # reindexing a large frame through a MultiIndex, and it stays correct when several
+            # points share the same coordinates (which happens for a step size of zero).
+            x_steps, y_steps = self.map_steps[0], self.map_steps[1]
+            order = np.arange(x_steps * y_steps).reshape(y_steps, x_steps)[::-1].reshape(-1)
+
+            data = data.iloc[order]
+            mapcoords = mapcoords.iloc[order].reset_index(drop=True)
+
+            if not index:
+                data = data.reset_index(drop=True)
+
+        return data, mapcoords
 
-        # TODO only 2D (x and y) maps are supported for now; z-axis and true 3D maps would need a
-        # different coordinate generation strategy.
+    def to_xarray(
+        self,
+        spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+        channel: int = 0,
+    ) -> "xr.DataArray":
+        """Wrap the spectral map in an xarray DataArray, without copying it.
+
+        Requires xarray, installed by the ``xarray`` extra.
+
+        Parameters
+        ----------
+        spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            Units of the spectral coordinate, by default None (the units of the file).
+        channel : int, optional
+            The channel index, by default 0.
+
+        Returns
+        -------
+        xr.DataArray
+            The spectra, of dimensions ``(y, x, spectral)``, sharing the memory of :attr:`data`.
+            The coordinates are the stage positions and the spectral axis, each with its units in
+            its ``attrs``; the metadata of the measurement, such as the laser wavelength, is in
+            the ``attrs`` of the array.
+
+        Raises
+        ------
+        ImportError
+            If xarray is not installed.
+
+        Examples
+        --------
+        >>> from nanofinderparser import sample_mapping
+        >>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+        >>> cube = mapping.to_xarray("raman_shift")
+        >>> cube.dims, cube.shape
+        (('y', 'x', 'spectral'), (3, 4, 512))
+        >>> g_band = cube.sel(spectral=slice(1550, 1620)).sum("spectral")
+        """
+        xarray = import_optional("xarray", "xarray")
+        values = self.get_map(channel)
         axes = self.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions
-        mapcoords = _nanofinder_mapcoords(
-            self.map_steps[0],
-            self.map_steps[1],
-            x_axis=AxisSpec(axes.x.start_position, axes.x.step_size, axes.x.unit_name),
-            y_axis=AxisSpec(axes.y.start_position, axes.y.step_size, axes.y.unit_name),
-        )
+        if axes.x.is_slow and not axes.y.is_slow:
+            # A transposed view, still sharing the data
+            values = values.transpose(1, 0, 2)
+        units = validate_units(spectral_units or self._get_channel_axis_unit(channel))
+        channel_obj = self.scanned_frame_parameters.data_calibration.channels[channel]
 
-        data = pd.DataFrame(
-            self.get_spectra(channel),
-            columns=spectral_axis,
-            index=pd.MultiIndex.from_arrays([mapcoords["x"], mapcoords["y"]]),
+        cube: xr.DataArray = xarray.DataArray(
+            values,
+            dims=("y", "x", "spectral"),
+            coords={
+                "y": _xarray_coordinate(
+                    "y",
+                    AxisSpec(axes.y.start_position, axes.y.step_size, axes.y.unit_name),
+                    values.shape[0],
+                ),
+                "x": _xarray_coordinate(
+                    "x",
+                    AxisSpec(axes.x.start_position, axes.x.step_size, axes.x.unit_name),
+                    values.shape[1],
+                ),
+                "spectral": (
+                    "spectral",
+                    self.get_spectral_axis(units, channel),
+                    {"units": units.value},
+                ),
+            },
+            name=channel_obj.data_channel_name,
+            attrs=self.get_metadata(channel),
         )
+        return cube
 
-        # Reordering the rows
-        # NOTE: this is not essential, only done to coincide with NanoFinder's convention of 'y'
-        # starting from the bottom side of the mapping area.
-        # The rows are moved by position rather than looked up by coordinate: it avoids
-        # reindexing a large frame through a MultiIndex, and it stays correct when several
-        # points share the same coordinates (which happens for a step size of zero).
-        x_steps, y_steps = self.map_steps[0], self.map_steps[1]
-        order = np.arange(x_steps * y_steps).reshape(y_steps, x_steps)[::-1].reshape(-1)
+    def to_dask(self, chunks: int = DEFAULT_DASK_CHUNK_SIZE, channel: int = 0) -> "da.Array":
+        """Return the spectra as a dask array, for computations in parallel and out of core.
 
-        data = data.iloc[order]
-        mapcoords = mapcoords.iloc[order].reset_index(drop=True)
+        For a mapping memory-mapped from its file, as by ``load_smd(file, lazy=True)``, every
+        chunk reads its own spectra from the file, at their position in the data block, when it
+        is computed: the data block is never loaded whole, and the chunks can be computed in
+        other processes. Otherwise the chunks are views of :attr:`data`.
 
-        if not index:
-            data = data.reset_index(drop=True)
+        Requires dask, installed by the ``dask`` extra.
 
-        return data, mapcoords
+        Parameters
+        ----------
+        chunks : int, optional
+            Number of spectra in each chunk, by default 4096.
+        channel : int, optional
+            The channel index, by default 0.
+
+        Returns
+        -------
+        da.Array
+            The spectra, of shape ``(n_spectra, spectral_len)`` as :meth:`get_spectra`, chunked
+            along the spectra only.
+
+        Raises
+        ------
+        ImportError
+            If dask is not installed.
+        ValueError
+            If `chunks` is not positive.
+
+        Examples
+        --------
+        >>> from nanofinderparser import sample_mapping
+        >>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+        >>> spectra = mapping.to_dask(chunks=5)
+        >>> spectra.chunks[0]
+        (5, 5, 2)
+        >>> g_band = spectra[:, mapping.spectral_slice(1550, 1620, "raman_shift")].sum(axis=1)
+        >>> g_band.compute().shape
+        (12,)
+        """
+        if chunks < 1:
+            msg = f"The number of spectra in each chunk must be positive, got {chunks}."
+            raise ValueError(msg)
+        dask = import_optional("dask", "dask")
+        dask_array = import_optional("dask.array", "dask")
+        n_points = self.get_spectral_axis_len(channel)
+        n_spectra = self.data.size // n_points
+        if self.source is None or self.data_offset is None:
+            in_memory: da.Array = dask_array.from_array(
+                self.get_spectra(channel), chunks=(chunks, n_points)
+            )
+            return in_memory
+
+        itemsize = self.data.itemsize
+        blocks = [
+            dask_array.from_delayed(
+                dask.delayed(_read_spectra)(
+                    self.source,
+                    self.data_offset + start * n_points * itemsize,
+                    min(chunks, n_spectra - start),
+                    n_points,
+                ),
+                shape=(min(chunks, n_spectra - start), n_points),
+                dtype=self.data.dtype,
+            )
+            for start in range(0, n_spectra, chunks)
+        ]
+        spectra: da.Array = dask_array.concatenate(blocks)
+        return spectra
 
     def to_smd(self, file: Path | str) -> Path:
         """Write the mapping back as a NanoFinder SMD file.
@@ -1239,6 +2090,91 @@ class Mapping:
 
         return write_smd(self, file)
 
+    def to_envi(
+        self,
+        file: Path | str,
+        spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.nm,
+        channel: int = 0,
+    ) -> list[Path]:
+        """Write the mapping as an ENVI file, interleaved by pixel (BIP), and its header.
+
+        A mapping memory-mapped from its file, as by ``load_smd(file, lazy=True)``, has its data
+        block copied from the file by the kernel rather than written from memory.
+
+        Parameters
+        ----------
+        file : Path | str
+            Path of the data file, such as ``mapping.bip``. The header is written next to it,
+            with the suffix ``.hdr``. Parent directories are created when missing.
+        spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+            Units of the wavelengths of the header, by default nm.
+        channel : int, optional
+            The channel index, by default 0.
+
+        Returns
+        -------
+        list[Path]
+            The data file and the header just written.
+
+        Raises
+        ------
+        ValueError
+            If `file` has the suffix of the header, or the source file is shorter than the data
+            block.
+        OSError
+            If the files cannot be written.
+
+        Notes
+        -----
+        See :func:`~nanofinderparser.export.write_envi`.
+        """
+        from nanofinderparser.export import write_envi  # noqa: PLC0415
+
+        return write_envi(self, file, spectral_units, channel)
+
+    def to_npy(
+        self,
+        file: Path | str,
+        spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] = Units.nm,
+        channel: int = 0,
+    ) -> list[Path]:
+        """Write the spectral map as a NumPy ``.npy`` file, and its metadata as JSON.
+
+        The array has shape ``(y, x, n_points)``, for ``np.load(file, mmap_mode="r")``. A
+        mapping memory-mapped from its file, as by ``load_smd(file, lazy=True)``, has its data
+        block copied from the file by the kernel rather than written from memory.
+
+        Parameters
+        ----------
+        file : Path | str
+            Path of the array, such as ``mapping.npy``. The metadata is written next to it, with
+            the suffix ``.json``. Parent directories are created when missing.
+        spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"}, optional
+            Units of the spectral axis of the metadata, by default nm.
+        channel : int, optional
+            The channel index, by default 0.
+
+        Returns
+        -------
+        list[Path]
+            The array and the metadata just written.
+
+        Raises
+        ------
+        ValueError
+            If `file` has the suffix of the metadata, or the source file is shorter than the
+            data block.
+        OSError
+            If the files cannot be written.
+
+        Notes
+        -----
+        See :func:`~nanofinderparser.export.write_npy`.
+        """
+        from nanofinderparser.export import write_npy  # noqa: PLC0415
+
+        return write_npy(self, file, spectral_units, channel)
+
 
 # Number of arrays NanoFinder stores per spectrum frame: the spectral axis and the intensities.
 _MDT_SPECTRUM_ARRAY_COUNT: int = 2
@@ -1285,6 +2221,10 @@ class Spectrum:
     -------
     get_spectral_axis(spectral_units=None)
         Get the spectral axis, optionally converted to other units.
+    spectral_index(value, units=None)
+        Find the point of the spectral axis nearest to a value.
+    spectral_slice(low, high, units=None)
+        Find the points of the spectral axis within a window.
     to_df(spectral_units=None)
         Export the spectrum to a DataFrame indexed by the spectral axis.
     to_csv(path=Path(), filename="", spectral_units=None)
@@ -1299,6 +2239,26 @@ class Spectrum:
     laser_wavelength: float | None
     measured_at: datetime | None
     text_comment: str = ""
+    # Spectral axes prepared for lookups, by units
+    _spectral_axes: dict[Units, SpectralAxis] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def __reduce_ex__(self, protocol: SupportsIndex) -> tuple[Any, ...]:
+        """Pickle the spectrum without its cache, its arrays out of band with protocol 5."""
+        return (
+            type(self),
+            (
+                self.title,
+                self.spectral_axis,
+                self.data,
+                self.spectral_axis_unit,
+                self.data_unit,
+                self.laser_wavelength,
+                self.measured_at,
+                self.text_comment,
+            ),
+        )
 
     @classmethod
     def from_mdt_frame(cls, frame: MdtSpectrumFrame) -> Self:
@@ -1384,6 +2344,80 @@ class Spectrum:
         if new_unit == self.spectral_axis_unit:
             return self.spectral_axis
 
+        # The conversion is cached; the copy keeps the cached axis safe from the caller
+        return self._spectral_axis(new_unit).values.copy()
+
+    def spectral_index(
+        self,
+        value: float,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+    ) -> int:
+        """Find the point of the spectral axis nearest to a value.
+
+        Parameters
+        ----------
+        value : float
+            The value, in `units`.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            The units of the value, by default None (the units stored in the file).
+
+        Returns
+        -------
+        int
+            The index of the nearest point, as for :attr:`data`.
+
+        Raises
+        ------
+        ValueError
+            If `units` need the excitation wavelength, which the file does not record.
+        """
+        return self._spectral_axis(units).nearest(value)
+
+    def spectral_slice(
+        self,
+        low: float,
+        high: float,
+        units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+    ) -> slice:
+        """Find the points of the spectral axis within a window.
+
+        Parameters
+        ----------
+        low, high : float
+            The limits of the window, in `units`, in any order. Points on the limits are within
+            the window.
+        units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            The units of the limits, by default None (the units stored in the file).
+
+        Returns
+        -------
+        slice
+            The points within the window, to slice :attr:`data` with.
+
+        Raises
+        ------
+        ValueError
+            If no point of the spectral axis lies within the window, or if `units` need the
+            excitation wavelength, which the file does not record.
+        """
+        return self._spectral_axis(units).window(low, high)
+
+    def _spectral_axis(
+        self, units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None
+    ) -> SpectralAxis:
+        """Return the spectral axis in some units, prepared for lookups once and cached."""
+        new_unit = self.spectral_axis_unit if units is None else validate_units(units)
+        axis = self._spectral_axes.get(new_unit)
+        if axis is None:
+            axis = SpectralAxis.from_values(self._convert_spectral_axis(new_unit))
+            self._spectral_axes[new_unit] = axis
+        return axis
+
+    def _convert_spectral_axis(self, new_unit: Units) -> NDArray[np.float64]:
+        """Convert the spectral axis to other units, if the file records what that needs."""
+        if new_unit == self.spectral_axis_unit:
+            return self.spectral_axis
+
         if self.laser_wavelength is None:
             if Units.raman_shift in (new_unit, self.spectral_axis_unit):
                 msg = (
@@ -1489,6 +2523,63 @@ def _mdt_unit_name(unit_code: int) -> str:
         return str(unit_code)
 
 
+def _read_spectra(file: Path, position: int, n_spectra: int, n_points: int) -> NDArray[Any]:
+    """Read consecutive spectra of the data block of an SMD file, from their position."""
+    values = read_binary_part(file, position, SMD_DATA_FORMAT, count=n_spectra * n_points)
+    return values.reshape(n_spectra, n_points)
+
+
+def _shared_data_offset(metadata_size: int) -> int:
+    """Position of the data in a block of shared memory, after metadata of the given size."""
+    end = _SHARED_HEADER.size + metadata_size
+    return -(-end // _SHARED_DATA_ALIGNMENT) * _SHARED_DATA_ALIGNMENT
+
+
+class _SharedBlock:
+    """Expose a block of shared memory to NumPy, keeping it open as long as arrays use it.
+
+    The arrays built on the block hold this object, and through it the block, which would
+    otherwise fail to close when collected while they still use its memory.
+    """
+
+    __slots__ = ("block",)
+
+    def __init__(self, block: SharedMemory) -> None:
+        self.block = block
+
+    def __buffer__(self, flags: int) -> memoryview:
+        """Return the memory of the block."""
+        return _block_buffer(self.block)
+
+
+def _block_buffer(block: SharedMemory) -> memoryview:
+    """Return the memory of a block of shared memory, which must be open."""
+    if block.buf is None:
+        msg = f"The block of shared memory {block.name} is closed."
+        raise ValueError(msg)
+    return block.buf
+
+
+def _xarray_coordinate(
+    name: str, axis: AxisSpec, size: int
+) -> tuple[str, NDArray[np.float64], dict[str, str]]:
+    """Build the coordinate of a spatial dimension of an xarray DataArray."""
+    values = (axis.start + np.arange(size) * axis.step).astype(np.float64)
+    return name, values, {} if axis.units is None else {"units": axis.units}
+
+
+def _overlap_axis(axes: Sequence[NDArray[np.float64]]) -> NDArray[np.float64]:
+    """Build an evenly spaced axis over the range every axis covers, as long as the longest."""
+    start = max(float(axis.min()) for axis in axes)
+    stop = min(float(axis.max()) for axis in axes)
+    if start >= stop:
+        msg = f"The spectral axes do not overlap: the latest start, {start}, is past the "
+        msg += f"earliest end, {stop}."
+        raise ValueError(msg)
+    common: NDArray[np.float64] = np.linspace(start, stop, max(axis.size for axis in axes))
+    return common
+
+
 @dataclass(frozen=True, slots=True, eq=False)
 class Image:
     """A 2-D scalar map, as stored in a NanoFinder ``.mdt`` file.
@@ -1552,6 +2643,21 @@ class Image:
     measured_at: datetime | None
     text_comment: str = ""
 
+    def __reduce_ex__(self, protocol: SupportsIndex) -> tuple[Any, ...]:
+        """Pickle the map as its fields, its values out of band with protocol 5."""
+        return (
+            type(self),
+            (
+                self.title,
+                self.values,
+                self.x_axis,
+                self.y_axis,
+                self.value_unit,
+                self.measured_at,
+                self.text_comment,
+            ),
+        )
+
     @classmethod
     def from_mdt_frame(cls, frame: MdtImageFrame) -> Self:
         """Build an Image from a raw frame read out of a ``.mdt`` file.
@@ -1626,6 +2732,38 @@ class Image:
             columns=pd.Index(self.x_coords, name=f"x ({self.x_axis.units})"),
         )
 
+    def to_xarray(self) -> "xr.DataArray":
+        """Wrap the map in an xarray DataArray, without copying it.
+
+        Requires xarray, installed by the ``xarray`` extra.
+
+        Returns
+        -------
+        xr.DataArray
+            The map, of dimensions ``(y, x)``, named by its title, with the physical coordinates
+            and the units of the values.
+
+        Raises
+        ------
+        ImportError
+            If xarray is not installed.
+        """
+        xarray = import_optional("xarray", "xarray")
+        attrs = {"units": self.value_unit, "text_comment": self.text_comment}
+        if self.measured_at is not None:
+            attrs["datetime"] = self.measured_at.isoformat()
+        image: xr.DataArray = xarray.DataArray(
+            self.values,
+            dims=("y", "x"),
+            coords={
+                "y": _xarray_coordinate("y", self.y_axis, self.shape[0]),
+                "x": _xarray_coordinate("x", self.x_axis, self.shape[1]),
+            },
+            name=self.title,
+            attrs=attrs,
+        )
+        return image
+
     def to_csv(self, path: Path = Path(), filename: str = "") -> Path:
         """Export the map to a csv file.
 
@@ -1680,6 +2818,10 @@ class TitledSequence[ItemT: Titled](Sequence[ItemT]):
         """
         self._items: list[ItemT] = list(items)
         self.source = source
+        # Positions of the items by title, and the titles made unique, built on first use. The
+        # items are never replaced, so neither needs updating.
+        self._positions: dict[str, list[int]] | None = None
+        self._unique_titles: list[str] | None = None
 
     def __len__(self) -> int:
         """Items in the collection."""
@@ -1712,11 +2854,11 @@ class TitledSequence[ItemT: Titled](Sequence[ItemT]):
             If `key` is a title that no item in the collection has.
         """
         if isinstance(key, str):
-            for item in self._items:
-                if item.title == key:
-                    return item
-            msg = f"No item titled {key!r}. Available titles: {self.titles}"
-            raise KeyError(msg)
+            positions = self._title_positions().get(key)
+            if positions is None:
+                msg = f"No item titled {key!r}. Available titles: {self.titles}"
+                raise KeyError(msg)
+            return self._items[positions[0]]
         if isinstance(key, slice):
             return type(self)(self._items[key], source=self.source)
         return self._items[key]
@@ -1738,13 +2880,64 @@ class TitledSequence[ItemT: Titled](Sequence[ItemT]):
         list[str]
             The titles, where the n-th repetition of a title is suffixed with ``_n``.
         """
-        seen: dict[str, int] = {}
-        unique: list[str] = []
-        for title in self.titles:
-            count = seen.get(title, 0)
-            seen[title] = count + 1
-            unique.append(title if count == 0 else f"{title}_{count + 1}")
-        return unique
+        if self._unique_titles is None:
+            seen: dict[str, int] = {}
+            unique: list[str] = []
+            for title in self.titles:
+                count = seen.get(title, 0)
+                seen[title] = count + 1
+                unique.append(title if count == 0 else f"{title}_{count + 1}")
+            self._unique_titles = unique
+        # A copy, so that the cached titles are safe from the caller
+        return list(self._unique_titles)
+
+    def select(self, titles: Iterable[str]) -> Self:
+        """Get the sub-collection of the items with some titles.
+
+        Parameters
+        ----------
+        titles : Iterable[str]
+            The titles of the items, in the order they are wanted.
+
+        Returns
+        -------
+        Self
+            A collection of the same type, holding, title after title, every item that has the
+            title.
+
+        Raises
+        ------
+        KeyError
+            If no item in the collection has some of the titles.
+
+        Examples
+        --------
+        >>> spectra = load_mdt(Path("spectra.mdt"))  # doctest: +SKIP
+        >>> spectra.select(["Spectrum_2", "Spectrum_1"]).titles  # doctest: +SKIP
+        ['Spectrum_2', 'Spectrum_1']
+        """
+        positions = self._title_positions()
+        selected: list[int] = []
+        missing: list[str] = []
+        for title in titles:
+            found = positions.get(title)
+            if found is None:
+                missing.append(title)
+            else:
+                selected.extend(found)
+        if missing:
+            msg = f"No item titled {', '.join(map(repr, missing))}. Available titles: {self.titles}"
+            raise KeyError(msg)
+        return type(self)([self._items[position] for position in selected], source=self.source)
+
+    def _title_positions(self) -> dict[str, list[int]]:
+        """Return the positions of the items by title, indexing them on first use."""
+        if self._positions is None:
+            positions: dict[str, list[int]] = {}
+            for position, item in enumerate(self._items):
+                positions.setdefault(item.title, []).append(position)
+            self._positions = positions
+        return self._positions
 
 
 class Spectra(TitledSequence[Spectrum]):
@@ -1756,10 +2949,16 @@ class Spectra(TitledSequence[Spectrum]):
 
     Methods
     -------
-    to_df(spectral_units=None)
+    to_array(axis=None, spectral_units=None, method="linear")
+        Stack the spectra in a single array, on a spectral axis they share.
+    to_df(spectral_units=None, axis=None, method="linear")
         Export every spectrum to a single DataFrame, one column per spectrum.
     to_csv(path=Path(), filename="", spectral_units=None, combined=False)
         Export the spectra to csv file(s).
+    to_arrow(spectral_units=None)
+        Build an Arrow table of the spectra, one row per spectrum.
+    to_feather(file, spectral_units=None, batch_size=1024)
+        Write the spectra as a Feather file, batch after batch.
 
     Examples
     --------
@@ -1771,9 +2970,82 @@ class Spectra(TitledSequence[Spectrum]):
     532.0
     """
 
+    def to_array(
+        self,
+        axis: Literal["common"] | NDArray[Any] | None = None,
+        spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+        *,
+        method: ResampleMethod = "linear",
+    ) -> tuple[NDArray[np.float64], NDArray[Any]]:
+        """Stack the spectra in a single array, on a spectral axis they share.
+
+        Spectra recorded over the same axis, found by hashing their axes, are stacked as they
+        are. Otherwise each group of spectra sharing an axis is resampled onto the new axis in
+        one go; see :mod:`nanofinderparser.resample`.
+
+        Parameters
+        ----------
+        axis : "common" | NDArray[Any] | None, optional
+            The axis to stack the spectra on. None (the default) requires the spectra to share
+            an axis. "common" resamples spectra on different axes onto an evenly spaced axis
+            over the range they all cover, with as many points as the longest of them. An array
+            is the axis to resample every spectrum onto, in `spectral_units`.
+        spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            Units of the spectral axes, by default None (the units of each spectrum).
+        method : {"linear", "cubic"}, optional
+            Interpolation between the two nearest points ("linear", the default) or by the cubic
+            through the four nearest ones ("cubic"), where the spectra are resampled.
+
+        Returns
+        -------
+        tuple[NDArray[np.float64], NDArray[Any]]
+            The spectral axis, and the spectra of shape ``(n_spectra, n_points)``. Spectra
+            stacked as they are keep their precision; resampled, they are single precision, NaN
+            at points beyond their own axis.
+
+        Raises
+        ------
+        ValueError
+            If the collection is empty, `axis` is None and the spectra do not share an axis,
+            `axis` is "common" and their axes do not overlap, or an axis cannot be resampled.
+
+        Examples
+        --------
+        >>> from nanofinderparser import load_mdt
+        >>> spectra = load_mdt(Path("spectra.mdt"))  # doctest: +SKIP
+        >>> axis, values = spectra.to_array("common", "raman_shift")  # doctest: +SKIP
+        >>> grid = np.arange(200.0, 3000.0, 2.0)
+        >>> axis, values = spectra.to_array(grid, "raman_shift")  # doctest: +SKIP
+        """
+        if not self._items:
+            msg = "The collection holds no spectrum to stack."
+            raise ValueError(msg)
+        groups = self._axis_groups(spectral_units)
+        if isinstance(axis, str) or axis is None:
+            if len(groups) == 1:
+                ((shared, _),) = groups
+                stacked: NDArray[Any] = np.stack([spectrum.data for spectrum in self._items])
+                return shared, stacked
+            if axis is None:
+                msg = f"The spectra of {self.source or 'this collection'} do not share a common "
+                msg += 'spectral axis; pass axis="common" or an axis to resample them onto.'
+                raise ValueError(msg)
+            axis = _overlap_axis([shared for shared, _ in groups])
+
+        axis = np.asarray(axis, dtype=np.float64)
+        values = np.empty((len(self._items), axis.size), dtype=np.float32)
+        for shared, rows in groups:
+            values[rows] = resample(
+                np.stack([self._items[row].data for row in rows]), shared, axis, method=method
+            )
+        return axis, values
+
     def to_df(
         self,
         spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+        axis: Literal["common"] | NDArray[Any] | None = None,
+        *,
+        method: ResampleMethod = "linear",
     ) -> pd.DataFrame:
         """Export every spectrum to a single DataFrame, one column per spectrum.
 
@@ -1781,6 +3053,11 @@ class Spectra(TitledSequence[Spectrum]):
         ----------
         spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
             Units in which the spectral axis will be exported, by default None.
+        axis : "common" | NDArray[Any] | None, optional
+            The axis to resample spectra recorded over different axes onto, as for
+            :meth:`to_array`, by default None (no resampling).
+        method : {"linear", "cubic"}, optional
+            Interpolation used where the spectra are resampled, by default "linear".
 
         Returns
         -------
@@ -1790,26 +3067,66 @@ class Spectra(TitledSequence[Spectrum]):
         Notes
         -----
         Spectra in the same file may have been recorded with different grating positions, and
-        therefore over different spectral axes. In that case the columns are aligned on the union
-        of the axes, which leaves missing values, and a warning is emitted; exporting each
-        spectrum separately is usually more appropriate.
+        therefore over different spectral axes. Unless `axis` is given, the columns are then
+        aligned on the sorted union of the axes, which leaves missing values, and a warning is
+        emitted; exporting each spectrum separately is usually more appropriate.
         """
         if not self._items:
             return pd.DataFrame()
 
-        frames = [spectrum.to_df(spectral_units) for spectrum in self._items]
-        for frame, title in zip(frames, self.unique_titles(), strict=True):
-            frame.columns = pd.Index([title])
+        with instrument.stage("spectra.to_df", source=self.source) as stage:
+            groups = self._axis_groups(spectral_units)
+            if axis is None and len(groups) > 1:
+                logger.warning(
+                    "The spectra of %s do not share a common spectral axis; the combined DataFrame "
+                    "will contain missing values.",
+                    self.source or "this collection",
+                )
+                index, values = self._union_array(groups)
+            else:
+                index, values = self.to_array(axis, spectral_units, method=method)
 
-        reference = frames[0].index
-        if any(not frame.index.equals(reference) for frame in frames[1:]):
-            logger.warning(
-                "The spectra of %s do not share a common spectral axis; the combined DataFrame "
-                "will contain missing values.",
-                self.source or "this collection",
+            units = (
+                self._items[0].spectral_axis_unit
+                if spectral_units is None
+                else validate_units(spectral_units)
+            )
+            combined = pd.DataFrame(
+                values.T,
+                index=pd.Index(index, name=str(units)),
+                columns=pd.Index(self.unique_titles()),
             )
+            stage.nbytes = sum(spectrum.data.nbytes for spectrum in self._items)
+
+        return combined
 
-        return pd.concat(frames, axis=1)
+    def _axis_groups(
+        self, spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None
+    ) -> list[tuple[NDArray[np.float64], list[int]]]:
+        """Group the spectra by spectral axis, hashing the bytes of the axes.
+
+        Returns
+        -------
+        list[tuple[NDArray[np.float64], list[int]]]
+            Every distinct axis, in order of first appearance, with the positions of the spectra
+            recorded over it.
+        """
+        groups: dict[bytes, tuple[NDArray[np.float64], list[int]]] = {}
+        for row, spectrum in enumerate(self._items):
+            axis = spectrum.get_spectral_axis(spectral_units)
+            groups.setdefault(axis.tobytes(), (axis, []))[1].append(row)
+        return list(groups.values())
+
+    def _union_array(
+        self, groups: list[tuple[NDArray[np.float64], list[int]]]
+    ) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """Place the spectra on the sorted union of their axes, NaN where one has no point."""
+        union = np.unique(np.concatenate([axis for axis, _ in groups]))
+        values = np.full((len(self._items), union.size), np.nan)
+        for axis, rows in groups:
+            columns = np.searchsorted(union, axis)
+            values[np.ix_(rows, columns)] = np.stack([self._items[row].data for row in rows])
+        return union, values
 
     def to_csv(
         self,
@@ -1842,17 +3159,91 @@ class Spectra(TitledSequence[Spectrum]):
         stem = Path(filename).with_suffix("").as_posix() if filename else ""
         path.mkdir(parents=True, exist_ok=True)
 
-        if combined:
-            file_path = path / (clean_filename(stem) + ".csv")
-            self.to_df(spectral_units).to_csv(file_path, na_rep="NaN")
-            return [file_path]
+        with instrument.stage("spectra.to_csv", source=self.source) as stage:
+            if combined:
+                file_path = path / (clean_filename(stem) + ".csv")
+                self.to_df(spectral_units).to_csv(file_path, na_rep="NaN")
+                written = [file_path]
+            else:
+                written = []
+                for spectrum, title in zip(self._items, self.unique_titles(), strict=True):
+                    name = f"{stem}_{title}" if stem else title
+                    written.append(
+                        spectrum.to_csv(path, filename=name, spectral_units=spectral_units)
+                    )
+
+            if stage.active:
+                stage.nbytes = sum(file.stat().st_size for file in written)
 
-        written: list[Path] = []
-        for spectrum, title in zip(self._items, self.unique_titles(), strict=True):
-            name = f"{stem}_{title}" if stem else title
-            written.append(spectrum.to_csv(path, filename=name, spectral_units=spectral_units))
         return written
 
+    def to_arrow(
+        self,
+        spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+    ) -> "pa.Table":
+        """Build an Arrow table of the spectra, one row per spectrum.
+
+        Every spectrum keeps its own spectral axis, rather than being aligned on the union of
+        the axes as by :meth:`to_df`. Requires pyarrow, installed by the ``arrow`` extra.
+
+        Parameters
+        ----------
+        spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            Units of the spectral axes, by default None (the units of each spectrum).
+
+        Returns
+        -------
+        pa.Table
+            The title, units, laser wavelength and time of measurement of every spectrum, and
+            its axis and intensities as lists of ``float32`` values; see
+            :func:`~nanofinderparser.arrow.spectra_schema`.
+
+        Raises
+        ------
+        ImportError
+            If pyarrow is not installed.
+        """
+        from nanofinderparser.arrow import spectra_to_table  # noqa: PLC0415
+
+        return spectra_to_table(self, spectral_units)
+
+    def to_feather(
+        self,
+        file: Path,
+        spectral_units: Units | Literal["nm", "cm-1", "eV", "raman_shift"] | None = None,
+        batch_size: int = 1024,
+    ) -> Path:
+        """Write the spectra as a Feather file, batch after batch.
+
+        The file is read back memory-mapped, without copying it, by
+        :func:`~nanofinderparser.arrow.read_feather`. Requires pyarrow, installed by the
+        ``arrow`` extra.
+
+        Parameters
+        ----------
+        file : Path
+            Path of the file to write. Parent directories are created when missing.
+        spectral_units : Units | {"nm", "cm-1", "eV", "raman_shift"} | None, optional
+            Units of the spectral axes, by default None (the units of each spectrum).
+        batch_size : int, optional
+            Spectra converted and written together, by default 1024.
+
+        Returns
+        -------
+        Path
+            The path of the file just written.
+
+        Raises
+        ------
+        ImportError
+            If pyarrow is not installed.
+        ValueError
+            If `batch_size` is not positive.
+        """
+        from nanofinderparser.arrow import write_feather  # noqa: PLC0415
+
+        return write_feather(self, file, spectral_units, batch_size)
+
 
 class Images(TitledSequence[Image]):
     """The 2-D scalar maps stored in a NanoFinder ``.mdt`` file.
@@ -1865,6 +3256,8 @@ class Images(TitledSequence[Image]):
     -------
     to_csv(path=Path(), filename="")
         Export the maps to one csv file each.
+    to_xarray()
+        Stack maps sharing a grid in an xarray DataArray.
 
     Examples
     --------
@@ -1901,3 +3294,54 @@ class Images(TitledSequence[Image]):
             name = f"{stem}_{title}" if stem else title
             written.append(image.to_csv(path, filename=name))
         return written
+
+    def to_xarray(self) -> "xr.DataArray":
+        """Stack maps sharing a grid in an xarray DataArray.
+
+        Requires xarray, installed by the ``xarray`` extra.
+
+        Returns
+        -------
+        xr.DataArray
+            The maps, of dimensions ``(map, y, x)``, the ``map`` coordinate holding their unique
+            titles and the ``units`` coordinate the units of their values.
+
+        Raises
+        ------
+        ValueError
+            If there is no map, or the maps do not all share the grid of the first one.
+        ImportError
+            If xarray is not installed.
+
+        Examples
+        --------
+        >>> from nanofinderparser import sample_mapping
+        >>> mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+        >>> maps = mapping.eval_maps({"G": "band(1550, 1620)", "2D": "band(2600, 2750)"})
+        >>> maps.to_xarray().sel(map="2D").shape
+        (3, 4)
+        """
+        xarray = import_optional("xarray", "xarray")
+        if not self._items:
+            msg = "There is no map to stack."
+            raise ValueError(msg)
+        first = self._items[0]
+        for image in self._items[1:]:
+            if (image.shape, image.x_axis, image.y_axis) != (
+                first.shape,
+                first.x_axis,
+                first.y_axis,
+            ):
+                msg = f"The map {image.title!r} does not share the grid of {first.title!r}."
+                raise ValueError(msg)
+        stacked: xr.DataArray = xarray.DataArray(
+            np.stack([image.values for image in self._items]),
+            dims=("map", "y", "x"),
+            coords={
+                "map": self.unique_titles(),
+                "units": ("map", [image.value_unit for image in self._items]),
+                "y": _xarray_coordinate("y", first.y_axis, first.shape[0]),
+                "x": _xarray_coordinate("x", first.x_axis, first.shape[1]),
+            },
+        )
+        return stacked
@@ -12,6 +12,8 @@ import numpy as np
 import xmltodict
 from numpy.typing import NDArray
 
+from nanofinderparser import instrument
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,7 +34,7 @@ def read_xml_part(file: Path, position: int = 0) -> tuple[dict[str, Any], int]:
     position : int
         The current position in the file.
     """
-    with Path.open(file, "rb") as f:
+    with Path.open(file, "rb") as f, instrument.stage("xml.scan", source=file) as scan:
         xml_content = b""
         first_tag = None
         f.seek(position)  # Move to the indicated position
@@ -50,9 +52,13 @@ def read_xml_part(file: Path, position: int = 0) -> tuple[dict[str, Any], int]:
             if first_tag and line.strip().startswith(b"</" + first_tag + b">"):
                 break
 
+        scan.nbytes = len(xml_content)
+        end = f.tell()
+
+    with instrument.stage("xml.parse", nbytes=len(xml_content), source=file):
         xml_data = xmltodict.parse(xml_content)
 
-        return xml_data, f.tell()
+    return xml_data, end
 
 
 # Little-endian numpy dtype for each ``struct`` format character that describes a homogeneous
@@ -80,7 +86,7 @@ SMD_DTYPE: Final[str] = _NUMPY_DTYPES[SMD_DATA_FORMAT]
 
 
 def read_binary_part(
-    file: Path, position: int = 0, data_format: str = SMD_DATA_FORMAT
+    file: Path, position: int = 0, data_format: str = SMD_DATA_FORMAT, count: int = -1
 ) -> NDArray[Any]:
     """Read the binary part of a file.
 
@@ -95,12 +101,15 @@ def read_binary_part(
         (little-endian ``float32``, which is what NanoFinder writes in SMD files). See
         https://docs.python.org/3/library/struct.html#format-characters for the full list; only
         the characters describing a single number are accepted.
+    count : int, optional
+        Number of values to read, by default -1 (all of them, to the end of the file).
 
     Returns
     -------
     NDArray[Any]
         The read values, as a flat array whose dtype matches `data_format`. Values are read from
-        `position` to the end of the file; a trailing partial value is ignored.
+        `position` to the end of the file, or `count` of them; a trailing partial value is
+        ignored.
 
     Raises
     ------
@@ -123,9 +132,12 @@ def read_binary_part(
         )
         raise ValueError(msg)
 
-    with Path.open(file, "rb") as f:
+    with Path.open(file, "rb") as f, instrument.stage("binary.read", source=file) as read:
         f.seek(position)  # Move to the indicated position
-        return np.fromfile(f, dtype=dtype)
+        data = np.fromfile(f, dtype=dtype, count=count)
+        read.nbytes = data.nbytes
+
+    return data
 
 
 # ----------------------------------------------------------------------------------------------
@@ -138,6 +150,9 @@ MDT_MAGIC: Final[bytes] = b"\x01\xb0\x93\xff"
 # Bytes taken by the file header, before the first frame.
 _MDT_FILE_HEADER_SIZE: Final[int] = 33
 
+# Offset of the ``uint32`` holding the size of the file after its header.
+_MDT_BODY_SIZE_OFFSET: Final[int] = 4
+
 # Offset of the ``uint16`` holding the index of the last frame.
 _MDT_FRAME_COUNT_OFFSET: Final[int] = 12
 
@@ -552,6 +567,40 @@ def _read_mdt_frame(buffer: bytes, offset: int, index: int) -> tuple[MdtAnyFrame
     return frame, next_offset
 
 
+def read_mdt_declared_size(file: Path) -> int:
+    """Read the size an NT-MDT ``.mdt`` file declares in its header.
+
+    Only the header is read, so this tells cheaply whether a file that is still being written
+    is complete.
+
+    Parameters
+    ----------
+    file : Path
+        The file to read.
+
+    Returns
+    -------
+    int
+        The size of the whole file, header included, in bytes.
+
+    Raises
+    ------
+    ValueError
+        If the file does not start with a complete NT-MDT header.
+    OSError
+        If the file cannot be read.
+    """
+    with Path(file).open("rb") as f:
+        header = f.read(_MDT_FILE_HEADER_SIZE)
+
+    if len(header) < _MDT_FILE_HEADER_SIZE or not header.startswith(MDT_MAGIC):
+        msg = f"{file} does not start with a complete NT-MDT '.mdt' header."
+        raise ValueError(msg)
+
+    (body_size,) = struct.unpack_from("<I", header, _MDT_BODY_SIZE_OFFSET)
+    return _MDT_FILE_HEADER_SIZE + int(body_size)
+
+
 def read_mdt_frames(file: Path) -> list[MdtAnyFrame]:
     """Read every supported frame of an NT-MDT ``.mdt`` file.
 
@@ -573,7 +622,9 @@ def read_mdt_frames(file: Path) -> list[MdtAnyFrame]:
     OSError
         If the file cannot be read.
     """
-    buffer = Path(file).read_bytes()
+    with instrument.stage("mdt.read", source=file) as read:
+        buffer = Path(file).read_bytes()
+        read.nbytes = len(buffer)
 
     if len(buffer) < _MDT_FILE_HEADER_SIZE or not buffer.startswith(MDT_MAGIC):
         msg = f"{file} is not an NT-MDT '.mdt' file (wrong signature)."
@@ -583,14 +634,16 @@ def read_mdt_frames(file: Path) -> list[MdtAnyFrame]:
 
     frames: list[MdtAnyFrame] = []
     offset = _MDT_FILE_HEADER_SIZE
-    for index in range(last_frame + 1):
-        if offset >= len(buffer):
-            logger.warning(
-                "MDT file declares %d frames but only %d could be read.", last_frame + 1, index
-            )
-            break
-        frame, offset = _read_mdt_frame(buffer, offset, index)
-        if frame is not None:
-            frames.append(frame)
+    with instrument.stage("mdt.decode", source=file) as decode:
+        for index in range(last_frame + 1):
+            if offset >= len(buffer):
+                logger.warning(
+                    "MDT file declares %d frames but only %d could be read.", last_frame + 1, index
+                )
+                break
+            frame, offset = _read_mdt_frame(buffer, offset, index)
+            if frame is not None:
+                frames.append(frame)
+        decode.nbytes = offset - _MDT_FILE_HEADER_SIZE
 
     return frames
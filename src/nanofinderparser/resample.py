@@ -0,0 +1,190 @@
+"""Resample spectra onto another spectral axis, such as an evenly spaced grid.
+
+NanoFinder writes the spectral axis in nm, with points that are not quite evenly spaced, and
+converting it to Raman shifts spaces them even less evenly. Resampling onto an evenly spaced grid
+makes the spectra of different files comparable point by point, and fit for methods that expect
+evenly spaced points, such as FFT smoothing.
+
+Every spectrum of a mapping shares the same axis, so where each point of the new axis falls on
+the old one is worked out once: an :class:`Interpolation` holds, for every point of the new axis,
+the points of the old axis it is interpolated from and their weights. Resampling a chunk of
+spectra is then a few gathers of columns and multiply-adds, with no search per spectrum.
+
+Examples
+--------
+>>> spectra = np.array([[0.0, 10.0, 20.0], [1.0, 1.0, 1.0]])
+>>> resample(spectra, np.array([100.0, 200.0, 300.0]), np.array([150.0, 275.0])).tolist()
+[[5.0, 17.5], [1.0, 1.0]]
+"""
+
+from dataclasses import dataclass
+from typing import Any, Final, Literal, Self
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.utils import DEFAULT_CHUNK_SIZE
+
+# Points of the old axis each point of the new one is interpolated from, by method
+_STENCIL_SIZES: Final[dict[str, int]] = {"linear": 2, "cubic": 4}
+
+Method = Literal["linear", "cubic"]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Interpolation:
+    """Where the points of a new spectral axis fall on an old one, worked out once.
+
+    Build it with :meth:`build`.
+
+    Attributes
+    ----------
+    indices : NDArray[np.intp]
+        The points of the old axis every point of the new one is interpolated from, of shape
+        ``(n_points, 2)`` for linear interpolation and ``(n_points, 4)`` for cubic.
+    weights : NDArray[np.float64]
+        The weight of each of those points, of the same shape.
+    inside : NDArray[np.bool_]
+        Whether each point of the new axis lies within the old one. Points beyond it are not
+        extrapolated.
+    """
+
+    indices: NDArray[np.intp]
+    weights: NDArray[np.float64]
+    inside: NDArray[np.bool_]
+
+    @classmethod
+    def build(
+        cls, source_axis: NDArray[Any], axis: NDArray[Any], method: Method = "linear"
+    ) -> Self:
+        """Work out where the points of a new axis fall on an old one.
+
+        Parameters
+        ----------
+        source_axis : NDArray[Any]
+            The old axis, the one of the spectra, increasing or decreasing.
+        axis : NDArray[Any]
+            The new axis, in the same units, in any order.
+        method : {"linear", "cubic"}, optional
+            Interpolation between the two nearest points of the old axis ("linear", the default)
+            or by the cubic through the four nearest ones ("cubic").
+
+        Returns
+        -------
+        Interpolation
+            The interpolation from the old axis to the new one.
+
+        Raises
+        ------
+        ValueError
+            If the old axis is neither increasing nor decreasing, or has too few points for the
+            method.
+        """
+        source_axis = np.asarray(source_axis, dtype=np.float64)
+        axis = np.asarray(axis, dtype=np.float64)
+        size = _STENCIL_SIZES[method]
+        if source_axis.size < size:
+            msg = f"{method.capitalize()} interpolation needs at least {size} points, "
+            msg += f"but the spectral axis has {source_axis.size}."
+            raise ValueError(msg)
+        steps = np.diff(source_axis)
+        if not ((steps > 0).all() or (steps < 0).all()):
+            msg = "The spectral axis must be increasing or decreasing to be resampled."
+            raise ValueError(msg)
+        # A decreasing axis is looked up reversed; the indices point back to the columns of the
+        # spectra
+        order = np.arange(source_axis.size)
+        if steps[0] < 0:
+            order = order[::-1]
+        values = source_axis[order]
+
+        # First point of the stencil of every new point: the interval holding it, centered
+        interval = np.clip(np.searchsorted(values, axis, side="right") - 1, 0, values.size - 2)
+        first = np.clip(interval - (size // 2 - 1), 0, values.size - size)
+        stencil = first[:, None] + np.arange(size)
+        nodes = values[stencil]
+
+        # Lagrange weights of every node of the stencil, at the new point
+        weights = np.ones((axis.size, size))
+        for k in range(size):
+            for m in range(size):
+                if m != k:
+                    weights[:, k] *= (axis - nodes[:, m]) / (nodes[:, k] - nodes[:, m])
+        inside = (axis >= values[0]) & (axis <= values[-1])
+        return cls(indices=order[stencil], weights=weights, inside=inside)
+
+    def apply(self, spectra: NDArray[Any]) -> NDArray[np.float64]:
+        """Resample a chunk of spectra.
+
+        Parameters
+        ----------
+        spectra : NDArray[Any]
+            The spectra, on the old axis, of shape ``(n_spectra, n_points)``.
+
+        Returns
+        -------
+        NDArray[np.float64]
+            The spectra on the new axis, NaN at points beyond the old one.
+        """
+        spectra = np.asarray(spectra, dtype=np.float64)
+        resampled: NDArray[np.float64] = spectra[:, self.indices[:, 0]] * self.weights[:, 0]
+        for k in range(1, self.indices.shape[1]):
+            resampled += spectra[:, self.indices[:, k]] * self.weights[:, k]
+        resampled[:, ~self.inside] = np.nan
+        return resampled
+
+
+def resample(  # noqa: PLR0913
+    spectra: NDArray[Any],
+    source_axis: NDArray[Any],
+    axis: NDArray[Any],
+    *,
+    method: Method = "linear",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    out: NDArray[Any] | None = None,
+) -> NDArray[Any]:
+    """Resample spectra onto another spectral axis, by chunks of spectra.
+
+    Parameters
+    ----------
+    spectra : NDArray[Any]
+        The spectra, of shape ``(n_spectra, n_points)``, such as a memory map.
+    source_axis : NDArray[Any]
+        The axis of the spectra, increasing or decreasing.
+    axis : NDArray[Any]
+        The new axis, in the same units, usually evenly spaced.
+    method : {"linear", "cubic"}, optional
+        Interpolation between the two nearest points ("linear", the default) or by the cubic
+        through the four nearest ones ("cubic").
+    chunk_size : int, optional
+        Number of spectra resampled together, by default 4096.
+    out : NDArray[Any] | None, optional
+        Where to write the resampled spectra, of shape ``(n_spectra, axis.size)``, by default
+        None (a new array of single precision).
+
+    Returns
+    -------
+    NDArray[Any]
+        The spectra on the new axis, NaN at points beyond the axis of the spectra; `out`, if
+        given.
+
+    Raises
+    ------
+    ValueError
+        If the spectra do not have a value per point of their axis, `out` does not have the
+        shape of the result, or the axis of the spectra cannot be resampled.
+    """
+    n_spectra, n_points = spectra.shape
+    if n_points != np.size(source_axis):
+        msg = f"The spectra have {n_points} points, but their axis has {np.size(source_axis)}."
+        raise ValueError(msg)
+    interpolation = Interpolation.build(source_axis, axis, method)
+    if out is None:
+        out = np.empty((n_spectra, np.size(axis)), dtype=np.float32)
+    elif out.shape != (n_spectra, np.size(axis)):
+        msg = f"The output has shape {out.shape}, but the resampled spectra have shape "
+        msg += f"{(n_spectra, np.size(axis))}."
+        raise ValueError(msg)
+    for start in range(0, n_spectra, chunk_size):
+        out[start : start + chunk_size] = interpolation.apply(spectra[start : start + chunk_size])
+    return out
@@ -636,6 +636,7 @@ def sample_mapping(  # noqa: PLR0913
     n_points: int = DEFAULT_POINTS,
     laser_nm: float = DEFAULT_LASER_NM,
     seed: int | None = DEFAULT_SEED,
+    tolerance: float | None = None,
 ) -> Mapping:
     """Build one of the samples of the catalog, without writing any file.
 
@@ -653,6 +654,9 @@ def sample_mapping(  # noqa: PLR0913
         Excitation wavelength, in nm.
     seed : int | None, optional
         Seed of the noise. None draws a different mapping every time.
+    tolerance : float | None, optional
+        Relative height below which peaks are not evaluated, by default None (exact). See
+        :func:`~nanofinderparser.synthetic.build_spectra`.
 
     Returns
     -------
@@ -679,5 +683,6 @@ def sample_mapping(  # noqa: PLR0913
             n_points=n_points,
             laser_nm=laser_nm,
             seed=seed,
-        )
+        ),
+        tolerance=tolerance,
     )
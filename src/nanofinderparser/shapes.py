@@ -0,0 +1,104 @@
+"""Lineshapes of the peaks of Raman and photoluminescence spectra.
+
+The peaks drawn by :mod:`nanofinderparser.synthetic` and fitted by :mod:`nanofinderparser.fit`
+share these shapes: a Gaussian, a Lorentzian, or a pseudo-Voigt, their weighted mean. Every
+shape is of unit height, and is evaluated at the squared distance to the center of the peak, in
+half-widths.
+
+Examples
+--------
+>>> squared = np.array([0.0, 1.0, 4.0])
+>>> gaussian(squared).round(4).tolist(), lorentzian(squared).round(4).tolist()
+([1.0, 0.5, 0.0625], [1.0, 0.5, 0.2])
+"""
+
+from typing import Final, Literal
+
+import numpy as np
+from numpy.typing import NDArray
+
+# Shape of a peak.
+type PeakShape = Literal["gaussian", "lorentzian", "pseudo_voigt"]
+
+# Peak width below which a lineshape would collapse to a spike.
+MIN_FWHM: Final[float] = 1e-12
+
+
+def gaussian(squared: NDArray[np.float64]) -> NDArray[np.float64]:
+    """Evaluate a Gaussian lineshape of unit height.
+
+    Parameters
+    ----------
+    squared : NDArray[np.float64]
+        Squared distance to the center of the peak, in half-widths.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The lineshape, worth 1 at the center of the peak and 0.5 half a width away from it.
+    """
+    profile: NDArray[np.float64] = np.exp(-np.log(2.0) * squared)
+    return profile
+
+
+def lorentzian(squared: NDArray[np.float64]) -> NDArray[np.float64]:
+    """Evaluate a Lorentzian lineshape of unit height.
+
+    Parameters
+    ----------
+    squared : NDArray[np.float64]
+        Squared distance to the center of the peak, in half-widths.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The lineshape, worth 1 at the center of the peak and 0.5 half a width away from it.
+    """
+    profile: NDArray[np.float64] = 1.0 / (1.0 + squared)
+    return profile
+
+
+def profile(
+    shape: str,
+    offset: NDArray[np.float64],
+    fwhm: NDArray[np.float64],
+    eta: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    """Evaluate a normalized lineshape, whose maximum is 1.
+
+    Parameters
+    ----------
+    shape : {"gaussian", "lorentzian", "pseudo_voigt"}
+        The lineshape to evaluate. Typed as a plain string, rather than as
+        :data:`PeakShape`, so that an unknown name coming from unchecked code is rejected here
+        rather than sailing through.
+    offset : NDArray[np.float64]
+        Distance to the center of the peak, of shape ``(y_size, x_size, n_points)``.
+    fwhm : NDArray[np.float64]
+        Full width at half maximum, broadcastable to the shape of `offset`.
+    eta : NDArray[np.float64]
+        Weight of the Lorentzian part of a pseudo-Voigt.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The lineshape, of the shape of `offset`.
+
+    Raises
+    ------
+    ValueError
+        If the shape is not one of the supported ones.
+    """
+    reduced = 2.0 * offset / np.maximum(fwhm, MIN_FWHM)
+    squared: NDArray[np.float64] = reduced**2
+
+    if shape == "gaussian":
+        return gaussian(squared)
+    if shape == "lorentzian":
+        return lorentzian(squared)
+    if shape == "pseudo_voigt":
+        blended: NDArray[np.float64] = eta * lorentzian(squared) + (1.0 - eta) * gaussian(squared)
+        return blended
+
+    msg = f"Unknown peak shape {shape!r}; expected 'gaussian', 'lorentzian' or 'pseudo_voigt'."
+    raise ValueError(msg)
@@ -0,0 +1,152 @@
+"""Find points of a spectral axis by their value, such as the column of 1580 cm-1.
+
+Windowing a spectrum (integrating a band, fitting a peak) starts by finding which points of the
+spectral axis lie within the window. :class:`SpectralAxis` answers that without scanning the
+axis: it records once whether the axis runs up or down, and whether its points are evenly spaced.
+Evenly spaced axes are then looked up with a little arithmetic, and other monotonic axes with a
+binary search; only axes that are not monotonic, which NanoFinder does not write, are scanned.
+
+:class:`~nanofinderparser.models.Mapping` and :class:`~nanofinderparser.models.Spectrum` keep one
+per units of their axis, through their ``spectral_index`` and ``spectral_slice`` methods.
+
+Examples
+--------
+>>> axis = SpectralAxis.from_values(np.linspace(1000.0, 2000.0, 11))
+>>> axis.nearest(1580.0), axis.window(1250.0, 1500.0)
+(6, slice(3, 6, None))
+"""
+
+from dataclasses import dataclass
+from typing import Final, Literal, Self
+
+import numpy as np
+from numpy.typing import NDArray
+
+# Largest deviation of a point from its place on an evenly spaced axis, relative to the spacing,
+# for the axis to be looked up by arithmetic.
+_UNIFORM_TOLERANCE: Final[float] = 1e-6
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class SpectralAxis:
+    """A spectral axis, prepared for finding its points by their value.
+
+    Build it with :meth:`from_values`.
+
+    Attributes
+    ----------
+    values : NDArray[np.float64]
+        The points of the axis, read-only.
+    direction : {1, -1, 0}
+        1 if the axis increases, -1 if it decreases, 0 if it does neither.
+    step : float | None
+        The spacing of the points, negative for a decreasing axis, when they are evenly spaced;
+        None otherwise.
+    """
+
+    values: NDArray[np.float64]
+    direction: Literal[1, -1, 0]
+    step: float | None
+
+    @classmethod
+    def from_values(cls, values: NDArray[np.float64]) -> Self:
+        """Prepare an axis for lookups.
+
+        Parameters
+        ----------
+        values : NDArray[np.float64]
+            The points of the axis. They are copied.
+
+        Returns
+        -------
+        SpectralAxis
+            The axis, ready for lookups.
+        """
+        values = np.array(values, dtype=np.float64)
+        values.setflags(write=False)
+        steps = np.diff(values)
+        direction: Literal[1, -1, 0] = 1 if (steps > 0).all() else -1 if (steps < 0).all() else 0
+
+        step = None
+        if direction and values.size > 1:
+            spacing = (values[-1] - values[0]) / (values.size - 1)
+            expected = values[0] + spacing * np.arange(values.size)
+            if np.abs(values - expected).max() <= _UNIFORM_TOLERANCE * abs(spacing):
+                step = float(spacing)
+        return cls(values, direction, step)
+
+    def nearest(self, value: float) -> int:
+        """Find the point of the axis nearest to a value.
+
+        Parameters
+        ----------
+        value : float
+            The value, in the units of the axis.
+
+        Returns
+        -------
+        int
+            The index of the nearest point.
+        """
+        values = self.values
+        if self.step is not None:
+            position = round(float(value - values[0]) / self.step)
+            return min(max(position, 0), values.size - 1)
+        if not self.direction:
+            return int(np.abs(values - value).argmin())
+
+        # The binary search runs on the axis sorted up, which for a decreasing one is reversed
+        ascending = values if self.direction > 0 else values[::-1]
+        above = int(np.searchsorted(ascending, value))
+        candidates = [i for i in (above - 1, above) if 0 <= i < values.size]
+        nearest = min(candidates, key=lambda i: abs(ascending[i] - value))
+        return nearest if self.direction > 0 else values.size - 1 - nearest
+
+    def window(self, low: float, high: float) -> slice:
+        """Find the points of the axis within a window.
+
+        Parameters
+        ----------
+        low, high : float
+            The limits of the window, in the units of the axis, in any order. Points on the
+            limits are within the window.
+
+        Returns
+        -------
+        slice
+            The points within the window, in the order of the axis.
+
+        Raises
+        ------
+        ValueError
+            If no point of the axis lies within the window, or, for an axis that is not
+            monotonic, if the points within it are not contiguous.
+        """
+        low, high = sorted((low, high))
+        values = self.values
+        if not self.direction:
+            inside = np.flatnonzero((values >= low) & (values <= high))
+            if inside.size and inside[-1] - inside[0] + 1 != inside.size:
+                msg = f"The points of the spectral axis between {low} and {high} are not "
+                msg += "contiguous."
+                raise ValueError(msg)
+            first, stop = (int(inside[0]), int(inside[-1]) + 1) if inside.size else (0, 0)
+        elif self.step is not None:
+            # Positions of the limits in points of the axis, sorted up, widened by the tolerance
+            # so that a limit falling on a point keeps it
+            step = abs(self.step)
+            start = min(values[0], values[-1])
+            slack = _UNIFORM_TOLERANCE
+            first = max(int(np.ceil((low - start) / step - slack)), 0)
+            stop = min(int(np.floor((high - start) / step + slack)) + 1, values.size)
+        else:
+            ascending = values if self.direction > 0 else values[::-1]
+            first = int(np.searchsorted(ascending, low, side="left"))
+            stop = int(np.searchsorted(ascending, high, side="right"))
+
+        if stop <= first:
+            msg = f"No point of the spectral axis lies between {low} and {high}."
+            raise ValueError(msg)
+        if self.direction < 0:
+            first, stop = values.size - stop, values.size - first
+        return slice(first, stop)
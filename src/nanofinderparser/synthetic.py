@@ -67,6 +67,7 @@ from nanofinderparser.models import (
     ChannelInfo,
     Mapping,
 )
+from nanofinderparser.shapes import MIN_FWHM, PeakShape, profile
 from nanofinderparser.units import Units, convert_spectral_units
 from nanofinderparser.write import DEFAULT_VENDOR, NIL_GUID, write_smd
 
@@ -76,9 +77,6 @@ logger = logging.getLogger(__name__)
 # clock so that the same spec always produces the same file.
 DEFAULT_MEASURED_AT: Final[datetime] = datetime(2024, 1, 1, 12, 0, 0)  # noqa: DTZ001
 
-# Shape of a peak.
-type PeakShape = Literal["gaussian", "lorentzian", "pseudo_voigt"]
-
 # A quantity that may change from one point of the map to another. It can be given as a single
 # number, as an array broadcastable to ``(y_size, x_size)``, or as a function of the physical map
 # coordinates, which arrive as two ``(y_size, x_size)`` arrays in the units of the stage axes.
@@ -90,12 +88,13 @@ type MapParameter = (
     | Callable[[NDArray[np.float64], NDArray[np.float64]], NDArray[np.float64] | float]
 )
 
-# Peak width below which a lineshape would collapse to a spike.
-_MIN_FWHM: Final[float] = 1e-12
-
 # Radius below which a shape drawn over the map would collapse to a point.
 _MIN_RADIUS: Final[float] = 1e-12
 
+# Fraction of the spectral axis above which a peak is evaluated over the whole axis rather than
+# over a window: past it, gathering and scattering the window costs more than it saves.
+_MAX_WINDOW_FRACTION: Final[float] = 0.5
+
 
 def _evaluate(
     value: MapParameter,
@@ -740,93 +739,144 @@ def _peak_axis(spec: MappingSpec, axis: NDArray[np.float64], peak: PeakSpec) ->
     )
 
 
-def _gaussian(squared: NDArray[np.float64]) -> NDArray[np.float64]:
-    """Evaluate a Gaussian lineshape of unit height.
+def _support(shape: str, tolerance: float) -> float:
+    """Distance to the center beyond which a lineshape of unit height stays below a tolerance.
 
     Parameters
     ----------
-    squared : NDArray[np.float64]
-        Squared distance to the center of the peak, in half-widths.
+    shape : {"gaussian", "lorentzian", "pseudo_voigt"}
+        The lineshape.
+    tolerance : float
+        The value the lineshape must not exceed beyond the returned distance, between 0 and 1.
 
     Returns
     -------
-    NDArray[np.float64]
-        The lineshape, worth 1 at the center of the peak and 0.5 half a width away from it.
+    float
+        The distance, in half-widths. A pseudo-Voigt is a weighted mean of the other two shapes,
+        so it is below the tolerance wherever both of them are, whatever its `eta`.
+
+    Raises
+    ------
+    ValueError
+        If the shape is not one of the supported ones.
     """
-    profile: NDArray[np.float64] = np.exp(-np.log(2.0) * squared)
-    return profile
+    gaussian = float(np.sqrt(np.log(1.0 / tolerance) / np.log(2.0)))
+    lorentzian = float(np.sqrt(1.0 / tolerance - 1.0))
 
+    if shape == "gaussian":
+        return gaussian
+    if shape == "lorentzian":
+        return lorentzian
+    if shape == "pseudo_voigt":
+        return max(gaussian, lorentzian)
+
+    msg = f"Unknown peak shape {shape!r}; expected 'gaussian', 'lorentzian' or 'pseudo_voigt'."
+    raise ValueError(msg)
 
-def _lorentzian(squared: NDArray[np.float64]) -> NDArray[np.float64]:
-    """Evaluate a Lorentzian lineshape of unit height.
+
+def _peak_windows(
+    peak_axis: NDArray[np.float64],
+    center: NDArray[np.float64],
+    half_width: NDArray[np.float64],
+) -> tuple[NDArray[np.intp], int] | None:
+    """Find, at every point of the map, the stretch of the spectral axis a peak covers.
 
     Parameters
     ----------
-    squared : NDArray[np.float64]
-        Squared distance to the center of the peak, in half-widths.
+    peak_axis : NDArray[np.float64]
+        The spectral axis, in the units of the peak.
+    center : NDArray[np.float64]
+        Center of the peak at every point of the map, of shape ``(y_size, x_size, 1)``.
+    half_width : NDArray[np.float64]
+        Distance to the center beyond which the peak is negligible, of the same shape.
 
     Returns
     -------
-    NDArray[np.float64]
-        The lineshape, worth 1 at the center of the peak and 0.5 half a width away from it.
+    tuple[NDArray[np.intp], int] | None
+        The index of the first point of the window at every point of the map, of shape
+        ``(y_size, x_size, 1)``, and the number of points of the windows, which is the same
+        everywhere so that the peak is evaluated as a single array. A window never runs past the
+        end of the axis: one that would is moved back, which only makes it cover more of the peak.
+        None when the axis is not monotonic, or when the windows would cover so much of it that
+        gathering and scattering the values would cost more than evaluating the whole axis.
     """
-    profile: NDArray[np.float64] = 1.0 / (1.0 + squared)
-    return profile
-
-
-def _profile(
+    size = peak_axis.size
+    steps = np.diff(peak_axis)
+    if np.all(steps > 0):
+        low = np.searchsorted(peak_axis, center - half_width, side="left")
+        high = np.searchsorted(peak_axis, center + half_width, side="right")
+    elif np.all(steps < 0):
+        ascending = peak_axis[::-1]
+        low = size - np.searchsorted(ascending, center + half_width, side="right")
+        high = size - np.searchsorted(ascending, center - half_width, side="left")
+    else:
+        return None
+
+    width = int((high - low).max())
+    if width > _MAX_WINDOW_FRACTION * size:
+        return None
+
+    return np.clip(low, 0, size - width), width
+
+
+def _add_peak(  # noqa: PLR0913, PLR0917
+    intensities: NDArray[np.float64],
+    peak_axis: NDArray[np.float64],
     shape: str,
-    offset: NDArray[np.float64],
+    center: NDArray[np.float64],
     fwhm: NDArray[np.float64],
+    amplitude: NDArray[np.float64],
     eta: NDArray[np.float64],
-) -> NDArray[np.float64]:
-    """Evaluate a normalized lineshape, whose maximum is 1.
+    tolerance: float | None,
+) -> None:
+    """Add a peak to the spectra, in place.
 
     Parameters
     ----------
+    intensities : NDArray[np.float64]
+        The spectra, of shape ``(y_size, x_size, n_points)``.
+    peak_axis : NDArray[np.float64]
+        The spectral axis, in the units of the peak.
     shape : {"gaussian", "lorentzian", "pseudo_voigt"}
-        The lineshape to evaluate. Typed as a plain string, rather than as
-        :data:`PeakShape`, so that an unknown name coming from unchecked code is rejected here
-        rather than sailing through.
-    offset : NDArray[np.float64]
-        Distance to the center of the peak, of shape ``(y_size, x_size, n_points)``.
-    fwhm : NDArray[np.float64]
-        Full width at half maximum, broadcastable to the shape of `offset`.
-    eta : NDArray[np.float64]
-        Weight of the Lorentzian part of a pseudo-Voigt.
-
-    Returns
-    -------
-    NDArray[np.float64]
-        The lineshape, of the shape of `offset`.
-
-    Raises
-    ------
-    ValueError
-        If the shape is not one of the supported ones.
+        Lineshape of the peak.
+    center, fwhm, amplitude, eta : NDArray[np.float64]
+        The parameters of the peak at every point of the map, of shape ``(y_size, x_size, 1)``.
+    tolerance : float | None
+        When given, the peak is only evaluated where it exceeds `tolerance` times its amplitude.
+        None evaluates it over the whole axis.
     """
-    reduced = 2.0 * offset / np.maximum(fwhm, _MIN_FWHM)
-    squared: NDArray[np.float64] = reduced**2
+    windows = None
+    if tolerance is not None:
+        half_width = 0.5 * _support(shape, tolerance) * np.maximum(fwhm, MIN_FWHM)
+        windows = _peak_windows(peak_axis, center, half_width)
 
-    if shape == "gaussian":
-        return _gaussian(squared)
-    if shape == "lorentzian":
-        return _lorentzian(squared)
-    if shape == "pseudo_voigt":
-        blended: NDArray[np.float64] = eta * _lorentzian(squared) + (1.0 - eta) * _gaussian(squared)
-        return blended
+    if windows is None:
+        intensities += amplitude * profile(shape, peak_axis - center, fwhm, eta)
+        return
 
-    msg = f"Unknown peak shape {shape!r}; expected 'gaussian', 'lorentzian' or 'pseudo_voigt'."
-    raise ValueError(msg)
+    start, width = windows
+    if width == 0:
+        # The peak is negligible everywhere on the axis.
+        return
 
+    columns = start + np.arange(width)
+    lineshape = profile(shape, peak_axis[columns] - center, fwhm, eta)
+    covered = np.take_along_axis(intensities, columns, axis=-1)
+    np.put_along_axis(intensities, columns, covered + amplitude * lineshape, axis=-1)
 
-def build_spectra(spec: MappingSpec) -> NDArray[np.float32]:
+
+def build_spectra(spec: MappingSpec, *, tolerance: float | None = None) -> NDArray[np.float32]:
     """Build the spectra of a synthetic mapping.
 
     Parameters
     ----------
     spec : MappingSpec
         The description of the mapping.
+    tolerance : float | None, optional
+        When given, every peak is only evaluated over the part of the spectral axis where it
+        exceeds `tolerance` times its amplitude, so each spectrum differs from the exact one by
+        at most ``tolerance * sum(abs(amplitude))`` before noise is added. By default None, which
+        evaluates every peak over the whole axis.
 
     Returns
     -------
@@ -838,15 +888,32 @@ def build_spectra(spec: MappingSpec) -> NDArray[np.float32]:
     Raises
     ------
     ValueError
-        If a parameter cannot be broadcast to the shape of the map, or if a peak has an unknown
-        shape.
+        If a parameter cannot be broadcast to the shape of the map, if a peak has an unknown
+        shape, or if `tolerance` is not between 0 and 1.
+
+    Notes
+    -----
+    A Gaussian falls below 1e-6 of its height within 4.5 FWHM of its center, so on a long axis a
+    tolerance saves most of the work. A Lorentzian decays much more slowly --- it only falls
+    below 1e-3 of its height 16 FWHM away from its center --- so the saving for Lorentzian and
+    pseudo-Voigt peaks depends on how loose a tolerance the caller accepts. Windows are only
+    used on a monotonic axis; other axes are always evaluated in full.
 
     Examples
     --------
     >>> spec = MappingSpec(map=MapSpec(x_size=3, y_size=2), baseline=BaselineSpec(offset=10.0))
     >>> build_spectra(spec).shape
     (2, 3, 512)
+    >>> peaks = [PeakSpec(center=550.0, fwhm=2.0, amplitude=100.0)]
+    >>> spec = MappingSpec(map=MapSpec(x_size=3, y_size=2), peaks=peaks)
+    >>> exact = build_spectra(spec)
+    >>> bool(np.abs(build_spectra(spec, tolerance=1e-6) - exact).max() <= 1e-4)
+    True
     """
+    if tolerance is not None and not 0.0 < tolerance < 1.0:
+        msg = f"The tolerance must be between 0 and 1, not {tolerance}."
+        raise ValueError(msg)
+
     axis = spec.spectral_axis.build()
     x, y = spec.map.coordinates()
 
@@ -870,7 +937,7 @@ def build_spectra(spec: MappingSpec) -> NDArray[np.float32]:
         amplitude = _evaluate(peak.amplitude, x, y, f"amplitude of peak {index}")[..., None]
         eta = _evaluate(peak.eta, x, y, f"eta of peak {index}")[..., None]
 
-        intensities += amplitude * _profile(peak.shape, peak_axis - center, fwhm, eta)
+        _add_peak(intensities, peak_axis, peak.shape, center, fwhm, amplitude, eta, tolerance)
 
     return _add_noise(intensities, spec, x, y).astype(np.float32)
 
@@ -1013,7 +1080,9 @@ def _axis_dict(  # noqa: PLR0913
     }
 
 
-def build_mapping(spec: MappingSpec, *, source: Path | None = None) -> Mapping:
+def build_mapping(
+    spec: MappingSpec, *, source: Path | None = None, tolerance: float | None = None
+) -> Mapping:
     """Build a synthetic mapping, without writing any file.
 
     Parameters
@@ -1022,6 +1091,9 @@ def build_mapping(spec: MappingSpec, *, source: Path | None = None) -> Mapping:
         The description of the mapping.
     source : Path | None, optional
         Path to record as the origin of the mapping, by default None.
+    tolerance : float | None, optional
+        Relative height below which peaks are not evaluated, by default None (exact). See
+        :func:`build_spectra`.
 
     Returns
     -------
@@ -1031,8 +1103,8 @@ def build_mapping(spec: MappingSpec, *, source: Path | None = None) -> Mapping:
     Raises
     ------
     ValueError
-        If a parameter cannot be broadcast to the shape of the map, or if a peak has an unknown
-        shape.
+        If a parameter cannot be broadcast to the shape of the map, if a peak has an unknown
+        shape, or if `tolerance` is not between 0 and 1.
 
     Examples
     --------
@@ -1044,7 +1116,7 @@ def build_mapping(spec: MappingSpec, *, source: Path | None = None) -> Mapping:
     (3, 4, 512)
     """
     axis = spec.spectral_axis.build()
-    spectra = build_spectra(spec)
+    spectra = build_spectra(spec, tolerance=tolerance)
     instrument = spec.instrument
     map_spec = spec.map
 
@@ -1123,7 +1195,7 @@ def build_mapping(spec: MappingSpec, *, source: Path | None = None) -> Mapping:
     return Mapping(init_dict, source=source)
 
 
-def create_smd(file: Path | str, spec: MappingSpec) -> Path:
+def create_smd(file: Path | str, spec: MappingSpec, *, tolerance: float | None = None) -> Path:
     """Build a synthetic mapping and write it as an SMD file.
 
     Parameters
@@ -1132,6 +1204,9 @@ def create_smd(file: Path | str, spec: MappingSpec) -> Path:
         Path of the file to write. Parent directories are created when missing.
     spec : MappingSpec
         The description of the mapping.
+    tolerance : float | None, optional
+        Relative height below which peaks are not evaluated, by default None (exact). See
+        :func:`build_spectra`.
 
     Returns
     -------
@@ -1141,8 +1216,8 @@ def create_smd(file: Path | str, spec: MappingSpec) -> Path:
     Raises
     ------
     ValueError
-        If a parameter cannot be broadcast to the shape of the map, or if a peak has an unknown
-        shape.
+        If a parameter cannot be broadcast to the shape of the map, if a peak has an unknown
+        shape, or if `tolerance` is not between 0 and 1.
     OSError
         If the file cannot be written.
 
@@ -1155,4 +1230,4 @@ def create_smd(file: Path | str, spec: MappingSpec) -> Path:
     (4, 3, 1)
     """
     file = Path(file)
-    return write_smd(build_mapping(spec, source=file), file)
+    return write_smd(build_mapping(spec, source=file, tolerance=tolerance), file)
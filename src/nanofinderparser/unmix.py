@@ -0,0 +1,260 @@
+"""Unmix the spectra of a mapping into known reference spectra, such as those of its materials.
+
+Each spectrum is approximated by a weighted sum of the references, ``abundances @ references``,
+the abundances being found by least squares, either freely (classical least squares, CLS) or
+constrained to be non-negative (NNLS), which is what the amount of a material is.
+
+The references are shared by every spectrum, so everything the least squares need of them is
+computed once: their Gram matrix ``references @ references.T``, of ``n_references²`` values.
+A chunk of spectra then costs a single matrix product with the references, and the rest works on
+``n_references`` values per spectrum:
+
+- CLS solves the normal equations for the whole chunk with the inverse of the Gram matrix.
+- NNLS starts from the CLS abundances clipped to zero, and refines them by coordinate descent on
+  every spectrum at once. The references used by each spectrum are then known, and its
+  abundances are solved exactly on them; spectra using the same references are solved together.
+
+Examples
+--------
+>>> references = np.array([[1.0, 0.0, 1.0, 0.0], [0.0, 1.0, 0.0, 1.0]])
+>>> spectra = np.array([[2.0, 3.0, 2.0, 3.0], [1.0, -1.0, 1.0, -1.0]])
+>>> unmix(spectra, references, method="cls")[0].tolist()
+[[2.0, 3.0], [1.0, -1.0]]
+>>> unmix(spectra, references)[0].tolist()
+[[2.0, 3.0], [1.0, 0.0]]
+"""
+
+from dataclasses import dataclass
+from typing import Any, Final, Literal
+
+import numpy as np
+from numpy.typing import NDArray
+
+from nanofinderparser.models import Mapping
+
+# Spectra unmixed together: twice the usual chunk, a spectrum costing only a few products with
+# the references.
+DEFAULT_UNMIX_CHUNK_SIZE: Final[int] = 8192
+
+# Sweeps of the coordinate descent of NNLS after which it is stopped, converged or not.
+DEFAULT_MAX_ITERATIONS: Final[int] = 200
+
+# Largest change of an abundance in a sweep, relative to the largest abundance of the chunk,
+# below which the coordinate descent has converged.
+_TOLERANCE: Final[float] = 1e-9
+
+Method = Literal["cls", "nnls"]
+
+
+@dataclass(frozen=True, slots=True)
+class Unmixing:
+    """The abundances of the references at every point of a mapping.
+
+    Attributes
+    ----------
+    names : tuple[str, ...]
+        The names of the references.
+    abundances : NDArray[np.float64]
+        The abundance of every reference at every point, of shape
+        ``(slow_axis, fast_axis, n_references)``, laid out as
+        :meth:`~nanofinderparser.models.Mapping.get_map`.
+    residual : NDArray[np.float64]
+        Root mean square of what the references leave of every spectrum, of shape
+        ``(slow_axis, fast_axis)``.
+    """
+
+    names: tuple[str, ...]
+    abundances: NDArray[np.float64]
+    residual: NDArray[np.float64]
+
+    def __getitem__(self, name: str) -> NDArray[np.float64]:
+        """Return the abundance map of a reference, of shape ``(slow_axis, fast_axis)``.
+
+        Raises
+        ------
+        KeyError
+            If no reference has that name.
+        """
+        if name not in self.names:
+            msg = f"No reference named {name!r}; the references are {', '.join(self.names)}."
+            raise KeyError(msg)
+        abundance: NDArray[np.float64] = self.abundances[..., self.names.index(name)]
+        return abundance
+
+
+def unmix(
+    spectra: NDArray[Any],
+    references: NDArray[Any],
+    *,
+    method: Method = "nnls",
+    chunk_size: int = DEFAULT_UNMIX_CHUNK_SIZE,
+    max_iterations: int = DEFAULT_MAX_ITERATIONS,
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """Unmix spectra into reference spectra, by chunks of spectra.
+
+    Parameters
+    ----------
+    spectra : NDArray[Any]
+        The spectra, of shape ``(n_spectra, n_points)``.
+    references : NDArray[Any]
+        The reference spectra, one per row, of shape ``(n_references, n_points)``.
+    method : {"cls", "nnls"}, optional
+        Least squares with free abundances ("cls") or non-negative ones ("nnls", the default).
+    chunk_size : int, optional
+        Number of spectra unmixed together, by default ``DEFAULT_UNMIX_CHUNK_SIZE`` (8192).
+    max_iterations : int, optional
+        Sweeps of the coordinate descent of NNLS after which it is stopped, by default 200.
+
+    Returns
+    -------
+    tuple[NDArray[np.float64], NDArray[np.float64]]
+        The abundances of the references in every spectrum, of shape
+        ``(n_spectra, n_references)``, and the root mean square of what they leave of every
+        spectrum, of shape ``(n_spectra,)``.
+
+    Raises
+    ------
+    ValueError
+        If the spectra and the references do not have the same number of points, or the
+        references are linearly dependent.
+    """
+    references = np.atleast_2d(np.asarray(references, dtype=np.float64))
+    n_spectra, n_points = spectra.shape
+    if references.shape[1] != n_points:
+        msg = f"The spectra have {n_points} points, but the references have "
+        msg += f"{references.shape[1]}."
+        raise ValueError(msg)
+    gram = references @ references.T
+    if np.linalg.matrix_rank(gram) < len(references):
+        msg = "The references are linearly dependent: their abundances cannot be told apart."
+        raise ValueError(msg)
+    inverse = np.linalg.inv(gram)
+
+    abundances = np.empty((n_spectra, len(references)))
+    residual = np.empty(n_spectra)
+    for start in range(0, n_spectra, chunk_size):
+        chunk = np.asarray(spectra[start : start + chunk_size], dtype=np.float64)
+        projections = chunk @ references.T
+        found = projections @ inverse
+        if method == "nnls":
+            found = _nnls(projections, gram, np.clip(found, 0.0, None), max_iterations)
+        abundances[start : start + chunk_size] = found
+        # |x - a R|² = |x|² - 2 a.(x R^T) + a G a^T, without building the reconstruction
+        squares = (
+            np.einsum("ij,ij->i", chunk, chunk)
+            - 2 * np.einsum("ij,ij->i", found, projections)
+            + np.einsum("ij,jk,ik->i", found, gram, found)
+        )
+        residual[start : start + chunk_size] = np.sqrt(np.clip(squares, 0.0, None) / n_points)
+    return abundances, residual
+
+
+def unmix_mapping(  # noqa: PLR0913
+    mapping: Mapping,
+    references: dict[str, NDArray[Any]],
+    *,
+    method: Method = "nnls",
+    channel: int = 0,
+    chunk_size: int = DEFAULT_UNMIX_CHUNK_SIZE,
+    max_iterations: int = DEFAULT_MAX_ITERATIONS,
+) -> Unmixing:
+    """Unmix every spectrum of a mapping into reference spectra.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    references : dict[str, NDArray[Any]]
+        The reference spectra by name, such as ``"MoS2"``, each on the spectral axis of the
+        mapping.
+    method : {"cls", "nnls"}, optional
+        Least squares with free abundances ("cls") or non-negative ones ("nnls", the default).
+    channel : int, optional
+        The channel index, by default 0.
+    chunk_size : int, optional
+        Number of spectra unmixed together, by default ``DEFAULT_UNMIX_CHUNK_SIZE`` (8192).
+    max_iterations : int, optional
+        Sweeps of the coordinate descent of NNLS after which it is stopped, by default 200.
+
+    Returns
+    -------
+    Unmixing
+        The abundance maps of the references, laid out as
+        :meth:`~nanofinderparser.models.Mapping.get_map`.
+
+    Raises
+    ------
+    ValueError
+        If there is no reference, a reference does not have as many points as the spectra, or
+        the references are linearly dependent.
+    """
+    if not references:
+        msg = "At least one reference spectrum is needed."
+        raise ValueError(msg)
+    abundances, residual = unmix(
+        mapping.get_spectra(channel),
+        np.stack([np.asarray(reference) for reference in references.values()]),
+        method=method,
+        chunk_size=chunk_size,
+        max_iterations=max_iterations,
+    )
+    shape = mapping.get_map(channel).shape[:2]
+    return Unmixing(
+        names=tuple(references),
+        abundances=abundances.reshape(*shape, len(references)),
+        residual=residual.reshape(shape),
+    )
+
+
+def _nnls(
+    projections: NDArray[np.float64],
+    gram: NDArray[np.float64],
+    abundances: NDArray[np.float64],
+    max_iterations: int,
+) -> NDArray[np.float64]:
+    """Find the non-negative abundances of a chunk of spectra.
+
+    Parameters
+    ----------
+    projections : NDArray[np.float64]
+        The products of the spectra with the references, of shape ``(n_spectra, n_references)``.
+    gram : NDArray[np.float64]
+        The Gram matrix of the references, of shape ``(n_references, n_references)``.
+    abundances : NDArray[np.float64]
+        Non-negative abundances to start from, of shape ``(n_spectra, n_references)``. They are
+        updated in place.
+    max_iterations : int
+        Sweeps of the coordinate descent after which it is stopped.
+
+    Returns
+    -------
+    NDArray[np.float64]
+        The abundances, non-negative.
+    """
+    diagonal = np.diag(gram)
+    for _ in range(max_iterations):
+        largest_change = 0.0
+        for j in range(len(gram)):
+            # The exact minimum along abundance j, the others fixed, clipped to zero
+            gradient = projections[:, j] - abundances @ gram[:, j]
+            updated = np.clip(abundances[:, j] + gradient / diagonal[j], 0.0, None)
+            largest_change = max(largest_change, float(np.abs(updated - abundances[:, j]).max()))
+            abundances[:, j] = updated
+        if largest_change <= _TOLERANCE * max(float(abundances.max()), 1e-300):
+            break
+
+    # The references each spectrum uses are now known: solving the least squares exactly on them
+    # removes what the descent has left. Spectra using the same references are solved together.
+    used = abundances > 0
+    patterns, groups = np.unique(used, axis=0, return_inverse=True)
+    for number, pattern in enumerate(patterns):
+        if not pattern.any():
+            continue
+        members = groups.ravel() == number
+        subset = np.ix_(pattern, pattern)
+        exact = projections[np.ix_(members, pattern)] @ np.linalg.inv(gram[subset])
+        # A solution leaving the constraints means the descent had not found the references yet
+        feasible = (exact >= 0).all(axis=1)
+        rows = np.flatnonzero(members)[feasible]
+        abundances[np.ix_(rows, pattern)] = exact[feasible]
+    return abundances
@@ -1,13 +1,39 @@
 """Utilities."""
 
+import importlib
+import os
 from enum import StrEnum
+from types import ModuleType
 from typing import Any, Final
 
+# Spectra processed together by the operations that go through a mapping chunk by chunk. Large
+# enough for the array operations to dominate, small enough for the double precision copy of a
+# chunk of 1024-point spectra to stay within a few tens of MB.
+DEFAULT_CHUNK_SIZE: Final[int] = 4096
+
 # NanoFinder is written in Visual Basic, whose booleans are -1 for true and 0 for false.
 VB_TRUE: Final[str] = "-1"
 VB_FALSE: Final[str] = "0"
 
 
+def resolve_jobs(jobs: int) -> int:
+    """Resolve the number of processes to work with, as for the ``jobs`` options.
+
+    Parameters
+    ----------
+    jobs : int
+        Processes asked for; 0 or less means one per CPU.
+
+    Returns
+    -------
+    int
+        The number of processes, at least 1.
+    """
+    if jobs > 0:
+        return jobs
+    return os.cpu_count() or 1
+
+
 def parse_vb_bool(value: str | bool | int) -> bool:
     """Parse the Visual Basic boolean convention used by NanoFinder files.
 
@@ -37,6 +63,33 @@ def parse_vb_bool(value: str | bool | int) -> bool:
     return bool(value)
 
 
+def import_optional(name: str, extra: str) -> ModuleType:
+    """Import an optional dependency, telling how to install it if it is missing.
+
+    Parameters
+    ----------
+    name : str
+        The name of the module, such as ``"xarray"``.
+    extra : str
+        The extra of nanofinderparser that installs it.
+
+    Returns
+    -------
+    ModuleType
+        The module.
+
+    Raises
+    ------
+    ImportError
+        If the module is not installed.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as error:
+        msg = f"{name} is not installed; install it with `pip install nanofinderparser[{extra}]`."
+        raise ImportError(msg) from error
+
+
 def format_vb_bool(value: bool) -> str:
     """Write a boolean the way NanoFinder files store it.
 
@@ -0,0 +1,242 @@
+"""Convert the files of a folder as the instrument writes them.
+
+NanoFinder writes a measurement into its folder over the whole acquisition, which may take hours
+for a large mapping. The folder is polled, and a file is converted once it is complete: its size
+and modification time have not changed between two polls, and it holds all the data its header
+declares (see :func:`~nanofinderparser.load.smd_is_complete`). Waiting for both means that a file
+whose header has just been written is not mistaken for an empty measurement, and that a copy
+still in progress is not read half-way.
+
+Files are converted by a pool of processes of bounded size, and recorded in the
+:class:`~nanofinderparser.convert.Manifest` of the output folder, so that a file is converted
+once: neither twice within a run, nor again when watching is stopped and restarted. A file is
+only converted again if it changes afterwards.
+
+Polling is used rather than notifications from the operating system because instruments often
+save to network shares, on which those notifications are unreliable or missing.
+"""
+
+import logging
+import time
+from collections.abc import Iterator, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final
+
+from nanofinderparser.convert import (
+    ConversionResult,
+    Converter,
+    Manifest,
+    convert_one,
+)
+from nanofinderparser.load import smd_is_complete
+from nanofinderparser.parsers import read_mdt_declared_size
+from nanofinderparser.utils import resolve_jobs
+
+logger = logging.getLogger(__name__)
+
+# Default time between two scans of the folder, in seconds.
+DEFAULT_POLL_INTERVAL: Final[float] = 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class WatchedFormat:
+    """How to convert the files of a format found in the watched folder.
+
+    Attributes
+    ----------
+    convert : Callable[[Path], list[Path]]
+        Converts a single file; see :func:`~nanofinderparser.convert.convert_files`.
+    options : dict[str, str]
+        The options of the conversion, as the manifest records them.
+    """
+
+    convert: Converter
+    options: dict[str, str]
+
+
+def is_complete(file: Path) -> bool:
+    """Whether a file holds all the data its header declares.
+
+    Parameters
+    ----------
+    file : Path
+        An SMD or MDT file.
+
+    Returns
+    -------
+    bool
+        True when the file is complete. Files of any other format are taken as complete.
+    """
+    suffix = file.suffix.lower()
+    try:
+        if suffix == ".smd":
+            return smd_is_complete(file)
+        if suffix == ".mdt":
+            return file.stat().st_size >= read_mdt_declared_size(file)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def _signature(file: Path) -> tuple[int, int] | None:
+    """Size and modification time of a file, or None if it vanished."""
+    try:
+        stat = file.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def watch_folder(  # noqa: PLR0913
+    folder: Path,
+    output_dir: Path,
+    formats: Mapping[str, WatchedFormat],
+    *,
+    jobs: int = 1,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    timeout: float | None = None,
+) -> Iterator[ConversionResult]:
+    """Convert the files of a folder as they are completed, until stopped.
+
+    Parameters
+    ----------
+    folder : Path
+        The folder to watch. Its subfolders are not watched.
+    output_dir : Path
+        The output folder of the conversions, where the manifest is kept.
+    formats : Mapping[str, WatchedFormat]
+        How to convert the files of every format watched, by suffix (such as ``".smd"``).
+    jobs : int, optional
+        Number of processes converting files at once, by default 1. 0 uses one per CPU.
+    poll_interval : float, optional
+        Time between two scans of the folder, in seconds, by default 1. A file is converted
+        between one and two intervals after it is completed.
+    timeout : float | None, optional
+        Stop watching after this many seconds, by default None (watch until interrupted). The
+        conversions already started are waited for.
+
+    Yields
+    ------
+    ConversionResult
+        The result of every file converted, as soon as its conversion ends.
+
+    Examples
+    --------
+    >>> from functools import partial
+    >>> from nanofinderparser.convert import smd_to_csv
+    >>> formats = {".smd": WatchedFormat(partial(smd_to_csv, output_dir=Path("csv")), {})}
+    >>> for result in watch_folder(Path("data"), Path("csv"), formats):  # doctest: +SKIP
+    ...     print(result.file, result.ok)
+    """
+    suffixes = {suffix.lower(): watched for suffix, watched in formats.items()}
+    manifest = Manifest.load(output_dir)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    workers = resolve_jobs(jobs)
+
+    # What each file looked like at the previous scan, when it was handed over to a worker, and
+    # when it was last dealt with (converted, failed or found up to date in the manifest)
+    observed: dict[Path, tuple[int, int]] = {}
+    handled: dict[Path, tuple[int, int]] = {}
+    running: dict[Future[ConversionResult], tuple[Path, tuple[int, int]]] = {}
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                busy = {path for path, _ in running.values()}
+                for file, signature in _completed_files(folder, suffixes, observed, handled, busy):
+                    if len(running) >= workers:
+                        break
+                    watched = suffixes[file.suffix.lower()]
+                    if manifest.is_current(file, watched.options):
+                        logger.debug("%s was converted already.", file)
+                        handled[file] = signature
+                        continue
+
+                    logger.debug("%s is complete; converting it.", file)
+                    future = executor.submit(convert_one, watched.convert, file, True)
+                    running[future] = (file, signature)
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+
+                interval = poll_interval if remaining is None else min(poll_interval, remaining)
+                if running:
+                    done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+                else:
+                    done = set()
+                    time.sleep(interval)
+
+                for future in done:
+                    yield _finish(future, running.pop(future), manifest, suffixes, handled)
+                if not running:
+                    # Every conversion started has ended: keep them before waiting for new files
+                    manifest.flush()
+
+            for future in list(running):
+                yield _finish(future, running.pop(future), manifest, suffixes, handled)
+    finally:
+        manifest.flush()
+
+
+def _completed_files(
+    folder: Path,
+    formats: Mapping[str, WatchedFormat],
+    observed: dict[Path, tuple[int, int]],
+    handled: dict[Path, tuple[int, int]],
+    busy: set[Path],
+) -> Iterator[tuple[Path, tuple[int, int]]]:
+    """Scan a folder for the files that are complete and wait to be converted.
+
+    Parameters
+    ----------
+    folder : Path
+        The folder watched.
+    formats : Mapping[str, WatchedFormat]
+        The formats watched, by lowercase suffix.
+    observed : dict[Path, tuple[int, int]]
+        Size and modification time of every file at the previous scan, updated in place.
+    handled : dict[Path, tuple[int, int]]
+        Size and modification time of every file when it was last dealt with.
+    busy : set[Path]
+        The files being converted.
+
+    Yields
+    ------
+    tuple[Path, tuple[int, int]]
+        Every file unchanged since the previous scan, complete, and not dealt with in this
+        state, with its size and modification time.
+    """
+    for file in sorted(folder.iterdir()):
+        if file.suffix.lower() not in formats or file in busy or not file.is_file():
+            continue
+        signature = _signature(file)
+        if signature is None or handled.get(file) == signature:
+            continue
+
+        previous = observed.get(file)
+        observed[file] = signature
+        if previous == signature and is_complete(file):
+            yield file, signature
+
+
+def _finish(
+    future: Future[ConversionResult],
+    submitted: tuple[Path, tuple[int, int]],
+    manifest: Manifest,
+    formats: Mapping[str, WatchedFormat],
+    handled: dict[Path, tuple[int, int]],
+) -> ConversionResult:
+    """Record the conversion of a file once it has ended."""
+    file, signature = submitted
+    try:
+        result = future.result()
+    except Exception as e:  # noqa: BLE001
+        # The worker itself died (e.g. killed by the system for using too much memory)
+        result = ConversionResult(file=file, error=f"{type(e).__name__}: {e}")
+
+    manifest.record(result, formats[file.suffix.lower()].options)
+    handled[file] = signature
+    return result
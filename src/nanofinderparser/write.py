@@ -24,6 +24,7 @@ import numpy as np
 import xmltodict
 from numpy.typing import NDArray
 
+from nanofinderparser import instrument
 from nanofinderparser.models import (
     SMD_DATE_FORMAT,
     SMD_TIME_FORMAT,
@@ -404,14 +405,18 @@ def write_smd(mapping: Mapping, file: Path | str) -> Path:
 
     """
     file = Path(file)
-    data = _validate(mapping)
 
-    header = _smd_header(mapping, data.nbytes, file)
+    with instrument.stage("smd.write", source=file) as write:
+        data = _validate(mapping)
 
-    file.parent.mkdir(parents=True, exist_ok=True)
-    with file.open("wb") as stream:
-        stream.write(header.encode("utf-8"))
-        stream.write(data.tobytes())
+        header = _smd_header(mapping, data.nbytes, file).encode("utf-8")
+
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with file.open("wb") as stream:
+            stream.write(header)
+            stream.write(data.tobytes())
+
+        write.nbytes = len(header) + data.nbytes
 
     logger.debug("Wrote %d spectra to %s.", data.size // mapping.get_spectral_axis_len(), file)
     return file
@@ -20,6 +20,7 @@ logger = logging.getLogger(__name__)
 
 ROOT_DIR = Path(__file__).parent
 TEST_DIR = ROOT_DIR.joinpath("tests")
+BENCHMARK_DIR = ROOT_DIR.joinpath("benchmarks")
 SOURCE_DIR = ROOT_DIR.joinpath("src/nanofinderparser")
 TOX_DIR = ROOT_DIR.joinpath(".tox")
 COVERAGE_FILE = ROOT_DIR.joinpath(".coverage")
@@ -28,7 +29,9 @@ COVERAGE_REPORT = COVERAGE_DIR.joinpath("index.html")
 DOCS_DIR = ROOT_DIR.joinpath("docs")
 DOCS_BUILD_DIR = DOCS_DIR.joinpath("site")
 DOCS_INDEX = DOCS_BUILD_DIR.joinpath("index.html")
-PYTHON_DIRS = [str(d) for d in [SOURCE_DIR, TEST_DIR]]
+PYTHON_DIRS = [str(d) for d in [SOURCE_DIR, TEST_DIR, BENCHMARK_DIR]]
+# The options of the test suite (type checking, doctests...) would distort the timings.
+BENCHMARK_OPTIONS = '-o addopts="" --benchmark-only --benchmark-columns=min,mean,stddev,rounds'
 
 
 def _delete_file(file: Path) -> None:
@@ -108,6 +111,29 @@ def coverage(c: Context, publish: bool = False) -> None:
         webbrowser.open(COVERAGE_REPORT.as_uri())
 
 
+@task(help={"name": "Name under which the results are stored, by default a counter"})
+def bench(c: Context, name: str = "") -> None:
+    """Run the benchmarks and store the results as a baseline."""
+    save = f"--benchmark-save={name}" if name else "--benchmark-autosave"
+    _run(c, f"pytest {BENCHMARK_DIR} {BENCHMARK_OPTIONS} {save}")
+
+
+@task(
+    help={
+        "baseline": "Stored run to compare with, by default the latest one",
+        "threshold": "Slowdown of the mean time that fails the comparison, in percent",
+    }
+)
+def bench_compare(c: Context, baseline: str = "", threshold: int = 15) -> None:
+    """Run the benchmarks and compare them with a stored baseline."""
+    compare = f"--benchmark-compare={baseline}" if baseline else "--benchmark-compare"
+    _run(
+        c,
+        f"pytest {BENCHMARK_DIR} {BENCHMARK_OPTIONS} {compare} "
+        f"--benchmark-compare-fail=mean:{threshold}%",
+    )
+
+
 @task
 def safety(c: Context) -> None:
     """Check safety of the dependencies with pip-audit."""
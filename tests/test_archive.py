@@ -0,0 +1,110 @@
+"""Tests for the search of similar spectra across an archive of mappings.
+
+The archive is a few sample mappings written as SMD files; the references are spectra of their
+points, which must be found back at those points.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import sample_mapping, write_smd
+from nanofinderparser.archive import ArchiveIndex, Representation
+from nanofinderparser.models import Mapping
+
+# Common axis of the indices, over the Raman bands of all the samples
+AXIS = np.linspace(200.0, 3000.0, 400)
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Write sample mappings of different materials and sizes to a folder."""
+    folder = tmp_path_factory.mktemp("archive")
+    for name, x_size, y_size in (("graphene", 6, 4), ("mos2", 5, 5), ("silicon", 3, 7)):
+        write_smd(
+            sample_mapping(name, x_size=x_size, y_size=y_size, n_points=256), folder / f"{name}.smd"
+        )
+    return folder
+
+
+def point_of(mapping: Mapping, index: int) -> tuple[int, int]:
+    """Column and row of a spectrum, given its position in the acquisition order."""
+    layout = mapping.to_image(np.arange(len(mapping.get_spectra())), "").values
+    rows, columns = np.nonzero(layout == index)
+    return int(columns[0]), int(rows[0])
+
+
+# --------------------------------------------------------------------------------------------
+# Searches
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("representation", ["float16", "pca"])
+def test_spectra_are_found_at_their_points(
+    archive: Path, tmp_path: Path, representation: Representation
+) -> None:
+    """A spectrum of the archive is its own best match, and matches its material first."""
+    index = ArchiveIndex.build(
+        archive, tmp_path / "index", AXIS, representation=representation, n_components=16
+    )
+    file = archive / "mos2.smd"
+    mapping = sample_mapping("mos2", x_size=5, y_size=5, n_points=256)
+
+    hits = index.search(mapping.get_spectra()[7], mapping.get_spectral_axis("raman_shift"), k=5)
+
+    assert len(hits) == 5  # noqa: PLR2004
+    assert (hits[0].file, hits[0].x, hits[0].y) == (file, *point_of(mapping, 7))
+    assert hits[0].similarity == pytest.approx(1.0, abs=1e-3)
+    assert all(hit.file == file for hit in hits)
+    assert [hit.similarity for hit in hits] == sorted(
+        (hit.similarity for hit in hits), reverse=True
+    )
+
+
+def test_chunks_and_parallel_indexing_do_not_change_the_hits(archive: Path, tmp_path: Path) -> None:
+    """Indexing in several processes, and searching by small chunks, find the same points."""
+    serial = ArchiveIndex.build(archive, tmp_path / "serial", AXIS)
+    parallel = ArchiveIndex.build(
+        sorted(archive.glob("*.smd")), tmp_path / "parallel", AXIS, jobs=2
+    )
+    reference = np.asarray(serial.vectors[40], dtype=np.float64)
+
+    np.testing.assert_array_equal(parallel.vectors, serial.vectors)
+    np.testing.assert_array_equal(parallel.pixels, serial.pixels)
+    assert serial.search(reference, k=7, chunk_size=5) == serial.search(reference, k=7)
+    # Asking for more points than the archive holds returns them all
+    assert len(serial.search(reference, k=1000)) == len(serial.vectors)
+
+
+def test_indices_are_opened_again(archive: Path, tmp_path: Path) -> None:
+    """An index opened from its folder holds what was built."""
+    built = ArchiveIndex.build(archive, tmp_path, AXIS, representation="pca", n_components=4)
+
+    opened = ArchiveIndex.open(tmp_path)
+
+    assert opened.files == built.files
+    assert opened.vectors.dtype == np.float32
+    assert opened.basis is not None
+    assert opened.basis.shape == (4, AXIS.size)
+    np.testing.assert_array_equal(opened.axis, AXIS)
+
+
+def test_invalid_arguments(archive: Path, tmp_path: Path) -> None:
+    """Bad axes and references, and folders without an index, are rejected."""
+    with pytest.raises(ValueError, match="increasing"):
+        ArchiveIndex.build(archive, tmp_path, AXIS[::-1])
+    with pytest.raises(ValueError, match="directions"):
+        ArchiveIndex.build(archive, tmp_path, AXIS, representation="pca", n_components=0)
+    with pytest.raises(ValueError, match="no SMD file"):
+        ArchiveIndex.build(tmp_path, tmp_path, AXIS)
+    with pytest.raises(ValueError, match="no archive index"):
+        ArchiveIndex.open(tmp_path)
+
+    index = ArchiveIndex.build(archive, tmp_path, AXIS)
+    with pytest.raises(ValueError, match="give its axis"):
+        index.search(np.ones(10))
+    with pytest.raises(ValueError, match="zero"):
+        index.search(np.ones(10), np.linspace(5000, 6000, 10))
+    with pytest.raises(ValueError, match="positive"):
+        index.search(np.ones(AXIS.size), k=0)
@@ -0,0 +1,124 @@
+"""Tests for the Arrow tables and Feather files of collections of spectra.
+
+Every spectrum must come back with its own axis, its intensities and its metadata, and the
+spectra read from a Feather file must be views of it rather than copies.
+"""
+
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import load_mdt
+from nanofinderparser.models import Spectra
+from nanofinderparser.units import Units
+
+pa = pytest.importorskip("pyarrow")
+
+from nanofinderparser.arrow import read_feather, spectra_from_table  # noqa: E402
+
+MDT_FILE = Path(__file__).parent.parent / "sample_data" / "mdt" / "Spectra.mdt"
+
+
+def assert_same_spectra(read: Spectra, written: Spectra, spectral_units: str | None = None) -> None:
+    """Check that spectra read back match those written, to the precision of float32."""
+    assert read.titles == written.titles
+    for spectrum, original in zip(read, written, strict=True):
+        np.testing.assert_allclose(
+            spectrum.spectral_axis, original.get_spectral_axis(spectral_units), rtol=1e-6
+        )
+        np.testing.assert_allclose(spectrum.data, original.data, rtol=1e-6)
+        assert spectrum.laser_wavelength == original.laser_wavelength
+        assert spectrum.measured_at == original.measured_at
+        assert spectrum.data_unit == original.data_unit
+
+
+# --------------------------------------------------------------------------------------------
+# Tables
+# --------------------------------------------------------------------------------------------
+
+
+def test_spectra_to_arrow() -> None:
+    """Each spectrum is a row, with its axis in the units asked for."""
+    spectra = load_mdt(MDT_FILE)
+
+    table = spectra.to_arrow("raman_shift")
+
+    assert table.num_rows == len(spectra)
+    assert table.column("title").to_pylist() == spectra.titles
+    assert set(table.column("spectral_axis_unit").to_pylist()) == {"raman_shift"}
+    assert table.schema.field("data").type == pa.list_(pa.float32())
+    assert table.schema.metadata[b"nanofinderparser.source"] == str(MDT_FILE).encode()
+    read = spectra_from_table(table)
+    assert read[0].spectral_axis_unit == Units.raman_shift
+    assert_same_spectra(read, spectra, "raman_shift")
+
+
+def test_spectra_on_different_axes() -> None:
+    """Spectra of different lengths keep their own axes, rather than being aligned."""
+    spectrum = load_mdt(MDT_FILE)[0]
+    spectra = Spectra(
+        [
+            replace(
+                spectrum,
+                title="Short",
+                spectral_axis=spectrum.spectral_axis[:5],
+                data=spectrum.data[:5],
+            ),
+            replace(
+                spectrum,
+                title="Long",
+                spectral_axis=spectrum.spectral_axis[3:12],
+                data=spectrum.data[3:12],
+            ),
+        ]
+    )
+
+    table = spectra.to_arrow()
+
+    assert [len(row) for row in table.column("data").to_pylist()] == [5, 9]
+    assert_same_spectra(spectra_from_table(table), spectra)
+
+
+# --------------------------------------------------------------------------------------------
+# Feather files
+# --------------------------------------------------------------------------------------------
+
+
+def test_feather_round_trip(tmp_path: Path) -> None:
+    """Spectra are read back as read-only views of the memory-mapped file."""
+    spectra = load_mdt(MDT_FILE)
+
+    file = spectra.to_feather(tmp_path / "feather" / "spectra.feather", batch_size=1)
+
+    read = read_feather(file)
+    assert read.source == file
+    assert_same_spectra(read, spectra)
+    assert read[0].data.dtype == np.float32
+    assert not read[0].data.flags.writeable
+    # The spectra of a batch are views of the same buffer, rather than copies of their rows
+    together = read_feather(spectra.to_feather(tmp_path / "together.feather"))
+    assert together[0].data.base is together[1].data.base
+    # The file holds one record batch per spectrum
+    with pa.memory_map(str(file)) as source:
+        assert pa.ipc.open_file(source).num_record_batches == len(spectra)
+
+
+def test_empty_collections(tmp_path: Path) -> None:
+    """A collection without spectra is written and read back empty."""
+    file = Spectra([]).to_feather(tmp_path / "empty.feather")
+
+    assert len(read_feather(file)) == 0
+
+
+def test_invalid_arguments(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Batches must hold spectra, and a missing pyarrow is explained."""
+    spectra = load_mdt(MDT_FILE)
+    with pytest.raises(ValueError, match="must be positive"):
+        spectra.to_feather(tmp_path / "spectra.feather", batch_size=0)
+
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ImportError, match=r"nanofinderparser\[arrow\]"):
+        spectra.to_arrow()
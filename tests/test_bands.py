@@ -0,0 +1,185 @@
+"""Tests for the integration of the spectra of a mapping over windows of the spectral axis.
+
+Every integral read from the index is checked against a direct integration of the spectra over
+the same points.
+"""
+
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import load_smd, sample_mapping, write_smd
+from nanofinderparser.bands import BandIndex
+from nanofinderparser.baseline import PolynomialBaseline, subtract_baseline
+from nanofinderparser.despike import despike
+
+AXIS = np.linspace(100.0, 200.0, 101)
+
+
+def direct_integral(axis: np.ndarray, spectra: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Integrate the spectra over the points of the axis within a window, by the trapezoidal rule.
+
+    Parameters
+    ----------
+    axis : np.ndarray
+        The spectral axis.
+    spectra : np.ndarray
+        The spectra, of shape ``(n_spectra, n_points)``.
+    low, high : float
+        The limits of the window, in any order.
+
+    Returns
+    -------
+    np.ndarray
+        The integral of every spectrum.
+    """
+    low, high = sorted((low, high))
+    inside = (axis >= low) & (axis <= high)
+    return np.trapezoid(spectra[:, inside], axis[inside], axis=1) * np.sign(axis[-1] - axis[0])
+
+
+# --------------------------------------------------------------------------------------------
+# Index
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("axis", [AXIS, AXIS[::-1], np.geomspace(1.0, 3.0, 101)])
+def test_integrals_match_a_direct_integration(axis: np.ndarray) -> None:
+    """Any window gives the integral of the points within it, whichever way the axis runs."""
+    spectra = np.random.default_rng(0).uniform(0.0, 100.0, (7, axis.size))
+    index = BandIndex.build(axis, spectra, chunk_size=3)
+
+    low, high = np.quantile(axis, [0.2, 0.65])
+    for window in ((low, high), (high, low), (axis.min(), axis.max())):
+        np.testing.assert_allclose(
+            index.integrate(*window), direct_integral(axis, spectra, *window)
+        )
+
+
+def test_index_built_into_a_file(tmp_path: Path) -> None:
+    """An index built into a file is memory-mapped from it, and holds the same integrals."""
+    spectra = np.random.default_rng(0).uniform(0.0, 100.0, (7, AXIS.size)).astype(np.float32)
+    file = tmp_path / "index.npy"
+
+    index = BandIndex.build(AXIS, spectra, file=file, chunk_size=3)
+
+    assert isinstance(index.cumulative, np.memmap)
+    assert not file.with_name("index.npy.tmp").exists()
+    np.testing.assert_array_equal(index.cumulative, BandIndex.build(AXIS, spectra).cumulative)
+
+
+def test_invalid_windows_and_spectra() -> None:
+    """Windows without points and spectra that do not match the axis are rejected."""
+    index = BandIndex.build(AXIS, np.ones((2, AXIS.size)))
+    assert index.integrate(150.0, 150.4).tolist() == [0.0, 0.0]
+    with pytest.raises(ValueError, match="No point"):
+        index.integrate(150.2, 150.4)
+    with pytest.raises(ValueError, match="points"):
+        BandIndex.build(AXIS[1:], np.ones((2, AXIS.size)))
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+def test_band_map() -> None:
+    """The map integrates every spectrum over the window, and is laid out as the mapping."""
+    mapping = sample_mapping("graphene", x_size=5, y_size=3, n_points=256)
+    axis = mapping.get_spectral_axis("raman_shift")
+
+    image = mapping.band_map(1620, 1550)
+
+    assert image.title == "Integral 1550-1620 raman_shift"
+    expected = mapping.to_image(direct_integral(axis, mapping.get_spectra(), 1550, 1620), "G")
+    np.testing.assert_allclose(image.values, expected.values, rtol=1e-6)
+    np.testing.assert_array_equal(image.x_coords, expected.x_coords)
+    assert mapping.band_index() is mapping.band_index("raman_shift")
+    assert mapping.band_map(500, 600, "nm", title="PL").title == "PL"
+
+
+def test_new_data_gets_a_new_index() -> None:
+    """Replacing the data of a mapping drops the indices built from the previous one."""
+    mapping = sample_mapping("graphene", x_size=3, y_size=2, n_points=64)
+    index = mapping.band_index()
+
+    doubled = mapping.with_data(2 * mapping.data)
+
+    assert mapping.band_index() is index
+    np.testing.assert_allclose(doubled.band_index().cumulative, 2 * index.cumulative, rtol=1e-6)
+
+
+@pytest.mark.parametrize("process", ["baseline", "despike"])
+def test_data_modified_in_place_gets_a_new_index(process: str) -> None:
+    """Processing a mapping in place drops the indices built from its previous data."""
+    mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+    # A cosmic ray in the G band of a spectrum
+    mapping.get_spectra()[5, mapping.spectral_index(1585, "raman_shift")] += 1e5
+    before = mapping.band_map(1550, 1620).values
+
+    if process == "baseline":
+        subtract_baseline(mapping, PolynomialBaseline(), inplace=True)
+    else:
+        despike(mapping, inplace=True)
+
+    after = mapping.band_map(1550, 1620).values
+    assert not np.array_equal(after, before)
+    np.testing.assert_allclose(
+        after, mapping.eval_maps({"G": "band(1550, 1620)"})["G"].values, rtol=1e-5
+    )
+
+
+def test_cached_index(tmp_path: Path) -> None:
+    """The cached index is written next to the file, reused, and rebuilt once the file changes."""
+    file = write_smd(
+        sample_mapping("graphene", x_size=4, y_size=3, n_points=128), tmp_path / "m.smd"
+    )
+    expected = load_smd(file).band_map(1500, 1700).values
+
+    np.testing.assert_allclose(load_smd(file).band_map(1500, 1700, cache=True).values, expected)
+    cached = tmp_path / "m.smd.bands-raman_shift-0.npy"
+    assert cached.is_file()
+    index = load_smd(file).band_index(cache=True)
+    assert isinstance(index.cumulative, np.memmap)
+    np.testing.assert_allclose(load_smd(file).band_map(1500, 1700, cache=True).values, expected)
+
+    write_smd(load_smd(file).with_data(2 * load_smd(file).data), file)
+    stat = cached.stat()
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    np.testing.assert_allclose(
+        load_smd(file).band_map(1500, 1700, cache=True).values, 2 * expected, rtol=1e-6
+    )
+
+    with pytest.raises(ValueError, match="read from a file"):
+        sample_mapping("graphene", x_size=2, y_size=2, n_points=64).band_index(cache=True)
+
+
+def test_cached_index_of_processed_data(tmp_path: Path) -> None:
+    """Only the data as read from the file can use the cached index, which must fit it."""
+    file = write_smd(
+        sample_mapping("graphene", x_size=4, y_size=3, n_points=128), tmp_path / "m.smd"
+    )
+    mapping = load_smd(file)
+    mapping.band_map(1550, 1620, cache=True)
+
+    for processed in (
+        subtract_baseline(mapping, PolynomialBaseline()),
+        despike(mapping)[0],
+        mapping.resample(np.linspace(1000, 3000, 64)),
+        load_smd(file, lazy=True).with_data(mapping.data.copy()),
+    ):
+        with pytest.raises(ValueError, match="data read from the file"):
+            processed.band_map(1550, 1620, cache=True)
+    # Lazily loaded and unpickled mappings hold the data of the file
+    expected = mapping.band_map(1550, 1620).values
+    for same in (load_smd(file, lazy=True), pickle.loads(pickle.dumps(load_smd(file)))):  # noqa: S301
+        np.testing.assert_allclose(same.band_map(1550, 1620, cache=True).values, expected)
+
+    # An index of other spectra is rebuilt rather than read
+    cached = tmp_path / "m.smd.bands-raman_shift-0.npy"
+    np.save(cached, np.zeros((128, 5)))
+    np.testing.assert_allclose(load_smd(file).band_map(1550, 1620, cache=True).values, expected)
+    assert np.load(cached).shape == (128, 12)
@@ -0,0 +1,149 @@
+"""Tests for the estimation and subtraction of the baselines of a mapping.
+
+Spectra are a narrow peak on a known curved background, so every estimator is checked against the
+background it should find, away from the peak where it is not ambiguous.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from nanofinderparser import load_smd, sample_mapping, write_smd
+from nanofinderparser.baseline import (
+    AlsBaseline,
+    BaselineMethod,
+    PolynomialBaseline,
+    RollingBallBaseline,
+    _rolling,
+    _second_difference_bands,
+    _solve_pentadiagonal,
+    estimate_baseline,
+    subtract_baseline,
+)
+
+AXIS = np.linspace(0.0, 1.0, 512)
+BACKGROUND = 100.0 + 50.0 * AXIS + 80.0 * AXIS**2
+PEAK_CENTER = 0.5
+PEAK = 400.0 * np.exp(-np.log(2.0) * ((AXIS - PEAK_CENTER) / 0.01) ** 2)
+
+# Points far enough from the peak for the background to be unambiguous.
+AWAY = np.abs(AXIS - PEAK_CENTER) > 0.1  # noqa: PLR2004
+
+
+@pytest.mark.parametrize(
+    ("method", "tolerance"),
+    [
+        # The polynomial stops as soon as it is under the spectrum, so it ends up a little low
+        (PolynomialBaseline(degree=2), 12.0),
+        (AlsBaseline(max_iterations=30), 3.0),
+        (RollingBallBaseline(radius=30), 4.0),
+    ],
+    ids=["polynomial", "als", "rolling_ball"],
+)
+def test_estimators_find_the_background(method: BaselineMethod, tolerance: float) -> None:
+    """Every estimator follows the background and leaves the peak out."""
+    spectra = np.vstack([BACKGROUND + PEAK, 2 * BACKGROUND + 0.5 * PEAK])
+
+    baseline = method.estimate(AXIS, spectra)
+
+    assert baseline.shape == spectra.shape
+    np.testing.assert_allclose(baseline[0, AWAY], BACKGROUND[AWAY], atol=tolerance)
+    np.testing.assert_allclose(baseline[1, AWAY], 2 * BACKGROUND[AWAY], atol=2 * tolerance)
+    assert (spectra - baseline).max(axis=1) == pytest.approx([400.0, 200.0], rel=0.05)
+
+
+def test_invalid_settings() -> None:
+    """Settings that cannot give a baseline are rejected."""
+    spectra = (BACKGROUND + PEAK)[None, :]
+    with pytest.raises(ValueError, match="asymmetry"):
+        AlsBaseline(asymmetry=1.5).estimate(AXIS, spectra)
+    with pytest.raises(ValueError, match="points"):
+        PolynomialBaseline(degree=5).estimate(AXIS[:3], spectra[:, :3])
+    with pytest.raises(ValueError, match="negative"):
+        RollingBallBaseline(radius=-1).estimate(AXIS, spectra)
+
+
+# --------------------------------------------------------------------------------------------
+# Building blocks
+# --------------------------------------------------------------------------------------------
+
+
+def test_pentadiagonal_solver_matches_a_dense_solve() -> None:
+    """The batched banded solver gives the solution of every system."""
+    rng = np.random.default_rng(0)
+    n_points, n_systems = 40, 6
+    second_difference = np.diff(np.eye(n_points), n=2, axis=0)
+    penalty = 1e3 * second_difference.T @ second_difference
+    weights = rng.uniform(0.01, 1.0, (n_points, n_systems))
+    rhs = rng.normal(size=(n_points, n_systems))
+
+    diagonal, first, second = _second_difference_bands(n_points)
+    solution = _solve_pentadiagonal(
+        1e3 * diagonal[:, None] + weights, 1e3 * first, 1e3 * second, rhs
+    )
+
+    expected = np.stack(
+        [np.linalg.solve(penalty + np.diag(weights[:, k]), rhs[:, k]) for k in range(n_systems)],
+        axis=1,
+    )
+    np.testing.assert_allclose(solution, expected, rtol=1e-8, atol=1e-10)
+
+
+@pytest.mark.parametrize("radius", [1, 4, 25, 80])
+def test_rolling_minimum(radius: int) -> None:
+    """The rolling minimum matches the minimum over every window, edges included."""
+    values = np.random.default_rng(radius).normal(size=(3, 97))
+    padded = np.pad(values, ((0, 0), (radius, radius)), mode="edge")
+
+    expected = sliding_window_view(padded, 2 * radius + 1, axis=1).min(axis=2)
+
+    np.testing.assert_array_equal(_rolling(np.minimum, values, radius), expected)
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+def test_subtract_baseline_returns_a_new_mapping() -> None:
+    """By default the mapping is left as it is, and the result shares its metadata."""
+    mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+    original = mapping.data.copy()
+
+    corrected = subtract_baseline(mapping, RollingBallBaseline(radius=20))
+
+    np.testing.assert_array_equal(mapping.data, original)
+    assert corrected is not mapping
+    assert corrected.scanned_frame_parameters is mapping.scanned_frame_parameters
+    assert corrected.data.dtype == mapping.data.dtype
+    np.testing.assert_allclose(
+        corrected.get_spectra(),
+        mapping.get_spectra() - estimate_baseline(mapping, RollingBallBaseline(radius=20)),
+        atol=1e-3,
+    )
+
+
+def test_chunks_jobs_and_inplace_give_the_same_result() -> None:
+    """Processing in chunks, in parallel, or in place does not change the result."""
+    mapping = sample_mapping("graphene", x_size=5, y_size=4, n_points=256)
+    expected = subtract_baseline(mapping).data
+
+    chunked = subtract_baseline(mapping, chunk_size=3, jobs=2).data
+    inplace = subtract_baseline(mapping, inplace=True, chunk_size=7)
+
+    np.testing.assert_array_equal(chunked, expected)
+    assert inplace is mapping
+    np.testing.assert_array_equal(mapping.data, expected)
+
+
+def test_read_only_mappings_are_not_modified_in_place(tmp_path: Path) -> None:
+    """A memory-mapped mapping is processed into a new one, but not in place."""
+    mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=128)
+    lazy = load_smd(write_smd(mapping, tmp_path / "map.smd"), lazy=True)
+
+    with pytest.raises(ValueError, match="lazy=True"):
+        subtract_baseline(lazy, inplace=True)
+
+    np.testing.assert_array_equal(subtract_baseline(lazy).data, subtract_baseline(mapping).data)
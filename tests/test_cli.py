@@ -0,0 +1,262 @@
+"""Tests for the command line, and the conversion of folders of files behind it.
+
+Folders are filled with small synthetic mappings, plus a broken file where the test needs one, and
+converted the way a user would: the files written and the exit code are what is checked.
+"""
+
+import shutil
+from functools import partial
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from nanofinderparser import create_smd, sample_spec
+from nanofinderparser.cli import app
+from nanofinderparser.convert import (
+    MANIFEST_NAME,
+    MANIFEST_SAVE_INTERVAL,
+    ConversionSummary,
+    Manifest,
+    convert_files,
+    smd_to_csv,
+)
+from nanofinderparser.units import Units
+
+MDT_FILE = Path(__file__).parent.parent / "sample_data" / "mdt" / "Spectra.mdt"
+
+N_FILES = 3
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def smd_folder(tmp_path: Path) -> Path:
+    """Folder holding a few small SMD files."""
+    folder = tmp_path / "smd"
+    for index in range(N_FILES):
+        spec = sample_spec("graphene", x_size=3, y_size=2, n_points=32, seed=index)
+        create_smd(folder / f"map_{index}.smd", spec)
+    return folder
+
+
+@pytest.fixture
+def broken_folder(smd_folder: Path) -> Path:
+    """Add a file that is not an SMD file at all to the folder of SMD files."""
+    (smd_folder / "broken.smd").write_bytes(b"not an SMD file")
+    return smd_folder
+
+
+# --------------------------------------------------------------------------------------------
+# Conversion of several files
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_files(smd_folder: Path, tmp_path: Path, jobs: int) -> None:
+    """Every file is converted, whether one after another or in parallel."""
+    files = sorted(smd_folder.glob("*.smd"))
+    convert = partial(smd_to_csv, output_dir=tmp_path / "csv")
+
+    results = list(convert_files(convert, files, jobs=jobs))
+
+    assert sorted(result.file for result in results) == files
+    assert all(result.ok for result in results)
+    assert sorted(output for result in results for output in result.outputs) == sorted(
+        (tmp_path / "csv").glob("*.csv")
+    )
+    summary = ConversionSummary.from_results(results, seconds=1.0)
+    assert summary.converted == N_FILES
+    assert summary.nbytes == sum(file.stat().st_size for file in files)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_failures_do_not_stop_the_other_files(
+    broken_folder: Path, tmp_path: Path, jobs: int
+) -> None:
+    """A file that cannot be converted is reported, and the others are still converted."""
+    files = sorted(broken_folder.glob("*.smd"))
+    convert = partial(smd_to_csv, output_dir=tmp_path / "csv")
+
+    results = {result.file.name: result for result in convert_files(convert, files, jobs=jobs)}
+
+    assert not results["broken.smd"].ok
+    assert results["broken.smd"].error
+    assert results["broken.smd"].outputs == ()
+    assert all(result.ok for name, result in results.items() if name != "broken.smd")
+
+    summary = ConversionSummary.from_results(list(results.values()), seconds=1.0)
+    assert (summary.converted, summary.failed) == (N_FILES, 1)
+
+
+# --------------------------------------------------------------------------------------------
+# Command line
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_convert_folder(smd_folder: Path, tmp_path: Path, jobs: str) -> None:
+    """A folder of SMD files is converted to one CSV file each, and the throughput reported."""
+    output = tmp_path / "csv"
+    result = runner.invoke(app, ["convert", str(smd_folder), str(output), "--jobs", jobs])
+
+    assert result.exit_code == 0, result.output
+    assert sorted(file.name for file in output.glob("*.csv")) == [
+        f"map_{index}.csv" for index in range(N_FILES)
+    ]
+    assert "MB/s" in result.output
+
+
+@pytest.mark.parametrize(
+    ("export_format", "suffixes"), [("envi", (".bip", ".hdr")), ("npy", (".npy", ".json"))]
+)
+def test_convert_folder_to_arrays(
+    smd_folder: Path, tmp_path: Path, export_format: str, suffixes: tuple[str, str]
+) -> None:
+    """With --format, each SMD file is written as an array and its header or metadata."""
+    output = tmp_path / export_format
+    result = runner.invoke(
+        app, ["convert", str(smd_folder), str(output), "--format", export_format]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert sorted(file.name for file in output.iterdir()) == sorted(
+        f"map_{index}{suffix}" for index in range(N_FILES) for suffix in suffixes
+    )
+
+
+def test_convert_reports_every_failure(broken_folder: Path, tmp_path: Path) -> None:
+    """The command converts what it can, then lists the failures and exits with an error."""
+    output = tmp_path / "csv"
+    result = runner.invoke(app, ["convert", str(broken_folder), str(output), "--jobs", "2"])
+
+    assert result.exit_code == 1
+    assert "broken.smd" in result.output
+    assert len(list(output.glob("*.csv"))) == N_FILES
+
+
+def test_convert_mdt_folder(tmp_path: Path) -> None:
+    """A folder of MDT files is converted in parallel, one CSV file per spectrum."""
+    folder = tmp_path / "mdt"
+    folder.mkdir()
+    for index in range(N_FILES):
+        shutil.copy(MDT_FILE, folder / f"spectra_{index}.mdt")
+    output = tmp_path / "csv"
+
+    result = runner.invoke(app, ["convert-mdt", str(folder), str(output), "--jobs", "0"])
+
+    assert result.exit_code == 0, result.output
+    assert len(list(output.glob("*.csv"))) == 2 * N_FILES
+
+
+# --------------------------------------------------------------------------------------------
+# Incremental conversion
+# --------------------------------------------------------------------------------------------
+
+
+def test_unchanged_files_are_not_converted_again(smd_folder: Path, tmp_path: Path) -> None:
+    """A second incremental run converts nothing, unless forced to."""
+    output = tmp_path / "csv"
+    result = runner.invoke(app, ["convert", str(smd_folder), str(output), "--incremental"])
+    assert result.exit_code == 0, result.output
+    assert (output / MANIFEST_NAME).is_file()
+    written = {file: file.stat().st_mtime_ns for file in output.glob("*.csv")}
+
+    result = runner.invoke(app, ["convert", str(smd_folder), str(output), "--incremental"])
+    assert result.exit_code == 0, result.output
+    assert "up to date" in result.output
+    assert {file: file.stat().st_mtime_ns for file in output.glob("*.csv")} == written
+
+    result = runner.invoke(
+        app, ["convert", str(smd_folder), str(output), "--incremental", "--force"]
+    )
+    assert result.exit_code == 0, result.output
+    assert all(file.stat().st_mtime_ns >= written[file] for file in written)
+    assert "up to date" not in result.output
+
+
+@pytest.mark.parametrize("command", ["convert", "convert-mdt"])
+def test_force_needs_incremental(smd_folder: Path, tmp_path: Path, command: str) -> None:
+    """--force without --incremental is rejected rather than ignored."""
+    output = tmp_path / "output"
+    result = runner.invoke(app, [command, str(smd_folder), str(output), "--force"])
+
+    assert result.exit_code == 2  # noqa: PLR2004
+    assert "--incremental" in result.output
+    assert not output.exists()
+
+
+def test_only_new_or_changed_files_are_converted(smd_folder: Path, tmp_path: Path) -> None:
+    """Files that are new, changed, converted with other options or lost their output are redone."""
+    output = tmp_path / "csv"
+    options = {"command": "convert", "units": "raman_shift", "save_mapcoords": "combined"}
+    runner.invoke(app, ["convert", str(smd_folder), str(output), "--incremental"])
+    manifest = Manifest.load(output)
+    files = sorted(smd_folder.glob("*.smd"))
+    assert all(manifest.is_current(file, options) for file in files)
+
+    # Changed content, touched without changes, lost output, new file
+    spec = sample_spec("graphene", x_size=3, y_size=2, n_points=32, seed=99)
+    create_smd(files[0], spec)
+    content = files[1].read_bytes()
+    files[1].write_bytes(content)
+    (output / "map_2.csv").unlink()
+    create_smd(smd_folder / "new.smd", spec)
+
+    manifest = Manifest.load(output)
+    pending = [file.name for file in sorted(smd_folder.glob("*.smd"))]
+    pending = [name for name in pending if not manifest.is_current(smd_folder / name, options)]
+    assert pending == ["map_0.smd", "map_2.smd", "new.smd"]
+    assert not manifest.is_current(files[1], {**options, "units": "nm"})
+
+
+def test_interrupted_runs_resume(broken_folder: Path, tmp_path: Path) -> None:
+    """A run interrupted keeps the files converted until then, and failed ones are tried again."""
+    output = tmp_path / "csv"
+    options = {"command": "convert", "units": "nm", "save_mapcoords": "combined"}
+    files = sorted(broken_folder.glob("*.smd"))
+    convert = partial(smd_to_csv, output_dir=output, spectral_units=Units.nm)
+
+    # A run that stops after the first two files: the broken one and map_0.smd
+    manifest = Manifest.load(output)
+    try:
+        for result in convert_files(convert, files[:2], digest=True):
+            manifest.record(result, options)
+    finally:
+        manifest.flush()
+
+    manifest = Manifest.load(output)
+    pending = [file.name for file in files if not manifest.is_current(file, options)]
+    assert pending == ["broken.smd", "map_1.smd", "map_2.smd"]
+    assert "broken.smd" not in {Path(key).name for key in manifest.entries}
+
+
+def test_manifest_is_written_when_due(smd_folder: Path, tmp_path: Path) -> None:
+    """Files recorded are written at most every few seconds, rather than after each one."""
+    output = tmp_path / "csv"
+    options = {"command": "convert"}
+    files = sorted(smd_folder.glob("*.smd"))
+    convert = partial(smd_to_csv, output_dir=output)
+    manifest = Manifest.load(output)
+
+    for result in convert_files(convert, files, digest=True):
+        manifest.record(result, options)
+    assert not manifest.path.exists()
+    manifest.flush()
+    assert len(Manifest.load(output).entries) == N_FILES
+
+    manifest._saved_at -= MANIFEST_SAVE_INTERVAL  # noqa: SLF001
+    manifest.record(next(convert_files(convert, files[:1], digest=True)), {"command": "other"})
+    assert Manifest.load(output).is_current(files[0], {"command": "other"})
+
+
+def test_unreadable_manifest_converts_everything(smd_folder: Path, tmp_path: Path) -> None:
+    """A manifest that cannot be read is ignored rather than trusted."""
+    output = tmp_path / "csv"
+    output.mkdir()
+    (output / MANIFEST_NAME).write_text("{not json", encoding="utf-8")
+
+    result = runner.invoke(app, ["convert", str(smd_folder), str(output), "--incremental"])
+
+    assert result.exit_code == 0, result.output
+    assert len(Manifest.load(output).entries) == N_FILES
@@ -0,0 +1,143 @@
+"""Tests for the decomposition of spectra into components, chunk by chunk.
+
+The PCA is checked against a singular value decomposition of all the spectra at once, and the
+NMF against spectra mixed from known non-negative components.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import sample_mapping
+from nanofinderparser.decomposition import (
+    IncrementalPCA,
+    Method,
+    MiniBatchNMF,
+    decompose,
+    decompose_mapping,
+)
+
+AXIS = np.linspace(0.0, 100.0, 300)
+
+# Three Gaussian peaks, as the spectra of three phases
+COMPONENTS = np.array(
+    [np.exp(-(((AXIS - center) / width) ** 2)) for center, width in ((30, 4), (50, 6), (70, 3))]
+)
+
+
+def mixtures(n_spectra: int = 1000, noise: float = 0.01, seed: int = 0) -> np.ndarray:
+    """Mix the components in random non-negative amounts, with some noise."""
+    rng = np.random.default_rng(seed)
+    amounts = rng.uniform(0.0, 10.0, (n_spectra, len(COMPONENTS)))
+    return amounts @ COMPONENTS + rng.normal(0.0, noise, (n_spectra, AXIS.size))
+
+
+# --------------------------------------------------------------------------------------------
+# PCA
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("chunk_size", [64, 1000])
+def test_pca_matches_a_decomposition_of_all_the_spectra(chunk_size: int) -> None:
+    """Components, variances and scores are those of an SVD, whatever the chunks."""
+    spectra = mixtures()
+    centered = spectra - spectra.mean(axis=0)
+    _, singular_values, vectors = np.linalg.svd(centered, full_matrices=False)
+
+    result = decompose(spectra, 3, chunk_size=chunk_size)
+
+    signs = np.sign(np.sum(result.components * vectors[:3], axis=1))
+    np.testing.assert_allclose(result.components, signs[:, None] * vectors[:3], atol=1e-8)
+    assert result.explained_variance is not None
+    np.testing.assert_allclose(result.explained_variance, singular_values[:3] ** 2 / 999)
+    np.testing.assert_allclose(result.scores, centered @ result.components.T, atol=1e-8)
+    np.testing.assert_allclose(result.mean, spectra.mean(axis=0))
+    # The signs are chosen by the largest value of each component
+    assert (result.components.max(axis=1) >= -result.components.min(axis=1)).all()
+
+
+def test_pca_learns_from_a_memory_map(tmp_path: Path) -> None:
+    """Chunks of a memory map are learnt from one by one, as the whole array is."""
+    spectra = mixtures().astype(np.float32)
+    file = tmp_path / "spectra.npy"
+    np.save(file, spectra)
+    stored = np.load(file, mmap_mode="r")
+
+    pca = IncrementalPCA(2)
+    for start in range(0, len(stored), 100):
+        pca.partial_fit(stored[start : start + 100])
+
+    assert pca.n_seen == len(spectra)
+    np.testing.assert_allclose(pca.components, decompose(spectra, 2).components, atol=1e-6)
+
+
+# --------------------------------------------------------------------------------------------
+# NMF
+# --------------------------------------------------------------------------------------------
+
+
+def test_nmf_finds_the_components_of_mixtures() -> None:
+    """The components mixed are found, and reconstruct the spectra with non-negative scores."""
+    spectra = mixtures()
+
+    result = decompose(spectra, 3, method="nmf", chunk_size=256)
+
+    expected = COMPONENTS / np.linalg.norm(COMPONENTS, axis=1)[:, None]
+    similarity = result.components @ expected.T
+    # Every component matches one of those mixed, in some order
+    assert sorted(similarity.argmax(axis=1)) == [0, 1, 2]
+    assert (similarity.max(axis=1) > 0.99).all()  # noqa: PLR2004
+    assert (result.scores >= 0).all()
+    assert result.explained_variance is None
+    residual = spectra - result.scores @ result.components
+    assert np.linalg.norm(residual) < 0.05 * np.linalg.norm(spectra)
+
+
+def test_nmf_is_reproducible() -> None:
+    """The same seed gives the same components."""
+    spectra = mixtures(200)
+
+    first = decompose(spectra, 2, method="nmf", chunk_size=50, seed=3)
+    second = decompose(spectra, 2, method="nmf", chunk_size=50, seed=3)
+
+    np.testing.assert_array_equal(first.components, second.components)
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("method", ["pca", "nmf"])
+def test_decompose_mapping(method: Method) -> None:
+    """Every component gets a map of its scores, laid out as the mapping."""
+    mapping = sample_mapping("mos2", x_size=5, y_size=4, n_points=128)
+
+    decomposition, maps = decompose_mapping(mapping, 2, method=method)
+
+    suffix = "PCA" if method == "pca" else "NMF"
+    assert maps.titles == [f"Component 1 ({suffix})", f"Component 2 ({suffix})"]
+    assert decomposition.components.shape == (2, 128)
+    np.testing.assert_array_equal(
+        maps[1].values, mapping.to_image(decomposition.scores[:, 1], "").values
+    )
+
+
+def test_invalid_arguments() -> None:
+    """Impossible numbers of components, and spectra of the wrong size, are rejected."""
+    spectra = mixtures(10)
+    with pytest.raises(ValueError, match="components"):
+        decompose(spectra, 11)
+    with pytest.raises(ValueError, match="positive"):
+        IncrementalPCA(0)
+    with pytest.raises(ValueError, match="epochs"):
+        decompose(spectra, 2, epochs=0)
+    with pytest.raises(ValueError, match="forget factor"):
+        MiniBatchNMF(2, forget_factor=1.5)
+    with pytest.raises(ValueError, match="not learnt"):
+        _ = IncrementalPCA(2).components
+
+    pca = IncrementalPCA(2).partial_fit(spectra)
+    with pytest.raises(ValueError, match="300 points"):
+        pca.partial_fit(spectra[:, :100])
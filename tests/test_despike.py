@@ -0,0 +1,151 @@
+"""Tests for the removal of the cosmic-ray spikes of a mapping.
+
+Spikes are added at known points of synthetic mappings, so the points flagged are checked against
+them exactly, and the spectra without them against the mapping before they were added.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import SAMPLES, SampleName, load_smd, sample_mapping, write_smd
+from nanofinderparser.despike import despike, despike_cube
+from nanofinderparser.models import Mapping
+
+N_SPIKES = 25
+
+Points = tuple[np.ndarray, ...]
+
+
+def add_spikes(mapping: Mapping, seed: int = 0) -> tuple[Points, np.ndarray]:
+    """Add spikes at random points of a mapping, in place.
+
+    Spikes are a few times higher than the range of the map, as cosmic rays usually are.
+
+    Parameters
+    ----------
+    mapping : Mapping
+        The mapping.
+    seed : int, optional
+        Seed of the random points, by default 0.
+
+    Returns
+    -------
+    tuple[Points, np.ndarray]
+        The points of the spikes, as indices of the map, and the map before they were added.
+    """
+    cube = mapping.get_map()
+    clean = cube.copy()
+    rng = np.random.default_rng(seed)
+    points = np.unravel_index(rng.choice(cube.size, N_SPIKES, replace=False), cube.shape)
+    cube[points] += np.ptp(clean) * rng.uniform(2.0, 5.0, N_SPIKES)
+    return points, clean
+
+
+def spike_mask(shape: tuple[int, ...], points: Points) -> np.ndarray:
+    """Mark the points of the spikes in an array of the shape of the map."""
+    mask = np.zeros(shape, dtype=bool)
+    mask[points] = True
+    return mask
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("name", list(SAMPLES))
+def test_spikes_are_found_and_replaced(name: SampleName) -> None:
+    """Every spike is flagged, nothing else is, and the spectra are restored around them."""
+    mapping = sample_mapping(name, x_size=30, y_size=20, n_points=256)
+    assert not despike(mapping)[1].any()
+    points, clean = add_spikes(mapping)
+
+    despiked, mask = despike(mapping)
+
+    np.testing.assert_array_equal(mask, spike_mask(clean.shape, points))
+    assert despiked is not mapping
+    assert (mapping.get_map()[points] > clean[points]).all()
+    np.testing.assert_array_equal(despiked.get_map()[~mask], clean[~mask])
+    # The replacement is the median of the neighbours: what was there, up to the noise
+    np.testing.assert_allclose(despiked.get_map()[points], clean[points], atol=0.25 * np.ptp(clean))
+
+
+def test_bands_and_inplace_give_the_same_result() -> None:
+    """Processing in bands of any height, or in place, does not change the result."""
+    mapping = sample_mapping("graphene", x_size=9, y_size=11, n_points=128)
+    add_spikes(mapping, seed=1)
+    expected, expected_mask = despike(mapping, band_rows=11)
+
+    for band_rows in (1, 2, 4):
+        result, mask = despike(mapping, band_rows=band_rows)
+        np.testing.assert_array_equal(mask, expected_mask)
+        np.testing.assert_array_equal(result.data, expected.data)
+
+    result, mask = despike(mapping, inplace=True, band_rows=3)
+    assert result is mapping
+    np.testing.assert_array_equal(mapping.data, expected.data)
+
+
+def test_single_row_and_column_maps() -> None:
+    """Lines of spectra are despiked along the line."""
+    for x_size, y_size in ((12, 1), (1, 12)):
+        mapping = sample_mapping("gaussians", x_size=x_size, y_size=y_size, n_points=128)
+        cube = mapping.get_map()
+        cube[0, 0, 40] += 5000.0
+        cube[-1, -1, 80] += 5000.0
+
+        _, mask = despike(mapping)
+
+        assert [index.tolist() for index in np.nonzero(mask)] == [
+            [0, cube.shape[0] - 1],
+            [0, cube.shape[1] - 1],
+            [40, 80],
+        ]
+
+
+def test_read_only_mappings_are_not_modified_in_place(tmp_path: Path) -> None:
+    """A memory-mapped mapping is despiked into a new one, but not in place."""
+    mapping = sample_mapping("graphene", x_size=5, y_size=4, n_points=128)
+    add_spikes(mapping)
+    lazy = load_smd(write_smd(mapping, tmp_path / "map.smd"), lazy=True)
+
+    with pytest.raises(ValueError, match="lazy=True"):
+        despike(lazy, inplace=True)
+
+    despiked, mask = despike(lazy)
+    expected, expected_mask = despike(mapping)
+    np.testing.assert_array_equal(mask, expected_mask)
+    np.testing.assert_array_equal(despiked.data, expected.data)
+
+
+# --------------------------------------------------------------------------------------------
+# Cubes
+# --------------------------------------------------------------------------------------------
+
+
+def test_despike_cube_reads_memory_maps(tmp_path: Path) -> None:
+    """A memory-mapped cube is despiked without being read whole, into another array."""
+    mapping = sample_mapping("graphene", x_size=8, y_size=6, n_points=128)
+    points, _ = add_spikes(mapping)
+    cube = mapping.get_map()
+    file = tmp_path / "cube.npy"
+    np.save(file, cube)
+    out = np.empty_like(cube)
+
+    mask = despike_cube(np.load(file, mmap_mode="r"), band_rows=2, out=out)
+
+    np.testing.assert_array_equal(mask, spike_mask(cube.shape, points))
+    np.testing.assert_array_equal(out, despike(mapping)[0].get_map())
+
+
+def test_invalid_arguments() -> None:
+    """A single spectrum, or settings that cannot flag anything, are rejected."""
+    cube = np.zeros((3, 4, 16))
+    with pytest.raises(ValueError, match="neighbours"):
+        despike_cube(cube[:1, :1])
+    with pytest.raises(ValueError, match="threshold"):
+        despike_cube(cube, threshold=0)
+    with pytest.raises(ValueError, match="row"):
+        despike_cube(cube, band_rows=0)
@@ -0,0 +1,167 @@
+"""Tests for the export of mappings to ENVI and NPY files.
+
+The cube read back with the layout the header gives must be the map of the mapping, whether its
+data block was copied from the SMD file by the kernel, through Python, or written from memory.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import load_smd, sample_mapping, write_smd
+from nanofinderparser.export import copy_range
+
+
+def read_envi(file: Path) -> tuple[dict[str, str], np.ndarray]:
+    """Read the fields of the header of an ENVI file, and its cube of float32 values."""
+    lines = file.with_suffix(".hdr").read_text(encoding="utf-8").splitlines()
+    assert lines[0] == "ENVI"
+    fields = dict(line.split(" = ", 1) for line in lines[1:])
+    assert fields["data type"] == "4"
+    shape = (int(fields["lines"]), int(fields["samples"]), int(fields["bands"]))
+    return fields, np.fromfile(file, dtype="<f4").reshape(shape)
+
+
+def wavelengths(fields: dict[str, str]) -> np.ndarray:
+    """Parse the list of wavelengths of an ENVI header."""
+    return np.array([float(value) for value in fields["wavelength"].strip("{}").split(",")])
+
+
+@pytest.fixture
+def smd_file(tmp_path: Path) -> Path:
+    """Write a small SMD file, scanned along x first."""
+    return write_smd(
+        sample_mapping("graphene", x_size=5, y_size=3, n_points=64), tmp_path / "map.smd"
+    )
+
+
+# --------------------------------------------------------------------------------------------
+# ENVI
+# --------------------------------------------------------------------------------------------
+
+
+def test_header_describes_the_cube(smd_file: Path, tmp_path: Path) -> None:
+    """The header gives the layout of the cube, its wavelengths and the map coordinates."""
+    mapping = load_smd(smd_file)
+
+    data, header = mapping.to_envi(tmp_path / "envi" / "map.bip", "raman_shift")
+
+    assert header == data.with_suffix(".hdr")
+    fields, cube = read_envi(data)
+    assert (fields["samples"], fields["lines"], fields["bands"]) == ("5", "3", "64")
+    assert fields["interleave"] == "bip"
+    assert fields["byte order"] == "0"
+    assert fields["wavelength units"] == "Wavenumber"
+    np.testing.assert_array_equal(wavelengths(fields), mapping.get_spectral_axis("raman_shift"))
+    axes = mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions
+    assert float(fields["x step"]) == axes.x.step_size
+    assert float(fields["y start"]) == axes.y.start_position
+    np.testing.assert_array_equal(cube, mapping.get_map())
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="No kernel copy on this system")
+def test_lazy_mappings_copy_the_data_block(
+    smd_file: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """The kernel copies the data block of a memory-mapped mapping from its file, tail excluded."""
+    mapping = load_smd(smd_file, lazy=True)
+    requested: list[int] = []
+    kernel_copy = os.copy_file_range
+
+    def spy(source: int, target: int, count: int, offset_src: int | None = None) -> int:
+        requested.append(count)
+        return kernel_copy(source, target, count, offset_src)
+
+    monkeypatch.setattr(os, "copy_file_range", spy)
+
+    data, _ = mapping.to_envi(tmp_path / "map.bip")
+
+    assert requested[0] == mapping.data.nbytes
+    assert data.read_bytes() == mapping.data.tobytes()
+    _, cube = read_envi(data)
+    np.testing.assert_array_equal(cube, mapping.get_map())
+
+
+def test_x_slow_mappings_are_transposed(tmp_path: Path) -> None:
+    """A mapping scanned along y first is written as rows along y all the same."""
+    mapping = sample_mapping("mos2", x_size=4, y_size=3, n_points=32)
+    mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions.x.is_slow = True
+    lazy = load_smd(write_smd(mapping, tmp_path / "map.smd"), lazy=True)
+
+    data, _ = lazy.to_envi(tmp_path / "map.bip")
+
+    fields, cube = read_envi(data)
+    assert (fields["samples"], fields["lines"]) == ("4", "3")
+    np.testing.assert_array_equal(cube, lazy.get_map().transpose(1, 0, 2))
+
+
+def test_copy_range_falls_back_to_python(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Where the kernel cannot copy between the files, the bytes are copied through Python."""
+    source = tmp_path / "source"
+    source.write_bytes(bytes(range(256)) * 10)
+
+    def unsupported(*args: object) -> int:
+        raise OSError
+
+    monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+    with (tmp_path / "target").open("wb") as target:
+        target.write(b"header")
+        copy_range(source, 100, 1000, target)
+    assert (tmp_path / "target").read_bytes() == b"header" + source.read_bytes()[100:1100]
+
+    with (
+        pytest.raises(ValueError, match="ends 40 bytes before"),
+        (tmp_path / "short").open("wb") as target,
+    ):
+        copy_range(source, 2000, 600, target)
+
+
+# --------------------------------------------------------------------------------------------
+# NPY
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_npy_files_load_as_the_map(smd_file: Path, tmp_path: Path, lazy: bool) -> None:
+    """The array is memory-mapped back as the map, and its metadata read from the sidecar."""
+    mapping = load_smd(smd_file, lazy=lazy)
+
+    array, sidecar = mapping.to_npy(tmp_path / "npy" / "map.npy", "raman_shift")
+
+    cube = np.load(array, mmap_mode="r")
+    assert cube.shape == (3, 5, 64)
+    assert cube.dtype == np.dtype("<f4")
+    np.testing.assert_array_equal(cube, mapping.get_map())
+    metadata = json.loads(sidecar.read_text(encoding="utf-8"))
+    assert metadata["dims"] == ["y", "x", "spectral"]
+    assert metadata["spectral_units"] == "raman_shift"
+    np.testing.assert_array_equal(
+        metadata["spectral_axis"], mapping.get_spectral_axis("raman_shift")
+    )
+    axes = mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions
+    assert metadata["coords"]["x"]["step"] == axes.x.step_size
+    assert metadata["laser_wavelength_nm"] == mapping.laser_wavelength
+    assert metadata["datetime"] == mapping.datetime.isoformat()
+
+
+def test_x_slow_npy_files_are_transposed(tmp_path: Path) -> None:
+    """A mapping scanned along y first is written with the dimensions (y, x) all the same."""
+    mapping = sample_mapping("mos2", x_size=4, y_size=3, n_points=32)
+    mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions.x.is_slow = True
+    lazy = load_smd(write_smd(mapping, tmp_path / "map.smd"), lazy=True)
+
+    array, _ = lazy.to_npy(tmp_path / "map.npy")
+
+    np.testing.assert_array_equal(np.load(array), lazy.get_map().transpose(1, 0, 2))
+
+
+def test_invalid_arguments(smd_file: Path, tmp_path: Path) -> None:
+    """Data files that their header or metadata would overwrite are rejected."""
+    mapping = load_smd(smd_file)
+    with pytest.raises(ValueError, match="overwritten"):
+        mapping.to_envi(tmp_path / "map.hdr")
+    with pytest.raises(ValueError, match="overwritten"):
+        mapping.to_npy(tmp_path / "map.json")
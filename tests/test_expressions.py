@@ -0,0 +1,149 @@
+"""Tests for the evaluation of expressions over windows of the spectral axis.
+
+Every value is checked against a direct computation on the spectra, or against peaks drawn at
+known positions.
+"""
+
+import numpy as np
+import pytest
+
+from nanofinderparser import sample_mapping
+from nanofinderparser.bands import BandIndex
+from nanofinderparser.expressions import Expression, Window, evaluate_expressions
+
+AXIS = np.linspace(0.0, 100.0, 201)
+CENTERS = np.array([30.0, 30.2, 31.7, 33.35])
+
+
+def peaks(centers: np.ndarray = CENTERS, height: float = 10.0) -> np.ndarray:
+    """Draw one Gaussian peak of FWHM 4 per center, on the axis."""
+    return height * np.exp(-4 * np.log(2) * ((AXIS[None, :] - centers[:, None]) / 4.0) ** 2)
+
+
+# --------------------------------------------------------------------------------------------
+# Parsing
+# --------------------------------------------------------------------------------------------
+
+
+def test_windows_are_gathered_in_order() -> None:
+    """The windows of an expression are found whatever the order of their limits."""
+    expression = Expression.parse("(band(20, 10) - 2 * band(10, 20)) / -height(5, 1.5) ** 2")
+
+    assert expression.windows == (
+        Window("band", 10.0, 20.0),
+        Window("band", 10.0, 20.0),
+        Window("height", 1.5, 5.0),
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "__import__('os').system('true')",
+        "band(1, 2).real",
+        "band(1, 2, 3)",
+        "band(1, high=2)",
+        "band(low, 2)",
+        "area(1, 2)",
+        "x + 1",
+        "1 if band(1, 2) else 2",
+        "band(1, 2) < 3",
+        "'text'",
+        "True + band(1, 2)",
+        "band(1, 2) +",
+    ],
+)
+def test_invalid_expressions(text: str) -> None:
+    """Anything other than numbers, the functions and arithmetic is rejected."""
+    with pytest.raises(ValueError, match="Invalid expression"):
+        Expression.parse(text)
+
+
+# --------------------------------------------------------------------------------------------
+# Evaluation
+# --------------------------------------------------------------------------------------------
+
+
+def test_functions_of_the_windows() -> None:
+    """Integrals, heights and positions match a direct computation, positions within a point."""
+    spectra = peaks() + peaks(CENTERS + 40.0, height=5.0)
+
+    maps = evaluate_expressions(
+        {
+            "area": "band(20, 45)",
+            "ratio": "height(60, 85) / height(20, 45)",
+            "shift": "position(60, 85) - position(20, 45)",
+            "position": "position(20, 45)",
+        },
+        AXIS,
+        spectra,
+    )
+
+    inside = (AXIS >= 20) & (AXIS <= 45)  # noqa: PLR2004
+    np.testing.assert_allclose(maps["area"], np.trapezoid(spectra[:, inside], AXIS[inside]))
+    np.testing.assert_allclose(maps["ratio"], 0.5, rtol=1e-2)
+    np.testing.assert_allclose(maps["shift"], 40.0, atol=1e-2)
+    # The refinement finds the peaks between the points of the axis, 0.5 apart
+    np.testing.assert_allclose(maps["position"], CENTERS, atol=0.02)
+
+
+@pytest.mark.parametrize("axis", [AXIS, AXIS[::-1]])
+def test_negative_integrals(axis: np.ndarray) -> None:
+    """Negative areas keep their sign whichever way the axis runs, as in the band index."""
+    peak = peaks()[0] if axis[0] < axis[-1] else peaks()[0][::-1]
+    spectra = np.vstack([-np.ones(axis.size), peak - 1.0])
+
+    area = evaluate_expressions({"area": "band(0, 10)", "peak": "band(20, 45)"}, axis, spectra)
+
+    np.testing.assert_allclose(area["area"], [-10.0, -10.0])
+    index = BandIndex.build(axis, spectra)
+    np.testing.assert_allclose(area["peak"], index.integrate(20, 45))
+    assert area["peak"][0] < 0 < area["peak"][1]
+
+
+def test_chunks_do_not_change_the_values() -> None:
+    """Reading the spectra in chunks of any size gives the same values."""
+    spectra = peaks(np.linspace(20.0, 80.0, 23))
+    expressions = {"a": "band(10, 50) + height(40, 90)", "b": "position(0, 100) * 2 - 1"}
+
+    whole = evaluate_expressions(expressions, AXIS, spectra)
+    chunked = evaluate_expressions(expressions, AXIS, spectra, chunk_size=4)
+
+    for name in expressions:
+        np.testing.assert_array_equal(chunked[name], whole[name])
+
+
+def test_divisions_by_zero_and_empty_windows() -> None:
+    """Dividing by zero gives infinities or NaN, and windows without points are rejected."""
+    spectra = np.vstack([peaks()[:1], np.zeros((1, AXIS.size))])
+    spectra[:, AXIS >= 60] = 0.0  # noqa: PLR2004
+
+    ratio = evaluate_expressions({"ratio": "height(0, 100) / height(60, 100)"}, AXIS, spectra)
+
+    assert np.isinf(ratio["ratio"][0])
+    assert np.isnan(ratio["ratio"][1])
+    with pytest.raises(ValueError, match="No point"):
+        evaluate_expressions({"empty": "band(10.1, 10.2)"}, AXIS, spectra)
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+def test_eval_maps() -> None:
+    """Every expression gives a map titled by its name, consistent with the band maps."""
+    mapping = sample_mapping("graphene", x_size=5, y_size=3, n_points=512)
+
+    maps = mapping.eval_maps(
+        {
+            "I(2D)/I(G)": "band(2600, 2750) / band(1550, 1620)",
+            "G": "position(1550, 1620)",
+        }
+    )
+
+    assert maps.titles == ["I(2D)/I(G)", "G"]
+    expected = mapping.band_map(2600, 2750).values / mapping.band_map(1550, 1620).values
+    np.testing.assert_allclose(maps["I(2D)/I(G)"].values, expected, rtol=1e-6)
+    assert maps["G"].shape == (3, 5)
+    assert ((maps["G"].values > 1570) & (maps["G"].values < 1600)).all()  # noqa: PLR2004
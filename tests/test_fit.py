@@ -0,0 +1,146 @@
+"""Tests for the fit of a peak to every spectrum of a mapping.
+
+Spectra are built from known parameters, so the fitted maps are checked against the exact values
+the peaks were drawn with.
+"""
+
+import numpy as np
+import pytest
+
+from nanofinderparser import (
+    BaselineSpec,
+    MappingSpec,
+    MapSpec,
+    PeakSpec,
+    SpectralAxisSpec,
+    build_mapping,
+    map_ramp,
+)
+from nanofinderparser.fit import fit_mapping, fit_peaks
+from nanofinderparser.shapes import PeakShape, profile
+
+AXIS = np.linspace(-20.0, 20.0, 201)
+CENTERS = np.array([-3.0, 0.0, 2.5, 6.0])
+FWHM = 4.0
+AMPLITUDE = 250.0
+BACKGROUND = 30.0
+ETA = 0.3
+
+SHAPES: list[PeakShape] = ["gaussian", "lorentzian", "pseudo_voigt"]
+
+
+def peaks(shape: PeakShape, centers: np.ndarray = CENTERS) -> np.ndarray:
+    """Draw one peak of known parameters per center, on a constant background.
+
+    Parameters
+    ----------
+    shape : {"gaussian", "lorentzian", "pseudo_voigt"}
+        The lineshape of the peaks.
+    centers : np.ndarray, optional
+        Center of the peak of each spectrum, by default CENTERS.
+
+    Returns
+    -------
+    np.ndarray
+        The spectra, of shape ``(len(centers), len(AXIS))``.
+    """
+    offset = AXIS[None, :] - centers[:, None]
+    return BACKGROUND + AMPLITUDE * profile(shape, offset, np.asarray(FWHM), np.asarray(ETA))
+
+
+# --------------------------------------------------------------------------------------------
+# Batches of spectra
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_fit_peaks_recovers_the_parameters(shape: PeakShape) -> None:
+    """Every parameter the peaks were drawn with is found again."""
+    fit = fit_peaks(AXIS, peaks(shape), shape)
+
+    np.testing.assert_allclose(fit.position, CENTERS, atol=1e-6)
+    np.testing.assert_allclose(fit.fwhm, FWHM, rtol=1e-6)
+    np.testing.assert_allclose(fit.amplitude, AMPLITUDE, rtol=1e-6)
+    np.testing.assert_allclose(fit.background, BACKGROUND, rtol=1e-6)
+    np.testing.assert_allclose(fit.residual, 0.0, atol=1e-4)
+    assert fit.converged.all()
+    if shape == "pseudo_voigt":
+        assert fit.eta is not None
+        np.testing.assert_allclose(fit.eta, ETA, atol=1e-6)
+    else:
+        assert fit.eta is None
+
+
+def test_chunks_and_jobs_do_not_change_the_fit() -> None:
+    """Fitting in chunks, in parallel or not, gives the same parameters as a single batch."""
+    centers = np.linspace(-8.0, 8.0, 37)
+    spectra = peaks("lorentzian", centers)
+
+    whole = fit_peaks(AXIS, spectra)
+    chunked = fit_peaks(AXIS, spectra, chunk_size=5, jobs=3)
+
+    np.testing.assert_array_equal(chunked.position, whole.position)
+    np.testing.assert_array_equal(chunked.fwhm, whole.fwhm)
+
+
+def test_missing_peaks_are_nan() -> None:
+    """A spectrum without a peak in the window gives NaN, and does not spoil the others."""
+    spectra = np.vstack([peaks("gaussian")[:1], np.full((1, AXIS.size), BACKGROUND)])
+
+    fit = fit_peaks(AXIS, spectra, "gaussian")
+
+    assert fit.position[0] == pytest.approx(CENTERS[0])
+    assert np.isnan(fit.position[1])
+
+
+def test_invalid_arguments() -> None:
+    """Mismatched axes and windows too narrow for the peak are rejected."""
+    with pytest.raises(ValueError, match="points"):
+        fit_peaks(AXIS[:-1], peaks("gaussian"))
+    with pytest.raises(ValueError, match="At least"):
+        fit_peaks(AXIS[:4], peaks("gaussian")[:, :4])
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+def test_fit_mapping_maps_the_parameters() -> None:
+    """The fitted maps follow the scan, with the titles NanoFinder gives its own."""
+    spec = MappingSpec(
+        map=MapSpec(x_size=5, y_size=3),
+        spectral_axis=SpectralAxisSpec(size=1024, start=560.0, stop=600.0),
+        peaks=[
+            PeakSpec(
+                center=map_ramp(1575.0, 1590.0),
+                fwhm=16.0,
+                amplitude=1000.0,
+                shape="lorentzian",
+                units="raman_shift",
+            )
+        ],
+        baseline=BaselineSpec(offset=100.0),
+    )
+    mapping = build_mapping(spec)
+
+    images = fit_mapping(mapping, (1650.0, 1500.0), "lorentzian", name="G")
+
+    assert images.titles == [
+        "G Peak position (Lorentz)",
+        "G Peak FWHM (Lorentz)",
+        "G Peak intensity (Lorentz)",
+        "G Background (Lorentz)",
+        "G Fit residual (Lorentz)",
+    ]
+    position = images["G Peak position (Lorentz)"]
+    assert position.shape == (3, 5)
+    assert position.value_unit == "raman_shift"
+    np.testing.assert_allclose(
+        position.values, np.tile(np.linspace(1575, 1590, 5), (3, 1)), atol=0.05
+    )
+    np.testing.assert_allclose(images["G Peak FWHM (Lorentz)"].values, 16.0, rtol=1e-2)
+    np.testing.assert_allclose(position.x_coords, np.arange(5) * 500.0)
+
+    with pytest.raises(ValueError, match="No point"):
+        fit_mapping(mapping, (3000.0, 3100.0))
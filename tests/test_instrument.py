@@ -0,0 +1,154 @@
+"""Tests for the instrumentation of the stages of reading, converting and writing files.
+
+The events are checked for what a user timing a slow load relies on: every stage is reported,
+nested stages end before the stage holding them, and the byte counts match what was actually read
+or written.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from nanofinderparser import instrument, load_mdt, load_smd, write_smd
+from nanofinderparser.instrument import StageEvent
+from nanofinderparser.parsers import read_mdt_frames
+
+# ruff: noqa: PLR2004
+
+SMD_FILE = Path(__file__).parent.parent / "sample_data" / "smd" / "mapping_small.smd"
+MDT_FILE = Path(__file__).parent.parent / "sample_data" / "mdt" / "Spectra.mdt"
+
+
+def by_stage(events: list[StageEvent]) -> dict[str, StageEvent]:
+    """Index the events by the name of their stage.
+
+    Parameters
+    ----------
+    events : list[StageEvent]
+        The events recorded, each stage run once.
+
+    Returns
+    -------
+    dict[str, StageEvent]
+        The events, by the name of their stage.
+    """
+    return {event.stage: event for event in events}
+
+
+# --------------------------------------------------------------------------------------------
+# Listeners
+# --------------------------------------------------------------------------------------------
+
+
+def test_nothing_is_measured_without_listeners() -> None:
+    """With no listener registered, stages are the shared object that does nothing."""
+    assert not instrument.is_active()
+    with instrument.stage("test.stage") as stage:
+        stage.nbytes = 10
+    assert not stage.active
+    assert stage is instrument.stage("test.other")
+
+
+def test_listeners_are_called_until_removed() -> None:
+    """A listener gets the events of the stages run while it is registered, and only those."""
+    events: list[StageEvent] = []
+    instrument.add_listener(events.append)
+    instrument.add_listener(events.append)
+    try:
+        with instrument.stage("test.stage", nbytes=10, source=SMD_FILE):
+            pass
+    finally:
+        instrument.remove_listener(events.append)
+
+    with instrument.stage("test.after"):
+        pass
+
+    assert [(event.stage, event.nbytes, event.source) for event in events] == [
+        ("test.stage", 10, SMD_FILE)
+    ]
+    assert not instrument.is_active()
+
+
+def test_failed_stages_are_reported() -> None:
+    """A stage ended by an exception is still reported, flagged as failed."""
+
+    def fail() -> None:
+        with instrument.stage("test.stage"):
+            msg = "boom"
+            raise ValueError(msg)
+
+    with instrument.recording() as events, pytest.raises(ValueError, match="boom"):
+        fail()
+
+    assert [event.failed for event in events] == [True]
+
+
+def test_throughput() -> None:
+    """The throughput of an event is its bytes per second, when both are known."""
+    assert StageEvent("test.stage", seconds=0.5, nbytes=100).throughput == 200
+    assert StageEvent("test.stage", seconds=0.5).throughput is None
+
+
+# --------------------------------------------------------------------------------------------
+# Stages of the package
+# --------------------------------------------------------------------------------------------
+
+
+def test_load_smd_stages() -> None:
+    """Loading an SMD file reports every stage, with the bytes of the part of the file it read."""
+    with instrument.recording() as events:
+        mapping = load_smd(SMD_FILE)
+
+    stages = [event.stage for event in events]
+    assert stages == [
+        "xml.scan",
+        "xml.parse",
+        "binary.read",
+        "smd.model",
+        "smd.check",
+        "smd.load",
+    ]
+
+    recorded = by_stage(events)
+    header_size = recorded["xml.scan"].nbytes
+    assert header_size is not None
+    assert recorded["xml.parse"].nbytes == header_size
+    assert recorded["binary.read"].nbytes == mapping.data.nbytes
+    assert recorded["smd.load"].nbytes == SMD_FILE.stat().st_size
+    assert all(event.source == SMD_FILE for event in events)
+    assert all(not event.failed for event in events)
+    assert recorded["smd.load"].seconds >= sum(
+        recorded[name].seconds for name in stages if name != "smd.load"
+    )
+
+
+def test_read_mdt_frames_stages() -> None:
+    """Reading an MDT file reports reading the file and decoding its frames."""
+    with instrument.recording() as events:
+        read_mdt_frames(MDT_FILE)
+
+    recorded = by_stage(events)
+    assert list(recorded) == ["mdt.read", "mdt.decode"]
+    assert recorded["mdt.read"].nbytes == MDT_FILE.stat().st_size
+    assert recorded["mdt.decode"].nbytes == MDT_FILE.stat().st_size - 33
+
+
+def test_export_stages(tmp_path: Path) -> None:
+    """Exports report the bytes converted to DataFrames, or written to files."""
+    mapping = load_smd(SMD_FILE)
+    spectra = load_mdt(MDT_FILE)
+
+    with instrument.recording() as events:
+        mapping.to_csv(tmp_path, filename="mapping", save_mapcoords="separated")
+        written = spectra.to_csv(tmp_path / "spectra")
+        write_smd(mapping, tmp_path / "copy.smd")
+        spectra.to_df()
+
+    recorded = by_stage(events)
+    assert recorded["mapping.to_df"].nbytes == mapping.data.nbytes
+    assert recorded["mapping.to_csv"].nbytes == sum(
+        (tmp_path / name).stat().st_size for name in ("mapping_data.csv", "mapping_mapcoords.csv")
+    )
+    assert recorded["spectra.to_csv"].nbytes == sum(file.stat().st_size for file in written)
+    assert recorded["spectra.to_df"].nbytes == sum(spectrum.data.nbytes for spectrum in spectra)
+    assert recorded["smd.write"].nbytes == (tmp_path / "copy.smd").stat().st_size
@@ -2,6 +2,7 @@
 
 import logging
 import struct
+from dataclasses import replace
 from pathlib import Path
 
 import numpy as np
@@ -270,6 +271,29 @@ def test_duplicate_titles_are_disambiguated(spectra: Spectra, tmp_path: Path) ->
     assert len(list(tmp_path.glob("*.csv"))) == 3
 
 
+def test_select_by_titles(spectra: Spectra) -> None:
+    """A sub-collection is selected by titles, every item of a repeated title included."""
+    repeated = Spectra([spectra[0], spectra[1], spectra[0]], source=spectra.source)
+
+    selected = repeated.select(["Spectrum_1", "Spectrum_2"])
+
+    assert isinstance(selected, Spectra)
+    assert selected.source == spectra.source
+    assert selected.titles == ["Spectrum_1", "Spectrum_1", "Spectrum_2"]
+    assert repeated["Spectrum_1"] is repeated[0]
+    assert repeated.select([]).titles == []
+    with pytest.raises(KeyError, match="'missing', 'other'"):
+        repeated.select(["Spectrum_2", "missing", "other"])
+
+
+def test_unique_titles_are_cached(spectra: Spectra) -> None:
+    """The titles made unique are worked out once, and a caller cannot change them."""
+    titles = spectra.unique_titles()
+    titles.append("changed")
+
+    assert spectra.unique_titles() == ["Spectrum_1", "Spectrum_2"]
+
+
 # --------------------------------------------------------------------------------------------
 # Exporting spectra
 # --------------------------------------------------------------------------------------------
@@ -293,6 +317,9 @@ def test_combined_to_df_warns_on_mismatched_axes(
     assert "do not share a common spectral axis" in caplog.text
     assert list(df.columns) == spectra.titles
     assert len(df) > SPECTRA_LEN  # the union of two different axes
+    assert df.index.is_monotonic_increasing
+    for spectrum in spectra:
+        np.testing.assert_array_equal(df[spectrum.title].dropna().index, spectrum.spectral_axis)
 
 
 def test_combined_to_df_is_quiet_for_a_shared_axis(
@@ -308,6 +335,60 @@ def test_combined_to_df_is_quiet_for_a_shared_axis(
     assert not df.isna().to_numpy().any()
 
 
+def test_to_array_stacks_a_shared_axis(spectra: Spectra) -> None:
+    """Spectra over the same axis are stacked as they are, and others need an axis."""
+    shared = Spectra([spectra[0], spectra[0]])
+
+    axis, values = shared.to_array(spectral_units="raman_shift")
+
+    np.testing.assert_array_equal(axis, spectra[0].get_spectral_axis("raman_shift"))
+    assert values.shape == (2, SPECTRA_LEN)
+    assert values.dtype == spectra[0].data.dtype
+    np.testing.assert_array_equal(values[1], spectra[0].data)
+    assert shared.to_array("common")[1].dtype == spectra[0].data.dtype
+    with pytest.raises(ValueError, match="do not share a common spectral axis"):
+        spectra.to_array()
+    with pytest.raises(ValueError, match="no spectrum"):
+        Spectra([]).to_array()
+
+
+def test_to_array_resamples_different_axes(spectra: Spectra) -> None:
+    """Spectra over different axes are resampled onto the range they all cover, or a grid."""
+    axis, values = spectra.to_array("common")
+
+    assert axis.size == SPECTRA_LEN
+    assert axis[0] == max(spectrum.spectral_axis.min() for spectrum in spectra)
+    assert np.allclose(np.diff(axis), axis[1] - axis[0])
+    assert not np.isnan(values).any()
+    for spectrum, row in zip(spectra, values, strict=True):
+        np.testing.assert_allclose(
+            row, np.interp(axis, spectrum.spectral_axis, spectrum.data), rtol=1e-5
+        )
+
+    grid = spectra[1].spectral_axis
+    _, on_grid = spectra.to_array(grid)
+    np.testing.assert_allclose(on_grid[1], spectra[1].data, rtol=1e-6)
+    # Points of the grid beyond the axis of a spectrum are left empty
+    assert np.isnan(on_grid[0]).any()
+
+    disjoint = replace(spectra[1], spectral_axis=spectra[0].spectral_axis + 1000.0)
+    with pytest.raises(ValueError, match="do not overlap"):
+        Spectra([spectra[0], disjoint]).to_array("common")
+
+
+def test_combined_to_df_resamples_onto_an_axis(
+    spectra: Spectra, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Given an axis, spectra over different axes combine without gaps nor warning."""
+    with caplog.at_level(logging.WARNING, logger="nanofinderparser.models"):
+        df = spectra.to_df("raman_shift", axis="common")
+
+    assert caplog.text == ""
+    assert df.index.name == "raman_shift"
+    assert list(df.columns) == spectra.titles
+    assert not df.isna().to_numpy().any()
+
+
 def test_spectra_to_csv_writes_one_file_each(spectra: Spectra, tmp_path: Path) -> None:
     """Exporting separately writes one CSV per spectrum."""
     written = spectra.to_csv(tmp_path, filename="Spectra.mdt", spectral_units="raman_shift")
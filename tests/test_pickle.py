@@ -0,0 +1,153 @@
+"""Tests for the transport of mappings, spectra and maps to other processes.
+
+Pickled with protocol 5, the arrays must travel out of band and the caches stay behind; shared
+memory must hand the same spectra to every process without copying them.
+"""
+
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import load_mdt_file, load_smd, sample_mapping, write_smd
+from nanofinderparser.models import Mapping
+
+MDT_FILE = Path(__file__).parent.parent / "sample_data" / "mdt" / "Spectra.mdt"
+
+
+def dumps_out_of_band(value: object) -> tuple[bytes, list[pickle.PickleBuffer]]:
+    """Pickle a value with protocol 5, keeping its buffers apart."""
+    buffers: list[pickle.PickleBuffer] = []
+    return pickle.dumps(value, protocol=5, buffer_callback=buffers.append), buffers
+
+
+def g_band_sum(mapping: Mapping) -> float:
+    """Sum the G band of every spectrum of a mapping."""
+    return float(mapping.get_spectra()[:, mapping.spectral_slice(1550, 1620, "raman_shift")].sum())
+
+
+def shared_g_band_sum(name: str) -> float:
+    """Open a mapping from shared memory, in a worker process, and sum its G band."""
+    return g_band_sum(Mapping.from_shared_memory(name))
+
+
+# --------------------------------------------------------------------------------------------
+# Pickling
+# --------------------------------------------------------------------------------------------
+
+
+def test_mapping_data_is_pickled_out_of_band() -> None:
+    """The data travels as a buffer of its own, and the caches are left behind."""
+    mapping = sample_mapping("graphene", x_size=8, y_size=6, n_points=512)
+    mapping.band_map(1550, 1620)
+    mapping.spectral_index(1580, "raman_shift")
+
+    pickled, buffers = dumps_out_of_band(mapping)
+
+    # The spectral axis of the header travels out of band too
+    assert mapping.data.nbytes in [buffer.raw().nbytes for buffer in buffers]
+    assert len(pickled) < mapping.data.nbytes
+    unpickled = pickle.loads(pickled, buffers=buffers)  # noqa: S301
+    np.testing.assert_array_equal(unpickled.get_map(), mapping.get_map())
+    np.testing.assert_array_equal(unpickled.get_spectral_axis(), mapping.get_spectral_axis())
+    assert unpickled.datetime == mapping.datetime
+    assert unpickled.spectral_index(1580, "raman_shift") == mapping.spectral_index(
+        1580, "raman_shift"
+    )
+    # In band, with the default protocol, the band index is left behind all the same
+    assert len(pickle.dumps(mapping)) < 2 * mapping.data.nbytes
+
+
+def test_lazy_mappings_are_pickled_as_their_file(tmp_path: Path) -> None:
+    """A memory-mapped mapping is pickled as the position of its data, and mapped again."""
+    mapping = load_smd(
+        write_smd(sample_mapping("mos2", x_size=8, y_size=6, n_points=256), tmp_path / "map.smd"),
+        lazy=True,
+    )
+
+    pickled, buffers = dumps_out_of_band(mapping)
+
+    # Only the spectral axis of the header travels out of band
+    assert len(pickled) + sum(buffer.raw().nbytes for buffer in buffers) < mapping.data.nbytes
+    unpickled = pickle.loads(pickled, buffers=buffers)  # noqa: S301
+    assert isinstance(unpickled.data.base, np.memmap)
+    assert unpickled.data_offset == mapping.data_offset
+    np.testing.assert_array_equal(unpickled.get_spectra(), mapping.get_spectra())
+
+
+def test_spectra_and_images_are_pickled_out_of_band() -> None:
+    """Spectra and maps keep their fields, their arrays travelling out of band."""
+    spectra, images = load_mdt_file(MDT_FILE)
+    spectrum = spectra[0]
+    spectrum.spectral_index(1000, "raman_shift")
+
+    pickled, buffers = dumps_out_of_band(spectrum)
+
+    assert len(buffers) == 2  # noqa: PLR2004
+    unpickled = pickle.loads(pickled, buffers=buffers)  # noqa: S301
+    np.testing.assert_array_equal(unpickled.data, spectrum.data)
+    np.testing.assert_array_equal(unpickled.spectral_axis, spectrum.spectral_axis)
+    assert (unpickled.title, unpickled.measured_at) == (spectrum.title, spectrum.measured_at)
+    assert not unpickled._spectral_axes  # noqa: SLF001
+
+    for image in images:
+        pickled, buffers = dumps_out_of_band(image)
+
+        assert len(buffers) == 1
+        unpickled = pickle.loads(pickled, buffers=buffers)  # noqa: S301
+        np.testing.assert_array_equal(unpickled.values, image.values)
+        assert (unpickled.title, unpickled.x_axis) == (image.title, image.x_axis)
+
+
+def test_mappings_are_sent_to_worker_processes() -> None:
+    """A mapping given to a pool of processes arrives whole."""
+    mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        (size,) = pool.map(Mapping.get_spectral_axis_len, [mapping])
+
+    assert size == mapping.get_spectral_axis_len()
+
+
+# --------------------------------------------------------------------------------------------
+# Shared memory
+# --------------------------------------------------------------------------------------------
+
+
+def test_shared_memory_round_trip() -> None:
+    """A mapping opened from shared memory is a read-only view of the block."""
+    mapping = sample_mapping("graphene", x_size=8, y_size=6, n_points=512)
+    block = mapping.to_shared_memory()
+    try:
+        shared = Mapping.from_shared_memory(block.name)
+
+        np.testing.assert_array_equal(shared.get_map(), mapping.get_map())
+        np.testing.assert_array_equal(shared.get_spectral_axis(), mapping.get_spectral_axis())
+        assert shared.laser_wavelength == mapping.laser_wavelength
+        assert not shared.data.flags.writeable
+        with pytest.raises(ValueError, match="read-only"):
+            shared.data[0] = 1.0
+        # The block stays open as long as arrays use it, and closes with the last of them
+        spectra = shared.get_spectra()
+        del shared
+        assert spectra[0, 0] == mapping.data[0]
+        del spectra
+    finally:
+        block.close()
+        block.unlink()
+
+
+def test_worker_processes_share_the_block() -> None:
+    """Workers open the mapping from the name of the block, rather than receiving it."""
+    mapping = sample_mapping("graphene", x_size=8, y_size=6, n_points=512)
+    block = mapping.to_shared_memory()
+    try:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            sums = list(pool.map(shared_g_band_sum, [block.name] * 3))
+    finally:
+        block.close()
+        block.unlink()
+
+    assert sums == pytest.approx([g_band_sum(mapping)] * 3)
@@ -0,0 +1,114 @@
+"""Tests for the resampling of spectra onto another spectral axis.
+
+Linear interpolation is exact for spectra linear along the axis, and cubic interpolation for
+cubic ones, however unevenly the points of the axis are spaced.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nanofinderparser import load_smd, sample_mapping, write_smd
+from nanofinderparser.resample import Interpolation, Method, resample
+
+# An uneven, decreasing axis, as a NanoFinder axis in nm is in cm-1
+SOURCE_AXIS = 3000.0 - np.cumsum(np.linspace(2.0, 4.0, 200))
+AXIS = np.linspace(SOURCE_AXIS[-1], SOURCE_AXIS[0], 333)
+
+
+def polynomials(axis: np.ndarray, degree: int) -> np.ndarray:
+    """Evaluate a few polynomials of a degree along an axis, one per row."""
+    rng = np.random.default_rng(degree)
+    scaled = (axis - 2600.0) / 400.0
+    return np.array(
+        [np.polyval(coefficients, scaled) for coefficients in rng.normal(size=(5, degree + 1))]
+    )
+
+
+# --------------------------------------------------------------------------------------------
+# Spectra
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(("method", "degree"), [("linear", 1), ("cubic", 3)])
+def test_interpolation_is_exact_for_polynomials(method: Method, degree: int) -> None:
+    """Each method reproduces the polynomials of its degree on an uneven axis."""
+    resampled = resample(polynomials(SOURCE_AXIS, degree), SOURCE_AXIS, AXIS, method=method)
+
+    assert resampled.dtype == np.float32
+    np.testing.assert_allclose(resampled, polynomials(AXIS, degree), rtol=1e-5, atol=1e-5)
+
+
+def test_linear_interpolation_matches_numpy() -> None:
+    """Linear interpolation gives the values of np.interp."""
+    spectra = np.random.default_rng(0).random((4, SOURCE_AXIS.size))
+
+    resampled = resample(spectra, SOURCE_AXIS, AXIS)
+
+    expected = [np.interp(AXIS, SOURCE_AXIS[::-1], spectrum[::-1]) for spectrum in spectra]
+    np.testing.assert_allclose(resampled, expected, rtol=1e-6)
+
+
+def test_points_beyond_the_axis_are_nan() -> None:
+    """Points of the new axis beyond the old one are not extrapolated."""
+    axis = np.array([SOURCE_AXIS[-1] - 1.0, 2800.0, SOURCE_AXIS[0] + 1.0])
+
+    resampled = resample(polynomials(SOURCE_AXIS, 1), SOURCE_AXIS, axis, method="cubic")
+
+    assert np.isnan(resampled[:, [0, 2]]).all()
+    assert np.isfinite(resampled[:, 1]).all()
+
+
+def test_chunks_are_written_to_the_output() -> None:
+    """Chunks of any size are written into the array given, which is returned."""
+    spectra = polynomials(SOURCE_AXIS, 3)
+    out = np.zeros((len(spectra), AXIS.size))
+
+    resampled = resample(spectra, SOURCE_AXIS, AXIS, method="cubic", chunk_size=2, out=out)
+
+    assert resampled is out
+    interpolation = Interpolation.build(SOURCE_AXIS, AXIS, "cubic")
+    np.testing.assert_array_equal(out, interpolation.apply(spectra))
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+def test_resample_mapping(tmp_path: Path) -> None:
+    """A mapping is resampled onto an even grid of Raman shifts, which it keeps when written."""
+    mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=512)
+    grid = np.arange(1300.0, 2800.0, 1.5)
+
+    resampled = mapping.resample(grid, "raman_shift", method="cubic")
+
+    assert resampled.get_map().shape == (3, 4, grid.size)
+    np.testing.assert_allclose(resampled.get_spectral_axis("raman_shift"), grid)
+    assert resampled.spectral_index(1580.0, "raman_shift") == 187  # noqa: PLR2004
+    np.testing.assert_allclose(
+        resampled.get_spectra(),
+        resample(
+            mapping.get_spectra(), mapping.get_spectral_axis("raman_shift"), grid, method="cubic"
+        ),
+    )
+    # The mapping resampled keeps its own axis
+    assert mapping.get_spectra().shape == (12, 512)
+
+    loaded = load_smd(write_smd(resampled, tmp_path / "resampled.smd"))
+    np.testing.assert_allclose(loaded.get_spectral_axis("raman_shift"), grid, atol=1e-6)
+    np.testing.assert_array_equal(loaded.get_spectra(), resampled.get_spectra())
+
+
+def test_invalid_arguments() -> None:
+    """Axes that cannot be resampled, and outputs of the wrong shape, are rejected."""
+    spectra = polynomials(SOURCE_AXIS, 1)
+    with pytest.raises(ValueError, match="increasing or decreasing"):
+        Interpolation.build(np.array([1.0, 3.0, 2.0, 4.0]), AXIS)
+    with pytest.raises(ValueError, match="at least 4 points"):
+        Interpolation.build(np.array([1.0, 2.0, 3.0]), AXIS, "cubic")
+    with pytest.raises(ValueError, match="their axis"):
+        resample(spectra, SOURCE_AXIS[:-1], AXIS)
+    with pytest.raises(ValueError, match="shape"):
+        resample(spectra, SOURCE_AXIS, AXIS, out=np.empty((5, 10)))
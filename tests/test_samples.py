@@ -6,6 +6,7 @@ to put it at. A test fails either when a sample is described wrongly or when the
 putting the peaks where the spec asks for them.
 """
 
+from dataclasses import replace
 from pathlib import Path
 from typing import get_args
 
@@ -14,7 +15,7 @@ import pytest
 from numpy.typing import NDArray
 from typeguard import suppress_type_checks
 
-from nanofinderparser import create_smd, load_smd
+from nanofinderparser import NoiseSpec, build_spectra, create_smd, load_smd
 from nanofinderparser.models import Mapping
 from nanofinderparser.samples import (
     BUILDERS,
@@ -122,6 +123,23 @@ def test_sample_is_reproducible(name: SampleName) -> None:
     assert np.array_equal(build(name).get_map(), build(name).get_map())
 
 
+@pytest.mark.parametrize("name", SAMPLE_NAMES)
+def test_sample_peaks_can_be_evaluated_over_their_support(name: SampleName) -> None:
+    """Skipping the far tails of the peaks of a sample leaves its spectra all but unchanged."""
+    tolerance = 1e-5
+    spec = replace(
+        sample_spec(name, x_size=X_SIZE, y_size=Y_SIZE, n_points=2048), noise=NoiseSpec()
+    )
+
+    exact = build_spectra(spec).astype(np.float64)
+    windowed = build_spectra(spec, tolerance=tolerance).astype(np.float64)
+
+    # No peak of a sample rises above the highest value of its spectra, which also sets the
+    # scale of the float32 rounding.
+    bound = (tolerance * len(spec.peaks) + np.finfo(np.float32).eps) * exact.max()
+    assert np.abs(windowed - exact).max() <= bound
+
+
 def test_unknown_sample_is_rejected() -> None:
     """Asking for a sample that is not in the catalog says so, and lists the ones that are.
 
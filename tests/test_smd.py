@@ -4,7 +4,10 @@ The sample file is a real mapping trimmed down to a 4 x 3 grid of 8-point spectr
 value asserted here comes from an actual instrument.
 """
 
+import itertools
 import logging
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -13,6 +16,7 @@ import pandas as pd
 import pytest
 
 from nanofinderparser import load_smd, load_smd_folder
+from nanofinderparser.load import follow_smd
 from nanofinderparser.models import Mapping
 from nanofinderparser.units import Units
 
@@ -233,20 +237,106 @@ def _copy_with_binary_delta(source: Path, target: Path, delta: int) -> Path:
     return target
 
 
-def test_truncated_file_is_rejected(tmp_path: Path) -> None:
+@pytest.mark.parametrize("lazy", [False, True])
+def test_truncated_file_is_rejected(tmp_path: Path, lazy: bool) -> None:
     """A file holding fewer values than its header declares raises."""
     short = _copy_with_binary_delta(SMD_FILE, tmp_path / "short.smd", -8)
 
     with pytest.raises(ValueError, match="truncated"):
-        load_smd(short)
+        load_smd(short, lazy=lazy)
 
 
-def test_extra_values_are_ignored(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+@pytest.mark.parametrize("lazy", [False, True])
+def test_extra_values_are_ignored(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture, lazy: bool
+) -> None:
     """A file holding more values than its header declares is trimmed, with a warning."""
     long = _copy_with_binary_delta(SMD_FILE, tmp_path / "long.smd", 8)
 
     with caplog.at_level(logging.WARNING):
-        mapping = load_smd(long)
+        mapping = load_smd(long, lazy=lazy)
 
     assert mapping.data.size == X_STEPS * Y_STEPS * SPECTRAL_LEN
     assert "more than" in caplog.text
+
+
+# --------------------------------------------------------------------------------------------
+# Memory-mapped data and dask arrays
+# --------------------------------------------------------------------------------------------
+
+
+def test_lazy_loading_maps_the_data_block(mapping: Mapping) -> None:
+    """A mapping loaded lazily holds the same spectra, read-only, and where they are in the file."""
+    lazy = load_smd(SMD_FILE, lazy=True)
+
+    np.testing.assert_array_equal(lazy.get_map(), mapping.get_map())
+    assert not lazy.data.flags.writeable
+    assert lazy.data_offset is not None
+    assert SMD_FILE.stat().st_size - lazy.data_offset == mapping.data.nbytes
+    # Only memory-mapped data has a position in the file, and replaced data has none
+    assert mapping.data_offset is None
+    assert lazy.with_data(mapping.data).data_offset is None
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_to_dask(mapping: Mapping, lazy: bool) -> None:
+    """The dask array holds the spectra, by chunks of spectra, from the file or the memory."""
+    pytest.importorskip("dask")
+    source = load_smd(SMD_FILE, lazy=True) if lazy else mapping
+
+    spectra = source.to_dask(chunks=5)
+
+    assert spectra.chunks == ((5, 5, 2), (SPECTRAL_LEN,))
+    assert spectra.dtype == mapping.data.dtype
+    np.testing.assert_array_equal(spectra.compute(), mapping.get_spectra())
+    np.testing.assert_allclose(
+        spectra.mean(axis=1).compute(scheduler="threads"), mapping.get_spectra().mean(axis=1)
+    )
+    with pytest.raises(ValueError, match="positive"):
+        source.to_dask(chunks=0)
+
+
+# --------------------------------------------------------------------------------------------
+# Following a file while it is acquired
+# --------------------------------------------------------------------------------------------
+
+
+def _acquire(source: Path, target: Path, chunks: int, interval: float) -> None:
+    """Write a copy of an SMD file little by little, as the instrument does."""
+    raw = source.read_bytes()
+    bounds = np.linspace(0, len(raw), chunks + 1).astype(int)
+    with target.open("wb") as f:
+        for start, stop in itertools.pairwise(bounds):
+            f.write(raw[start:stop])
+            f.flush()
+            time.sleep(interval)
+
+
+def test_follow_smd_yields_spectra_as_written(mapping: Mapping, tmp_path: Path) -> None:
+    """Every spectrum is yielded once, in acquisition order, while the file is being written."""
+    target = tmp_path / "acquiring.smd"
+    writer = threading.Thread(target=_acquire, args=(SMD_FILE, target, 7, 0.02))
+    writer.start()
+    try:
+        spectra = list(follow_smd(target, poll_interval=0.005, timeout=5))
+    finally:
+        writer.join()
+
+    assert [spectrum.index for spectrum in spectra] == list(range(X_STEPS * Y_STEPS))
+    np.testing.assert_array_equal(
+        np.stack([spectrum.data for spectrum in spectra]), mapping.get_spectra()
+    )
+    assert (spectra[0].x, spectra[0].y) == pytest.approx((X_START_NM, Y_START_NM))
+    assert (spectra[X_STEPS].x, spectra[X_STEPS].y) == pytest.approx(
+        (X_START_NM, Y_START_NM + STEP_SIZE_NM)
+    )
+
+
+def test_follow_smd_stops_when_the_file_stops_growing(tmp_path: Path) -> None:
+    """An acquisition that was aborted ends the generator after the timeout."""
+    short = _copy_with_binary_delta(SMD_FILE, tmp_path / "short.smd", -4)
+
+    spectra = list(follow_smd(short, poll_interval=0.01, timeout=0.1))
+
+    assert len(spectra) == X_STEPS * Y_STEPS - 1
+    assert list(follow_smd(tmp_path / "missing.smd", poll_interval=0.01, timeout=0.05)) == []
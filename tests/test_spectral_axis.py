@@ -0,0 +1,144 @@
+"""Tests for the lookups of points of the spectral axis by their value.
+
+Every lookup is checked against a scan of the whole axis, on axes running either way, evenly
+spaced or not.
+"""
+
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+
+from nanofinderparser import load_mdt, models, sample_mapping
+from nanofinderparser.spectral_axis import SpectralAxis
+
+MDT_FILE = Path(__file__).parent.parent / "sample_data" / "mdt" / "Spectra.mdt"
+
+RNG = np.random.default_rng(0)
+
+# Evenly spaced axes, and axes that are not, such as a wavelength axis converted to Raman shift
+AXES = {
+    "increasing": np.linspace(500.0, 700.0, 301),
+    "decreasing": np.linspace(700.0, 500.0, 301),
+    "uneven increasing": np.sort(RNG.uniform(0.0, 100.0, 200)),
+    "uneven decreasing": np.sort(RNG.uniform(0.0, 100.0, 200))[::-1],
+    "converted": 1e7 / 532.0 - 1e7 / np.linspace(540.0, 600.0, 256),
+    "single point": np.array([10.0]),
+}
+
+
+def scan_window(axis: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Find the points within a window by comparing every point of the axis with its limits."""
+    low, high = sorted((low, high))
+    return np.flatnonzero((axis >= low) & (axis <= high))
+
+
+# --------------------------------------------------------------------------------------------
+# Axes
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("name", list(AXES))
+def test_lookups_match_a_scan_of_the_axis(name: str) -> None:
+    """Nearest points and windows, limits included, are those a scan of the axis finds."""
+    values = AXES[name]
+    axis = SpectralAxis.from_values(values)
+    rng = np.random.default_rng(1)
+    span = values.min() - 5.0, values.max() + 5.0
+    # Random values, and the points of the axis themselves, which the limits must keep
+    limits = np.concatenate([rng.uniform(*span, 1000), values, values])
+    rng.shuffle(limits)
+
+    for low, high in limits.reshape(-1, 2):
+        expected = scan_window(values, low, high)
+        if expected.size:
+            np.testing.assert_array_equal(np.arange(values.size)[axis.window(low, high)], expected)
+        else:
+            with pytest.raises(ValueError, match="No point"):
+                axis.window(low, high)
+
+        nearest = axis.nearest(low)
+        assert abs(values[nearest] - low) == np.abs(values - low).min()
+
+
+def test_axes_are_classified() -> None:
+    """The direction and the spacing of the axes are recognised."""
+    assert (SpectralAxis.from_values(AXES["increasing"]).step) == pytest.approx(200 / 300)
+    assert (SpectralAxis.from_values(AXES["decreasing"]).step) == pytest.approx(-200 / 300)
+    converted = SpectralAxis.from_values(AXES["converted"])
+    assert (converted.direction, converted.step) == (1, None)
+    assert SpectralAxis.from_values(AXES["uneven decreasing"]).direction == -1
+
+
+def test_axes_that_are_not_monotonic() -> None:
+    """Windows of contiguous points are found, others are rejected."""
+    axis = SpectralAxis.from_values(np.array([0.0, 1.0, 2.0, 1.5, 3.0]))
+
+    assert axis.direction == 0
+    assert axis.window(1.4, 3.5) == slice(2, 5)
+    assert axis.nearest(1.6) == 3  # noqa: PLR2004
+    with pytest.raises(ValueError, match="contiguous"):
+        axis.window(0.5, 1.7)
+
+
+def test_values_are_copied_and_read_only() -> None:
+    """The axis keeps its own values, which cannot be changed."""
+    values = AXES["increasing"].copy()
+    axis = SpectralAxis.from_values(values)
+    values[:] = 0.0
+
+    assert axis.values[0] == 500.0  # noqa: PLR2004
+    with pytest.raises(ValueError, match="read-only"):
+        axis.values[0] = 0.0
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings and spectra
+# --------------------------------------------------------------------------------------------
+
+
+def count_conversions(monkeypatch: pytest.MonkeyPatch) -> list[None]:
+    """Count the conversions of spectral axes to other units, one item per conversion."""
+    conversions: list[None] = []
+    convert = models.convert_spectral_units
+
+    def counted(*args: Any, **kwargs: Any) -> Any:
+        conversions.append(None)
+        return convert(*args, **kwargs)
+
+    monkeypatch.setattr(models, "convert_spectral_units", counted)
+    return conversions
+
+
+def test_mapping_lookups(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The lookups of a mapping are those of its axis in the units asked, converted once."""
+    conversions = count_conversions(monkeypatch)
+    mapping = sample_mapping("graphene", x_size=3, y_size=2, n_points=512)
+    shift = mapping.get_spectral_axis("raman_shift")
+
+    points = mapping.spectral_slice(1550, 1620, "raman_shift")
+
+    np.testing.assert_array_equal(np.arange(shift.size)[points], scan_window(shift, 1550, 1620))
+    assert mapping.spectral_index(1580, "raman_shift") == np.abs(shift - 1580).argmin()
+    assert mapping.spectral_index(560.0) == np.abs(mapping.get_spectral_axis() - 560.0).argmin()
+    # The axis returned is a copy, which the caller may change
+    shift[:] = 0.0
+    assert mapping.get_spectral_axis("raman_shift")[0] != 0.0
+    mapping.with_data(mapping.data).spectral_slice(2600, 2750, "raman_shift")
+    assert len(conversions) == 1
+
+
+def test_spectrum_lookups(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The lookups of a spectrum are those of its axis in the units asked, converted once."""
+    conversions = count_conversions(monkeypatch)
+    spectrum = load_mdt(MDT_FILE)[0]
+    shift = spectrum.get_spectral_axis("raman_shift")
+
+    points = spectrum.spectral_slice(500, 1500, "raman_shift")
+
+    np.testing.assert_array_equal(np.arange(shift.size)[points], scan_window(shift, 500, 1500))
+    assert spectrum.spectral_index(1000, "raman_shift") == np.abs(shift - 1000).argmin()
+    nm = spectrum.spectral_axis
+    assert spectrum.spectral_index(nm[10]) == 10  # noqa: PLR2004
+    assert len(conversions) == 1
@@ -25,6 +25,7 @@ from nanofinderparser import (
     build_spectra,
     create_smd,
     load_smd,
+    map_ramp,
 )
 from nanofinderparser.models import (
     Axis,
@@ -147,6 +148,68 @@ def test_peaks_can_be_given_as_a_raman_shift() -> None:
     assert found == pytest.approx(expected, abs=axis[1] - axis[0])
 
 
+# --------------------------------------------------------------------------------------------
+# Peaks evaluated over their support only
+# --------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("shape", ["gaussian", "lorentzian", "pseudo_voigt"])
+@pytest.mark.parametrize("tolerance", [1e-2, 1e-4, 1e-6])
+def test_windowed_peaks_stay_within_the_tolerance(shape: str, tolerance: float) -> None:
+    """Skipping the tails of the peaks changes no value by more than the tolerance allows."""
+    amplitude = map_ramp(200.0, 1000.0)
+    spec = MappingSpec(
+        map=MapSpec(x_size=6, y_size=4),
+        spectral_axis=SpectralAxisSpec(size=2048, start=540.0, stop=640.0),
+        peaks=[
+            PeakSpec(center=map_ramp(560.0, 600.0), fwhm=1.5, amplitude=amplitude, shape=shape),  # type: ignore[arg-type]
+            PeakSpec(center=620.0, fwhm=map_ramp(0.5, 4.0, axis="y"), amplitude=300.0),
+        ],
+        baseline=BaselineSpec(offset=100.0),
+    )
+
+    exact = build_spectra(spec).astype(np.float64)
+    windowed = build_spectra(spec, tolerance=tolerance).astype(np.float64)
+
+    # float32 rounding of values around 1000 counts, on top of the bound itself.
+    bound = tolerance * (1000.0 + 300.0) + 1e-3
+    assert np.abs(windowed - exact).max() <= bound
+
+
+def test_windowed_peaks_follow_a_converted_axis() -> None:
+    """Windows are found on axes that decrease, as an energy axis does along wavelength."""
+    spec = MappingSpec(
+        map=MapSpec(x_size=3, y_size=2),
+        spectral_axis=SpectralAxisSpec(size=1024, start=540.0, stop=640.0),
+        peaks=[PeakSpec(center=2.1, fwhm=0.01, amplitude=500.0, units=Units.ev)],
+    )
+
+    exact = build_spectra(spec)
+    windowed = build_spectra(spec, tolerance=1e-6)
+
+    assert windowed.max() == pytest.approx(exact.max())
+    assert np.abs(windowed - exact).max() <= 500.0 * 1e-6 + 1e-4
+
+
+def test_a_peak_outside_the_axis_is_skipped() -> None:
+    """A narrow peak far beyond the axis contributes nothing within the tolerance."""
+    spec = MappingSpec(
+        map=MapSpec(x_size=2, y_size=2),
+        spectral_axis=SpectralAxisSpec(size=128, start=540.0, stop=560.0),
+        peaks=[PeakSpec(center=700.0, fwhm=1.0, amplitude=1000.0)],
+        baseline=BaselineSpec(offset=10.0),
+    )
+
+    assert np.array_equal(build_spectra(spec, tolerance=1e-6), np.full((2, 2, 128), 10.0))
+
+
+@pytest.mark.parametrize("tolerance", [0.0, 1.0, -1e-3])
+def test_a_tolerance_out_of_range_is_rejected(spec: MappingSpec, tolerance: float) -> None:
+    """The tolerance is a fraction of the height of the peak."""
+    with pytest.raises(ValueError, match="tolerance"):
+        build_spectra(spec, tolerance=tolerance)
+
+
 # --------------------------------------------------------------------------------------------
 # Parameters changing across the map
 # --------------------------------------------------------------------------------------------
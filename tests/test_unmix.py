@@ -0,0 +1,127 @@
+"""Tests for the unmixing of spectra into reference spectra.
+
+Spectra are mixed from known references in known amounts; NNLS is also checked against an
+exhaustive search over the references each spectrum may use.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from nanofinderparser import sample_mapping
+from nanofinderparser.unmix import unmix, unmix_mapping
+
+AXIS = np.linspace(0.0, 100.0, 256)
+
+# Overlapping references, so that the abundances of NNLS differ from the clipped CLS ones
+REFERENCES = np.array(
+    [
+        np.exp(-(((AXIS - center) / width) ** 2))
+        + 0.3 * np.exp(-(((AXIS - center - 20) / width) ** 2))
+        for center, width in ((30, 8), (38, 8), (50, 10), (60, 5))
+    ]
+)
+
+
+def mixtures(n_spectra: int, noise: float, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Mix the references in random amounts, some of them zero, with some noise."""
+    rng = np.random.default_rng(seed)
+    amounts = rng.uniform(0.0, 5.0, (n_spectra, len(REFERENCES)))
+    amounts[rng.random(amounts.shape) < 0.3] = 0.0  # noqa: PLR2004
+    spectra = amounts @ REFERENCES + rng.normal(0.0, noise, (n_spectra, AXIS.size))
+    return spectra, amounts
+
+
+def exhaustive_nnls(spectrum: np.ndarray) -> np.ndarray:
+    """Solve NNLS by trying every subset of the references, keeping the best feasible one."""
+    gram = REFERENCES @ REFERENCES.T
+    projection = REFERENCES @ spectrum
+    best, best_cost = np.zeros(len(REFERENCES)), 0.0
+    for size in range(1, len(REFERENCES) + 1):
+        for subset in map(list, itertools.combinations(range(len(REFERENCES)), size)):
+            solution = np.zeros(len(REFERENCES))
+            solution[subset] = np.linalg.solve(gram[np.ix_(subset, subset)], projection[subset])
+            cost = solution @ gram @ solution - 2 * solution @ projection
+            if (solution >= 0).all() and cost < best_cost:
+                best, best_cost = solution, cost
+    return best
+
+
+# --------------------------------------------------------------------------------------------
+# Spectra
+# --------------------------------------------------------------------------------------------
+
+
+def test_cls_recovers_the_amounts() -> None:
+    """Without noise, CLS finds the amounts mixed exactly, negative ones included."""
+    spectra, amounts = mixtures(500, noise=0.0)
+    amounts[::7, 1] -= 2.0
+    spectra = amounts @ REFERENCES
+
+    found, residual = unmix(spectra, REFERENCES, method="cls")
+
+    np.testing.assert_allclose(found, amounts, atol=1e-9)
+    np.testing.assert_allclose(residual, 0.0, atol=1e-6)
+
+
+def test_nnls_matches_an_exhaustive_search() -> None:
+    """NNLS finds the best non-negative amounts, and the residual they leave."""
+    spectra, _ = mixtures(200, noise=0.2)
+
+    found, residual = unmix(spectra, REFERENCES)
+
+    expected = np.array([exhaustive_nnls(spectrum) for spectrum in spectra])
+    np.testing.assert_allclose(found, expected, atol=1e-9)
+    assert (found >= 0).all()
+    # Some spectra need fewer references than CLS gives them, or the test proves nothing
+    assert (unmix(spectra, REFERENCES, method="cls")[0] < 0).any()
+    direct = np.sqrt(np.mean((spectra - found @ REFERENCES) ** 2, axis=1))
+    np.testing.assert_allclose(residual, direct, rtol=1e-6)
+
+
+def test_chunks_do_not_change_the_result() -> None:
+    """Unmixing in chunks of any size gives the same abundances."""
+    spectra, _ = mixtures(300, noise=0.1)
+
+    whole, _ = unmix(spectra, REFERENCES)
+    chunked, _ = unmix(spectra.astype(np.float32), REFERENCES, chunk_size=7)
+
+    np.testing.assert_allclose(chunked, whole, atol=1e-5)
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+def test_unmix_mapping() -> None:
+    """Abundance maps are laid out as the map of the spectra, one per reference."""
+    mapping = sample_mapping("graphene", x_size=6, y_size=4, n_points=AXIS.size)
+    spectra, _ = mixtures(24, noise=0.0)
+    mixed = mapping.with_data(spectra.ravel())
+    names = ("MoS2", "hBN", "Si", "Graphene")
+
+    unmixing = unmix_mapping(mixed, dict(zip(names, REFERENCES, strict=True)))
+
+    assert unmixing.names == names
+    assert unmixing.abundances.shape == (4, 6, 4)
+    # The spectrum at every point of the map is rebuilt from the abundances at that point
+    np.testing.assert_allclose(unmixing.abundances @ REFERENCES, mixed.get_map(), atol=1e-9)
+    np.testing.assert_allclose(unmixing["Si"], unmixing.abundances[..., 2])
+    assert unmixing.residual.shape == (4, 6)
+
+
+def test_invalid_arguments() -> None:
+    """References that do not fit the spectra, or cannot be told apart, are rejected."""
+    spectra, _ = mixtures(10, noise=0.0)
+    with pytest.raises(ValueError, match="points"):
+        unmix(spectra, REFERENCES[:, :100])
+    with pytest.raises(ValueError, match="linearly dependent"):
+        unmix(spectra, np.vstack([REFERENCES, REFERENCES[0] + REFERENCES[1]]))
+
+    mapping = sample_mapping("graphene", x_size=2, y_size=2, n_points=AXIS.size)
+    with pytest.raises(ValueError, match="reference"):
+        unmix_mapping(mapping, {})
+    with pytest.raises(KeyError, match="MoS2"):
+        _ = unmix_mapping(mapping, {"Si": REFERENCES[0]})["MoS2"]
@@ -0,0 +1,185 @@
+"""Tests for the conversion of the files of a folder as the instrument writes them.
+
+Files being written are simulated by truncating complete files: the watcher must leave them alone
+until they hold all their data, then convert them once, including across restarts.
+"""
+
+import shutil
+from functools import partial
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from nanofinderparser import create_smd, sample_spec
+from nanofinderparser.cli import app
+from nanofinderparser.convert import MANIFEST_NAME, smd_to_csv
+from nanofinderparser.load import smd_is_complete
+from nanofinderparser.watch import WatchedFormat, is_complete, watch_folder
+
+MDT_FILE = Path(__file__).parent.parent / "sample_data" / "mdt" / "Spectra.mdt"
+
+N_FILES = 2
+POLL_INTERVAL = 0.05
+TIMEOUT = 1.0
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def smd_file(tmp_path: Path) -> Path:
+    """Write a small, complete SMD file."""
+    spec = sample_spec("graphene", x_size=3, y_size=2, n_points=32, seed=0)
+    return create_smd(tmp_path / "complete.smd", spec)
+
+
+def truncate(file: Path, target: Path, nbytes: int) -> Path:
+    """Copy a file without its last bytes, as if it was still being written.
+
+    Parameters
+    ----------
+    file : Path
+        The complete file.
+    target : Path
+        Where to write the incomplete copy.
+    nbytes : int
+        Number of bytes to leave out.
+
+    Returns
+    -------
+    Path
+        The incomplete copy.
+    """
+    target.write_bytes(file.read_bytes()[:-nbytes])
+    return target
+
+
+def smd_formats(output: Path) -> dict[str, WatchedFormat]:
+    """Convert SMD files to CSV files in a folder."""
+    return {".smd": WatchedFormat(partial(smd_to_csv, output_dir=output), {"command": "test"})}
+
+
+# --------------------------------------------------------------------------------------------
+# Complete files
+# --------------------------------------------------------------------------------------------
+
+
+def test_smd_is_complete(smd_file: Path, tmp_path: Path) -> None:
+    """An SMD file is complete once it holds its whole data block, and not before."""
+    assert smd_is_complete(smd_file)
+    assert not smd_is_complete(truncate(smd_file, tmp_path / "data.smd", 4))
+    assert not smd_is_complete(
+        truncate(smd_file, tmp_path / "header.smd", smd_file.stat().st_size // 2)
+    )
+
+    empty = tmp_path / "empty.smd"
+    empty.touch()
+    assert not smd_is_complete(empty)
+
+
+def test_mdt_is_complete(tmp_path: Path) -> None:
+    """An MDT file is complete once it holds every byte its header declares."""
+    assert is_complete(MDT_FILE)
+    assert not is_complete(truncate(MDT_FILE, tmp_path / "spectra.mdt", 4))
+    assert not is_complete(
+        truncate(MDT_FILE, tmp_path / "header.mdt", MDT_FILE.stat().st_size - 10)
+    )
+
+
+# --------------------------------------------------------------------------------------------
+# Watching a folder
+# --------------------------------------------------------------------------------------------
+
+
+def test_files_are_converted_once_complete(smd_file: Path, tmp_path: Path) -> None:
+    """Complete files are converted once each, and incomplete ones are left alone."""
+    folder = tmp_path / "watched"
+    folder.mkdir()
+    for index in range(N_FILES):
+        shutil.copy(smd_file, folder / f"map_{index}.smd")
+    truncate(smd_file, folder / "writing.smd", 4)
+    output = tmp_path / "csv"
+
+    results = list(
+        watch_folder(
+            folder, output, smd_formats(output), poll_interval=POLL_INTERVAL, timeout=TIMEOUT
+        )
+    )
+
+    assert sorted(result.file.name for result in results) == [
+        f"map_{index}.smd" for index in range(N_FILES)
+    ]
+    assert all(result.ok for result in results)
+    assert sorted(file.name for file in output.glob("*.csv")) == [
+        f"map_{index}.csv" for index in range(N_FILES)
+    ]
+    assert (output / MANIFEST_NAME).is_file()
+
+
+def test_restarts_convert_only_changed_files(smd_file: Path, tmp_path: Path) -> None:
+    """Watching again converts nothing, until a file is completed."""
+    folder = tmp_path / "watched"
+    folder.mkdir()
+    shutil.copy(smd_file, folder / "map_0.smd")
+    writing = truncate(smd_file, folder / "writing.smd", 4)
+    output = tmp_path / "csv"
+    watch = partial(
+        watch_folder,
+        folder,
+        output,
+        smd_formats(output),
+        poll_interval=POLL_INTERVAL,
+        timeout=TIMEOUT,
+    )
+
+    assert [result.file.name for result in watch()] == ["map_0.smd"]
+    assert list(watch()) == []
+
+    shutil.copy(smd_file, writing)
+    assert [result.file.name for result in watch()] == ["writing.smd"]
+
+
+def test_unreadable_files_are_left_alone(tmp_path: Path) -> None:
+    """A file whose header cannot be read is taken as still being written, not converted."""
+    folder = tmp_path / "watched"
+    folder.mkdir()
+    output = tmp_path / "csv"
+    (folder / "broken.smd").write_bytes(b"not an SMD file")
+
+    results = list(
+        watch_folder(
+            folder, output, smd_formats(output), poll_interval=POLL_INTERVAL, timeout=TIMEOUT
+        )
+    )
+
+    assert results == []
+    assert not output.exists() or not list(output.glob("*.csv"))
+
+
+def test_watch_command(smd_file: Path, tmp_path: Path) -> None:
+    """The command converts the files of the folder until its timeout, and reports them."""
+    folder = tmp_path / "watched"
+    folder.mkdir()
+    shutil.copy(smd_file, folder / "map.smd")
+    shutil.copy(MDT_FILE, folder / "spectra.mdt")
+    output = tmp_path / "csv"
+
+    result = runner.invoke(
+        app,
+        [
+            "watch",
+            str(folder),
+            str(output),
+            "--poll-interval",
+            str(POLL_INTERVAL),
+            "--timeout",
+            str(TIMEOUT),
+            "--jobs",
+            "2",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Converted 2 file(s)" in result.output
+    assert (output / "map.csv").is_file()
+    assert len(list(output.glob("spectra*.csv"))) == 2  # noqa: PLR2004
@@ -0,0 +1,91 @@
+"""Tests for the export of mappings and maps to xarray.
+
+The arrays must share the memory of the mapping, and be laid out as the maps of
+:meth:`~nanofinderparser.models.Mapping.to_image`, whatever the scan order.
+"""
+
+import sys
+
+import numpy as np
+import pytest
+
+from nanofinderparser import sample_mapping
+
+xr = pytest.importorskip("xarray")
+
+
+# --------------------------------------------------------------------------------------------
+# Mappings
+# --------------------------------------------------------------------------------------------
+
+
+def test_mapping_to_xarray() -> None:
+    """The cube wraps the data of the mapping, with its coordinates and metadata."""
+    mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+
+    cube = mapping.to_xarray("raman_shift")
+
+    assert cube.dims == ("y", "x", "spectral")
+    assert np.shares_memory(cube.values, mapping.data)
+    np.testing.assert_array_equal(cube["spectral"], mapping.get_spectral_axis("raman_shift"))
+    assert cube["spectral"].attrs["units"] == "raman_shift"
+    image = mapping.to_image(mapping.get_spectra().max(axis=1), "Maximum")
+    np.testing.assert_array_equal(cube.max("spectral"), image.values)
+    np.testing.assert_allclose(cube["x"], image.x_coords)
+    np.testing.assert_allclose(cube["y"], image.y_coords)
+    assert cube["x"].attrs["units"] == mapping.step_units[0]
+    assert cube.attrs["laser_wavelength_nm"] == mapping.laser_wavelength
+    assert cube.attrs["datetime"] == mapping.datetime.isoformat()
+    # Missing metadata is left out rather than written as None
+    assert None not in cube.attrs.values()
+
+
+def test_x_slow_mappings_are_transposed() -> None:
+    """A mapping scanned along y first keeps the dimensions (y, x), still without copying."""
+    mapping = sample_mapping("mos2", x_size=4, y_size=3, n_points=64)
+    mapping.scanned_frame_parameters.stage_3d_parameters.stage_axes_dimensions.x.is_slow = True
+
+    cube = mapping.to_xarray()
+
+    assert cube.shape == (3, 4, 64)
+    assert np.shares_memory(cube.values, mapping.data)
+    # Spectra are acquired down each column, y being the fast axis
+    np.testing.assert_array_equal(cube.isel(x=1, y=2), mapping.get_spectra()[1 * 3 + 2])
+
+
+# --------------------------------------------------------------------------------------------
+# Maps
+# --------------------------------------------------------------------------------------------
+
+
+def test_images_to_xarray() -> None:
+    """Maps sharing a grid are stacked, by their titles."""
+    mapping = sample_mapping("graphene", x_size=4, y_size=3, n_points=256)
+    maps = mapping.eval_maps(
+        {"G": "band(1550, 1620)", "2D / G": "band(2600, 2750) / band(1550, 1620)"}
+    )
+
+    stacked = maps.to_xarray()
+
+    assert stacked.dims == ("map", "y", "x")
+    assert list(stacked["map"].values) == ["G", "2D / G"]
+    np.testing.assert_array_equal(stacked.sel(map="G"), maps["G"].values)
+    single = maps["G"].to_xarray()
+    assert single.name == "G"
+    np.testing.assert_array_equal(single["x"], stacked["x"])
+
+
+def test_invalid_arguments(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Maps on different grids are not stacked, and a missing xarray is explained."""
+    small = sample_mapping("graphene", x_size=4, y_size=3, n_points=64)
+    large = sample_mapping("graphene", x_size=5, y_size=3, n_points=64)
+    maps = small.eval_maps({"G": "band(1550, 1620)"})
+    other = large.eval_maps({"G wide": "band(1550, 1620)"})
+    with pytest.raises(ValueError, match="does not share the grid"):
+        type(maps)([maps[0], other[0]]).to_xarray()
+    with pytest.raises(ValueError, match="no map"):
+        type(maps)([]).to_xarray()
+
+    monkeypatch.setitem(sys.modules, "xarray", None)
+    with pytest.raises(ImportError, match=r"nanofinderparser\[xarray\]"):
+        small.to_xarray()